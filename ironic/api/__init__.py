@@ -23,10 +23,61 @@ API_SERVICE_OPTS = [
     cfg.IntOpt('port',
                default=6385,
                help='The port for the Ironic API server.'),
+    cfg.IntOpt('workers',
+               default=1,
+               help='Number of worker processes for the Ironic API server. '
+                    'When greater than 1, the workers are forked from a '
+                    'parent process and share the listening socket.'),
     cfg.IntOpt('max_limit',
                default=1000,
                help='The maximum number of items returned in a single '
                     'response from a collection resource.'),
+    cfg.IntOpt('bulk_batch_size',
+               default=100,
+               help='The number of nodes inserted per database transaction '
+                    'when enrolling nodes in bulk.'),
+    cfg.IntOpt('stream_batch_size',
+               default=100,
+               help='The number of items read from the database at a time '
+                    'when streaming a whole collection to the client.'),
+    cfg.IntOpt('max_job_wait',
+               default=60,
+               help='The maximum number of seconds a client may wait for a '
+                    'running job to finish in a single request.'),
+    cfg.IntOpt('max_watch_wait',
+               default=60,
+               help='The maximum number of seconds a client watching node '
+                    'state changes may wait for one in a single request. '
+                    'A waiting request holds an API thread and queries '
+                    'the database three times every poll_interval '
+                    'seconds.'),
+    cfg.IntOpt('node_event_commit_window',
+               default=10,
+               help='The maximum number of seconds between the recording '
+                    'of a node state change and the commit of its '
+                    'database transaction. The cursor of the clients '
+                    'watching node state changes does not move past the '
+                    'changes missing from the last seconds, which may '
+                    'still be committed.'),
+    cfg.IntOpt('node_event_id_increment',
+               default=1,
+               help='The increment between the ids the database allocates '
+                    'to consecutive node state changes, e.g. the '
+                    'auto_increment_increment of MySQL. Set it to 0 if '
+                    'several database servers allocate them, e.g. a Galera '
+                    'cluster written through all its nodes: each change is '
+                    'then returned to the watching clients only once it is '
+                    'older than node_event_commit_window.'),
+    cfg.FloatOpt('poll_interval',
+                 default=1.0,
+                 help='The interval, in seconds, between the database '
+                      'checks of a request waiting for a job to finish or '
+                      'for a node state change.'),
+    cfg.IntOpt('node_stats_cache_ttl',
+               default=0,
+               help='The number of seconds an API worker reuses the node '
+                    'statistics it computed. 0 computes them on each '
+                    'request.'),
     ]
 
 CONF = cfg.CONF
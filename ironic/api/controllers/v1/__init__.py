@@ -32,6 +32,7 @@ from ironic.api.controllers import base
 from ironic.api.controllers import link
 from ironic.api.controllers.v1 import chassis
 from ironic.api.controllers.v1 import driver
+from ironic.api.controllers.v1 import job
 from ironic.api.controllers.v1 import node
 from ironic.api.controllers.v1 import port
 
@@ -71,6 +72,9 @@ class V1(base.APIBase):
     drivers = [link.Link]
     "Links to the drivers resource"
 
+    jobs = [link.Link]
+    "Links to the jobs resource"
+
     @classmethod
     def convert(self):
         v1 = V1()
@@ -113,6 +117,13 @@ class V1(base.APIBase):
                                           'drivers', '',
                                           bookmark=True)
                      ]
+        v1.jobs = [link.Link.make_link('self', pecan.request.host_url,
+                                       'jobs', ''),
+                   link.Link.make_link('bookmark',
+                                       pecan.request.host_url,
+                                       'jobs', '',
+                                       bookmark=True)
+                  ]
         return v1
 
 
@@ -123,6 +134,7 @@ class Controller(rest.RestController):
     ports = port.PortsController()
     chassis = chassis.ChassisController()
     drivers = driver.DriversController()
+    jobs = job.JobsController()
 
     @wsme_pecan.wsexpose(V1)
     def get(self):
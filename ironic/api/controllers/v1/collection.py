@@ -14,10 +14,12 @@
 #    under the License.
 
 import pecan
+from wsme.rest import json as wjson
 from wsme import types as wtypes
 
 from ironic.api.controllers import base
 from ironic.api.controllers import link
+from ironic.openstack.common import jsonutils
 
 
 class Collection(base.APIBase):
@@ -46,3 +48,27 @@ class Collection(base.APIBase):
 
         return link.Link.make_link('next', pecan.request.host_url,
                                    resource_url, next_args).href
+
+
+def stream(collection_type, item_type, batches):
+    """Serialize a collection to JSON one batch at a time.
+
+    The document produced is the same as the one of a Collection holding
+    all the items, without the link to the next subset, but only a single
+    batch of items has to be held in memory at a time.
+
+    :param collection_type: the name of the collection, e.g. 'nodes'.
+    :param item_type: the API type of the items in the collection.
+    :param batches: an iterable yielding lists of API objects.
+    :returns: a generator of JSON encoded chunks.
+    """
+    yield '{"%s": [' % collection_type
+    separator = ''
+    for batch in batches:
+        if not batch:
+            continue
+        yield separator + ', '.join(
+                jsonutils.dumps(wjson.tojson(item_type, item))
+                for item in batch)
+        separator = ', '
+    yield ']}'
@@ -81,6 +81,47 @@ class DriverList(base.APIBase):
         return sample
 
 
+class ImagePrefetch(base.APIBase):
+    """API representation of a set of images to prefetch."""
+
+    images = [wtypes.text]
+    "UUIDs or hrefs of instance images, with their kernel and ramdisk"
+
+    boot_images = [wtypes.text]
+    "UUIDs or hrefs of other kernels and ramdisks, e.g. of deploy ramdisks"
+
+    @classmethod
+    def sample(cls):
+        sample = cls(images=['c7a4ba3e-5a80-4e5c-b5c3-5b2fd6b3b0f3'],
+                     boot_images=['2b7e5cd5-ac40-4a47-9b4b-5a0dcfaf1c05',
+                                  '9b8d3b8e-4c36-4b6b-a0a4-6e0d1c9a6c84'])
+        return sample
+
+
+class DriverPrefetchController(rest.RestController):
+    """REST controller for prefetching the images of a driver."""
+
+    @wsme_pecan.wsexpose(None, wtypes.text, body=ImagePrefetch,
+                         status_code=202)
+    def post(self, driver_name, prefetch):
+        """Have the conductors of a driver download images into its caches.
+
+        The first deploy of an image then does not wait for its download.
+
+        :param driver_name: name of the driver whose caches to fill.
+        :param prefetch: the images to download.
+        """
+        # NOTE: raises DriverNotFound if no conductor supports the driver
+        pecan.request.rpcapi.get_topic_for_driver(driver_name)
+        images = prefetch.images or []
+        boot_images = prefetch.boot_images or []
+        if not images and not boot_images:
+            raise wsme.exc.ClientSideError(_("No images specified"))
+        pecan.request.rpcapi.prefetch_images(pecan.request.context,
+                                             driver_name, images,
+                                             boot_images)
+
+
 class DriverPassthruController(rest.RestController):
     """REST controller for driver passthru.
 
@@ -113,6 +154,8 @@ class DriversController(rest.RestController):
 
     vendor_passthru = DriverPassthruController()
 
+    prefetch_images = DriverPrefetchController()
+
     @wsme_pecan.wsexpose(DriverList)
     def get_all(self):
         """Retrieve a list of drivers.
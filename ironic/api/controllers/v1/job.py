@@ -0,0 +1,249 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import datetime
+
+import time
+
+from oslo.config import cfg
+import pecan
+from pecan import rest
+import six
+import wsme
+from wsme import types as wtypes
+import wsmeext.pecan as wsme_pecan
+
+from ironic.api.controllers import base
+from ironic.api.controllers import link
+from ironic.api.controllers.v1 import types
+from ironic.common import exception
+from ironic.common import states as ir_states
+from ironic import objects
+
+CONF = cfg.CONF
+
+# The target states accepted for each action of a job.
+JOB_TARGETS = {
+    'power': [ir_states.POWER_ON, ir_states.POWER_OFF, ir_states.REBOOT],
+    'provision': [ir_states.ACTIVE, ir_states.DELETED],
+}
+
+
+class JobFilters(wtypes.Base):
+    """API representation of the nodes a job applies to.
+
+    A node is selected if it matches all the filters which are set.
+    """
+
+    chassis_uuid = types.uuid
+    "The UUID of the chassis the nodes belong to"
+
+    driver = wtypes.text
+    "The driver of the nodes"
+
+    maintenance = types.boolean
+    "Whether the nodes are in maintenance mode"
+
+    node_uuids = [types.uuid]
+    "An explicit list of node UUIDs"
+
+    def as_dict(self):
+        return dict((k, getattr(self, k))
+                    for k in ('chassis_uuid', 'driver', 'maintenance',
+                              'node_uuids')
+                    if getattr(self, k) not in (wsme.Unset, None))
+
+
+class Job(base.APIBase):
+    """API representation of a job.
+
+    A job applies an action to one or more nodes asynchronously and
+    records its progress and outcome.
+    """
+
+    uuid = wsme.wsattr(types.uuid, readonly=True)
+    "Unique UUID for this job"
+
+    action = wsme.wsattr(wtypes.text, mandatory=True)
+    "The action of the job, 'power', 'provision' or 'vendor_passthru'"
+
+    target = wsme.wsattr(wtypes.text)
+    "The power or provision state the nodes are brought to"
+
+    filters = wsme.wsattr(JobFilters, mandatory=True)
+    "The nodes this job applies to"
+
+    state = wsme.wsattr(wtypes.text, readonly=True)
+    "The state of the job: running, done or failed"
+
+    total = wsme.wsattr(int, readonly=True)
+    "The number of nodes this job applies to"
+
+    succeeded = wsme.wsattr(int, readonly=True)
+    "The number of nodes the action was completed on"
+
+    failed = wsme.wsattr(int, readonly=True)
+    "The number of nodes the action failed on"
+
+    last_error = wsme.wsattr(wtypes.text, readonly=True)
+    "The error of the last node the action failed on"
+
+    links = wsme.wsattr([link.Link], readonly=True)
+    "A list containing a self link and associated job links"
+
+    def __init__(self, **kwargs):
+        self.fields = objects.Job.fields.keys()
+        for k in self.fields:
+            # Skip fields we do not expose.
+            if not hasattr(self, k):
+                continue
+            setattr(self, k, kwargs.get(k))
+
+    @classmethod
+    def _convert_with_links(cls, job, url):
+        job.links = [link.Link.make_link('self', url, 'jobs', job.uuid),
+                     link.Link.make_link('bookmark', url, 'jobs', job.uuid,
+                                         bookmark=True)
+                    ]
+        return job
+
+    @classmethod
+    def convert_with_links(cls, rpc_job):
+        job_dict = rpc_job.as_dict()
+        job_dict['filters'] = JobFilters(**(job_dict.get('filters') or {}))
+        job = Job(**job_dict)
+        return cls._convert_with_links(job, pecan.request.host_url)
+
+    @classmethod
+    def sample(cls):
+        time = datetime.datetime(2000, 1, 1, 12, 0, 0)
+        filters = JobFilters(chassis_uuid='edcad704-b2da-41d5-96d9-'
+                                          'afd580ecfa12')
+        sample = cls(uuid='27e3153e-d5bf-4b7e-b517-fb518e17f34c',
+                     action='power', target=ir_states.POWER_OFF,
+                     filters=filters, state=ir_states.JOB_RUNNING,
+                     total=40, succeeded=31, failed=1,
+                     last_error='Node 1be26c0b-03f2-4d2e-ae87-c02d7f33c123 '
+                                'is locked by host conductor-1.',
+                     created_at=time, updated_at=time)
+        return cls._convert_with_links(sample, 'http://localhost:6385')
+
+
+def create_node_job(context, node_uuid, action, target=None):
+    """Create the job tracking an action on a single node.
+
+    :param context: request context.
+    :param node_uuid: UUID of the node.
+    :param action: 'power', 'provision' or 'vendor_passthru'.
+    :param target: the desired state of the node, if any.
+    :returns: a Job object.
+    """
+    rpc_job = objects.Job(context=context, action=action, target=target,
+                          filters={'node_uuids': [node_uuid]}, total=1)
+    rpc_job.create()
+    return rpc_job
+
+
+class JobsController(rest.RestController):
+    """REST controller for Jobs."""
+
+    @wsme_pecan.wsexpose(Job, types.uuid, int)
+    def get_one(self, job_uuid, wait=None):
+        """Retrieve information about the given job.
+
+        :param job_uuid: UUID of a job.
+        :param wait: Optional, the number of seconds to wait for the job to
+                     finish before returning it. This is capped by the
+                     max_job_wait configuration option.
+        """
+        if wait is not None and wait < 0:
+            raise wsme.exc.ClientSideError(
+                    _("The wait parameter must be a positive integer."))
+
+        rpc_job = objects.Job.get_by_uuid(pecan.request.context, job_uuid)
+        if wait:
+            deadline = time.time() + min(wait, CONF.api.max_job_wait)
+            while (rpc_job.state == ir_states.JOB_RUNNING and
+                   time.time() < deadline):
+                time.sleep(CONF.api.poll_interval)
+                rpc_job.refresh()
+        return Job.convert_with_links(rpc_job)
+
+    @wsme_pecan.wsexpose(Job, body=Job, status_code=202)
+    def post(self, job):
+        """Start a power or provision action on a set of nodes.
+
+        The nodes matching the filters are grouped by the conductor they
+        are mapped to, and each conductor is asked, with a single RPC, to
+        apply the action to its nodes. The job is returned as soon as the
+        requests have been sent; its progress is updated by the conductors.
+
+        :param job: a job within the request body.
+        """
+        if job.action not in JOB_TARGETS:
+            raise wsme.exc.ClientSideError(
+                    _("Invalid action %(action)s, expected one of: "
+                      "%(actions)s.") %
+                    {'action': job.action,
+                     'actions': ', '.join(sorted(JOB_TARGETS))})
+
+        if job.target not in JOB_TARGETS[job.action]:
+            raise wsme.exc.ClientSideError(
+                    _("Invalid target %(target)s for action %(action)s, "
+                      "expected one of: %(targets)s.") %
+                    {'target': job.target, 'action': job.action,
+                     'targets': ', '.join(JOB_TARGETS[job.action])})
+
+        filters = job.filters.as_dict()
+        if not filters:
+            raise wsme.exc.ClientSideError(
+                    _("At least one filter must be specified."))
+
+        db_filters = dict(filters)
+        if 'node_uuids' in db_filters:
+            db_filters['uuids'] = db_filters.pop('node_uuids')
+        context = pecan.request.context
+        rpcapi = pecan.request.rpcapi
+        nodes = pecan.request.dbapi.get_nodeinfo_list(
+                                        columns=['uuid', 'driver'],
+                                        filters=db_filters)
+
+        node_uuids_by_topic = collections.defaultdict(list)
+        unroutable = []
+        for node in nodes:
+            try:
+                topic = rpcapi.get_topic_for(node)
+            except exception.NoValidHost as e:
+                unroutable.append((node.uuid, e))
+                continue
+            node_uuids_by_topic[topic].append(node.uuid)
+
+        new_job = objects.Job(context=context, action=job.action,
+                              target=job.target, filters=filters,
+                              total=len(nodes))
+        new_job.create()
+
+        if unroutable:
+            node_uuid, error = unroutable[-1]
+            pecan.request.dbapi.update_job_progress(
+                    new_job.uuid, failed=len(unroutable),
+                    last_error=_("Node %(node)s: %(error)s") %
+                               {'node': node_uuid,
+                                'error': six.text_type(error)})
+            new_job.refresh()
+
+        for topic, node_uuids in node_uuids_by_topic.items():
+            rpcapi.do_bulk_node_action(context, new_job.uuid, node_uuids,
+                                       job.action, job.target, topic)
+
+        return Job.convert_with_links(new_job)
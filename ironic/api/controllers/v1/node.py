@@ -14,6 +14,7 @@
 #    under the License.
 
 import datetime
+import time
 
 from oslo.config import cfg
 import pecan
@@ -26,6 +27,7 @@ import wsmeext.pecan as wsme_pecan
 from ironic.api.controllers import base
 from ironic.api.controllers import link
 from ironic.api.controllers.v1 import collection
+from ironic.api.controllers.v1 import job
 from ironic.api.controllers.v1 import port
 from ironic.api.controllers.v1 import types
 from ironic.api.controllers.v1 import utils as api_utils
@@ -33,12 +35,37 @@ from ironic.common import exception
 from ironic.common import states as ir_states
 from ironic.common import utils
 from ironic import objects
+from ironic.openstack.common.db.sqlalchemy import utils as db_utils
+from ironic.openstack.common import excutils
+from ironic.openstack.common import log
 
 
 CONF = cfg.CONF
 CONF.import_opt('heartbeat_timeout', 'ironic.conductor.manager',
                 group='conductor')
 
+LOG = log.getLogger(__name__)
+
+# The node statistics last computed by this API worker, reused until
+# expires_at, see [api]node_stats_cache_ttl.
+_NODE_STATS = {'stats': None, 'expires_at': 0}
+
+# The fields shown when the nodes are not expanded.
+_NODE_SUMMARY_FIELDS = ['instance_uuid', 'maintenance', 'power_state',
+                        'provision_state', 'uuid']
+
+
+def _get_node_for_update(node_uuid):
+    """Get a node from the primary database before acting on it.
+
+    The conductor refuses to act on a node that changed since it was read,
+    so the node must not be read from a replica lagging behind.
+
+    :param node_uuid: UUID of a node.
+    """
+    pecan.request.dbapi.use_replica_reads(False)
+    return objects.Node.get_by_uuid(pecan.request.context, node_uuid)
+
 
 class NodePatchType(types.JsonPatchType):
 
@@ -101,7 +128,7 @@ class NodeConsoleController(rest.RestController):
         :param enabled: Boolean value; whether to enable or disable the
                 console.
         """
-        rpc_node = objects.Node.get_by_uuid(pecan.request.context, node_uuid)
+        rpc_node = _get_node_for_update(node_uuid)
         topic = pecan.request.rpcapi.get_topic_for(rpc_node)
         pecan.request.rpcapi.set_console_mode(pecan.request.context, node_uuid,
                                               enabled, topic)
@@ -168,10 +195,13 @@ class NodeStatesController(rest.RestController):
         rpc_node = objects.Node.get_by_uuid(pecan.request.context, node_uuid)
         return NodeStates.convert(rpc_node)
 
-    @wsme_pecan.wsexpose(None, types.uuid, wtypes.text, status_code=202)
+    @wsme_pecan.wsexpose(job.Job, types.uuid, wtypes.text, status_code=202)
     def power(self, node_uuid, target):
         """Set the power state of the node.
 
+        The power state change is performed asynchronously. The returned
+        job records its outcome.
+
         :param node_uuid: UUID of a node.
         :param target: The desired power state of the node.
         :raises: ClientSideError (HTTP 409) if a power operation is
@@ -182,7 +212,7 @@ class NodeStatesController(rest.RestController):
         """
         # TODO(lucasagomes): Test if it's able to transition to the
         #                    target state from the current one
-        rpc_node = objects.Node.get_by_uuid(pecan.request.context, node_uuid)
+        rpc_node = _get_node_for_update(node_uuid)
         topic = pecan.request.rpcapi.get_topic_for(rpc_node)
 
         if target not in [ir_states.POWER_ON,
@@ -190,24 +220,23 @@ class NodeStatesController(rest.RestController):
                           ir_states.REBOOT]:
             raise exception.InvalidStateRequested(state=target, node=node_uuid)
 
-        pecan.request.rpcapi.change_node_power_state(pecan.request.context,
-                                                     node_uuid, target, topic)
+        context = pecan.request.context
+        rpc_job = job.create_node_job(context, node_uuid, 'power', target)
+        pecan.request.rpcapi.change_node_power_state(context, node_uuid,
+                                                     target, topic,
+                                                     job_id=rpc_job.uuid)
+        return job.Job.convert_with_links(rpc_job)
 
-        # FIXME(lucasagomes): Currently WSME doesn't support returning
-        # the Location header. Once it's implemented we should use the
-        # Location to point to the /states subresource of the node so
-        # that clients will know how to track the status of the request
-        # https://bugs.launchpad.net/wsme/+bug/1233687
-
-    @wsme_pecan.wsexpose(None, types.uuid, wtypes.text, status_code=202)
+    @wsme_pecan.wsexpose(job.Job, types.uuid, wtypes.text, status_code=202)
     def provision(self, node_uuid, target):
         """Asynchronous trigger the provisioning of the node.
 
         This will set the target provision state of the node, and a
         background task will begin which actually applies the state
         change. This call will return a 202 (Accepted) indicating the
-        request was accepted and is in progress; the client should
-        continue to GET the status of this node to observe the status
+        request was accepted and is in progress, with a job recording
+        the outcome of the request; the client should poll the job, or
+        continue to GET the status of this node, to observe the status
         of the requested action.
 
         :param node_uuid: UUID of a node.
@@ -219,7 +248,7 @@ class NodeStatesController(rest.RestController):
         :raises: InvalidStateRequested (HTTP 400) if the requested target
                  state is not valid.
         """
-        rpc_node = objects.Node.get_by_uuid(pecan.request.context, node_uuid)
+        rpc_node = _get_node_for_update(node_uuid)
         topic = pecan.request.rpcapi.get_topic_for(rpc_node)
 
         if target == rpc_node.provision_state:
@@ -240,22 +269,25 @@ class NodeStatesController(rest.RestController):
                    % rpc_node.uuid)
             raise wsme.exc.ClientSideError(msg, status_code=409)  # Conflict
 
+        if (target in (ir_states.ACTIVE, ir_states.REBUILD) and
+                rpc_node.maintenance):
+            raise exception.NodeInMaintenance(op=_('provisioning'),
+                                              node=rpc_node.uuid)
+
         # Note that there is a race condition. The node state(s) could change
-        # by the time the RPC call is made and the TaskManager manager gets a
-        # lock.
+        # by the time the RPC request is handled and the TaskManager manager
+        # gets a lock. Such failures are recorded on the job.
 
+        context = pecan.request.context
+        rpc_job = job.create_node_job(context, node_uuid, 'provision', target)
         if target in (ir_states.ACTIVE, ir_states.REBUILD):
             rebuild = (target == ir_states.REBUILD)
-            pecan.request.rpcapi.do_node_deploy(
-                    pecan.request.context, node_uuid, rebuild, topic)
+            pecan.request.rpcapi.do_node_deploy(context, node_uuid, rebuild,
+                                                topic, job_id=rpc_job.uuid)
         elif target == ir_states.DELETED:
-            pecan.request.rpcapi.do_node_tear_down(
-                    pecan.request.context, node_uuid, topic)
-        # FIXME(lucasagomes): Currently WSME doesn't support returning
-        # the Location header. Once it's implemented we should use the
-        # Location to point to the /states subresource of this node so
-        # that clients will know how to track the status of the request
-        # https://bugs.launchpad.net/wsme/+bug/1233687
+            pecan.request.rpcapi.do_node_tear_down(context, node_uuid, topic,
+                                                   job_id=rpc_job.uuid)
+        return job.Job.convert_with_links(rpc_job)
 
 
 class Node(base.APIBase):
@@ -376,9 +408,7 @@ class Node(base.APIBase):
     @classmethod
     def _convert_with_links(cls, node, url, expand=True):
         if not expand:
-            except_list = ['instance_uuid', 'maintenance', 'power_state',
-                           'provision_state', 'uuid']
-            node.unset_fields_except(except_list)
+            node.unset_fields_except(_NODE_SUMMARY_FIELDS)
         else:
             node.ports = [link.Link.make_link('self', url, 'nodes',
                                               node.uuid + "/ports"),
@@ -400,7 +430,13 @@ class Node(base.APIBase):
 
     @classmethod
     def convert_with_links(cls, rpc_node, expand=True):
-        node = Node(**rpc_node.as_dict())
+        if expand:
+            node = Node(**rpc_node.as_dict())
+        else:
+            # NOTE: only read the fields which are shown, so that the JSON
+            #       fields of the node are not decoded.
+            node = Node(**dict((k, rpc_node[k])
+                               for k in _NODE_SUMMARY_FIELDS))
         return cls._convert_with_links(node, pecan.request.host_url,
                                        expand)
 
@@ -424,6 +460,54 @@ class Node(base.APIBase):
         return cls._convert_with_links(sample, 'http://localhost:6385', expand)
 
 
+class NodePort(base.APIBase):
+    """API representation of a port enrolled along with its node."""
+
+    uuid = types.uuid
+    "Unique UUID for this port"
+
+    address = wsme.wsattr(types.macaddress, mandatory=True)
+    "MAC Address for this port"
+
+    extra = {wtypes.text: types.MultiType(wtypes.text, six.integer_types)}
+    "This port's meta data"
+
+    def __init__(self, **kwargs):
+        self.fields = ['uuid', 'address', 'extra']
+        for k in self.fields:
+            setattr(self, k, kwargs.get(k))
+
+
+class NodeEnrollment(Node):
+    """API representation of a node to enroll along with its ports."""
+
+    ports = [NodePort]
+    "The ports of this node"
+
+
+class NodeEnrollmentResult(base.APIBase):
+    """API representation of the result of the enrollment of a node."""
+
+    uuid = types.uuid
+    "Unique UUID of the node"
+
+    ports = [NodePort]
+    "The ports enrolled along with the node"
+
+    error = wtypes.text
+    "Why the node was not enrolled, unset if it was"
+
+    links = wsme.wsattr([link.Link], readonly=True)
+    "A list containing a self link and associated node links"
+
+
+class NodeEnrollmentResultCollection(base.APIBase):
+    """API representation of the results of a bulk enrollment."""
+
+    nodes = [NodeEnrollmentResult]
+    "The results, in the order the nodes were submitted"
+
+
 class NodeCollection(collection.Collection):
     """API representation of a collection of nodes."""
 
@@ -449,6 +533,65 @@ class NodeCollection(collection.Collection):
         return sample
 
 
+class NodeEvent(base.APIBase):
+    """API representation of a change of the state of a node."""
+
+    id = int
+    "The id of the event, increasing with each event"
+
+    node_uuid = types.uuid
+    "The UUID of the node"
+
+    power_state = wtypes.text
+    "The power state of the node after the change"
+
+    target_power_state = wtypes.text
+    "The target power state of the node after the change"
+
+    provision_state = wtypes.text
+    "The provision state of the node after the change"
+
+    target_provision_state = wtypes.text
+    "The target provision state of the node after the change"
+
+    last_error = wtypes.text
+    "The last error of the node after the change"
+
+    def __init__(self, **kwargs):
+        self.fields = ['id', 'node_uuid', 'power_state', 'target_power_state',
+                       'provision_state', 'target_provision_state',
+                       'last_error', 'created_at']
+        for k in self.fields:
+            setattr(self, k, kwargs.get(k))
+
+    @classmethod
+    def convert(cls, db_event):
+        return cls(**dict((k, db_event[k]) for k in cls().fields))
+
+    @classmethod
+    def sample(cls):
+        time = datetime.datetime(2000, 1, 1, 12, 0, 0)
+        return cls(id=421, node_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
+                   power_state=ir_states.POWER_ON, target_power_state=None,
+                   provision_state=ir_states.ACTIVE,
+                   target_provision_state=ir_states.NOSTATE,
+                   last_error=None, created_at=time)
+
+
+class NodeEventCollection(base.APIBase):
+    """API representation of the node state changes since a cursor."""
+
+    events = [NodeEvent]
+    "The changes, oldest first"
+
+    cursor = int
+    "The cursor to watch the changes following these ones"
+
+    @classmethod
+    def sample(cls):
+        return cls(events=[NodeEvent.sample()], cursor=421)
+
+
 class NodeVendorPassthruController(rest.RestController):
     """REST controller for VendorPassthru.
 
@@ -457,26 +600,81 @@ class NodeVendorPassthruController(rest.RestController):
     appropriate driver, no introspection will be made in the message body.
     """
 
-    @wsme_pecan.wsexpose(wtypes.text, types.uuid, wtypes.text,
+    @wsme_pecan.wsexpose(job.Job, types.uuid, wtypes.text,
                          body=wtypes.text,
                          status_code=202)
     def post(self, node_uuid, method, data):
         """Call a vendor extension.
 
+        The vendor method is run asynchronously. The returned job records
+        its outcome.
+
         :param node_uuid: UUID of a node.
         :param method: name of the method in vendor driver.
         :param data: body of data to supply to the specified method.
         """
         # Raise an exception if node is not found
-        rpc_node = objects.Node.get_by_uuid(pecan.request.context, node_uuid)
+        rpc_node = _get_node_for_update(node_uuid)
         topic = pecan.request.rpcapi.get_topic_for(rpc_node)
 
         # Raise an exception if method is not specified
         if not method:
             raise wsme.exc.ClientSideError(_("Method not specified"))
 
-        return pecan.request.rpcapi.vendor_passthru(
-                pecan.request.context, node_uuid, method, data, topic)
+        # NOTE: the vendor method name is not recorded as the target, the
+        #       job only tracks the outcome of the call.
+        context = pecan.request.context
+        rpc_job = job.create_node_job(context, node_uuid, 'vendor_passthru')
+        pecan.request.rpcapi.vendor_passthru(context, node_uuid, method, data,
+                                             topic, job_id=rpc_job.uuid)
+        return job.Job.convert_with_links(rpc_job)
+
+
+class NodeStats(base.APIBase):
+    """API representation of the number of nodes per provision state,
+    power state, driver, maintenance mode and chassis.
+
+    The nodes without a value, eg without a chassis, are counted under
+    "None".
+    """
+
+    provision_state = {wtypes.text: int}
+    "The number of nodes per provision state"
+
+    power_state = {wtypes.text: int}
+    "The number of nodes per power state"
+
+    driver = {wtypes.text: int}
+    "The number of nodes per driver"
+
+    maintenance = {wtypes.text: int}
+    "The number of nodes in (True) and out of (False) maintenance mode"
+
+    chassis_uuid = {wtypes.text: int}
+    "The number of nodes per chassis UUID"
+
+    total = int
+    "The number of nodes"
+
+    @classmethod
+    def convert(cls, stats):
+        stats = dict(stats)
+        total = stats.pop('total')
+        return cls(total=total,
+                   **dict((field, dict((six.text_type(value), count)
+                                       for value, count in counts.items()))
+                          for field, counts in stats.items()))
+
+    @classmethod
+    def sample(cls):
+        return cls(provision_state={'None': 3, ir_states.ACTIVE: 12,
+                                    ir_states.DEPLOYWAIT: 1},
+                   power_state={ir_states.POWER_ON: 13,
+                                ir_states.POWER_OFF: 3},
+                   driver={'pxe_ipmitool': 16},
+                   maintenance={'False': 15, 'True': 1},
+                   chassis_uuid={'edcad704-b2da-41d5-96d9-afd580ecfa12': 16},
+                   total=16)
 
 
 class NodesController(rest.RestController):
@@ -492,8 +690,12 @@ class NodesController(rest.RestController):
     "Expose ports as a sub-element of nodes"
 
     _custom_actions = {
+        'bulk': ['POST'],
         'detail': ['GET'],
+        'export': ['GET'],
+        'stats': ['GET'],
         'validate': ['GET'],
+        'watch': ['GET'],
     }
 
     def __init__(self, from_chassis=False):
@@ -501,7 +703,13 @@ class NodesController(rest.RestController):
 
     def _get_nodes_collection(self, chassis_uuid, instance_uuid, associated,
                               maintenance, marker, limit, sort_key, sort_dir,
-                              expand=False, resource_url=None):
+                              expand=False, resource_url=None, **filters):
+        """Retrieve a page of nodes.
+
+        :param filters: Additional filters of dbapi.get_node_list, those
+                        which are None are ignored.
+        """
+        filters = dict((k, v) for k, v in filters.items() if v is not None)
         if self._from_chassis and not chassis_uuid:
             raise exception.InvalidParameterValue(_(
                   "Chassis id not specified."))
@@ -516,20 +724,15 @@ class NodesController(rest.RestController):
         if instance_uuid:
             nodes = self._get_nodes_by_instance(instance_uuid)
         else:
-            filters = {}
-            if chassis_uuid:
-                filters['chassis_uuid'] = chassis_uuid
-            if associated is not None:
-                filters['associated'] = associated
-            if maintenance is not None:
-                filters['maintenance'] = maintenance
-
-            nodes = pecan.request.dbapi.get_node_list(filters, limit,
+            node_filters = self._get_nodes_filters(chassis_uuid, associated,
+                                                   maintenance)
+            node_filters.update(filters)
+            nodes = pecan.request.dbapi.get_node_list(node_filters, limit,
                                                       marker_obj,
                                                       sort_key=sort_key,
                                                       sort_dir=sort_dir)
 
-        parameters = {'sort_key': sort_key, 'sort_dir': sort_dir}
+        parameters = dict(filters, sort_key=sort_key, sort_dir=sort_dir)
         if associated:
             parameters['associated'] = associated
         if maintenance:
@@ -539,6 +742,49 @@ class NodesController(rest.RestController):
                                                  expand=expand,
                                                  **parameters)
 
+    def _get_nodes_filters(self, chassis_uuid, associated, maintenance):
+        filters = {}
+        if chassis_uuid:
+            filters['chassis_uuid'] = chassis_uuid
+        if associated is not None:
+            filters['associated'] = associated
+        if maintenance is not None:
+            filters['maintenance'] = maintenance
+        return filters
+
+    def _get_nodes_batches(self, filters, sort_key, sort_dir):
+        """Read the nodes matching the filters, one batch at a time.
+
+        The request attributes needed are captured up front because the
+        batches are consumed while the response body is being written,
+        after the controller has returned.
+        """
+        dbapi = pecan.request.dbapi
+        url = pecan.request.host_url
+        batch_size = CONF.api.stream_batch_size
+        chassis_uuids = {}
+        marker = None
+        while True:
+            rpc_nodes = dbapi.get_node_list(filters, batch_size, marker,
+                                            sort_key=sort_key,
+                                            sort_dir=sort_dir)
+            nodes = []
+            for rpc_node in rpc_nodes:
+                node_dict = rpc_node.as_dict()
+                chassis_id = node_dict.pop('chassis_id', None)
+                node = Node(**node_dict)
+                if chassis_id:
+                    if chassis_id not in chassis_uuids:
+                        chassis = dbapi.get_chassis(chassis_id)
+                        chassis_uuids[chassis_id] = chassis.uuid
+                    node._chassis_uuid = chassis_uuids[chassis_id]
+                nodes.append(Node._convert_with_links(node, url, expand=True))
+            yield nodes
+
+            if len(rpc_nodes) < batch_size:
+                return
+            marker = rpc_nodes[-1]
+
     def _get_nodes_by_instance(self, instance_uuid):
         """Retrieve a node by its instance uuid.
 
@@ -552,10 +798,13 @@ class NodesController(rest.RestController):
 
     @wsme_pecan.wsexpose(NodeCollection, types.uuid, types.uuid,
                types.boolean, types.boolean, types.uuid, int, wtypes.text,
-               wtypes.text)
+               wtypes.text, wtypes.text, int, int, int, wtypes.text,
+               wtypes.text, wtypes.text, types.boolean)
     def get_all(self, chassis_uuid=None, instance_uuid=None, associated=None,
                 maintenance=None, marker=None, limit=None, sort_key='id',
-                sort_dir='asc'):
+                sort_dir='asc', cpu_arch=None, min_cpus=None,
+                min_memory_mb=None, min_local_gb=None, driver=None,
+                provision_state=None, power_state=None, reserved=None):
         """Retrieve a list of nodes.
 
         :param chassis_uuid: Optional UUID of a chassis, to get only nodes for
@@ -572,17 +821,44 @@ class NodesController(rest.RestController):
         :param limit: maximum number of resources to return in a single result.
         :param sort_key: column to sort results by. Default: id.
         :param sort_dir: direction to sort. "asc" or "desc". Default: asc.
+        :param cpu_arch: Optional CPU architecture, to get only nodes with
+                         that cpu_arch property.
+        :param min_cpus: Optional, to get only nodes with at least this
+                         number of CPUs.
+        :param min_memory_mb: Optional, to get only nodes with at least this
+                              much memory, in MiB.
+        :param min_local_gb: Optional, to get only nodes with at least this
+                             much local disk, in GiB.
+        :param driver: Optional name of a driver, to get only nodes using
+                       that driver.
+        :param provision_state: Optional provision state, to get only nodes
+                                in that state.
+        :param power_state: Optional power state, to get only nodes in that
+                            state.
+        :param reserved: Optional boolean whether to get nodes locked by a
+                         conductor ("True"), or not locked ("False").
         """
         return self._get_nodes_collection(chassis_uuid, instance_uuid,
                                           associated, maintenance, marker,
-                                          limit, sort_key, sort_dir)
+                                          limit, sort_key, sort_dir,
+                                          cpu_arch=cpu_arch,
+                                          min_cpus=min_cpus,
+                                          min_memory_mb=min_memory_mb,
+                                          min_local_gb=min_local_gb,
+                                          driver=driver,
+                                          provision_state=provision_state,
+                                          power_state=power_state,
+                                          reserved=reserved)
 
     @wsme_pecan.wsexpose(NodeCollection, types.uuid, types.uuid,
             types.boolean, types.boolean, types.uuid, int, wtypes.text,
-            wtypes.text)
+            wtypes.text, wtypes.text, int, int, int, wtypes.text,
+            wtypes.text, wtypes.text, types.boolean)
     def detail(self, chassis_uuid=None, instance_uuid=None, associated=None,
                maintenance=None, marker=None, limit=None, sort_key='id',
-               sort_dir='asc'):
+               sort_dir='asc', cpu_arch=None, min_cpus=None,
+               min_memory_mb=None, min_local_gb=None, driver=None,
+               provision_state=None, power_state=None, reserved=None):
         """Retrieve a list of nodes with detail.
 
         :param chassis_uuid: Optional UUID of a chassis, to get only nodes for
@@ -599,6 +875,22 @@ class NodesController(rest.RestController):
         :param limit: maximum number of resources to return in a single result.
         :param sort_key: column to sort results by. Default: id.
         :param sort_dir: direction to sort. "asc" or "desc". Default: asc.
+        :param cpu_arch: Optional CPU architecture, to get only nodes with
+                         that cpu_arch property.
+        :param min_cpus: Optional, to get only nodes with at least this
+                         number of CPUs.
+        :param min_memory_mb: Optional, to get only nodes with at least this
+                              much memory, in MiB.
+        :param min_local_gb: Optional, to get only nodes with at least this
+                             much local disk, in GiB.
+        :param driver: Optional name of a driver, to get only nodes using
+                       that driver.
+        :param provision_state: Optional provision state, to get only nodes
+                                in that state.
+        :param power_state: Optional power state, to get only nodes in that
+                            state.
+        :param reserved: Optional boolean whether to get nodes locked by a
+                         conductor ("True"), or not locked ("False").
         """
         # /detail should only work agaist collections
         parent = pecan.request.path.split('/')[:-1][-1]
@@ -610,7 +902,167 @@ class NodesController(rest.RestController):
         return self._get_nodes_collection(chassis_uuid, instance_uuid,
                                           associated, maintenance, marker,
                                           limit, sort_key, sort_dir, expand,
-                                          resource_url)
+                                          resource_url, cpu_arch=cpu_arch,
+                                          min_cpus=min_cpus,
+                                          min_memory_mb=min_memory_mb,
+                                          min_local_gb=min_local_gb,
+                                          driver=driver,
+                                          provision_state=provision_state,
+                                          power_state=power_state,
+                                          reserved=reserved)
+
+    @pecan.expose()
+    def export(self, chassis_uuid=None, associated=None, maintenance=None,
+               sort_key='id', sort_dir='asc'):
+        """Retrieve all the nodes with detail as a single streamed document.
+
+        Unlike detail, the result is not paginated. Nodes are read from the
+        database in batches of [api]stream_batch_size and written to the
+        client as they are converted, so the memory used does not grow with
+        the size of the collection.
+
+        :param chassis_uuid: Optional UUID of a chassis, to get only nodes for
+                           that chassis.
+        :param associated: Optional boolean whether to return a list of
+                           associated or unassociated nodes.
+        :param maintenance: Optional boolean value that indicates whether
+                            to get nodes in maintenance mode ("True"), or not
+                            in maintenance mode ("False").
+        :param sort_key: column to sort results by. Default: id.
+        :param sort_dir: direction to sort. "asc" or "desc". Default: asc.
+        """
+        # /export should only work agaist collections
+        parent = pecan.request.path.split('/')[:-1][-1]
+        if parent != "nodes":
+            pecan.abort(404)
+
+        # NOTE: errors must be detected before the first chunk is sent,
+        #       afterwards the status code can not be changed anymore.
+        try:
+            if chassis_uuid is not None:
+                chassis_uuid = types.uuid.validate(chassis_uuid)
+            if associated is not None:
+                associated = types.boolean.validate(associated)
+            if maintenance is not None:
+                maintenance = types.boolean.validate(maintenance)
+            sort_dir = api_utils.validate_sort_dir(sort_dir)
+            filters = self._get_nodes_filters(chassis_uuid, associated,
+                                              maintenance)
+            batches = self._get_nodes_batches(filters, sort_key, sort_dir)
+            first = next(batches)
+        except wsme.exc.ClientSideError as e:
+            pecan.abort(e.code, e.faultstring)
+        except exception.IronicException as e:
+            pecan.abort(e.code, six.text_type(e))
+        except db_utils.InvalidSortKey:
+            pecan.abort(400, _("Invalid sort key: %s") % sort_key)
+
+        def _batches():
+            yield first
+            try:
+                for batch in batches:
+                    yield batch
+            except Exception:
+                with excutils.save_and_reraise_exception():
+                    LOG.exception(_("Error while streaming the node "
+                                    "collection."))
+
+        pecan.response.content_type = 'application/json'
+        pecan.response.app_iter = collection.stream('nodes', Node,
+                                                    _batches())
+        return pecan.response
+
+    @wsme_pecan.wsexpose(NodeEventCollection, wtypes.text, int, int)
+    def watch(self, node_uuids=None, since=None, wait=None):
+        """Watch the power and provision state changes of nodes.
+
+        Without a cursor, no change is returned, only the cursor to use
+        in the following requests. With a cursor, the changes recorded
+        after it are returned, at most [api]max_limit of them; if there
+        are none, the request waits up to the given number of seconds for
+        one to happen. Clients should read the state of the nodes they
+        are interested in only after getting their first cursor, and
+        again with a new cursor when the changes following theirs were
+        deleted.
+
+        A waiting request holds an API thread and queries the database
+        every [api]poll_interval seconds.
+
+        :param node_uuids: Optional comma-separated list of node UUIDs, to
+                           only watch the changes of those nodes.
+        :param since: the cursor returned by the previous request.
+        :param wait: Optional, the number of seconds to wait for a change.
+                     This is capped by the max_watch_wait configuration
+                     option.
+        :raises: NodeEventCursorExpired (HTTP 410) if the changes following
+                 the cursor were deleted.
+        """
+        # /watch should only work agaist collections
+        parent = pecan.request.path.split('/')[:-1][-1]
+        if parent != "nodes" or self._from_chassis:
+            raise exception.HTTPNotFound
+
+        if node_uuids is not None:
+            node_uuids = [types.uuid.validate(u.strip())
+                          for u in node_uuids.split(',')]
+        if since is not None and since < 0:
+            raise wsme.exc.ClientSideError(
+                    _("The since parameter must be a positive integer."))
+        if wait is not None and wait < 0:
+            raise wsme.exc.ClientSideError(
+                    _("The wait parameter must be a positive integer."))
+
+        dbapi = pecan.request.dbapi
+        commit_window = CONF.api.node_event_commit_window
+        id_increment = CONF.api.node_event_id_increment
+        if since is None:
+            return NodeEventCollection(
+                    events=[],
+                    cursor=dbapi.get_last_node_event_id(commit_window,
+                                                        id_increment))
+
+        if since < dbapi.get_pruned_node_event_id():
+            raise exception.NodeEventCursorExpired(cursor=since)
+
+        limit = CONF.api.max_limit
+        deadline = time.time() + min(wait or 0, CONF.api.max_watch_wait)
+        while True:
+            # NOTE: read before the events, so the cursor can skip the
+            #       changes of the other nodes without missing any. The
+            #       changes recorded after a missing one, which may still
+            #       be committed, are left for the next requests.
+            last_id = max(since, dbapi.get_last_node_event_id(commit_window,
+                                                              id_increment))
+            events = dbapi.get_node_events(since, node_uuids, limit=limit,
+                                           until=last_id)
+            if events or time.time() >= deadline:
+                break
+            time.sleep(CONF.api.poll_interval)
+
+        if len(events) == limit:
+            cursor = events[-1].id
+        else:
+            cursor = last_id
+        return NodeEventCollection(
+                events=[NodeEvent.convert(e) for e in events], cursor=cursor)
+
+    @wsme_pecan.wsexpose(NodeStats)
+    def stats(self):
+        """Count the nodes per provision state, power state, driver,
+        maintenance mode and chassis.
+
+        The counts may be up to [api]node_stats_cache_ttl seconds old.
+        """
+        # /stats should only work agaist collections
+        parent = pecan.request.path.split('/')[:-1][-1]
+        if parent != "nodes" or self._from_chassis:
+            raise exception.HTTPNotFound
+
+        now = time.time()
+        if _NODE_STATS['expires_at'] <= now:
+            _NODE_STATS['stats'] = pecan.request.dbapi.get_node_stats()
+            _NODE_STATS['expires_at'] = now + CONF.api.node_stats_cache_ttl
+        return NodeStats.convert(_NODE_STATS['stats'])
 
     @wsme_pecan.wsexpose(wtypes.text, types.uuid)
     def validate(self, node_uuid):
@@ -663,6 +1115,66 @@ class NodesController(rest.RestController):
         new_node.create()
         return Node.convert_with_links(new_node)
 
+    @wsme_pecan.wsexpose(NodeEnrollmentResultCollection,
+                         body=[NodeEnrollment])
+    def bulk(self, nodes):
+        """Create several nodes, along with their ports.
+
+        The nodes are validated in one pass and inserted in batches of
+        [api]bulk_batch_size nodes per transaction. A node conflicting with
+        an existing node or port, or with another node of the request, is
+        not created; the other nodes are, and the result of each node is
+        returned in the order they were submitted.
+
+        :param nodes: a list of nodes, each with a list of ports, within the
+                      request body.
+        """
+        if self._from_chassis:
+            raise exception.OperationNotPermitted
+
+        max_nodes = CONF.api.max_limit
+        if len(nodes) > max_nodes:
+            raise wsme.exc.ClientSideError(
+                    _("At most %d nodes can be enrolled at once.") % max_nodes)
+
+        results = []
+        values = []
+        for node in nodes:
+            if not node.uuid:
+                node.uuid = utils.generate_uuid()
+            ports = node.ports or []
+            for port in ports:
+                if not port.uuid:
+                    port.uuid = utils.generate_uuid()
+            result = NodeEnrollmentResult(uuid=node.uuid, ports=ports)
+            results.append(result)
+
+            try:
+                pecan.request.rpcapi.get_topic_for(node)
+            except exception.NoValidHost as e:
+                result.error = six.text_type(e)
+                continue
+            node_values = dict((k, v) for k, v in node.as_dict().items()
+                               if k in objects.Node.fields)
+            node_values['ports'] = [p.as_dict() for p in ports]
+            values.append((result, node_values))
+
+        errors = pecan.request.dbapi.create_nodes(
+                        [v for r, v in values],
+                        batch_size=CONF.api.bulk_batch_size)
+        url = pecan.request.host_url
+        for (result, node_values), error in zip(values, errors):
+            if error is not None:
+                result.error = six.text_type(error)
+                continue
+            result.links = [link.Link.make_link('self', url, 'nodes',
+                                                result.uuid),
+                            link.Link.make_link('bookmark', url, 'nodes',
+                                                result.uuid, bookmark=True)
+                           ]
+
+        return NodeEnrollmentResultCollection(nodes=results)
+
     @wsme.validate(types.uuid, [NodePatchType])
     @wsme_pecan.wsexpose(Node, types.uuid, body=[NodePatchType])
     def patch(self, node_uuid, patch):
@@ -674,7 +1186,7 @@ class NodesController(rest.RestController):
         if self._from_chassis:
             raise exception.OperationNotPermitted
 
-        rpc_node = objects.Node.get_by_uuid(pecan.request.context, node_uuid)
+        rpc_node = _get_node_for_update(node_uuid)
 
         # Check if node is transitioning state
         if rpc_node['target_power_state'] or \
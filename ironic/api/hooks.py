@@ -38,6 +38,12 @@ class DBHook(hooks.PecanHook):
 
     def before(self, state):
         state.request.dbapi = dbapi.get_instance()
+        state.request.dbapi.use_replica_reads(True)
+
+    def after(self, state):
+        # NOTE: the after hooks also run if routing the request failed,
+        #       before the dbapi was attached to it.
+        dbapi.get_instance().use_replica_reads(False)
 
 
 class ContextHook(hooks.PecanHook):
@@ -122,12 +128,13 @@ class NoExceptionTracebackHook(hooks.PecanHook):
     # catches and handles all the errors, so 'on_error' dedicated for unhandled
     # exceptions never fired.
     def after(self, state):
-        # Omit empty body. Some errors may not have body at this level yet.
-        if not state.response.body:
+        # Do nothing if there is no error. This is checked first so that
+        # streamed (app_iter) responses are not read into memory here.
+        if 200 <= state.response.status_int < 400:
             return
 
-        # Do nothing if there is no error.
-        if 200 <= state.response.status_int < 400:
+        # Omit empty body. Some errors may not have body at this level yet.
+        if not state.response.body:
             return
 
         json_body = state.response.json
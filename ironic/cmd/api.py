@@ -21,41 +21,39 @@ import logging
 import sys
 
 from oslo.config import cfg
-from six.moves import socketserver
-from wsgiref import simple_server
 
 from ironic.api import app
+from ironic.common import exception
 from ironic.common import service as ironic_service
 from ironic.openstack.common import log
+from ironic.openstack.common import service
 
 CONF = cfg.CONF
 
 
-class ThreadedSimpleServer(socketserver.ThreadingMixIn,
-                           simple_server.WSGIServer):
-    """A Mixin class to make the API service greenthread-able."""
-    pass
-
-
 def main():
     # Pase config file and command line options, then start logging
     ironic_service.prepare_service(sys.argv)
 
-    # Build and start the WSGI app
+    if CONF.api.workers < 1:
+        raise exception.ConfigInvalid(
+                error_msg=_('[api]workers must be at least 1, got %d.') %
+                          CONF.api.workers)
+
+    # Build the WSGI app and bind the listening socket before forking any
+    # worker, so that all the workers share it.
     host = CONF.api.host_ip
     port = CONF.api.port
-    wsgi = simple_server.make_server(
-            host, port,
-            app.VersionSelectorApplication(),
-            server_class=ThreadedSimpleServer)
+    server = ironic_service.WSGIService('ironic-api',
+                                        app.VersionSelectorApplication(),
+                                        host, port)
 
     LOG = log.getLogger(__name__)
-    LOG.info(_("Serving on http://%(host)s:%(port)s") %
-             {'host': host, 'port': port})
+    LOG.info(_("Serving on http://%(host)s:%(port)s with %(workers)d "
+               "worker(s)") %
+             {'host': host, 'port': port, 'workers': CONF.api.workers})
     LOG.info(_("Configuration:"))
     CONF.log_opt_values(LOG, logging.INFO)
 
-    try:
-        wsgi.serve_forever()
-    except KeyboardInterrupt:
-        pass
+    launcher = service.launch(server, workers=CONF.api.workers)
+    launcher.wait()
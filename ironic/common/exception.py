@@ -158,6 +158,15 @@ class ImageConvertFailed(IronicException):
     message = _("Image %(image_id)s is unacceptable: %(reason)s")
 
 
+class ImageDownloadFailed(IronicException):
+    message = _("Failed to download images: %(reason)s")
+
+
+class ImageChecksumMismatch(IronicException):
+    message = _("Downloaded image %(image_id)s has checksum %(actual)s, "
+                "expected %(expected)s.")
+
+
 # Cannot be templated as the error syntax varies.
 # msg needs to be constructed when raised.
 class InvalidParameterValue(Invalid):
@@ -189,6 +198,15 @@ class NodeNotFound(NotFound):
     message = _("Node %(node)s could not be found.")
 
 
+class NodeAlreadyExists(Conflict):
+    message = _("A node with UUID %(uuid)s already exists.")
+
+
+class NodeVersionConflict(Conflict):
+    message = _("Node %(node)s was modified by another request, version "
+                "%(version)s was expected. Please read it again and retry.")
+
+
 class NodeAssociated(InvalidState):
     message = _("Node %(node)s is associated with instance %(instance)s.")
 
@@ -205,6 +223,16 @@ class FailedToUpdateMacOnPort(IronicException):
     message = _("Update MAC address on port: %(port_id)s failed.")
 
 
+class JobNotFound(NotFound):
+    message = _("Job %(job)s could not be found.")
+
+
+class NodeEventCursorExpired(IronicException):
+    message = _("The node events following cursor %(cursor)s were deleted. "
+                "Read the state of the nodes again and get a new cursor.")
+    code = 410
+
+
 class ChassisNotFound(NotFound):
     message = _("Chassis %(chassis)s could not be found.")
 
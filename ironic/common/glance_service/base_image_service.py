@@ -15,9 +15,11 @@
 #    under the License.
 
 
+import collections
+import copy
 import functools
+import hashlib
 import logging
-import shutil
 import sys
 import time
 
@@ -25,7 +27,9 @@ from glanceclient import client
 import six.moves.urllib.parse as urlparse
 
 from ironic.common import exception
+from ironic.common.glance_service import downloader
 from ironic.common.glance_service import service_utils
+from ironic.common import utils
 
 from oslo.config import cfg
 
@@ -33,6 +37,17 @@ from oslo.config import cfg
 LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 
+# The glance clients whose connections are shared by the image services
+# of this process, by version, endpoint and SSL options, least recently
+# used first. They hold no token.
+_CLIENTS = collections.OrderedDict()
+_MAX_CLIENTS = 32
+
+# The metadata of the images shown by this process, by version and image
+# id: (time cached, glance image, metadata), least recently cached first.
+_IMAGE_METADATA = collections.OrderedDict()
+_MAX_IMAGE_METADATA = 1024
+
 
 def _translate_image_exception(image_id, exc_value):
     if isinstance(exc_value, (exception.Forbidden,
@@ -80,18 +95,107 @@ def check_image_service(func):
         if CONF.glance.auth_strategy == 'keystone':
             params['token'] = self.context.auth_token
         endpoint = '%s://%s:%s' % (scheme, self.glance_host, self.glance_port)
-        self.client = client.Client(self.version,
-                                    endpoint, **params)
+        self.client = _get_client(self.version, endpoint, params)
+        self.endpoint = endpoint
         return func(self, *args, **kwargs)
     return wrapper
 
 
+def _get_client(version, endpoint, params):
+    """Return a glance client sharing the connections of the other ones.
+
+    The clients are pooled by version, endpoint and SSL options. Since
+    the token differs for each request context, a client with a token is
+    created for it, which uses the connections of the pooled client.
+    """
+    params = dict(params)
+    token = params.pop('token', None)
+    key = (version, endpoint, tuple(sorted(params.items())))
+    shared_client = _CLIENTS.pop(key, None)
+    if shared_client is None:
+        shared_client = client.Client(version, endpoint, **params)
+        while len(_CLIENTS) >= _MAX_CLIENTS:
+            _CLIENTS.popitem(last=False)
+    _CLIENTS[key] = shared_client
+    if token is None:
+        return shared_client
+
+    glance_client = client.Client(version, endpoint, token=token, **params)
+    session = getattr(shared_client.http_client, 'session', None)
+    # NOTE: glanceclients without a requests session can not share their
+    #       connections.
+    if session is not None:
+        for prefix, adapter in session.adapters.items():
+            glance_client.http_client.session.mount(prefix, adapter)
+    return glance_client
+
+
+def _get_cached_image(version, image_id):
+    """Return the cached glance image and its metadata, or None."""
+    entry = _IMAGE_METADATA.get((version, image_id))
+    if entry is None:
+        return None
+    cached_at, image, image_meta = entry
+    if time.time() - cached_at >= CONF.glance.glance_metadata_cache_ttl:
+        _IMAGE_METADATA.pop((version, image_id), None)
+        return None
+    return image, image_meta
+
+
+def _cache_image(version, image_id, image, image_meta):
+    if CONF.glance.glance_metadata_cache_ttl <= 0:
+        return
+    _IMAGE_METADATA.pop((version, image_id), None)
+    while len(_IMAGE_METADATA) >= _MAX_IMAGE_METADATA:
+        _IMAGE_METADATA.popitem(last=False)
+    _IMAGE_METADATA[(version, image_id)] = (time.time(), image, image_meta)
+
+
+def _file_chunks(f):
+    return iter(lambda: f.read(downloader.CHUNK_SIZE), b'')
+
+
+def _write_chunks(image_id, chunks, data, checksum=None):
+    """Write the chunks of an image, verifying them against checksum.
+
+    :param data: file object to write the chunks to, or None to only
+                 verify them.
+    """
+    md5 = hashlib.md5()
+    for chunk in chunks:
+        if checksum:
+            md5.update(chunk)
+        if data is not None:
+            data.write(chunk)
+    if checksum:
+        downloader.verify_checksum(image_id, md5, checksum)
+
+
+def _forget_image(image_id, checksum=None):
+    """Remove an image from the metadata cache.
+
+    :param checksum: if set, the image is only removed if its cached
+                     checksum is different.
+    """
+    for version in (1, 2):
+        entry = _IMAGE_METADATA.get((version, image_id))
+        if entry is None or (checksum is not None and
+                             entry[2].get('checksum') == checksum):
+            continue
+        del _IMAGE_METADATA[(version, image_id)]
+        if checksum is not None:
+            LOG.info(_("Checksum of image %s changed, forgetting its "
+                       "cached metadata.") % image_id)
+
+
 class BaseImageService(object):
 
     def __init__(self, client=None, version=1, context=None):
         self.client = client
         self.version = version
         self.context = context
+        # the endpoint of the client, if it was created by the service
+        self.endpoint = None
 
     def call(self, method, *args, **kwargs):
         """Call a glance client method.
@@ -184,20 +288,38 @@ class BaseImageService(object):
         (image_id, self.glance_host,
          self.glance_port, use_ssl) = service_utils.parse_image_ref(image_href)
 
-        image = self.call(method, image_id)
+        # NOTE: the metadata of images is cached for
+        #       [glance]glance_metadata_cache_ttl seconds, the access of
+        #       the context to the image is still checked.
+        cached = _get_cached_image(self.version, image_id)
+        if cached is not None:
+            image, base_image_meta = cached
+        else:
+            image = self.call(method, image_id)
+            base_image_meta = None
 
         if not service_utils.is_image_available(self.context, image):
             raise exception.ImageNotFound(image_id=image_id)
 
-        base_image_meta = service_utils.translate_from_glance(image)
-        return base_image_meta
+        if base_image_meta is None:
+            base_image_meta = service_utils.translate_from_glance(image)
+            _cache_image(self.version, image_id, image, base_image_meta)
+        return copy.deepcopy(base_image_meta)
 
     @check_image_service
-    def _download(self, image_id, data=None, method='data'):
+    def _download(self, image_id, data=None, method='data', path=None,
+                  checksum=None):
         """Calls out to Glance for data and writes data.
 
         :param image_id: The opaque image identifier.
         :param data: (Optional) File object to write data to.
+        :param path: (Optional) Path of the file to write the image to.
+                     Images stored in files this host can read are linked
+                     or copied there without reading them. If data is
+                     also given, path is only used for such images.
+        :param checksum: (Optional) The MD5 the image written must match.
+        :returns: True if the image was written to path.
+        :raises: ImageChecksumMismatch if the image does not match checksum.
         """
         (image_id, self.glance_host,
          self.glance_port, use_ssl) = service_utils.parse_image_ref(image_id)
@@ -208,24 +330,59 @@ class BaseImageService(object):
             location = self._get_location(image_id)
             url = urlparse.urlparse(location)
             if url.scheme == "file":
-                with open(url.path, "r") as f:
-                    #TODO(ghe): Use system call for downloading files.
-                    # Bug #1199522
-
-                    # FIXME(jbresnah) a system call to cp could have
-                    # significant performance advantages, however we
-                    # do not have the path to files at this point in
-                    # the abstraction.
-                    shutil.copyfileobj(f, data)
+                if path is not None:
+                    how = utils.copy_file(
+                            url.path, path,
+                            hardlink=CONF.glance.allow_direct_url_hardlinks)
+                    LOG.debug(_("Image %(image)s copied from %(source)s to "
+                                "%(path)s by %(how)s.") %
+                              {'image': image_id, 'source': url.path,
+                               'path': path, 'how': how})
+                    if checksum:
+                        with open(path, 'rb') as f:
+                            _write_chunks(image_id, _file_chunks(f), None,
+                                          checksum)
+                    return True
+                with open(url.path, "rb") as f:
+                    # NOTE: callers passing a path let the file be copied
+                    #       without reading it.
+                    _write_chunks(image_id, _file_chunks(f), data, checksum)
                 return
 
+        if data is None and path is not None:
+            with open(path, 'wb') as image_file:
+                self._download_data(image_id, image_file, method, checksum)
+            return True
+        return self._download_data(image_id, data, method, checksum)
+
+    def _download_data(self, image_id, data, method, checksum=None):
+        if data is not None and self.endpoint is not None:
+            glance_checksum = downloader.download(self._get_source(image_id),
+                                                  data, checksum)
+            if glance_checksum:
+                _forget_image(image_id, glance_checksum)
+            return
+
         image_chunks = self.call(method, image_id)
 
         if data is None:
             return image_chunks
         else:
-            for chunk in image_chunks:
-                data.write(chunk)
+            _write_chunks(image_id, image_chunks, data, checksum)
+
+    def _get_source(self, image_id):
+        """Return the HTTPImageSource of the data of an image."""
+        if self.version == 1:
+            path = '/v1/images/%s'
+        else:
+            path = '/v2/images/%s/file'
+        url = self.endpoint + path % urlparse.quote(str(image_id))
+        auth_token = None
+        if CONF.glance.auth_strategy == 'keystone':
+            auth_token = self.context.auth_token
+        return downloader.HTTPImageSource(
+                image_id, url, auth_token=auth_token,
+                insecure=CONF.glance.glance_api_insecure)
 
     @check_image_service
     def _create(self, image_meta, data=None, method='create'):
@@ -271,6 +428,7 @@ class BaseImageService(object):
         #NOTE(bcwaldon): id is not an editable field, but it is likely to be
         # passed in by calling code. Let's be nice and ignore it.
         image_meta.pop('id', None)
+        _forget_image(image_id)
 
         image_meta = self.call(method, image_id, **image_meta)
 
@@ -294,4 +452,5 @@ class BaseImageService(object):
         (image_id, glance_host,
          glance_port, use_ssl) = service_utils.parse_image_ref(image_id)
 
+        _forget_image(image_id)
         self.call(method, image_id)
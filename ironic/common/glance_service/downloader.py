@@ -0,0 +1,328 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Resumable, checksum-verified downloads of image data from glance.
+"""
+
+import hashlib
+import socket
+import ssl
+import time
+
+from eventlet import greenpool
+from oslo.config import cfg
+from six.moves import http_client
+import six.moves.urllib.parse as urlparse
+
+from ironic.common import exception
+from ironic.openstack.common import excutils
+from ironic.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _BrokenDownload(Exception):
+    """The connection to glance failed or broke, the download can resume."""
+
+
+class ImageResponse(object):
+    """The response of glance to a request for image data."""
+
+    def __init__(self, connection, response):
+        self._connection = connection
+        self._response = response
+        # offset in the image of the first byte of the response
+        self.start = 0
+        # size of the image, if known
+        self.size = None
+        content_range = response.getheader('content-range')
+        try:
+            if (response.status == http_client.PARTIAL_CONTENT and
+                    content_range):
+                # bytes <first>-<last>/<size>
+                byte_range, sep, size = (content_range.partition(' ')[2]
+                                         .partition('/'))
+                self.start = int(byte_range.partition('-')[0])
+                if size != '*':
+                    self.size = int(size)
+            elif response.getheader('content-length') is not None:
+                self.size = int(response.getheader('content-length'))
+        except ValueError:
+            self.close()
+            raise exception.ImageDownloadFailed(
+                    reason=_("invalid Content-Range %s") % content_range)
+        self.checksum = (response.getheader('x-image-meta-checksum') or
+                         response.getheader('content-md5'))
+        self.ranges = response.getheader('accept-ranges') == 'bytes'
+
+    def chunks(self):
+        while True:
+            chunk = self._response.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self._response.close()
+        self._connection.close()
+
+
+class HTTPImageSource(object):
+    """The data of an image served by the glance API."""
+
+    def __init__(self, image_id, url, auth_token=None, insecure=False):
+        """Constructor.
+
+        :param image_id: the image, for error messages.
+        :param url: the URL of the image data.
+        :param auth_token: the token to authenticate with, if any.
+        :param insecure: whether not to verify the certificate of glance.
+        """
+        self.image_id = image_id
+        url = urlparse.urlparse(url)
+        self.host = url.hostname
+        self.port = url.port
+        self._use_ssl = url.scheme == 'https'
+        self._path = url.path
+        self._insecure = insecure
+        self._headers = {'User-Agent': 'ironic'}
+        if auth_token:
+            self._headers['X-Auth-Token'] = auth_token
+
+    def _connect(self):
+        timeout = CONF.glance.glance_download_timeout
+        if not self._use_ssl:
+            return http_client.HTTPConnection(self.host, self.port,
+                                              timeout=timeout)
+        kwargs = {}
+        if self._insecure and hasattr(ssl, 'create_default_context'):
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            kwargs['context'] = context
+        return http_client.HTTPSConnection(self.host, self.port,
+                                           timeout=timeout, **kwargs)
+
+    def open(self, start=0, end=None):
+        """Request the bytes of the image from start up to end.
+
+        :returns: an ImageResponse, which holds all the image if glance
+                  does not support ranged requests.
+        :raises: _BrokenDownload if the request failed and can be retried.
+        :raises: ImageNotAuthorized, ImageNotFound, ImageDownloadFailed.
+        """
+        headers = dict(self._headers)
+        if start or end is not None:
+            headers['Range'] = 'bytes=%d-%s' % (
+                    start, '' if end is None else end - 1)
+        connection = self._connect()
+        try:
+            connection.request('GET', self._path, headers=headers)
+            response = connection.getresponse()
+        except (socket.error, http_client.HTTPException) as e:
+            connection.close()
+            raise _BrokenDownload(e)
+
+        status = response.status
+        if status in (http_client.OK, http_client.PARTIAL_CONTENT):
+            return ImageResponse(connection, response)
+        response.close()
+        connection.close()
+        if status in (http_client.UNAUTHORIZED, http_client.FORBIDDEN):
+            raise exception.ImageNotAuthorized(image_id=self.image_id)
+        if status == http_client.NOT_FOUND:
+            raise exception.ImageNotFound(image_id=self.image_id)
+        reason = _("glance returned HTTP status %d") % status
+        if status >= http_client.INTERNAL_SERVER_ERROR:
+            raise _BrokenDownload(reason)
+        raise exception.ImageDownloadFailed(reason=reason)
+
+
+class _Segment(object):
+    """A range of the image downloaded over one connection."""
+
+    def __init__(self, start, end):
+        # next byte to write
+        self.offset = start
+        self.end = end
+        self.resumes = 0
+
+    @property
+    def done(self):
+        return self.end is not None and self.offset >= self.end
+
+
+def verify_checksum(image_id, md5, checksum):
+    """Check that an image matches its checksum.
+
+    :param image_id: the image, for error messages.
+    :param md5: the MD5 hash object the image data was fed to.
+    :param checksum: the expected MD5 hex digest.
+    :raises: ImageChecksumMismatch if the image is corrupted.
+    """
+    actual = md5.hexdigest()
+    if actual != checksum:
+        raise exception.ImageChecksumMismatch(image_id=image_id,
+                                              actual=actual,
+                                              expected=checksum)
+
+
+class _Download(object):
+
+    def __init__(self, source, data, checksum=None):
+        self._source = source
+        self._data = data
+        self._checksum = checksum
+        self._md5 = hashlib.md5()
+        self._parallel = False
+
+    def run(self):
+        first = _Segment(0, None)
+        response = self._open(first)
+        segments = self._split(response)
+        if len(segments) > 1:
+            self._fetch_parallel(segments, response)
+        else:
+            first.end = response.size
+            self._fetch(first, response)
+
+        for checksum in (response.checksum, self._checksum):
+            if checksum:
+                verify_checksum(self._source.image_id, self._md5, checksum)
+        return response.checksum
+
+    def _split(self, response):
+        streams = CONF.glance.glance_download_streams
+        min_size = CONF.glance.glance_download_stream_min_size * 1024 * 1024
+        size = response.size
+        # NOTE: the streams write at their offset in the file, and the
+        #       checksum is computed once they are done by reading the
+        #       file back.
+        if (streams <= 1 or size is None or size < min_size or
+                not response.ranges or not hasattr(self._data, 'seek') or
+                not getattr(self._data, 'name', None)):
+            return [_Segment(0, size)]
+        step = -(-size // streams)
+        return [_Segment(start, min(start + step, size))
+                for start in range(0, size, step)]
+
+    def _open(self, segment):
+        while True:
+            try:
+                return self._source.open(segment.offset, segment.end)
+            except _BrokenDownload as e:
+                self._resume(segment, e)
+
+    def _resume(self, segment, error):
+        segment.resumes += 1
+        if segment.resumes > CONF.glance.glance_download_resumes:
+            raise exception.GlanceConnectionFailed(host=self._source.host,
+                                                   port=self._source.port,
+                                                   reason=error)
+        LOG.warning(_("Download of image %(image)s broken at byte "
+                      "%(offset)d: %(error)s, resuming.") %
+                    {'image': self._source.image_id,
+                     'offset': segment.offset, 'error': error})
+        time.sleep(1)
+
+    def _fetch(self, segment, response):
+        """Write the bytes of segment, resuming the download if it breaks."""
+        while True:
+            if response is None:
+                response = self._open(segment)
+            try:
+                self._copy(segment, response)
+                if segment.done or segment.end is None:
+                    return
+                error = _("connection closed by glance")
+            except (socket.error, http_client.HTTPException) as e:
+                error = e
+            finally:
+                response.close()
+            response = None
+            self._resume(segment, error)
+
+    def _copy(self, segment, response):
+        if response.start > segment.offset:
+            raise exception.ImageDownloadFailed(
+                    reason=_("glance sent image %(image)s from byte "
+                             "%(start)d, byte %(offset)d was requested") %
+                    {'image': self._source.image_id,
+                     'start': response.start, 'offset': segment.offset})
+        # NOTE: glance sends the image from the start if it ignores the
+        #       range requested.
+        skip = segment.offset - response.start
+        for chunk in response.chunks():
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            chunk = chunk[skip:]
+            skip = 0
+            if segment.end is not None:
+                chunk = chunk[:segment.end - segment.offset]
+            self._write(segment.offset, chunk)
+            segment.offset += len(chunk)
+            if segment.done:
+                return
+
+    def _write(self, offset, chunk):
+        if self._parallel:
+            # NOTE: greenthreads only switch on network I/O, the writes of
+            #       the other streams can not come between seek and write.
+            self._data.seek(offset)
+        else:
+            self._md5.update(chunk)
+        self._data.write(chunk)
+
+    def _fetch_parallel(self, segments, response):
+        self._parallel = True
+        pool = greenpool.GreenPool(len(segments))
+        threads = [pool.spawn(self._fetch, segments[0], response)]
+        threads.extend(pool.spawn(self._fetch, segment, None)
+                       for segment in segments[1:])
+        try:
+            for thread in threads:
+                thread.wait()
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for thread in threads:
+                    thread.kill()
+
+        self._data.seek(segments[-1].end)
+        self._data.flush()
+        with open(self._data.name, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                self._md5.update(chunk)
+
+
+def download(source, data, checksum=None):
+    """Download an image and write it to a file.
+
+    The image is verified against the checksum sent by glance and, if
+    given, the expected checksum. Broken
+    downloads are resumed from the last byte written, up to
+    [glance]glance_download_resumes times. Large images are downloaded
+    over [glance]glance_download_streams connections when data is a file
+    and glance supports ranged requests.
+
+    :param source: the HTTPImageSource of the image.
+    :param data: file object to write the image to.
+    :param checksum: the expected MD5 of the image, if known.
+    :returns: the checksum of the image sent by glance, if any.
+    :raises: GlanceConnectionFailed if the download broke too many times.
+    :raises: ImageChecksumMismatch if the image is corrupted.
+    """
+    return _Download(source, data, checksum).run()
@@ -41,11 +41,18 @@ class ImageService(object):
         """
 
     @abc.abstractmethod
-    def download(self, image_id, data=None):
+    def download(self, image_id, data=None, path=None, checksum=None):
         """Calls out to Glance for data and writes data.
 
         :param image_id: The opaque image identifier.
         :param data: (Optional) File object to write data to.
+        :param path: (Optional) Path of the file to write the image to.
+                     Images stored in files this host can read are linked
+                     or copied there without reading them. If data is
+                     also given, path is only used for such images.
+        :param checksum: (Optional) The MD5 the image written must match.
+        :returns: True if the image was written to path.
+        :raises: ImageChecksumMismatch if the image does not match checksum.
         """
 
     @abc.abstractmethod
@@ -27,8 +27,9 @@ class GlanceImageService(base_image_service.BaseImageService,
     def show(self, image_id):
         return self._show(image_id, method='get')
 
-    def download(self, image_id, data=None):
-        return self._download(image_id, method='data', data=data)
+    def download(self, image_id, data=None, path=None, checksum=None):
+        return self._download(image_id, method='data', data=data,
+                              path=path, checksum=checksum)
 
     def create(self, image_meta, data=None):
         return self._create(image_meta, method='create', data=data)
@@ -26,7 +26,15 @@ glance_opts = [
                 default=[],
                 help='A list of URL schemes that can be downloaded directly '
                 'via the direct_url.  Currently supported schemes: '
-                '[file].')
+                '[file].'),
+    cfg.BoolOpt('allow_direct_url_hardlinks',
+                default=False,
+                help='Hardlink the images downloaded from file direct URLs '
+                     'when the glance store is on the same filesystem, '
+                     'instead of copying them. The images then share '
+                     'their data with the glance store, and are never '
+                     'removed from the master image caches, which only '
+                     'remove the images with one link.'),
 ]
 
 CONF = cfg.CONF
@@ -42,8 +50,9 @@ class GlanceImageService(base_image_service.BaseImageService,
     def show(self, image_id):
         return self._show(image_id, method='get')
 
-    def download(self, image_id, data=None):
-        return self._download(image_id, method='data', data=data)
+    def download(self, image_id, data=None, path=None, checksum=None):
+        return self._download(image_id, method='data', data=data,
+                              path=path, checksum=checksum)
 
     def create(self, image_meta, data=None):
         image_id = self._create(image_meta, method='create', data=None)['id']
@@ -35,6 +35,11 @@ glance_opts = [
                help='A list of the glance api servers available to ironic. '
                'Prefix with https:// for SSL-based glance API servers. '
                'Format is [hostname|IP]:port.'),
+    cfg.IntOpt('glance_api_version',
+               default=1,
+               help='Version of the glance API used to download images '
+                    'and read their metadata. Images are only copied from '
+                    'the allowed_direct_url_schemes with version 2.'),
     cfg.BoolOpt('glance_api_insecure',
                 default=False,
                 help='Allow to perform insecure SSL (https) requests to '
@@ -43,6 +48,30 @@ glance_opts = [
                default=0,
                help='Number of retries when downloading an image from '
                     'glance.'),
+    cfg.IntOpt('glance_download_resumes',
+               default=3,
+               help='Number of times an image download broken by a '
+                    'connection error is resumed from the last byte '
+                    'received.'),
+    cfg.IntOpt('glance_download_timeout',
+               default=60,
+               help='Seconds without data after which an image download '
+                    'is considered broken.'),
+    cfg.IntOpt('glance_download_streams',
+               default=1,
+               help='Number of connections used to download an image of '
+                    'at least glance_download_stream_min_size MiB, when '
+                    'glance supports ranged requests.'),
+    cfg.IntOpt('glance_download_stream_min_size',
+               default=1024,
+               help='Size in MiB from which an image is downloaded over '
+                    'glance_download_streams connections.'),
+    cfg.IntOpt('glance_metadata_cache_ttl',
+               default=300,
+               help='Seconds the metadata of an image is cached for after '
+                    'it is read from glance. It is read again earlier if '
+                    'a download shows that the checksum of the image '
+                    'changed. 0 disables the cache.'),
     cfg.StrOpt('auth_strategy',
                default='keystone',
                help='Default protocol to use when connecting to glance. '
@@ -61,7 +90,9 @@ def import_versioned_module(version, submodule=None):
     return importutils.import_module(module)
 
 
-def Service(client=None, version=1, context=None):
+def Service(client=None, version=None, context=None):
+    if version is None:
+        version = CONF.glance.glance_api_version
     module = import_versioned_module(version, 'image_service')
     service_class = getattr(module, 'GlanceImageService')
     return service_class(client, version, context)
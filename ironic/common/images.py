@@ -21,13 +21,16 @@ Handling of VM disk images.
 
 import os
 import re
+import tempfile
 
 from oslo.config import cfg
 
 from ironic.common import exception
 from ironic.common import image_service as service
+from ironic.common import qcow2
 from ironic.common import utils
 from ironic.openstack.common import fileutils
+from ironic.openstack.common import jsonutils
 from ironic.openstack.common import log as logging
 from ironic.openstack.common import strutils
 
@@ -37,11 +40,47 @@ image_opts = [
     cfg.BoolOpt('force_raw_images',
                 default=True,
                 help='Force backing images to raw format.'),
+    cfg.BoolOpt('convert_images_while_downloading',
+                default=True,
+                help='Convert qcow2 images to raw as they are downloaded, '
+                     'instead of storing them and converting them with '
+                     'qemu-img. Images using qcow2 features which can not '
+                     'be converted this way are still converted with '
+                     'qemu-img. Only used with force_raw_images.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(image_opts)
 
+# Bytes read from an image to probe its format.
+_PROBE_SIZE = 512
+
+# The formats other than raw qemu-img probes, with their signatures as
+# (format, offset, magic). Negative offsets are from the end of the
+# image. The images with one of them are probed with qemu-img, the
+# images with none of them, which are not vmdk descriptors either, are
+# raw.
+_QEMU_IMG_SIGNATURES = [
+    ('qcow2', 0, qcow2.MAGIC),          # not probed natively
+    ('qcow', 0, qcow2.MAGIC),
+    ('qed', 0, b'QED\0'),
+    ('vmdk', 0, b'KDMV'),
+    ('vmdk', 0, b'COWD'),
+    ('vpc', 0, b'conectix'),
+    ('vhdx', 0, b'vhdxfile'),
+    ('vdi', 0x40, b'\x7f\x10\xda\xbe'),
+    ('luks', 0, b'LUKS\xba\xbe'),
+    ('bochs', 0, b'Bochs Virtual HD Image'),
+    ('cloop', 0, b'#!/bin/sh\n#V2.0 Format\n'),
+    ('parallels', 0, b'WithoutFreeSpace'),
+    ('parallels', 0, b'WithouFreSpacExt'),
+    ('cow', 0, b'OOOM'),
+    ('dmg', -512, b'koly'),
+]
+
+# The longest backing file name qemu accepts in a qcow2 image.
+_MAX_BACKING_FILE_SIZE = 1023
+
 
 class QemuImgInfo(object):
     BACKING_FILE_RE = re.compile((r"^(.*?)\s*\(actual\s+path\s*:"
@@ -49,8 +88,11 @@ class QemuImgInfo(object):
     TOP_LEVEL_RE = re.compile(r"^([\w\d\s\_\-]+):(.*)$")
     SIZE_RE = re.compile(r"\(\s*(\d+)\s+bytes\s*\)", re.I)
 
-    def __init__(self, cmd_output=None):
-        details = self._parse(cmd_output or '')
+    def __init__(self, cmd_output=None, format='human'):
+        if format == 'json':
+            details = self._parse_json(cmd_output or '{}')
+        else:
+            details = self._parse(cmd_output or '')
         self.image = details.get('image')
         self.backing_file = details.get('backing_file')
         self.file_format = details.get('file_format')
@@ -134,15 +176,28 @@ class QemuImgInfo(object):
                 del lines_after[0]
         return real_details
 
+    def _parse_json(self, cmd_output):
+        # Output of qemu-img info --output=json, see qapi/block-core.json
+        # (ImageInfo) in the qemu sources.
+        details = jsonutils.loads(cmd_output)
+        snapshots = [{'id': snapshot.get('id'),
+                      'tag': snapshot.get('name'),
+                      'vm_size': snapshot.get('vm-state-size')}
+                     for snapshot in details.get('snapshots', [])]
+        return {'image': details.get('filename'),
+                'backing_file': details.get('backing-filename'),
+                'file_format': details.get('format'),
+                'virtual_size': details.get('virtual-size'),
+                'cluster_size': details.get('cluster-size'),
+                'disk_size': details.get('actual-size'),
+                'snapshot_list': snapshots,
+                'encryption': details.get('encrypted')}
+
     def _parse(self, cmd_output):
         # Analysis done of qemu-img.c to figure out what is going on here
         # Find all points start with some chars and then a ':' then a newline
         # and then handle the results of those 'top level' items in a separate
         # function.
-        #
-        # TODO(harlowja): newer versions might have a json output format
-        #                 we should switch to that whenever possible.
-        #                 see: http://bit.ly/XLJXDX
         contents = {}
         lines = [x for x in cmd_output.splitlines() if x.strip()]
         while lines:
@@ -164,8 +219,98 @@ def qemu_img_info(path):
         return QemuImgInfo()
 
     out, err = utils.execute('env', 'LC_ALL=C', 'LANG=C',
-                             'qemu-img', 'info', path)
-    return QemuImgInfo(out)
+                             'qemu-img', 'info', '--output=json', path)
+    return QemuImgInfo(out, format='json')
+
+
+def _probe_qcow2(image_file, head):
+    """Probe a qcow2 image from its header.
+
+    :returns: a QemuImgInfo, or None if the image is not a qcow2 image
+              which can be probed natively.
+    """
+    try:
+        header = qcow2.parse_header(head)
+    except ValueError:
+        return None
+    if (header is None or header.version not in (2, 3) or
+            header.incompatible_features & ~qcow2.INCOMPAT_DIRTY):
+        return None
+
+    info = QemuImgInfo()
+    info.file_format = 'qcow2'
+    info.virtual_size = header.size
+    info.cluster_size = header.cluster_size
+    info.encryption = bool(header.crypt_method)
+    if header.backing_file_offset:
+        image_file.seek(header.backing_file_offset)
+        info.backing_file = image_file.read(
+                min(header.backing_file_size, _MAX_BACKING_FILE_SIZE))
+    return info
+
+
+def _is_vmdk_descriptor(head):
+    """Whether qemu probes an image starting with head as a vmdk descriptor.
+
+    Like qemu, the comments and blank lines before the version line are
+    skipped.
+    """
+    for line in head.split(b'\n'):
+        if line.startswith(b'#') or not line.strip(b' \r'):
+            continue
+        return line.startswith(b'version=')
+    return False
+
+
+def _is_qemu_img_format(head, tail):
+    """Whether an image is in a format other than raw qemu-img probes.
+
+    :param head: the first _PROBE_SIZE bytes of the image.
+    :param tail: the last _PROBE_SIZE bytes of the image.
+    """
+    for format, offset, magic in _QEMU_IMG_SIGNATURES:
+        if offset < 0:
+            data, offset = tail, len(tail) + offset
+            if offset < 0:
+                continue
+        else:
+            data = head
+        if data[offset:offset + len(magic)] == magic:
+            return True
+    return _is_vmdk_descriptor(head)
+
+
+def probe_image(path):
+    """Return an object describing the format of an image.
+
+    raw and qcow2 images, including their backing file, are probed from
+    their header, without running qemu-img. qemu_img_info is only used
+    for the other formats.
+
+    :param path: the image to probe.
+    :returns: a QemuImgInfo, whose file_format is None if the image does
+              not exist.
+    """
+    if not os.path.exists(path):
+        return QemuImgInfo()
+
+    with open(path, 'rb') as image_file:
+        head = image_file.read(_PROBE_SIZE)
+        info = _probe_qcow2(image_file, head)
+        if info is None:
+            image_file.seek(max(os.fstat(image_file.fileno()).st_size -
+                                _PROBE_SIZE, 0))
+            tail = image_file.read(_PROBE_SIZE)
+    if info is None:
+        if _is_qemu_img_format(head, tail):
+            return qemu_img_info(path)
+        info = QemuImgInfo()
+        info.file_format = 'raw'
+        info.virtual_size = os.path.getsize(path)
+
+    info.image = path
+    info.disk_size = os.stat(path).st_blocks * 512
+    return info
 
 
 def convert_image(source, dest, out_format, run_as_root=False):
@@ -174,33 +319,154 @@ def convert_image(source, dest, out_format, run_as_root=False):
     utils.execute(*cmd, run_as_root=run_as_root)
 
 
-def fetch(context, image_href, path, image_service=None):
+class _RawConvertingWriter(object):
+    """File-like object converting a qcow2 image to raw as it is written.
+
+    The format is detected from the first bytes of the image. Images in
+    other formats, and qcow2 images which qcow2.StreamConverter can not
+    convert, are written to image_path as they are.
+    """
+
+    def __init__(self, image_path, raw_path):
+        self._image_path = image_path
+        self._raw_path = raw_path
+        self._head = b''
+        self._target = None
+        self._image_file = None
+        self._raw_file = None
+        self._spill_file = None
+        self.converted = False
+
+    def write(self, data):
+        if self._target is None:
+            self._head += data
+            if len(self._head) < qcow2.HEADER_SIZE:
+                return
+            self._start()
+        else:
+            self._target.write(data)
+
+    def _start(self):
+        try:
+            header = qcow2.parse_header(self._head)
+        except ValueError:
+            header = None
+
+        if header is not None and header.streamable:
+            self._raw_file = open(self._raw_path, 'w+b')
+            self._spill_file = tempfile.TemporaryFile(
+                    dir=os.path.dirname(os.path.abspath(self._raw_path)))
+            self._target = qcow2.StreamConverter(header, self._raw_file,
+                                                 self._spill_file)
+            self.converted = True
+        else:
+            self._image_file = open(self._image_path, 'wb')
+            self._target = self._image_file
+
+        data, self._head = self._head, None
+        self._target.write(data)
+
+    def finish(self):
+        """Convert the end of the image.
+
+        :raises: ValueError if the image could not be converted.
+        """
+        if self._target is None:
+            self._start()
+        if self.converted:
+            self._target.finish()
+
+    def close(self):
+        for f in (self._image_file, self._raw_file, self._spill_file):
+            if f is not None:
+                f.close()
+
+
+def fetch(context, image_href, path, image_service=None, raw_path=None,
+          checksum=None):
+    """Download an image.
+
+    :param context: request context.
+    :param image_href: the image to download.
+    :param path: the file to download the image to.
+    :param image_service: the image service to use, None for the default.
+    :param raw_path: if set, qcow2 images are converted to raw as they are
+                     downloaded and written to raw_path instead of path,
+                     when possible.
+    :param checksum: if set, the MD5 the downloaded image must match.
+    :returns: True if the image was converted to raw_path.
+    :raises: ImageConvertFailed if the image could not be converted.
+    :raises: ImageChecksumMismatch if the image does not match checksum.
+    """
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
     #             checked before we got here.
     if not image_service:
-        image_service = service.Service(version=1, context=context)
+        image_service = service.Service(context=context)
 
+    # NOTE: the image service verifies the checksum of the image as it
+    #       reads it.
     with fileutils.remove_path_on_error(path):
-        with open(path, "wb") as image_file:
-            image_service.download(image_href, image_file)
-
-
-def fetch_to_raw(context, image_href, path, image_service=None):
+        if raw_path is None:
+            image_service.download(image_href, path=path, checksum=checksum)
+            return False
+
+        writer = _RawConvertingWriter(path, raw_path)
+        unsupported = None
+        with fileutils.remove_path_on_error(raw_path):
+            try:
+                # NOTE: images the service can copy from a local file are
+                #       copied to path, and converted afterwards.
+                if image_service.download(image_href, writer, path=path,
+                                          checksum=checksum):
+                    return False
+                writer.finish()
+            except qcow2.StreamingUnsupported as e:
+                unsupported = e
+            except ValueError as e:
+                raise exception.ImageConvertFailed(image_id=image_href,
+                                                   reason=e)
+            finally:
+                writer.close()
+
+        if unsupported is not None:
+            # NOTE: the image is downloaded again, and converted with
+            #       qemu-img afterwards.
+            LOG.info(_("%(image)s can not be converted while downloading: "
+                       "%(reason)s") % {'image': image_href,
+                                        'reason': unsupported})
+            utils.delete_if_exists(raw_path)
+            image_service.download(image_href, path=path, checksum=checksum)
+            return False
+
+    if writer.converted:
+        utils.delete_if_exists(path)
+    return writer.converted
+
+
+def fetch_to_raw(context, image_href, path, image_service=None,
+                 checksum=None):
     path_tmp = "%s.part" % path
-    fetch(context, image_href, path_tmp, image_service)
+    raw_path = None
+    if CONF.force_raw_images and CONF.convert_images_while_downloading:
+        raw_path = path
+    if fetch(context, image_href, path_tmp, image_service, raw_path,
+             checksum):
+        LOG.debug(_("%s was converted to raw while downloading") %
+                  image_href)
+        return
     image_to_raw(image_href, path, path_tmp)
 
 
 def image_to_raw(image_href, path, path_tmp):
     with fileutils.remove_path_on_error(path_tmp):
-        data = qemu_img_info(path_tmp)
+        data = probe_image(path_tmp)
 
         fmt = data.file_format
         if fmt is None:
             raise exception.ImageUnacceptable(
-                    reason=_("'qemu-img info' parsing failed."),
+                    reason=_("Image format probing failed."),
                     image_id=image_href)
 
         backing_file = data.backing_file
@@ -218,7 +484,7 @@ def image_to_raw(image_href, path, path_tmp):
                 convert_image(path_tmp, staged, 'raw')
                 os.unlink(path_tmp)
 
-                data = qemu_img_info(staged)
+                data = probe_image(staged)
                 if data.file_format != "raw":
                     raise exception.ImageConvertFailed(image_id=image_href,
                         reason=_("Converted to raw, but format is now %s") %
@@ -23,8 +23,7 @@ CONF = cfg.CONF
 acl.register_opts(CONF)
 
 
-def get_service_url(service_type='baremetal', endpoint_type='internal'):
-    """Wrapper for get service url from keystone service catalog."""
+def _get_ksclient():
     auth_url = CONF.keystone_authtoken.auth_uri
     if not auth_url:
         raise exception.CatalogFailure(_('Keystone API endpoint is missing'))
@@ -42,7 +41,7 @@ def get_service_url(service_type='baremetal', endpoint_type='internal'):
     #   fails to override the version in the URL
     auth_url = parse.urljoin(auth_url.rstrip('/'), api_version)
     try:
-        ksclient = client.Client(username=CONF.keystone_authtoken.admin_user,
+        return client.Client(username=CONF.keystone_authtoken.admin_user,
                         password=CONF.keystone_authtoken.admin_password,
                         tenant_name=CONF.keystone_authtoken.admin_tenant_name,
                         auth_url=auth_url)
@@ -54,6 +53,11 @@ def get_service_url(service_type='baremetal', endpoint_type='internal'):
                                          'process for service catalog: %s')
                                           % err)
 
+
+def get_service_url(service_type='baremetal', endpoint_type='internal'):
+    """Wrapper for get service url from keystone service catalog."""
+    ksclient = _get_ksclient()
+
     if not ksclient.has_service_catalog():
         raise exception.CatalogFailure(_('No keystone service catalog loaded'))
 
@@ -65,3 +69,8 @@ def get_service_url(service_type='baremetal', endpoint_type='internal'):
                                         endpoint_type=endpoint_type)
 
     return endpoint
+
+
+def get_admin_auth_token():
+    """Get an auth token of the ironic service user from keystone."""
+    return _get_ksclient().auth_token
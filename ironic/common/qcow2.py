@@ -0,0 +1,385 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Reading of qcow2 images, see docs/interop/qcow2.txt in the qemu sources.
+"""
+
+import struct
+import zlib
+
+MAGIC = b'QFI\xfb'
+
+# Bytes needed to parse the header of any version.
+HEADER_SIZE = 112
+
+_HEADER_V2 = struct.Struct('>4sIQIIQIIQQIIQ')
+_HEADER_V3 = struct.Struct('>QQQII')
+
+INCOMPAT_DIRTY = 1 << 0
+
+# The bounds qemu puts on the header fields when it opens an image.
+_MIN_CLUSTER_BITS = 9
+_MAX_CLUSTER_BITS = 21
+_MAX_L1_SIZE = 32 * 1024 * 1024
+
+_OFFSET_MASK = 0x00fffffffffffe00
+_OFLAG_COMPRESSED = 1 << 62
+_OFLAG_ZERO = 1 << 0
+
+_ENTRY = struct.Struct('>Q')
+
+# The most clusters the tables read so far may map ahead of the position
+# in the image. Each of them is kept in memory until it is read; qemu-img
+# writes an L2 table right before the clusters it maps, so its images stay
+# far below this.
+_MAX_PENDING_CLUSTERS = 256 * 1024
+
+
+class StreamingUnsupported(ValueError):
+    """The image is valid, but can not be converted in one pass."""
+
+
+class Qcow2Header(object):
+    """The header of a qcow2 image."""
+
+    def __init__(self, data):
+        (magic, self.version, self.backing_file_offset,
+         self.backing_file_size, self.cluster_bits, self.size,
+         self.crypt_method, self.l1_size, self.l1_table_offset,
+         self.refcount_table_offset, self.refcount_table_clusters,
+         self.nb_snapshots,
+         self.snapshots_offset) = _HEADER_V2.unpack_from(data)
+        self.incompatible_features = 0
+        if self.version >= 3:
+            (self.incompatible_features, compatible_features,
+             autoclear_features, refcount_order,
+             header_length) = _HEADER_V3.unpack_from(data, _HEADER_V2.size)
+
+    @property
+    def cluster_size(self):
+        return 1 << self.cluster_bits
+
+    def check(self):
+        """Reject the headers qemu refuses to open.
+
+        The fields of the header are untrusted, they are only used once
+        they are within the bounds qemu checks.
+
+        :raises: ValueError if the header is invalid.
+        """
+        if not _MIN_CLUSTER_BITS <= self.cluster_bits <= _MAX_CLUSTER_BITS:
+            raise ValueError(_("Unsupported qcow2 cluster bits %d.") %
+                             self.cluster_bits)
+        if self.l1_size * _ENTRY.size > _MAX_L1_SIZE:
+            raise ValueError(_("qcow2 L1 table too large, %d entries.") %
+                             self.l1_size)
+        l2_entries = self.cluster_size // _ENTRY.size
+        l1_span = l2_entries * self.cluster_size
+        if self.l1_size < (self.size + l1_span - 1) // l1_span:
+            raise ValueError(_("qcow2 L1 table too small for an image of "
+                               "%d bytes.") % self.size)
+        if self.l1_table_offset % self.cluster_size:
+            raise ValueError(_("qcow2 L1 table offset %d is not aligned.") %
+                             self.l1_table_offset)
+
+    @property
+    def streamable(self):
+        """Whether StreamConverter can convert the image."""
+        return (self.version in (2, 3) and
+                9 <= self.cluster_bits <= 21 and
+                not self.backing_file_offset and
+                not self.crypt_method and
+                not self.incompatible_features & ~INCOMPAT_DIRTY)
+
+
+def parse_header(data):
+    """Parse the header of a qcow2 image.
+
+    :param data: the first bytes of the image, at least HEADER_SIZE of them
+                 for version 3 images.
+    :returns: a Qcow2Header, or None if the image is not a qcow2 image.
+    :raises: ValueError if the header is truncated or invalid.
+    """
+    if not data.startswith(MAGIC):
+        return None
+    try:
+        header = Qcow2Header(data)
+    except struct.error:
+        raise ValueError(_("Truncated qcow2 header."))
+    header.check()
+    return header
+
+
+class _CompressedCluster(object):
+    """A compressed cluster being read."""
+
+    def __init__(self, start, length, guest_offset):
+        self.start = start
+        self.length = length
+        self.guest_offset = guest_offset
+        self.chunks = {}
+        self.written = False
+
+    @property
+    def end(self):
+        return self.start + self.length
+
+    def add(self, offset, data):
+        """Add the bytes of the cluster found in data, read at offset."""
+        start = max(self.start, offset)
+        end = min(self.end, offset + len(data))
+        if start < end:
+            self.chunks[start] = data[start - offset:end - offset]
+        return max(end - start, 0)
+
+    def data(self):
+        return b''.join(self.chunks[k] for k in sorted(self.chunks))
+
+
+class StreamConverter(object):
+    """Converts a qcow2 image to raw in one pass, as it is read.
+
+    The guest clusters are written to the raw file as soon as the L2 table
+    mapping them has been read. The image is read cluster by cluster;
+    until all the L2 tables have been read, clusters which no table read
+    so far accounts for are kept in a spill file, in case a table read
+    later maps them. qemu-img writes the tables before the clusters they
+    map, so its images only spill a few metadata clusters.
+
+    Images with snapshots may map a cluster more than once, so all their
+    clusters are kept until all the tables are read. Images mapping more
+    than _MAX_PENDING_CLUSTERS clusters ahead of their data raise
+    StreamingUnsupported.
+    """
+
+    def __init__(self, header, raw_file, spill_file):
+        """Constructor.
+
+        :param header: the Qcow2Header of the image, which must be
+                       streamable.
+        :raises: ValueError if the raw image can not be written.
+        :param raw_file: the file to write the raw image to, opened for
+                         reading and writing.
+        :param spill_file: a temporary file opened for reading and writing.
+        """
+        self._header = header
+        self._cluster_size = header.cluster_size
+        self._l2_entries = self._cluster_size // _ENTRY.size
+        self._raw = raw_file
+        self._spill = spill_file
+        self._shared = header.nb_snapshots > 0
+        self._zeros = b'\0' * self._cluster_size
+
+        # host offset of _buffer and its bytes
+        self._offset = 0
+        self._buffer = b''
+        # host offset of the L1 table clusters -> index of their first entry
+        l1_bytes = header.l1_size * _ENTRY.size
+        self._l1_clusters = dict(
+            (header.l1_table_offset + i, i // _ENTRY.size)
+            for i in range(0, l1_bytes, self._cluster_size))
+        # host offset of the L2 tables not read yet -> their L1 index
+        self._l2_tables = {}
+        # host offset of the data clusters not read yet -> guest offsets
+        self._data = {}
+        # host offset of the clusters -> compressed clusters they hold
+        self._compressed = {}
+        # number of guest offsets and compressed clusters in _data and
+        # _compressed
+        self._pending = 0
+        # host offset of the spilled clusters -> their offset in the spill
+        self._spilled = {}
+
+        try:
+            raw_file.truncate(header.size)
+        except (IOError, OSError) as e:
+            raise ValueError(_("Can not write a raw image of %(size)d "
+                               "bytes: %(error)s") %
+                             {'size': header.size, 'error': e})
+
+    @property
+    def _tables_read(self):
+        return not self._l1_clusters and not self._l2_tables
+
+    def write(self, data):
+        """Convert the next bytes of the image."""
+        size = self._cluster_size
+        buf = self._buffer + data if self._buffer else data
+        end = len(buf) - len(buf) % size
+        for start in range(0, end, size):
+            self._read_cluster(self._offset, buf[start:start + size])
+            self._offset += size
+        self._buffer = buf[end:]
+
+    def finish(self):
+        """Convert the end of the image.
+
+        :raises: ValueError if the image is truncated or corrupted.
+        """
+        if self._buffer:
+            self._read_cluster(self._offset, self._buffer)
+            self._offset += len(self._buffer)
+            self._buffer = b''
+
+        truncated = not self._tables_read or bool(self._data)
+        pending = set(cluster for clusters in self._compressed.values()
+                      for cluster in clusters)
+        self._compressed.clear()
+        for cluster in pending:
+            if cluster.start >= self._offset:
+                truncated = True
+            elif not cluster.written:
+                self._write_compressed(cluster)
+
+        if truncated:
+            raise ValueError(_("Truncated qcow2 image, %d bytes read.") %
+                             self._offset)
+
+    def _read_cluster(self, host, data):
+        is_table = False
+        if host in self._l1_clusters:
+            self._read_l1(self._l1_clusters.pop(host), host, data)
+            is_table = True
+        l1_index = self._l2_tables.pop(host, None)
+        if l1_index is not None:
+            self._read_l2(l1_index, host, data)
+            is_table = True
+
+        used = 0
+        guest_offsets = self._data.pop(host, None)
+        if guest_offsets:
+            self._pending -= len(guest_offsets)
+            for guest_offset in guest_offsets:
+                self._write_guest(guest_offset, data)
+            used = len(data)
+        compressed = self._compressed.pop(host, [])
+        self._pending -= len(compressed)
+        for cluster in compressed:
+            used += cluster.add(host, data)
+            # NOTE: the last cluster of the image is the only short one,
+            #       and may end before the sectors of the last compressed
+            #       cluster do.
+            if (host + len(data) >= cluster.end or
+                    len(data) < self._cluster_size):
+                self._write_compressed(cluster)
+
+        if self._tables_read:
+            if self._spilled:
+                self._spilled.clear()
+                self._spill.truncate(0)
+        elif not is_table and (self._shared or used < len(data)):
+            self._spill.seek(0, 2)
+            self._spilled[host] = self._spill.tell()
+            self._spill.write(data)
+
+    def _read_spilled(self, start, length):
+        """Read bytes of the image which were spilled."""
+        size = self._cluster_size
+        chunks = []
+        end = start + length
+        host = start - start % size
+        while host < end:
+            if host not in self._spilled:
+                raise ValueError(_("qcow2 cluster %d is mapped after being "
+                                   "read.") % host)
+            self._spill.seek(self._spilled[host] + max(start - host, 0))
+            chunks.append(self._spill.read(min(end, host + size) -
+                                           max(start, host)))
+            host += size
+        return b''.join(chunks)
+
+    def _read_l1(self, first_index, host, data):
+        count = min(self._header.l1_size - first_index,
+                    len(data) // _ENTRY.size)
+        for i in range(count):
+            l2_offset = _ENTRY.unpack_from(data, i * _ENTRY.size)[0]
+            l2_offset &= _OFFSET_MASK
+            if not l2_offset:
+                continue
+            if l2_offset < host:
+                self._read_l2(first_index + i, l2_offset,
+                              self._read_spilled(l2_offset,
+                                                 self._cluster_size))
+            else:
+                self._l2_tables[l2_offset] = first_index + i
+
+    def _read_l2(self, l1_index, host, data):
+        size = self._cluster_size
+        x = 62 - (self._header.cluster_bits - 8)
+        sector_mask = (1 << (self._header.cluster_bits - 8)) - 1
+        first_cluster = l1_index * self._l2_entries
+        for i in range(len(data) // _ENTRY.size):
+            entry = _ENTRY.unpack_from(data, i * _ENTRY.size)[0]
+            guest_offset = (first_cluster + i) * size
+            if not entry or guest_offset >= self._header.size:
+                continue
+
+            if entry & _OFLAG_COMPRESSED:
+                start = entry & ((1 << x) - 1)
+                sectors = ((entry >> x) & sector_mask) + 1
+                cluster = _CompressedCluster(start,
+                                             sectors * 512 - start % 512,
+                                             guest_offset)
+                self._map_compressed(cluster, host)
+                continue
+
+            data_offset = entry & _OFFSET_MASK
+            if not data_offset or entry & _OFLAG_ZERO:
+                # NOTE: unallocated and zero clusters are read as zeros,
+                #       the raw file is sparse.
+                continue
+            if data_offset < host:
+                self._write_guest(guest_offset,
+                                  self._read_spilled(data_offset, size))
+            else:
+                self._add_pending()
+                self._data.setdefault(data_offset, []).append(guest_offset)
+
+    def _map_compressed(self, cluster, host):
+        size = self._cluster_size
+        if cluster.start < host:
+            length = min(cluster.end, host) - cluster.start
+            cluster.add(cluster.start,
+                        self._read_spilled(cluster.start, length))
+        if cluster.end <= host:
+            self._write_compressed(cluster)
+            return
+        first = max(cluster.start, host)
+        for offset in range(first - first % size, cluster.end, size):
+            self._add_pending()
+            self._compressed.setdefault(offset, []).append(cluster)
+
+    def _add_pending(self):
+        if self._pending >= _MAX_PENDING_CLUSTERS:
+            raise StreamingUnsupported(
+                _("More than %d qcow2 clusters are mapped ahead of "
+                  "their data.") % _MAX_PENDING_CLUSTERS)
+        self._pending += 1
+
+    def _write_compressed(self, cluster):
+        cluster.written = True
+        try:
+            data = zlib.decompressobj(-12).decompress(cluster.data(),
+                                                      self._cluster_size)
+        except zlib.error as e:
+            raise ValueError(_("Invalid compressed qcow2 cluster at "
+                               "%(offset)d: %(error)s") %
+                             {'offset': cluster.start, 'error': e})
+        self._write_guest(cluster.guest_offset, data)
+
+    def _write_guest(self, guest_offset, data):
+        data = data[:self._header.size - guest_offset]
+        if data == self._zeros[:len(data)]:
+            return
+        self._raw.seek(guest_offset)
+        self._raw.write(data)
@@ -16,10 +16,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
 import socket
+import threading
+from wsgiref import simple_server
 
+import eventlet
 from oslo.config import cfg
 from oslo import messaging
+from six.moves import socketserver
 
 from ironic.common import config
 from ironic.common import rpc
@@ -90,6 +95,81 @@ class RPCService(service.Service):
                             'the RPC manager. Error: %s'), e)
 
 
+class ThreadedSimpleServer(socketserver.ThreadingMixIn,
+                           simple_server.WSGIServer):
+    """A Mixin class to make the API service greenthread-able."""
+    pass
+
+
+class WSGIService(service.Service):
+    """Serve a WSGI application from one or more worker processes.
+
+    The listening socket is bound when the service is created, so that
+    when the service is launched with a ProcessLauncher every forked
+    worker accepts connections on the same socket. Each worker counts the
+    requests it has handled, under a lock since every request is handled
+    in its own thread, and, when stopped or reloaded, waits for the
+    requests in progress to complete before returning.
+    """
+
+    def __init__(self, name, app, host, port):
+        super(WSGIService, self).__init__()
+        self.name = name
+        self.app = app
+        self.host = host
+        self.port = port
+        self.server = simple_server.make_server(
+                host, port, self._handle_request,
+                server_class=ThreadedSimpleServer)
+        self.handled_requests = 0
+        self.active_requests = 0
+        self._counts_lock = threading.Lock()
+        self._serving = False
+
+    def _handle_request(self, environ, start_response):
+        with self._counts_lock:
+            self.handled_requests += 1
+            self.active_requests += 1
+        result = None
+        try:
+            result = self.app(environ, start_response)
+            for chunk in result:
+                yield chunk
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+            with self._counts_lock:
+                self.active_requests -= 1
+
+    def _serve(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self._serving = False
+
+    def start(self):
+        super(WSGIService, self).start()
+        self._serving = True
+        self.tg.add_thread(self._serve)
+        LOG.info(_("%(name)s worker %(pid)d serving on "
+                   "http://%(host)s:%(port)s"),
+                 {'name': self.name, 'pid': os.getpid(),
+                  'host': self.host, 'port': self.port})
+
+    def stop(self):
+        # NOTE: shutdown() blocks until serve_forever() returns, so it
+        #       must not be called if the server loop is not running.
+        if self._serving:
+            self.server.shutdown()
+        while self.active_requests:
+            eventlet.sleep(0.1)
+        LOG.info(_("%(name)s worker %(pid)d stopped after handling "
+                   "%(count)d requests"),
+                 {'name': self.name, 'pid': os.getpid(),
+                  'count': self.handled_requests})
+        super(WSGIService, self).stop()
+
+
 def prepare_service(argv=[]):
     config.parse_args(argv)
     cfg.set_defaults(log.log_opts,
@@ -64,3 +64,10 @@ POWER_ON = 'power on'
 POWER_OFF = 'power off'
 REBOOT = 'rebooting'
 SUSPEND = 'suspended'
+
+# States of a job, an asynchronous action on one or more nodes. A job is
+# RUNNING until the action has been attempted on all its nodes; it is then
+# DONE if the action succeeded on all of them, or FAILED otherwise.
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
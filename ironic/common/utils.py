@@ -18,9 +18,14 @@
 
 """Utilities and helper functions."""
 
+import collections
 import contextlib
+import ctypes
+import ctypes.util
 import errno
+import fcntl
 import hashlib
+import json
 import os
 import random
 import re
@@ -161,6 +166,55 @@ class LazyPluggable(object):
         return getattr(backend, key)
 
 
+class LazyJSON(collections.MutableMapping):
+    """A JSON object which is decoded the first time it is used.
+
+    It behaves as the dict it encodes, so that the JSON fields of the
+    models can be given as they are loaded from the database. The objects
+    decode it the first time the field holding it is read, so that
+    documents which are never read are never decoded. Saving it back
+    before it is decoded writes the original text.
+    """
+
+    def __init__(self, raw, loads=None):
+        self.raw = raw
+        self._loads = loads or json.loads
+        self._value = None
+
+    @property
+    def decoded(self):
+        """Whether the document was decoded, and may have been changed."""
+        return self._value is not None
+
+    def decode(self):
+        if self._value is None:
+            self._value = self._loads(self.raw)
+        return self._value
+
+    def copy(self):
+        return dict(self.decode())
+
+    def __getitem__(self, key):
+        return self.decode()[key]
+
+    def __setitem__(self, key, value):
+        self.decode()[key] = value
+
+    def __delitem__(self, key):
+        del self.decode()[key]
+
+    def __iter__(self):
+        return iter(self.decode())
+
+    def __len__(self):
+        return len(self.decode())
+
+    def __repr__(self):
+        if self.decoded:
+            return repr(self._value)
+        return '<LazyJSON %r>' % self.raw
+
+
 def delete_if_exists(pathname):
     """delete a file, but ignore file not found error."""
 
@@ -473,6 +527,107 @@ def create_link_without_raise(source, link):
                        {'source': source, 'link': link, 'e': e})
 
 
+# ioctl sharing the data of a file with another one, from linux/fs.h
+_FICLONE = 0x40049409
+
+# errors meaning that the files can not be copied by a given system call
+_COPY_UNSUPPORTED = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.ENOTTY,
+                     errno.EOPNOTSUPP, errno.EBADF)
+
+_COPY_CHUNK_SIZE = 1024 * 1024 * 1024
+
+_KERNEL_COPY_ARGTYPES = {
+    'copy_file_range': [ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                        ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint],
+    'sendfile': [ctypes.c_int, ctypes.c_int, ctypes.c_void_p,
+                 ctypes.c_size_t],
+}
+
+_LIBC = []
+
+
+def _kernel_copy(name, source_fd, dest_fd):
+    """Copy a file with the copy_file_range or sendfile system call.
+
+    Both calls copy from and to the current offset of the files, so
+    another method can go on from where this one stopped.
+
+    :returns: False if the system call can not copy the files.
+    """
+    if not _LIBC:
+        _LIBC.append(ctypes.CDLL(ctypes.util.find_library('c'),
+                                 use_errno=True))
+    function = getattr(_LIBC[0], name, None)
+    if function is None:
+        return False
+    function.argtypes = _KERNEL_COPY_ARGTYPES[name]
+    function.restype = ctypes.c_ssize_t
+    if name == 'copy_file_range':
+        args = (source_fd, None, dest_fd, None, _COPY_CHUNK_SIZE, 0)
+    else:
+        args = (dest_fd, source_fd, None, _COPY_CHUNK_SIZE)
+
+    while True:
+        copied = function(*args)
+        if copied == 0:
+            return True
+        if copied < 0:
+            error = ctypes.get_errno()
+            if error == errno.EINTR:
+                continue
+            if error in _COPY_UNSUPPORTED:
+                return False
+            raise OSError(error, os.strerror(error))
+
+
+def copy_file(source, dest, hardlink=False):
+    """Copy a file, without its data going through userspace if possible.
+
+    The file is hardlinked if hardlink is set, else cloned on filesystems
+    able to share data between files (reflink), else copied within the
+    kernel by copy_file_range or sendfile, and only as a last resort read
+    and written.
+
+    :param source: the file to copy.
+    :param dest: the path of the copy, replaced if it exists.
+    :param hardlink: whether dest may be a hardlink to source, whose
+                     changes are then seen in source.
+    :returns: how the file was copied: 'hardlink', 'reflink',
+              'copy_file_range', 'sendfile' or 'copy'.
+    """
+    if hardlink:
+        delete_if_exists(dest)
+        try:
+            os.link(source, dest)
+            return 'hardlink'
+        except OSError as e:
+            LOG.debug(_("Could not hardlink %(source)s to %(dest)s: "
+                        "%(error)s") %
+                      {'source': source, 'dest': dest, 'error': e})
+
+    with open(source, 'rb') as source_file:
+        with open(dest, 'wb') as dest_file:
+            source_fd = source_file.fileno()
+            dest_fd = dest_file.fileno()
+            try:
+                fcntl.ioctl(dest_fd, _FICLONE, source_fd)
+                return 'reflink'
+            except IOError as e:
+                if e.errno not in _COPY_UNSUPPORTED:
+                    raise
+
+            for name in ('copy_file_range', 'sendfile'):
+                if _kernel_copy(name, source_fd, dest_fd):
+                    return name
+
+            while True:
+                chunk = os.read(source_fd, 1024 * 1024)
+                if not chunk:
+                    return 'copy'
+                while chunk:
+                    chunk = chunk[os.write(dest_fd, chunk):]
+
+
 def safe_rstrip(value, chars=None):
     """Removes trailing characters from a string if that does not make it empty
 
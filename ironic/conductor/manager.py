@@ -42,16 +42,21 @@ a change, etc.
 """
 
 import collections
+import datetime
+import functools
 
 import eventlet
 from eventlet import greenpool
 
 from oslo.config import cfg
 from oslo import messaging
+import six
 
+from ironic.common import context as ironic_context
 from ironic.common import driver_factory
 from ironic.common import exception
 from ironic.common import hash_ring as hash
+from ironic.common import keystone
 from ironic.common import neutron
 from ironic.common import states
 from ironic.conductor import task_manager
@@ -62,6 +67,7 @@ from ironic.openstack.common import excutils
 from ironic.openstack.common import lockutils
 from ironic.openstack.common import log
 from ironic.openstack.common import periodic_task
+from ironic.openstack.common import timeutils
 
 MANAGER_TOPIC = 'ironic.conductor_manager'
 WORKER_SPAWN_lOCK = "conductor_worker_spawn"
@@ -113,16 +119,61 @@ conductor_opts = [
         cfg.IntOpt('workers_pool_size',
                    default=100,
                    help='The size of the workers greenthread pool.'),
+        cfg.IntOpt('node_event_retention',
+                   default=300,
+                   help='Time (in seconds) node power and provision state '
+                        'changes are kept for the clients watching them. '
+                        'Older changes are deleted periodically.'),
+        cfg.IntOpt('bulk_action_batch_size',
+                   default=10,
+                   help='Number of nodes a conductor starts a bulk power or '
+                        'provision action on at a time. The next batch is '
+                        'started once there are enough free workers in the '
+                        'pool.'),
+        cfg.ListOpt('prefetch_images',
+                    default=[],
+                    help='UUIDs or hrefs of instance images the conductor '
+                         'downloads into the image caches of its drivers '
+                         'when it starts, with their kernel and ramdisk. '
+                         'Glance is accessed with the '
+                         '[keystone_authtoken] admin credentials.'),
+        cfg.ListOpt('prefetch_boot_images',
+                    default=[],
+                    help='UUIDs or hrefs of kernels and ramdisks, e.g. of '
+                         'the deploy ramdisk, the conductor downloads into '
+                         'the image caches of its drivers when it starts.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(conductor_opts, 'conductor')
+CONF.import_opt('auth_strategy', 'ironic.common.image_service',
+                group='glance')
+
+
+def record_job_failure(f):
+    """Decorator to record on a job the failure to start a node action.
+
+    Decorated RPC methods take the node as their first argument after the
+    context, and an optional job_id keyword argument. If they fail while
+    a job_id is given, the failure is counted on that job.
+
+    """
+    @functools.wraps(f)
+    def wrapper(self, context, node_id, *args, **kwargs):
+        try:
+            return f(self, context, node_id, *args, **kwargs)
+        except Exception as e:
+            with excutils.save_and_reraise_exception():
+                job_id = kwargs.get('job_id')
+                if job_id is not None:
+                    self._record_job_outcome(job_id, node_id, e)
+    return wrapper
 
 
 class ConductorManager(periodic_task.PeriodicTasks):
     """Ironic Conductor manager main class."""
 
-    RPC_API_VERSION = '1.14'
+    RPC_API_VERSION = '1.18'
 
     target = messaging.Target(version=RPC_API_VERSION)
 
@@ -158,6 +209,16 @@ class ConductorManager(periodic_task.PeriodicTasks):
                                 size=CONF.conductor.workers_pool_size)
         """GreenPool of background workers for performing tasks async."""
 
+        if CONF.conductor.prefetch_images or \
+                CONF.conductor.prefetch_boot_images:
+            # NOTE: drivers may share a deploy interface class, and its
+            #       caches.
+            deploys = dict((type(self.driver_factory[name].obj.deploy),
+                            self.driver_factory[name].obj.deploy)
+                           for name in self.drivers)
+            self._spawn_worker(self._prefetch_startup_images,
+                               list(deploys.values()))
+
     def del_host(self):
         try:
             self.dbapi.unregister_conductor(self.host)
@@ -170,7 +231,8 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
     @messaging.expected_exceptions(exception.InvalidParameterValue,
                                    exception.NodeLocked,
-                                   exception.NodeInWrongPowerState)
+                                   exception.NodeInWrongPowerState,
+                                   exception.NodeVersionConflict)
     def update_node(self, context, node_obj):
         """Update a node with the supplied data.
 
@@ -193,28 +255,38 @@ class ConductorManager(periodic_task.PeriodicTasks):
         driver_name = node_obj.driver if 'driver' in delta else None
         with task_manager.acquire(context, node_id, shared=False,
                                   driver_name=driver_name) as task:
+            node = task.node
 
             # TODO(deva): Determine what value will be passed by API when
             #             instance_uuid needs to be unset, and handle it.
             if 'instance_uuid' in delta:
-                task.driver.power.validate(task, node_obj)
-                node_obj['power_state'] = \
-                        task.driver.power.get_power_state(task, node_obj)
+                task.driver.power.validate(task, node)
+                power_state = task.driver.power.get_power_state(task, node)
 
-                if node_obj['power_state'] != states.POWER_OFF:
+                if power_state != states.POWER_OFF:
                     raise exception.NodeInWrongPowerState(
                             node=node_id,
-                            pstate=node_obj['power_state'])
+                            pstate=power_state)
+                node['power_state'] = power_state
+
+            # NOTE: the conductors may have updated other fields of the
+            #       node since the API read it, e.g. its power state or
+            #       its reservation, so apply the changes to the node as
+            #       read under the lock.
+            for field in delta:
+                node[field] = node_obj[field]
 
             # update any remaining parameters, then save
-            node_obj.save(context)
+            node.save(context)
 
-            return node_obj
+            return node
 
     @messaging.expected_exceptions(exception.InvalidParameterValue,
                                    exception.NoFreeConductorWorker,
                                    exception.NodeLocked)
-    def change_node_power_state(self, context, node_id, new_state):
+    @record_job_failure
+    def change_node_power_state(self, context, node_id, new_state,
+                                job_id=None):
         """RPC method to encapsulate changes to a node's state.
 
         Perform actions such as power on, power off. The validation is
@@ -226,6 +298,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
         :param context: an admin context.
         :param node_id: the id or uuid of a node.
         :param new_state: the desired power state of the node.
+        :param job_id: the id or uuid of a job to record the outcome on.
         :raises: NoFreeConductorWorker when there is no free worker to start
                  async task.
 
@@ -236,14 +309,16 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
         with task_manager.acquire(context, node_id, shared=False) as task:
             task.driver.power.validate(task, task.node)
-            task.spawn_after(self._spawn_worker, utils.node_power_action,
-                             task, task.node, new_state)
+            self._spawn_node_worker(task, job_id, utils.node_power_action,
+                                    task, task.node, new_state)
 
     @messaging.expected_exceptions(exception.NoFreeConductorWorker,
                                    exception.NodeLocked,
                                    exception.InvalidParameterValue,
                                    exception.UnsupportedDriverExtension)
-    def vendor_passthru(self, context, node_id, driver_method, info):
+    @record_job_failure
+    def vendor_passthru(self, context, node_id, driver_method, info,
+                        job_id=None):
         """RPC method to encapsulate vendor action.
 
         Synchronously validate driver specific info or get driver status,
@@ -254,6 +329,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
         :param node_id: the id or uuid of a node.
         :param driver_method: the name of the vendor method.
         :param info: vendor method args.
+        :param job_id: the id or uuid of a job to record the outcome on.
         :raises: InvalidParameterValue if supplied info is not valid.
         :raises: UnsupportedDriverExtension if current driver does not have
                  vendor interface or method is unsupported.
@@ -275,9 +351,9 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
             task.driver.vendor.validate(task, method=driver_method,
                                         **info)
-            task.spawn_after(self._spawn_worker,
-                             task.driver.vendor.vendor_passthru, task,
-                             method=driver_method, **info)
+            self._spawn_node_worker(task, job_id,
+                                    task.driver.vendor.vendor_passthru, task,
+                                    method=driver_method, **info)
 
     @messaging.expected_exceptions(exception.InvalidParameterValue,
                                    exception.UnsupportedDriverExtension,
@@ -318,11 +394,72 @@ class ConductorManager(periodic_task.PeriodicTasks):
                                                     method=driver_method,
                                                     **info)
 
+    def prefetch_images(self, context, driver_name, images, boot_images):
+        """RPC method to download images into the caches of a driver.
+
+        The images are downloaded by a background worker, so that the
+        first deploy of a new image does not wait for its download.
+        Conductors which do not support the driver ignore the request.
+
+        :param context: an admin context.
+        :param driver_name: name of the driver whose caches to fill.
+        :param images: a list of UUIDs or hrefs of instance images.
+        :param boot_images: a list of UUIDs or hrefs of other kernels and
+                            ramdisks, e.g. those of the deploy ramdisk.
+
+        """
+        if driver_name not in self.drivers:
+            return
+        LOG.debug(_("RPC prefetch_images called for driver %(driver)s, "
+                    "%(count)d images.") %
+                  {'driver': driver_name,
+                   'count': len(images) + len(boot_images)})
+        deploy = self.driver_factory[driver_name].obj.deploy
+        try:
+            self._spawn_worker(self._prefetch_images, context, deploy,
+                               images, boot_images)
+        except exception.NoFreeConductorWorker:
+            LOG.warning(_("No free conductor worker to prefetch images for "
+                          "driver %s.") % driver_name)
+
+    def _prefetch_startup_images(self, deploys):
+        """Download the images to prefetch when the conductor starts.
+
+        Glance is accessed with a token of the ironic service user, from
+        the [keystone_authtoken] admin credentials, unless its
+        auth_strategy is noauth.
+
+        :param deploys: the deploy interfaces whose caches to fill.
+        """
+        auth_token = None
+        if CONF.glance.auth_strategy == 'keystone':
+            try:
+                auth_token = keystone.get_admin_auth_token()
+            except exception.IronicException as e:
+                LOG.error(_("Failed to get a keystone token to prefetch "
+                            "images: %s") % e)
+                return
+        admin_context = ironic_context.RequestContext(auth_token=auth_token,
+                                                      is_admin=True)
+        for deploy in deploys:
+            self._prefetch_images(admin_context, deploy,
+                                  CONF.conductor.prefetch_images,
+                                  CONF.conductor.prefetch_boot_images)
+
+    def _prefetch_images(self, context, deploy, images, boot_images):
+        try:
+            deploy.prefetch_images(context, images, boot_images)
+        except Exception as e:
+            LOG.error(_("Failed to prefetch images %(images)s: %(error)s") %
+                      {'images': ', '.join(list(images) + list(boot_images)),
+                       'error': e})
+
     @messaging.expected_exceptions(exception.NoFreeConductorWorker,
                                    exception.NodeLocked,
                                    exception.NodeInMaintenance,
                                    exception.InstanceDeployFailure)
-    def do_node_deploy(self, context, node_id, rebuild=False):
+    @record_job_failure
+    def do_node_deploy(self, context, node_id, rebuild=False, job_id=None):
         """RPC method to initiate deployment to a node.
 
         Initiate the deployment of a node. Validations are done
@@ -335,6 +472,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
                         recreate the instance on the same node, overwriting
                         all disk. The ephemeral partition, if it exists, can
                         optionally be preserved.
+        :param job_id: the id or uuid of a job to record the outcome on.
         :raises: InstanceDeployFailure
         :raises: NodeInMaintenance if the node is in maintenance mode.
         :raises: NoFreeConductorWorker when there is no free worker to start
@@ -378,8 +516,8 @@ class ConductorManager(periodic_task.PeriodicTasks):
             node.target_provision_state = states.DEPLOYDONE
             node.last_error = None
             node.save(context)
-            task.spawn_after(self._spawn_worker, self._do_node_deploy,
-                             context, task)
+            self._spawn_node_worker(task, job_id, self._do_node_deploy,
+                                    context, task)
 
     def _do_node_deploy(self, context, task):
         """Prepare the environment and deploy a node."""
@@ -406,7 +544,8 @@ class ConductorManager(periodic_task.PeriodicTasks):
     @messaging.expected_exceptions(exception.NoFreeConductorWorker,
                                    exception.NodeLocked,
                                    exception.InstanceDeployFailure)
-    def do_node_tear_down(self, context, node_id):
+    @record_job_failure
+    def do_node_tear_down(self, context, node_id, job_id=None):
         """RPC method to tear down an existing node deployment.
 
         Validate driver specific information synchronously, and then
@@ -414,6 +553,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
         :param context: an admin context.
         :param node_id: the id or uuid of a node.
+        :param job_id: the id or uuid of a job to record the outcome on.
         :raises: InstanceDeployFailure
         :raises: NoFreeConductorWorker when there is no free worker to start
                  async task
@@ -443,8 +583,8 @@ class ConductorManager(periodic_task.PeriodicTasks):
             node.target_provision_state = states.DELETED
             node.last_error = None
             node.save(context)
-            task.spawn_after(self._spawn_worker, self._do_node_tear_down,
-                             context, task)
+            self._spawn_node_worker(task, job_id, self._do_node_tear_down,
+                                    context, task)
 
     def _do_node_tear_down(self, context, task):
         """Internal RPC method to tear down an existing node deployment."""
@@ -468,6 +608,75 @@ class ConductorManager(periodic_task.PeriodicTasks):
         finally:
             node.save(context)
 
+    def do_bulk_node_action(self, context, job_id, node_ids, action,
+                            target):
+        """RPC method to apply a power or provision action to many nodes.
+
+        The action is started on the nodes from a single background worker,
+        in batches of bulk_action_batch_size nodes, and the outcome for
+        each node is recorded on the job once its own worker is done.
+
+        :param context: an admin context.
+        :param job_id: the id or uuid of the job tracking the action.
+        :param node_ids: a list of ids or uuids of nodes.
+        :param action: 'power' or 'provision'.
+        :param target: the desired power or provision state of the nodes.
+
+        """
+        LOG.debug(_("RPC do_bulk_node_action called for job %(job)s, "
+                    "%(count)d nodes.") % {'job': job_id,
+                                           'count': len(node_ids)})
+        try:
+            if CONF.conductor.workers_pool_size < 2:
+                # NOTE: the bulk worker holds one slot of the pool, its
+                #       batches could never get another one.
+                raise exception.NoFreeConductorWorker()
+            self._spawn_worker(self._do_bulk_node_action, context, job_id,
+                               node_ids, action, target)
+        except exception.NoFreeConductorWorker as e:
+            self.dbapi.update_job_progress(job_id, failed=len(node_ids),
+                                           last_error=six.text_type(e))
+
+    def _start_node_action(self, context, node_id, action, target, job_id):
+        """Start a power or provision action on a node for a job."""
+        try:
+            if action == 'power':
+                self.change_node_power_state(context, node_id, target,
+                                             job_id=job_id)
+            elif target == states.ACTIVE:
+                self.do_node_deploy(context, node_id, job_id=job_id)
+            else:
+                self.do_node_tear_down(context, node_id, job_id=job_id)
+        except messaging.rpc.ExpectedException as e:
+            # NOTE: the RPC methods wrap their expected exceptions
+            raise e.exc_info[1]
+
+    def _do_bulk_node_action(self, context, job_id, node_ids, action,
+                             target):
+        # NOTE: this worker holds one slot of the pool, the batch must
+        #       leave room for it. do_bulk_node_action made sure there is
+        #       room for one node.
+        batch_size = max(1, min(CONF.conductor.bulk_action_batch_size,
+                                CONF.conductor.workers_pool_size - 1))
+        for start in range(0, len(node_ids), batch_size):
+            batch = node_ids[start:start + batch_size]
+            # Wait for the workers of the previous batches rather than
+            # failing the nodes with NoFreeConductorWorker.
+            while self._worker_pool.free() < len(batch):
+                eventlet.sleep(1)
+
+            for node_id in batch:
+                # NOTE: the outcome is recorded on the job by the RPC
+                #       method or, once it is done, by the node's worker.
+                try:
+                    self._start_node_action(context, node_id, action,
+                                            target, job_id)
+                except Exception as e:
+                    LOG.warning(_("Bulk %(action)s action of job %(job)s "
+                                  "failed on node %(node)s: %(error)s") %
+                                {'action': action, 'job': job_id,
+                                 'node': node_id, 'error': e})
+
     @periodic_task.periodic_task(spacing=CONF.conductor.heartbeat_interval)
     def _conductor_service_record_keepalive(self, context):
         self.dbapi.touch_conductor(self.host)
@@ -662,6 +871,15 @@ class ConductorManager(periodic_task.PeriodicTasks):
             if workers_count == CONF.conductor.periodic_max_workers:
                 break
 
+    @periodic_task.periodic_task(
+            spacing=CONF.conductor.node_event_retention)
+    def _prune_node_events(self, context):
+        before = (timeutils.utcnow() -
+                  datetime.timedelta(
+                      seconds=CONF.conductor.node_event_retention))
+        count = self.dbapi.destroy_node_events(before)
+        LOG.debug(_("Deleted %d expired node events.") % count)
+
     def rebalance_node_ring(self):
         """Perform any actions necessary when rebalancing the consistent hash.
 
@@ -767,6 +985,51 @@ class ConductorManager(periodic_task.PeriodicTasks):
         else:
             raise exception.NoFreeConductorWorker()
 
+    def _spawn_node_worker(self, task, job_id, func, *args, **kwargs):
+        """Spawn a worker for a task, recording its outcome on a job.
+
+        :param task: a TaskManager instance with a single node.
+        :param job_id: the id or uuid of a job, or None.
+        :param func: the function the worker runs.
+
+        """
+        if job_id is None:
+            task.spawn_after(self._spawn_worker, func, *args, **kwargs)
+        else:
+            task.spawn_after(self._spawn_worker, self._do_job_worker, task,
+                             job_id, functools.partial(func, *args, **kwargs))
+
+    def _do_job_worker(self, task, job_id, func):
+        """Run the worker of a task and record its outcome on a job."""
+        node_uuid = task.node.uuid
+        # NOTE: the node is unlocked before the outcome is recorded, so
+        #       that it can be acted on again as soon as the job is done.
+        try:
+            func()
+        except Exception as e:
+            with excutils.save_and_reraise_exception():
+                task.release_resources()
+                self._record_job_outcome(job_id, node_uuid, e)
+        else:
+            task.release_resources()
+            self._record_job_outcome(job_id, node_uuid)
+
+    def _record_job_outcome(self, job_id, node_id, error=None):
+        """Count a node as succeeded or, given an error, failed on a job."""
+        try:
+            if error is None:
+                self.dbapi.update_job_progress(job_id, succeeded=1)
+            else:
+                self.dbapi.update_job_progress(
+                        job_id, failed=1,
+                        last_error=_("Node %(node)s: %(error)s") %
+                                   {'node': node_id,
+                                    'error': six.text_type(error)})
+        except exception.JobNotFound:
+            LOG.warning(_("Job %(job)s of node %(node)s was not found, its "
+                          "outcome is not recorded.") %
+                        {'job': job_id, 'node': node_id})
+
     @messaging.expected_exceptions(exception.NodeLocked,
                                    exception.NodeAssociated,
                                    exception.NodeInWrongPowerState)
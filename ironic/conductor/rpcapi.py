@@ -53,10 +53,14 @@ class ConductorAPI(object):
         1.13 - Added update_port.
         1.14 - Added driver_vendor_passthru.
         1.15 - Added rebuild parameter to do_node_deploy.
+        1.16 - Added do_bulk_node_action.
+        1.17 - Added job_id parameter to change_node_power_state,
+               vendor_passthru, do_node_deploy and do_node_tear_down.
+        1.18 - Added prefetch_images.
 
     """
 
-    RPC_API_VERSION = '1.15'
+    RPC_API_VERSION = '1.18'
 
     def __init__(self, topic=None):
         super(ConductorAPI, self).__init__()
@@ -124,32 +128,45 @@ class ConductorAPI(object):
         cctxt = self.client.prepare(topic=topic or self.topic)
         return cctxt.call(context, 'update_node', node_obj=node_obj)
 
-    def change_node_power_state(self, context, node_id, new_state, topic=None):
+    def change_node_power_state(self, context, node_id, new_state, topic=None,
+                                job_id=None):
         """Synchronously, acquire lock and start the conductor background task
         to change power state of a node.
 
+        If a job is given, the request is sent asynchronously instead and
+        its outcome is recorded on the job.
+
         :param context: request context.
         :param node_id: node id or uuid.
         :param new_state: one of ironic.common.states power state values
         :param topic: RPC topic. Defaults to self.topic.
+        :param job_id: id or uuid of a job tracking the action.
         :raises: NoFreeConductorWorker when there is no free worker to start
                  async task.
 
         """
         cctxt = self.client.prepare(topic=topic or self.topic)
+        if job_id is not None:
+            return cctxt.cast(context, 'change_node_power_state',
+                              node_id=node_id, new_state=new_state,
+                              job_id=job_id)
         return cctxt.call(context, 'change_node_power_state', node_id=node_id,
                           new_state=new_state)
 
     def vendor_passthru(self, context, node_id, driver_method, info,
-                        topic=None):
+                        topic=None, job_id=None):
         """Synchronously, acquire lock, validate given parameters and start
         the conductor background task for specified vendor action.
 
+        If a job is given, the request is sent asynchronously instead and
+        its outcome is recorded on the job.
+
         :param context: request context.
         :param node_id: node id or uuid.
         :param driver_method: name of method for driver.
         :param info: info for node driver.
         :param topic: RPC topic. Defaults to self.topic.
+        :param job_id: id or uuid of a job tracking the action.
         :raises: InvalidParameterValue if supplied info is not valid.
         :raises: UnsupportedDriverExtension if current driver does not have
                  vendor interface.
@@ -158,6 +175,10 @@ class ConductorAPI(object):
 
         """
         cctxt = self.client.prepare(topic=topic or self.topic)
+        if job_id is not None:
+            return cctxt.cast(context, 'vendor_passthru', node_id=node_id,
+                              driver_method=driver_method, info=info,
+                              job_id=job_id)
         return cctxt.call(context, 'vendor_passthru', node_id=node_id,
                           driver_method=driver_method, info=info)
 
@@ -182,13 +203,33 @@ class ConductorAPI(object):
                           driver_method=driver_method,
                           info=info)
 
-    def do_node_deploy(self, context, node_id, rebuild, topic=None):
+    def prefetch_images(self, context, driver_name, images, boot_images):
+        """Asynchronously, have all the conductors which support a driver
+        download images into the caches of the driver.
+
+        :param context: request context.
+        :param driver_name: name of the driver whose caches to fill.
+        :param images: a list of UUIDs or hrefs of instance images.
+        :param boot_images: a list of UUIDs or hrefs of other kernels and
+                            ramdisks, e.g. those of the deploy ramdisk.
+
+        """
+        cctxt = self.client.prepare(fanout=True)
+        return cctxt.cast(context, 'prefetch_images', driver_name=driver_name,
+                          images=images, boot_images=boot_images)
+
+    def do_node_deploy(self, context, node_id, rebuild, topic=None,
+                       job_id=None):
         """Signal to conductor service to perform a deployment.
 
+        If a job is given, the request is sent asynchronously and its
+        outcome is recorded on the job.
+
         :param context: request context.
         :param node_id: node id or uuid.
         :param rebuild: True if this is a rebuild request.
         :param topic: RPC topic. Defaults to self.topic.
+        :param job_id: id or uuid of a job tracking the action.
         :raises: InstanceDeployFailure
         :raises: InvalidParameterValue if validation fails
         :raises: NoFreeConductorWorker when there is no free worker to start
@@ -199,15 +240,22 @@ class ConductorAPI(object):
 
         """
         cctxt = self.client.prepare(topic=topic or self.topic)
+        if job_id is not None:
+            return cctxt.cast(context, 'do_node_deploy', node_id=node_id,
+                              rebuild=rebuild, job_id=job_id)
         return cctxt.call(context, 'do_node_deploy', node_id=node_id,
                           rebuild=rebuild)
 
-    def do_node_tear_down(self, context, node_id, topic=None):
+    def do_node_tear_down(self, context, node_id, topic=None, job_id=None):
         """Signal to conductor service to tear down a deployment.
 
+        If a job is given, the request is sent asynchronously and its
+        outcome is recorded on the job.
+
         :param context: request context.
         :param node_id: node id or uuid.
         :param topic: RPC topic. Defaults to self.topic.
+        :param job_id: id or uuid of a job tracking the action.
         :raises: InstanceDeployFailure
         :raises: InvalidParameterValue if validation fails
         :raises: NoFreeConductorWorker when there is no free worker to start
@@ -218,6 +266,9 @@ class ConductorAPI(object):
 
         """
         cctxt = self.client.prepare(topic=topic or self.topic)
+        if job_id is not None:
+            return cctxt.cast(context, 'do_node_tear_down', node_id=node_id,
+                              job_id=job_id)
         return cctxt.call(context, 'do_node_tear_down', node_id=node_id)
 
     def validate_driver_interfaces(self, context, node_id, topic=None):
@@ -309,3 +360,23 @@ class ConductorAPI(object):
         """
         cctxt = self.client.prepare(topic=topic or self.topic)
         return cctxt.call(context, 'update_port', port_obj=port_obj)
+
+    def do_bulk_node_action(self, context, job_id, node_ids, action, target,
+                            topic=None):
+        """Asynchronously, have a conductor apply an action to many nodes.
+
+        The conductor starts the action on the nodes in batches, in the
+        background, and records the outcome for each node on the job.
+
+        :param context: request context.
+        :param job_id: id or uuid of the job tracking the action.
+        :param node_ids: a list of ids or uuids of nodes mapped to the
+                         conductor.
+        :param action: 'power' or 'provision'.
+        :param target: the desired power or provision state of the nodes.
+        :param topic: RPC topic. Defaults to self.topic.
+
+        """
+        cctxt = self.client.prepare(topic=topic or self.topic)
+        return cctxt.cast(context, 'do_bulk_node_action', job_id=job_id,
+                          node_ids=node_ids, action=action, target=target)
@@ -68,13 +68,30 @@ handling are re-raised.
 from oslo.config import cfg
 
 from ironic.openstack.common import excutils
+from ironic.openstack.common import log
 
 from ironic.common import driver_factory
 from ironic.common import exception
 from ironic.db import api as dbapi
 from ironic import objects
 
+LOG = log.getLogger(__name__)
+
+task_manager_opts = [
+        cfg.BoolOpt('coalesce_node_writes',
+                    default=False,
+                    help='Whether tasks holding an exclusive lock on a node '
+                         'buffer changes to internal node fields, such as '
+                         'driver_info, and write them together with the '
+                         'next power or provision state change, or when '
+                         'the lock is released. This delays when the changes '
+                         'made by the drivers become visible to the API, so '
+                         'only enable it for drivers which do not rely on '
+                         'these changes being visible immediately.'),
+]
+
 CONF = cfg.CONF
+CONF.register_opts(task_manager_opts, 'conductor')
 
 
 def require_exclusive_lock(f):
@@ -93,7 +110,8 @@ def require_exclusive_lock(f):
     return wrapper
 
 
-def acquire(context, node_ids, shared=False, driver_name=None):
+def acquire(context, node_ids, shared=False, driver_name=None,
+            coalesce_writes=None):
     """Shortcut for acquiring a lock on one or more Nodes.
 
     :param context: Request context.
@@ -101,10 +119,14 @@ def acquire(context, node_ids, shared=False, driver_name=None):
     :param shared: Boolean indicating whether to take a shared or exclusive
                    lock. Default: False.
     :param driver_name: Name of Driver. Default: None.
+    :param coalesce_writes: Whether to coalesce node writes, see
+                            :class:`TaskManager`. Default: the
+                            [conductor]coalesce_node_writes option.
     :returns: An instance of :class:`TaskManager`.
 
     """
-    return TaskManager(context, node_ids, shared, driver_name)
+    return TaskManager(context, node_ids, shared, driver_name,
+                       coalesce_writes)
 
 
 class TaskManager(object):
@@ -115,7 +137,8 @@ class TaskManager(object):
 
     """
 
-    def __init__(self, context, node_ids, shared=False, driver_name=None):
+    def __init__(self, context, node_ids, shared=False, driver_name=None,
+                 coalesce_writes=None):
         """Create a new TaskManager.
 
         Acquire a lock atomically on a non-empty set of nodes. The lock
@@ -123,12 +146,19 @@ class TaskManager(object):
         read-only or non-disruptive actions only, and must be considerate
         to what other threads may be doing on the nodes at the same time.
 
+        While an exclusive lock is held with write coalescing enabled,
+        Node.save() only writes once a power or provision state (or
+        another field clients watch) changes; changes to internal fields
+        are buffered until then, or until the resources are released.
+
         :param context: request context
         :param node_ids: A list of ids or uuids of nodes to lock.
         :param shared: Boolean indicating whether to take a shared or exclusive
                        lock. Default: False.
         :param driver_name: The name of the driver to load, if different
                             from the Node's current driver.
+        :param coalesce_writes: Whether to coalesce node writes. Default:
+                                the [conductor]coalesce_node_writes option.
         :raises: DriverNotFound
         :raises: NodeAlreadyLocked
 
@@ -139,6 +169,9 @@ class TaskManager(object):
         self.shared = shared
         self.dbapi = dbapi.get_instance()
         self._spawn_method = None
+        if coalesce_writes is None:
+            coalesce_writes = CONF.conductor.coalesce_node_writes
+        coalesce_writes = coalesce_writes and not shared
 
         # instead of generating an exception, DTRT and convert to a list
         if not isinstance(node_ids, list):
@@ -154,12 +187,13 @@ class TaskManager(object):
                     #             list. This should be refactored.
                     node = self.dbapi.reserve_nodes(CONF.host, [id])[0]
                     locked_node_list.append(node.id)
+                    node.coalesce_writes = coalesce_writes
                 else:
                     node = objects.Node.get(context, id)
-                ports = self.dbapi.get_ports_by_node_id(node.id)
                 driver = driver_factory.get_driver(driver_name or node.driver)
 
-                self.resources.append(NodeResource(node, ports, driver))
+                # NOTE: ports are only loaded if the task uses them.
+                self.resources.append(NodeResource(node, None, driver))
         except Exception:
             with excutils.save_and_reraise_exception():
                 if locked_node_list:
@@ -171,6 +205,11 @@ class TaskManager(object):
         self._spawn_args = args
         self._spawn_kwargs = kwargs
 
+    def flush(self):
+        """Write the node changes buffered by write coalescing."""
+        for r in self.resources:
+            r.node.flush(self.context)
+
     def release_resources(self):
         """Release any resources for which this TaskManager
         was holding an exclusive lock.
@@ -178,6 +217,18 @@ class TaskManager(object):
 
         if not self.shared:
             if self.resources:
+                for r in self.resources:
+                    try:
+                        r.node.flush(self.context)
+                    except exception.NodeNotFound:
+                        # the node was deleted within the task's context.
+                        pass
+                    except Exception as e:
+                        LOG.error(_("Failed to save pending changes of "
+                                    "node %(node)s before releasing it: "
+                                    "%(error)s"),
+                                  {'node': r.node.uuid, 'error': e})
+                    r.node.coalesce_writes = False
                 node_ids = [r.node.id for r in self.resources]
                 try:
                     self.dbapi.release_nodes(CONF.host, node_ids)
@@ -265,9 +316,24 @@ class TaskManager(object):
 
 
 class NodeResource(object):
-    """Wrapper to hold a Node, its associated Port(s), and its Driver."""
+    """Wrapper to hold a Node, its associated Port(s), and its Driver.
+
+    If no ports are given, they are loaded from the database the first
+    time they are accessed and kept for the lifetime of the resource.
+    """
 
     def __init__(self, node, ports, driver):
         self.node = node
-        self.ports = ports
+        self._ports = ports
         self.driver = driver
+
+    @property
+    def ports(self):
+        if self._ports is None:
+            self._ports = dbapi.get_instance().get_ports_by_node_id(
+                    self.node.id)
+        return self._ports
+
+    @ports.setter
+    def ports(self, ports):
+        self._ports = ports
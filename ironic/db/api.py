@@ -46,6 +46,17 @@ class Connection(object):
     def __init__(self):
         """Constructor."""
 
+    @abc.abstractmethod
+    def use_replica_reads(self, enabled):
+        """Allow or forbid the reads of the current thread to use the
+        read-only replica of the database, if one is configured.
+
+        Once the thread writes, its reads use the primary database again
+        until this is called anew, so that it reads its own writes.
+
+        :param enabled: Whether reads may use the replica.
+        """
+
     @abc.abstractmethod
     def get_nodeinfo_list(self, columns=None, filters=None, limit=None,
                           marker=None, sort_key=None, sort_dir=None):
@@ -61,8 +72,15 @@ class Connection(object):
                         'chassis_uuid': uuid of chassis
                         'driver': driver's name
                         'provision_state': provision state of node
+                        'power_state': power state of node
                         'provisioned_before': nodes with provision_updated_at
                          field before this interval in seconds
+                        'cpu_arch': CPU architecture of node
+                        'min_cpus': nodes with at least this many CPUs
+                        'min_memory_mb': nodes with at least this much
+                         memory
+                        'min_local_gb': nodes with at least this much
+                         local disk
         :param limit: Maximum number of nodes to return.
         :param marker: the last item of the previous page; we return the next
                        result set.
@@ -84,8 +102,15 @@ class Connection(object):
                         'chassis_uuid': uuid of chassis
                         'driver': driver's name
                         'provision_state': provision state of node
+                        'power_state': power state of node
                         'provisioned_before': nodes with provision_updated_at
                          field before this interval in seconds
+                        'cpu_arch': CPU architecture of node
+                        'min_cpus': nodes with at least this many CPUs
+                        'min_memory_mb': nodes with at least this much
+                         memory
+                        'min_local_gb': nodes with at least this much
+                         local disk
         :param limit: Maximum number of nodes to return.
         :param marker: the last item of the previous page; we return the next
                        result set.
@@ -94,6 +119,18 @@ class Connection(object):
                          (asc, desc)
         """
 
+    @abc.abstractmethod
+    def get_node_stats(self):
+        """Count the nodes per provision state, power state, driver,
+        maintenance mode and chassis.
+
+        :returns: A dict with the 'provision_state', 'power_state',
+                  'driver', 'maintenance' and 'chassis_uuid' keys, each
+                  mapping the values of that field to the number of
+                  nodes having it, and a 'total' key with the number
+                  of nodes.
+        """
+
     @abc.abstractmethod
     def reserve_nodes(self, tag, nodes):
         """Reserve a set of nodes atomically.
@@ -140,6 +177,24 @@ class Connection(object):
         :returns: A node.
         """
 
+    @abc.abstractmethod
+    def create_nodes(self, nodes, batch_size=100):
+        """Create several nodes, along with their ports.
+
+        The nodes are checked for conflicts with the existing nodes and
+        ports, and with each other, in one pass per batch; the nodes which
+        do not conflict are then inserted in a single transaction per batch.
+
+        :param nodes: A list of dicts of node values as accepted by
+                      create_node(). Each dict may also have a 'ports' key
+                      with a list of dicts of port values; their node_id is
+                      set once the node is inserted.
+        :param batch_size: The maximum number of nodes inserted per
+                           transaction.
+        :returns: A list with, for each node, None if it was created with
+                  all its ports or the exception explaining why it was not.
+        """
+
     @abc.abstractmethod
     def get_node_by_id(self, node_id):
         """Return a node.
@@ -172,9 +227,14 @@ class Connection(object):
         """
 
     @abc.abstractmethod
-    def update_node(self, node_id, values):
+    def update_node(self, node_id, values, expected_version=None):
         """Update properties of a node.
 
+        Each update increments the version of the node. If an expected
+        version is given, the node is only updated if it still has that
+        version, with a single compare-and-swap statement rather than by
+        locking the row.
+
         :param node_id: The id or uuid of a node.
         :param values: Dict of values to update.
                        May be a partial list, eg. when setting the
@@ -187,9 +247,15 @@ class Connection(object):
                              'my-field-2': val2,
                             }
                        }
+
+                       A change of the power or provision state is
+                       recorded as a node event.
+        :param expected_version: Optional, the version the node must have.
         :returns: A node.
         :raises: NodeAssociated
         :raises: NodeNotFound
+        :raises: NodeVersionConflict if the node does not have the expected
+                 version.
         """
 
     @abc.abstractmethod
@@ -206,6 +272,7 @@ class Connection(object):
 
         :param vif: The uuid of the VIF.
         :returns: A port.
+        :raises: PortNotFound
         """
 
     @abc.abstractmethod
@@ -352,3 +419,89 @@ class Connection(object):
                     {driverA: set([host1, host2]),
                      driverB: set([host2, host3])}
         """
+
+    @abc.abstractmethod
+    def create_job(self, values):
+        """Create a new job.
+
+        :param values: A dict containing the values of the job. For example:
+
+                        {
+                         'uuid': utils.generate_uuid(),
+                         'action': 'power',
+                         'target': states.POWER_OFF,
+                         'filters': {'driver': 'pxe_ipmitool'},
+                         'total': 42,
+                        }
+        :returns: A job.
+        """
+
+    @abc.abstractmethod
+    def get_job(self, job_id):
+        """Return a job.
+
+        :param job_id: The id or the uuid of a job.
+        :returns: A job.
+        :raises: JobNotFound
+        """
+
+    @abc.abstractmethod
+    def update_job_progress(self, job_id, succeeded=0, failed=0,
+                            last_error=None):
+        """Record the outcome of the action of a job on some of its nodes.
+
+        The counters are updated atomically, so that several conductors
+        may record the progress of the same job concurrently. The job
+        state is updated once all its nodes have been accounted for.
+
+        :param job_id: The id or the uuid of a job.
+        :param succeeded: The number of nodes the action succeeded on.
+        :param failed: The number of nodes the action failed on.
+        :param last_error: The error of the last failed node, if any.
+        :returns: A job.
+        :raises: JobNotFound
+        """
+
+    @abc.abstractmethod
+    def get_node_events(self, since, node_uuids=None, limit=None,
+                        until=None):
+        """Return the node state changes recorded after a given event.
+
+        :param since: The id of the last event already seen.
+        :param node_uuids: Optional, a list of node uuids to filter on.
+        :param limit: Maximum number of events to return.
+        :param until: Optional, the id of the last event to return.
+        :returns: A list of node events, ordered by id.
+        """
+
+    @abc.abstractmethod
+    def get_last_node_event_id(self, commit_window=None, id_increment=1):
+        """Return the id of the last recorded node event, or 0.
+
+        :param commit_window: Optional, the number of seconds the
+                              transaction recording an event may take to
+                              be committed. If given, the id returned is
+                              the last one up to which every event is
+                              committed: an id missing before an event
+                              recorded in the last commit_window seconds
+                              may belong to an event not committed yet.
+        :param id_increment: The increment between the ids allocated to
+                             consecutive events, used to find the missing
+                             ids. If 0, the events recorded in the last
+                             commit_window seconds are all ignored.
+        """
+
+    @abc.abstractmethod
+    def get_pruned_node_event_id(self):
+        """Return the id of the last node event deleted, or 0."""
+
+    @abc.abstractmethod
+    def destroy_node_events(self, before):
+        """Delete the node events recorded before a given time.
+
+        The id of the last deleted event is kept, see
+        get_pruned_node_event_id().
+
+        :param before: A datetime.
+        :returns: The number of deleted events.
+        """
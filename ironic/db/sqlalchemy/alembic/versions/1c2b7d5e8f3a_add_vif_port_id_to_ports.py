@@ -0,0 +1,54 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add vif_port_id to ports
+
+Revision ID: 1c2b7d5e8f3a
+Revises: d9a535cf701d
+Create Date: 2014-06-09 14:21:05.118212
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1c2b7d5e8f3a'
+down_revision = 'd9a535cf701d'
+
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import table, column
+
+
+def upgrade():
+    op.add_column('ports', sa.Column('vif_port_id', sa.String(length=255),
+                                     nullable=True))
+    op.create_index('port_vif_port_id', 'ports', ['vif_port_id'])
+
+    # Copy the VIF ids of the existing ports out of their extra field.
+    ports = table('ports',
+                  column('id', sa.Integer),
+                  column('extra', sa.Text),
+                  column('vif_port_id', sa.String(length=255)))
+    bind = op.get_bind()
+    for port_id, extra in bind.execute(sa.select([ports.c.id,
+                                                  ports.c.extra])):
+        vif = json.loads(extra).get('vif_port_id') if extra else None
+        if vif:
+            bind.execute(ports.update().
+                         where(ports.c.id == port_id).
+                         values(vif_port_id=vif))
+
+
+def downgrade():
+    op.drop_index('port_vif_port_id', 'ports')
+    op.drop_column('ports', 'vif_port_id')
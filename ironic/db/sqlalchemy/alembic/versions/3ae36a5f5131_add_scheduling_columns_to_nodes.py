@@ -0,0 +1,80 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add scheduling columns to nodes
+
+Revision ID: 3ae36a5f5131
+Revises: 1c2b7d5e8f3a
+Create Date: 2014-06-11 09:47:26.530741
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3ae36a5f5131'
+down_revision = '1c2b7d5e8f3a'
+
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import table, column
+
+
+_COLUMNS = ('cpus', 'memory_mb', 'local_gb', 'cpu_arch')
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def upgrade():
+    op.add_column('nodes', sa.Column('cpus', sa.Integer(), nullable=True))
+    op.add_column('nodes', sa.Column('memory_mb', sa.Integer(),
+                                     nullable=True))
+    op.add_column('nodes', sa.Column('local_gb', sa.Integer(),
+                                     nullable=True))
+    op.add_column('nodes', sa.Column('cpu_arch', sa.String(length=255),
+                                     nullable=True))
+    for name in _COLUMNS:
+        op.create_index('node_%s' % name, 'nodes', [name])
+
+    # Copy the scheduling properties of the existing nodes.
+    nodes = table('nodes',
+                  column('id', sa.Integer),
+                  column('properties', sa.Text),
+                  column('cpus', sa.Integer),
+                  column('memory_mb', sa.Integer),
+                  column('local_gb', sa.Integer),
+                  column('cpu_arch', sa.String(length=255)))
+    bind = op.get_bind()
+    for node_id, properties in bind.execute(sa.select([nodes.c.id,
+                                                       nodes.c.properties])):
+        if not properties:
+            continue
+        properties = json.loads(properties)
+        values = {'cpus': _int_or_none(properties.get('cpus')),
+                  'memory_mb': _int_or_none(properties.get('memory_mb')),
+                  'local_gb': _int_or_none(properties.get('local_gb')),
+                  'cpu_arch': properties.get('cpu_arch') or None}
+        if any(value is not None for value in values.values()):
+            bind.execute(nodes.update().
+                         where(nodes.c.id == node_id).
+                         values(**values))
+
+
+def downgrade():
+    for name in _COLUMNS:
+        op.drop_index('node_%s' % name, 'nodes')
+        op.drop_column('nodes', name)
@@ -0,0 +1,38 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add node state indexes
+
+Revision ID: 5a8f2c4b9e71
+Revises: 3ae36a5f5131
+Create Date: 2014-06-12 16:05:52.248107
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5a8f2c4b9e71'
+down_revision = '3ae36a5f5131'
+
+from alembic import op
+
+
+_COLUMNS = ('driver', 'provision_state', 'power_state', 'reservation')
+
+
+def upgrade():
+    for name in _COLUMNS:
+        op.create_index('node_%s' % name, 'nodes', [name])
+
+
+def downgrade():
+    for name in _COLUMNS:
+        op.drop_index('node_%s' % name, 'nodes')
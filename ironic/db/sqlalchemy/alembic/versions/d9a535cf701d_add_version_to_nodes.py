@@ -0,0 +1,35 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add version to nodes
+
+Revision ID: d9a535cf701d
+Revises: fda9c2b8a957
+Create Date: 2014-06-05 11:02:37.415682
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd9a535cf701d'
+down_revision = 'fda9c2b8a957'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('nodes', sa.Column('version', sa.Integer(),
+                                     nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('nodes', 'version')
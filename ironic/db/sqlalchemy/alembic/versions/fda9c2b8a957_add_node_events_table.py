@@ -0,0 +1,52 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add node_events table
+
+Revision ID: fda9c2b8a957
+Revises: 4f399b21ae71
+Create Date: 2014-06-04 15:36:08.102871
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'fda9c2b8a957'
+down_revision = '4f399b21ae71'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'node_events',
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('node_uuid', sa.String(length=36), nullable=True),
+        sa.Column('power_state', sa.String(length=15), nullable=True),
+        sa.Column('target_power_state', sa.String(length=15),
+                  nullable=True),
+        sa.Column('provision_state', sa.String(length=15), nullable=True),
+        sa.Column('target_provision_state', sa.String(length=15),
+                  nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        mysql_ENGINE='InnoDB',
+        mysql_DEFAULT_CHARSET='UTF8'
+    )
+    op.create_index('node_events_created_at', 'node_events', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('node_events_created_at', 'node_events')
+    op.drop_table('node_events')
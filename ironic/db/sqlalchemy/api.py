@@ -18,9 +18,13 @@
 
 import collections
 import datetime
+import threading
+import time
 
 from oslo.config import cfg
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.sql import expression
+from sqlalchemy.sql import func
 
 from ironic.common import exception
 from ironic.common import paths
@@ -36,13 +40,32 @@ from ironic.openstack.common.db.sqlalchemy import utils as db_utils
 from ironic.openstack.common import log
 from ironic.openstack.common import timeutils
 
+replica_opts = [
+    cfg.StrOpt('slave_connection',
+               secret=True,
+               help='The SQLAlchemy connection string of a read-only '
+                    'replica of the database. If set, the API service '
+                    'reads from it, except after a write within the same '
+                    'request or while the replica lags too far behind.'),
+    cfg.IntOpt('max_slave_lag',
+               default=30,
+               help='Maximum replication lag, in seconds, before reads '
+                    'fall back to the primary database. The lag is '
+                    'estimated from the conductor heartbeats seen on the '
+                    'replica.'),
+]
+
 CONF = cfg.CONF
+CONF.register_opts(replica_opts, 'database')
 CONF.import_opt('connection',
                 'ironic.openstack.common.db.options',
                 group='database')
 CONF.import_opt('heartbeat_timeout',
                 'ironic.conductor.manager',
                 group='conductor')
+CONF.import_opt('heartbeat_interval',
+                'ironic.conductor.manager',
+                group='conductor')
 
 LOG = log.getLogger(__name__)
 
@@ -51,10 +74,27 @@ db_options.set_defaults(_DEFAULT_SQL_CONNECTION, 'ironic.sqlite')
 
 
 _FACADE = None
-
-
-def _create_facade_lazily():
-    global _FACADE
+_SLAVE_FACADE = None
+
+# Whether the current thread may read from the replica, and whether it
+# wrote to the primary database since it was allowed to.
+_REPLICA_READS = threading.local()
+
+# NOTE: the replication lag is checked at most once per this many
+#       seconds, see _slave_lagging().
+_SLAVE_LAG_CHECK_INTERVAL = 5
+_SLAVE_LAG = {'checked_at': None, 'lagging': True}
+
+
+def _create_facade_lazily(use_slave=False):
+    global _FACADE, _SLAVE_FACADE
+    if use_slave:
+        if _SLAVE_FACADE is None:
+            _SLAVE_FACADE = db_session.EngineFacade(
+                CONF.database.slave_connection,
+                **dict(CONF.database.iteritems())
+            )
+        return _SLAVE_FACADE
     if _FACADE is None:
         _FACADE = db_session.EngineFacade(
             CONF.database.connection,
@@ -68,23 +108,93 @@ def get_engine():
     return facade.get_engine()
 
 
-def get_session(**kwargs):
-    facade = _create_facade_lazily()
+def get_session(use_slave=False, **kwargs):
+    """Return a session on the primary database or on its replica.
+
+    Any session on the primary database is assumed to write, so the
+    following reads of the thread no longer use the replica.
+
+    :param use_slave: Whether to use the replica.
+    """
+    if not use_slave:
+        _REPLICA_READS.wrote = True
+    facade = _create_facade_lazily(use_slave)
     return facade.get_session(**kwargs)
 
 
+def _slave_lagging():
+    """Whether the replica lags too far behind the primary database.
+
+    The conductors update their heartbeat every heartbeat_interval
+    seconds, so the newest heartbeat on the replica tells how far it
+    lags. An unreachable replica is considered to be lagging.
+    """
+    now = time.time()
+    checked_at = _SLAVE_LAG['checked_at']
+    if checked_at is not None and now - checked_at < _SLAVE_LAG_CHECK_INTERVAL:
+        return _SLAVE_LAG['lagging']
+
+    try:
+        session = get_session(use_slave=True)
+        last_heartbeat = session.query(
+                func.max(models.Conductor.updated_at)).scalar()
+    except Exception as e:
+        LOG.warning(_("Failed to check the replication lag of the "
+                      "database replica, reading from the primary "
+                      "database. Error: %s"), e)
+        last_heartbeat = None
+
+    max_age = (CONF.conductor.heartbeat_interval +
+               CONF.database.max_slave_lag)
+    lagging = (last_heartbeat is None or
+               timeutils.is_older_than(last_heartbeat, max_age))
+    if lagging and not _SLAVE_LAG['lagging']:
+        LOG.warning(_("The database replica lags more than %s seconds "
+                      "behind, reading from the primary database."),
+                    CONF.database.max_slave_lag)
+    _SLAVE_LAG.update(checked_at=now, lagging=lagging)
+    return lagging
+
+
+def _use_slave():
+    """Whether the reads of the current thread should use the replica."""
+    return (bool(CONF.database.slave_connection) and
+            getattr(_REPLICA_READS, 'enabled', False) and
+            not getattr(_REPLICA_READS, 'wrote', False) and
+            not _slave_lagging())
+
+
 def get_backend():
     """The backend is this module itself."""
     return Connection()
 
 
+# The fields of a node whose changes are recorded as node events.
+_NODE_EVENT_FIELDS = ('power_state', 'target_power_state',
+                      'provision_state', 'target_provision_state')
+
+
+def _add_node_event(node, session):
+    """Record the current power and provision state of a node."""
+    event = models.NodeEvent()
+    event.update({'node_uuid': node.uuid,
+                  'power_state': node.power_state,
+                  'target_power_state': node.target_power_state,
+                  'provision_state': node.provision_state,
+                  'target_provision_state': node.target_provision_state,
+                  'last_error': node.last_error})
+    session.add(event)
+
+
 def model_query(model, *args, **kwargs):
     """Query helper for simpler session usage.
 
-    :param session: if present, the session to use
+    :param session: if present, the session to use. Otherwise the
+                    replica is used if the current thread may read
+                    from it.
     """
 
-    session = kwargs.get('session') or get_session()
+    session = kwargs.get('session') or get_session(use_slave=_use_slave())
     query = session.query(model, *args)
     return query
 
@@ -174,6 +284,19 @@ def _check_port_change_forbidden(port, session):
                                        host=node_ref['reservation'])
 
 
+def _decoded_column(column):
+    """Return the column, decoding it when loaded if it is lazily decoded.
+
+    The JSON fields of the models are only decoded by the objects, see
+    models.LazyJSONEncodedDict, but queries returning the columns
+    themselves give them to the caller as they are.
+    """
+    if isinstance(column.type, models.LazyJSONEncodedDict):
+        decoded = expression.type_coerce(column, models.JSONEncodedDict)
+        return decoded.label(column.key)
+    return column
+
+
 def _paginate_query(model, limit=None, marker=None, sort_key=None,
                     sort_dir=None, query=None):
     if not query:
@@ -207,10 +330,16 @@ class Connection(api.Connection):
     def __init__(self):
         pass
 
+    def use_replica_reads(self, enabled):
+        _REPLICA_READS.enabled = enabled
+        _REPLICA_READS.wrote = False
+
     def _add_nodes_filters(self, query, filters):
         if filters is None:
             filters = []
 
+        if 'uuids' in filters:
+            query = query.filter(models.Node.uuid.in_(filters['uuids']))
         if 'chassis_uuid' in filters:
             # get_chassis() to raise an exception if the chassis is not found
             chassis_obj = self.get_chassis(filters['chassis_uuid'])
@@ -231,10 +360,18 @@ class Connection(api.Connection):
             query = query.filter_by(driver=filters['driver'])
         if 'provision_state' in filters:
             query = query.filter_by(provision_state=filters['provision_state'])
+        if 'power_state' in filters:
+            query = query.filter_by(power_state=filters['power_state'])
         if 'provisioned_before' in filters:
             limit = timeutils.utcnow() - datetime.timedelta(
                                          seconds=filters['provisioned_before'])
             query = query.filter(models.Node.provision_updated_at < limit)
+        if 'cpu_arch' in filters:
+            query = query.filter_by(cpu_arch=filters['cpu_arch'])
+        for name in ('cpus', 'memory_mb', 'local_gb'):
+            if 'min_' + name in filters:
+                column = getattr(models.Node, name)
+                query = query.filter(column >= filters['min_' + name])
 
         return query
 
@@ -245,9 +382,10 @@ class Connection(api.Connection):
         if columns is None:
             columns = [models.Node.id]
         else:
-            columns = [getattr(models.Node, c) for c in columns]
+            columns = [_decoded_column(getattr(models.Node, c))
+                       for c in columns]
 
-        query = model_query(*columns, base_model=models.Node)
+        query = model_query(*columns)
         query = self._add_nodes_filters(query, filters)
         return _paginate_query(models.Node, limit, marker,
                                sort_key, sort_dir, query)
@@ -260,6 +398,30 @@ class Connection(api.Connection):
         return _paginate_query(models.Node, limit, marker,
                                sort_key, sort_dir, query)
 
+    def get_node_stats(self):
+        # NOTE: count with a single query, so that all the counts are
+        #       read from the same snapshot and add up to the same total.
+        fields = ('provision_state', 'power_state', 'driver', 'maintenance')
+        columns = [getattr(models.Node, f) for f in fields]
+        columns.append(models.Chassis.uuid)
+        query = model_query(*(columns + [func.count(models.Node.id)])).\
+                    select_from(models.Node).\
+                    outerjoin(models.Chassis,
+                              models.Node.chassis_id == models.Chassis.id).\
+                    group_by(*columns)
+
+        stats = dict((f, collections.defaultdict(int))
+                     for f in fields + ('chassis_uuid',))
+        total = 0
+        for row in query:
+            count = row[-1]
+            for field, value in zip(fields + ('chassis_uuid',), row[:-1]):
+                stats[field][value] += count
+            total += count
+        stats = dict((f, dict(counts)) for f, counts in stats.items())
+        stats['total'] = total
+        return stats
+
     @objects.objectify(objects.Node)
     def reserve_nodes(self, tag, nodes):
         # assume nodes does not contain duplicates
@@ -314,6 +476,98 @@ class Connection(api.Connection):
         node.save()
         return node
 
+    def _check_new_nodes(self, nodes):
+        """Return, for each node, why it can not be created if it can't."""
+        uuids = [n['uuid'] for n in nodes]
+        addresses = [p['address'] for n in nodes for p in n.get('ports', [])]
+        # NOTE: a node created by an earlier request may not have reached
+        #       the replica yet, check the primary database.
+        session = get_session()
+        known_uuids = set()
+        if uuids:
+            query = model_query(models.Node.uuid, session=session).filter(
+                                    models.Node.uuid.in_(uuids))
+            known_uuids.update(row[0] for row in query)
+        known_addresses = set()
+        if addresses:
+            query = model_query(models.Port.address, session=session).filter(
+                                    models.Port.address.in_(addresses))
+            known_addresses.update(row[0] for row in query)
+
+        errors = []
+        for node in nodes:
+            error = None
+            if node['uuid'] in known_uuids:
+                error = exception.NodeAlreadyExists(uuid=node['uuid'])
+            else:
+                for port in node.get('ports', []):
+                    if port['address'] in known_addresses:
+                        error = exception.MACAlreadyExists(
+                                                mac=port['address'])
+                        break
+            if error is None:
+                # also catch duplicates within the request
+                known_uuids.add(node['uuid'])
+                known_addresses.update(p['address']
+                                       for p in node.get('ports', []))
+            errors.append(error)
+        return errors
+
+    def _insert_nodes(self, nodes):
+        session = get_session()
+        with session.begin():
+            for values in nodes:
+                values = dict(values)
+                ports = values.pop('ports', [])
+                node = models.Node()
+                node.update(values)
+                session.add(node)
+                # NOTE: flush to get the node id the ports refer to.
+                session.flush()
+                for port_values in ports:
+                    port = models.Port()
+                    port.update(port_values)
+                    port.node_id = node.id
+                    session.add(port)
+            session.flush()
+
+    def create_nodes(self, nodes, batch_size=100):
+        for values in nodes:
+            # ensure defaults are present for new nodes
+            if not values.get('uuid'):
+                values['uuid'] = utils.generate_uuid()
+            if not values.get('power_state'):
+                values['power_state'] = states.NOSTATE
+            if not values.get('provision_state'):
+                values['provision_state'] = states.NOSTATE
+            for port_values in values.get('ports', []):
+                if not port_values.get('uuid'):
+                    port_values['uuid'] = utils.generate_uuid()
+
+        results = []
+        for start in range(0, len(nodes), batch_size):
+            batch = nodes[start:start + batch_size]
+            errors = self._check_new_nodes(batch)
+            valid = [n for n, e in zip(batch, errors) if e is None]
+            if not valid:
+                results.extend(errors)
+                continue
+            try:
+                self._insert_nodes(valid)
+            except db_exc.DBDuplicateEntry:
+                # NOTE: a conflicting node or port was created concurrently,
+                #       insert the nodes one by one to find out which ones.
+                for i, node in enumerate(batch):
+                    if errors[i] is not None:
+                        continue
+                    try:
+                        self._insert_nodes([node])
+                    except db_exc.DBDuplicateEntry:
+                        errors[i] = (self._check_new_nodes([node])[0] or
+                                     exception.Conflict())
+            results.extend(errors)
+        return results
+
     def get_node_by_id(self, node_id):
         query = model_query(models.Node).filter_by(id=node_id)
         try:
@@ -366,7 +620,14 @@ class Connection(api.Connection):
             query.delete()
 
     @objects.objectify(objects.Node)
-    def update_node(self, node_id, values):
+    def update_node(self, node_id, values, expected_version=None):
+        if 'provision_state' in values:
+            values['provision_updated_at'] = timeutils.utcnow()
+
+        if expected_version is not None:
+            return self._update_node_if_version(node_id, values,
+                                                expected_version)
+
         session = get_session()
         with session.begin():
             query = model_query(models.Node, session=session)
@@ -381,10 +642,46 @@ class Connection(api.Connection):
                 raise exception.NodeAssociated(node=node_id,
                                 instance=ref.instance_uuid)
 
-            if 'provision_state' in values:
-                values['provision_updated_at'] = timeutils.utcnow()
-
+            state_changed = any(field in values and
+                                values[field] != ref[field]
+                                for field in _NODE_EVENT_FIELDS)
             ref.update(values)
+            ref.version += 1
+            if state_changed:
+                _add_node_event(ref, session)
+        return ref
+
+    def _update_node_if_version(self, node_id, values, expected_version):
+        session = get_session()
+        with session.begin():
+            query = model_query(models.Node, session=session)
+            query = add_identity_filter(query, node_id)
+
+            cas_query = query.filter_by(version=expected_version)
+            # Prevent instance_uuid overwriting
+            if values.get('instance_uuid'):
+                cas_query = cas_query.filter_by(instance_uuid=None)
+            updates = dict(values, version=expected_version + 1)
+            # NOTE: a bulk update does not go through the model validators.
+            if 'properties' in values:
+                updates.update(models.Node.scheduling_columns(
+                        values['properties']))
+            count = cas_query.update(updates, synchronize_session=False)
+
+            ref = query.first()
+            if ref is None:
+                raise exception.NodeNotFound(node=node_id)
+            if not count:
+                if ref.version != expected_version:
+                    raise exception.NodeVersionConflict(
+                            node=node_id, version=expected_version)
+                raise exception.NodeAssociated(node=node_id,
+                                               instance=ref.instance_uuid)
+
+            # NOTE: the previous values are not read, any update of the
+            #       state fields is recorded.
+            if any(field in values for field in _NODE_EVENT_FIELDS):
+                _add_node_event(ref, session)
         return ref
 
     @objects.objectify(objects.Port)
@@ -401,7 +698,11 @@ class Connection(api.Connection):
 
     @objects.objectify(objects.Port)
     def get_port_by_vif(self, vif):
-        pass
+        query = model_query(models.Port).filter_by(vif_port_id=vif)
+        result = query.first()
+        if result is None:
+            raise exception.PortNotFound(port=vif)
+        return result
 
     @objects.objectify(objects.Port)
     def get_port_list(self, limit=None, marker=None,
@@ -574,3 +875,122 @@ class Connection(api.Connection):
             for driver in row['drivers']:
                 d2c[driver].add(row['hostname'])
         return d2c
+
+    def create_job(self, values):
+        if not values.get('uuid'):
+            values['uuid'] = utils.generate_uuid()
+        values.setdefault('total', 0)
+        values.setdefault('succeeded', 0)
+        values.setdefault('failed', 0)
+        if not values.get('state'):
+            if values['total']:
+                values['state'] = states.JOB_RUNNING
+            else:
+                values['state'] = states.JOB_DONE
+
+        job = models.Job()
+        job.update(values)
+        job.save()
+        return job
+
+    def get_job(self, job_id):
+        query = model_query(models.Job)
+        query = add_identity_filter(query, job_id)
+        try:
+            return query.one()
+        except NoResultFound:
+            raise exception.JobNotFound(job=job_id)
+
+    def update_job_progress(self, job_id, succeeded=0, failed=0,
+                            last_error=None):
+        session = get_session()
+        with session.begin():
+            query = model_query(models.Job, session=session)
+            query = add_identity_filter(query, job_id)
+            try:
+                ref = query.with_lockmode('update').one()
+            except NoResultFound:
+                raise exception.JobNotFound(job=job_id)
+
+            ref.succeeded += succeeded
+            ref.failed += failed
+            if last_error:
+                ref.last_error = last_error
+            if ref.succeeded + ref.failed >= ref.total:
+                if ref.failed:
+                    ref.state = states.JOB_FAILED
+                else:
+                    ref.state = states.JOB_DONE
+        return ref
+
+    def get_node_events(self, since, node_uuids=None, limit=None,
+                        until=None):
+        query = model_query(models.NodeEvent)
+        query = query.filter(models.NodeEvent.id > since)
+        if until is not None:
+            query = query.filter(models.NodeEvent.id <= until)
+        if node_uuids is not None:
+            query = query.filter(models.NodeEvent.node_uuid.in_(node_uuids))
+        query = query.order_by(models.NodeEvent.id)
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+    def get_last_node_event_id(self, commit_window=None, id_increment=1):
+        if not commit_window:
+            query = model_query(func.max(models.NodeEvent.id))
+            return query.scalar() or 0
+
+        recent = (timeutils.utcnow() -
+                  datetime.timedelta(seconds=commit_window))
+        query = model_query(func.max(models.NodeEvent.id))
+        query = query.filter(models.NodeEvent.created_at < recent)
+        last_id = query.scalar()
+        if last_id is None:
+            # NOTE: no event is old enough to be settled, those before
+            #       the recent ones were deleted, if any.
+            last_id = self.get_pruned_node_event_id()
+        if not id_increment:
+            return last_id
+
+        # NOTE: ids are allocated in order, but the events are committed
+        #       in any order. Stop before the first id missing among the
+        #       recent events, it may still be committed.
+        query = model_query(models.NodeEvent.id)
+        query = query.filter(models.NodeEvent.id > last_id)
+        query = query.order_by(models.NodeEvent.id)
+        for (event_id,) in query:
+            if event_id - last_id > id_increment:
+                break
+            last_id = event_id
+        return last_id
+
+    def get_pruned_node_event_id(self):
+        query = model_query(func.max(models.NodeEventMark.pruned_id))
+        return query.scalar() or 0
+
+    def destroy_node_events(self, before):
+        session = get_session()
+        with session.begin():
+            query = model_query(func.max(models.NodeEvent.id),
+                                session=session)
+            pruned_id = query.filter(
+                    models.NodeEvent.created_at < before).scalar()
+            if pruned_id is None:
+                return 0
+
+            query = model_query(models.NodeEvent, session=session)
+            query = query.filter(models.NodeEvent.created_at < before)
+            count = query.delete(synchronize_session=False)
+
+            # NOTE: keep the id of the last deleted event, it tells which
+            #       cursors of the clients watching node events expired.
+            mark = model_query(models.NodeEventMark,
+                               session=session).first()
+            if mark is None:
+                mark = models.NodeEventMark()
+                mark.pruned_id = pruned_id
+                session.add(mark)
+            elif mark.pruned_id < pruned_id:
+                mark.pruned_id = pruned_id
+            return count
@@ -27,18 +27,46 @@ from sqlalchemy import Boolean, Column, DateTime
 from sqlalchemy import ForeignKey, Integer, Index
 from sqlalchemy import schema, String, Text
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import validates
 from sqlalchemy.types import TypeDecorator, TEXT
 
+from ironic.common import utils
 from ironic.openstack.common.db.sqlalchemy import models
+from ironic.openstack.common import importutils
+from ironic.openstack.common import log as logging
 
 sql_opts = [
     cfg.StrOpt('mysql_engine',
                default='InnoDB',
-               help='MySQL engine to use.')
+               help='MySQL engine to use.'),
+    cfg.StrOpt('json_codec',
+               default='json',
+               help='Module used to encode and decode the JSON fields '
+                    'stored in the database, such as json, simplejson or '
+                    'ujson. It must provide loads() and dumps(). json is '
+                    'used if it can not be imported.'),
 ]
 
 cfg.CONF.register_opts(sql_opts, 'database')
 
+LOG = logging.getLogger(__name__)
+
+_JSON_CODECS = {}
+
+
+def json_codec():
+    """Return the module encoding and decoding the JSON fields."""
+    name = cfg.CONF.database.json_codec
+    codec = _JSON_CODECS.get(name)
+    if codec is None:
+        codec = importutils.try_import(name)
+        if codec is None:
+            LOG.warning(_('Could not import the JSON codec %s, using '
+                          'json instead.'), name)
+            codec = json
+        _JSON_CODECS[name] = codec
+    return codec
+
 
 def table_args():
     engine_name = urlparse.urlparse(cfg.CONF.database_connection).scheme
@@ -52,8 +80,14 @@ class JsonEncodedType(TypeDecorator):
     """Abstract base type serialized as json-encoded string in db."""
     type = None
     impl = TEXT
+    # Whether the loaded values are left encoded, see utils.LazyJSON.
+    lazy = False
 
     def process_bind_param(self, value, dialect):
+        if isinstance(value, utils.LazyJSON):
+            if not value.decoded:
+                return value.raw
+            value = value.decode()
         if value is None:
             # Save default value according to current type to keep the
             # interface the consistent.
@@ -63,12 +97,14 @@ class JsonEncodedType(TypeDecorator):
                             % (self.__class__.__name__,
                                self.type.__name__,
                                type(value).__name__))
-        serialized_value = json.dumps(value)
+        serialized_value = json_codec().dumps(value)
         return serialized_value
 
     def process_result_value(self, value, dialect):
         if value is not None:
-            value = json.loads(value)
+            if self.lazy:
+                return utils.LazyJSON(value, json_codec().loads)
+            value = json_codec().loads(value)
         return value
 
 
@@ -77,6 +113,15 @@ class JSONEncodedDict(JsonEncodedType):
     type = dict
 
 
+class LazyJSONEncodedDict(JSONEncodedDict):
+    """Represents dict serialized as json-encoded string in db.
+
+    The values are loaded as utils.LazyJSON, which is decoded the first
+    time it is used, by the objects when the field is first read.
+    """
+    lazy = True
+
+
 class JSONEncodedList(JsonEncodedType):
     """Represents list serialized as json-encoded string in db."""
     type = list
@@ -113,7 +158,7 @@ class Chassis(Base):
         )
     id = Column(Integer, primary_key=True)
     uuid = Column(String(36))
-    extra = Column(JSONEncodedDict)
+    extra = Column(LazyJSONEncodedDict)
     description = Column(String(255), nullable=True)
 
 
@@ -129,13 +174,28 @@ class Conductor(Base):
     drivers = Column(JSONEncodedList)
 
 
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
 class Node(Base):
     """Represents a bare metal node."""
 
     __tablename__ = 'nodes'
     __table_args__ = (
         schema.UniqueConstraint('uuid', name='uniq_nodes0uuid'),
-        Index('node_instance_uuid', 'instance_uuid'))
+        Index('node_instance_uuid', 'instance_uuid'),
+        Index('node_driver', 'driver'),
+        Index('node_provision_state', 'provision_state'),
+        Index('node_power_state', 'power_state'),
+        Index('node_reservation', 'reservation'),
+        Index('node_cpus', 'cpus'),
+        Index('node_memory_mb', 'memory_mb'),
+        Index('node_local_gb', 'local_gb'),
+        Index('node_cpu_arch', 'cpu_arch'))
     id = Column(Integer, primary_key=True)
     uuid = Column(String(36))
     # NOTE(deva): we store instance_uuid directly on the node so that we can
@@ -149,14 +209,41 @@ class Node(Base):
     target_provision_state = Column(String(15), nullable=True)
     provision_updated_at = Column(DateTime, nullable=True)
     last_error = Column(Text, nullable=True)
-    instance_info = Column(JSONEncodedDict)
-    properties = Column(JSONEncodedDict)
+    instance_info = Column(LazyJSONEncodedDict)
+    properties = Column(LazyJSONEncodedDict)
     driver = Column(String(15))
-    driver_info = Column(JSONEncodedDict)
+    driver_info = Column(LazyJSONEncodedDict)
     reservation = Column(String(255), nullable=True)
     maintenance = Column(Boolean, default=False)
     console_enabled = Column(Boolean, default=False)
-    extra = Column(JSONEncodedDict)
+    extra = Column(LazyJSONEncodedDict)
+    # NOTE: incremented by each update, see Connection.update_node.
+    version = Column(Integer, nullable=False, default=0)
+    # NOTE: copies of the properties instances are scheduled on, so that
+    #       nodes can be filtered on them without decoding properties.
+    #       Set whenever properties is, see scheduling_columns().
+    cpus = Column(Integer, nullable=True)
+    memory_mb = Column(Integer, nullable=True)
+    local_gb = Column(Integer, nullable=True)
+    cpu_arch = Column(String(255), nullable=True)
+
+    @staticmethod
+    def scheduling_columns(properties):
+        """Return the values of the scheduling columns for properties.
+
+        Values which are missing or not integers are None.
+        """
+        properties = properties or {}
+        return {'cpus': _int_or_none(properties.get('cpus')),
+                'memory_mb': _int_or_none(properties.get('memory_mb')),
+                'local_gb': _int_or_none(properties.get('local_gb')),
+                'cpu_arch': properties.get('cpu_arch') or None}
+
+    @validates('properties')
+    def _set_scheduling_columns(self, key, properties):
+        for name, value in self.scheduling_columns(properties).items():
+            setattr(self, name, value)
+        return properties
 
 
 class Port(Base):
@@ -165,9 +252,61 @@ class Port(Base):
     __tablename__ = 'ports'
     __table_args__ = (
         schema.UniqueConstraint('address', name='uniq_ports0address'),
-        schema.UniqueConstraint('uuid', name='uniq_ports0uuid'))
+        schema.UniqueConstraint('uuid', name='uniq_ports0uuid'),
+        Index('port_vif_port_id', 'vif_port_id'))
     id = Column(Integer, primary_key=True)
     uuid = Column(String(36))
     address = Column(String(18))
     node_id = Column(Integer, ForeignKey('nodes.id'), nullable=True)
-    extra = Column(JSONEncodedDict)
+    extra = Column(LazyJSONEncodedDict)
+    # NOTE: copy of extra['vif_port_id'], so that ports can be looked up
+    #       by their VIF without decoding extra. Set whenever extra is.
+    vif_port_id = Column(String(255), nullable=True)
+
+    @validates('extra')
+    def _set_vif_port_id(self, key, extra):
+        self.vif_port_id = (extra or {}).get('vif_port_id')
+        return extra
+
+
+class Job(Base):
+    """Represents an asynchronous action on one or more nodes."""
+
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        schema.UniqueConstraint('uuid', name='uniq_jobs0uuid'),
+        )
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String(36))
+    action = Column(String(15))
+    target = Column(String(15))
+    filters = Column(JSONEncodedDict)
+    state = Column(String(15))
+    total = Column(Integer, default=0)
+    succeeded = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+
+
+class NodeEvent(Base):
+    """Represents a change of the power or provision state of a node."""
+
+    __tablename__ = 'node_events'
+    __table_args__ = (
+        Index('node_events_created_at', 'created_at'),
+        )
+    id = Column(Integer, primary_key=True)
+    node_uuid = Column(String(36))
+    power_state = Column(String(15), nullable=True)
+    target_power_state = Column(String(15), nullable=True)
+    provision_state = Column(String(15), nullable=True)
+    target_provision_state = Column(String(15), nullable=True)
+    last_error = Column(Text, nullable=True)
+
+
+class NodeEventMark(Base):
+    """Represents the id of the last node event deleted."""
+
+    __tablename__ = 'node_event_marks'
+    id = Column(Integer, primary_key=True)
+    pruned_id = Column(Integer, nullable=False)
@@ -191,6 +191,19 @@ class DeployInterface(object):
         :param node: the Node which is now being managed by this Conductor.
         """
 
+    def prefetch_images(self, context, images, boot_images):
+        """Download images into the caches of this interface, if any.
+
+        This lets conductors download new images before the nodes are
+        deployed, instead of in `prepare`. DeployInterface subclasses which
+        do not cache images are not required to implement it.
+
+        :param context: a context for this action.
+        :param images: a list of UUIDs or hrefs of instance images.
+        :param boot_images: a list of UUIDs or hrefs of other kernels and
+                            ramdisks, e.g. those of the deploy ramdisk.
+        """
+
 
 @six.add_metaclass(abc.ABCMeta)
 class PowerInterface(object):
@@ -14,12 +14,15 @@
 #    under the License.
 
 
+import errno
 import os
 import re
 import socket
 import stat
 import time
 
+from oslo.config import cfg
+
 from ironic.common import disk_partitioner
 from ironic.common import exception
 from ironic.common import utils
@@ -27,9 +30,39 @@ from ironic.openstack.common import excutils
 from ironic.openstack.common import log as logging
 from ironic.openstack.common import processutils
 
+deploy_opts = [
+    cfg.IntOpt('dd_block_size',
+               default=1024,
+               help='Block size (in KiB) images are written with. It is '
+                    'rounded down to a multiple of 4 KiB, so that the '
+                    'direct writes are aligned.'),
+    cfg.BoolOpt('sparse_image_writes',
+                default=False,
+                help='Only write the data of images to the root partition, '
+                     'skipping their holes and blocks of zeros. The '
+                     'partition is zeroed with "blkdiscard -z" first, so '
+                     'that the skipped blocks do not keep their previous '
+                     'contents; the whole image is written when it can not '
+                     'be zeroed.'),
+    cfg.BoolOpt('discard_before_write',
+                default=False,
+                help='Discard the blocks of the root partition before '
+                     'writing the image to it.'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(deploy_opts, group='deploy')
 
 LOG = logging.getLogger(__name__)
 
+_SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+_SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
+
+# NOTE: holes smaller than this are copied rather than skipped: dd reads
+#       them as zeros, which costs less than running dd once more, and
+#       does not write them.
+_MIN_SKIPPED_HOLE = 64 * 1024 * 1024
+
 
 # All functions are called from deploy() directly or indirectly.
 # They are split for stub-out.
@@ -119,15 +152,117 @@ def is_block_device(dev):
     return stat.S_ISBLK(s.st_mode)
 
 
+def _get_block_size():
+    """Return [deploy]dd_block_size in bytes, aligned on 4 KiB."""
+    return max(CONF.deploy.dd_block_size // 4 * 4, 4) * 1024
+
+
+def get_data_extents(path, block_size):
+    """Return the ranges of a sparse file which hold data.
+
+    The holes are found with SEEK_DATA and SEEK_HOLE. Filesystems which do
+    not support them report the whole file as data.
+
+    :param path: the path of the file.
+    :param block_size: the size in bytes the ranges are aligned on.
+    :returns: a list of (start, end) byte offsets, end excluded. The ends
+              are aligned, except at the end of the file.
+    """
+    extents = []
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        offset = 0
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, _SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    # NOTE: there is no data after offset
+                    break
+                if e.errno == errno.EINVAL:
+                    return [(0, size)]
+                raise
+            end = os.lseek(fd, start, _SEEK_HOLE)
+            start -= start % block_size
+            end = min(end + -end % block_size, size)
+            if extents and start - extents[-1][1] < _MIN_SKIPPED_HOLE:
+                extents[-1] = (extents[-1][0], end)
+            else:
+                extents.append((start, end))
+            offset = end
+    finally:
+        os.close(fd)
+    return extents
+
+
+def discard(dev):
+    """Discard the blocks of a device.
+
+    Devices which do not support discard are left as they are.
+    """
+    try:
+        utils.execute('blkdiscard', dev, run_as_root=True,
+                      check_exit_code=[0])
+    except processutils.ProcessExecutionError as e:
+        LOG.warning(_("Failed to discard the blocks of %(dev)s: %(error)s") %
+                    {'dev': dev, 'error': e})
+
+
+def zero(dev):
+    """Zero the blocks of a device.
+
+    Unlike discarded blocks, zeroed blocks are guaranteed to read as zeros.
+    The kernel writes the zeros on devices which can not zero blocks
+    without writing them.
+
+    :returns: True if the device was zeroed.
+    """
+    try:
+        utils.execute('blkdiscard', '-z', dev, run_as_root=True,
+                      check_exit_code=[0])
+    except processutils.ProcessExecutionError as e:
+        LOG.warning(_("Failed to zero the blocks of %(dev)s: %(error)s") %
+                    {'dev': dev, 'error': e})
+        return False
+    return True
+
+
 def dd(src, dst):
-    """Execute dd from src to dst."""
-    utils.execute('dd',
-                  'if=%s' % src,
-                  'of=%s' % dst,
-                  'bs=1M',
-                  'oflag=direct',
-                  run_as_root=True,
-                  check_exit_code=[0])
+    """Execute dd from src to dst.
+
+    With [deploy]sparse_image_writes, dst is zeroed and only the data of
+    src is copied, by one dd for each of its data extents, and the blocks
+    of zeros are not written. The whole of src is copied if dst can not be
+    zeroed, so that no block keeps its previous contents.
+    """
+    block_size = _get_block_size()
+    if CONF.deploy.discard_before_write:
+        discard(dst)
+    sparse = CONF.deploy.sparse_image_writes and zero(dst)
+
+    args = ['dd',
+            'if=%s' % src,
+            'of=%s' % dst,
+            'bs=%d' % block_size,
+            'oflag=direct']
+    if not sparse:
+        utils.execute(*args, run_as_root=True, check_exit_code=[0])
+        return
+
+    extents = get_data_extents(src, block_size)
+    LOG.debug(_("Writing %(size)d bytes of image %(src)s to %(dst)s.") %
+              {'size': sum(end - start for start, end in extents),
+               'src': src, 'dst': dst})
+    for start, end in extents:
+        first = start // block_size
+        count = (end - start + block_size - 1) // block_size
+        utils.execute(*(args + ['skip=%d' % first,
+                                'seek=%d' % first,
+                                'count=%d' % count,
+                                'conv=sparse,notrunc']),
+                      run_as_root=True,
+                      check_exit_code=[0])
 
 
 def mkswap(dev, label='swap1'):
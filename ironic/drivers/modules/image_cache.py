@@ -18,11 +18,17 @@
 Utility for caching master images.
 """
 
+import collections
+import errno
+import json
 import os
+import re
 import tempfile
 import time
 
+from ironic.common import exception
 from ironic.common.glance_service import service_utils
+from ironic.common import image_service as service
 from ironic.common import images
 from ironic.common import utils
 from ironic.openstack.common import fileutils
@@ -32,6 +38,20 @@ from ironic.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+# The file of a master directory saving the last use of its images.
+_INDEX_FILE = '.index.json'
+
+# The name of the master images stored by the checksum of their content.
+# NOTE: the checksum is the MD5 glance records for the image, which its
+#       owner can make collide with the MD5 of another image it uploads,
+#       so masters are only shared between the images of one owner.
+_CONTENT_NAME = 'md5-%(owner)s-%(checksum)s'
+_CHECKSUM_RE = re.compile(r'^[0-9a-f]{32}$')
+_OWNER_RE = re.compile(r'^[0-9A-Za-z_-]{1,64}$')
+
+# The indexes of the master directories used by this process, by directory.
+_INDEXES = {}
+
 
 class ImageCache(object):
     """Class handling access to cache for master images."""
@@ -59,6 +79,13 @@ class ImageCache(object):
         Only creates a link if master image for this UUID is already in cache.
         Otherwise downloads an image and also stores it in cache.
 
+        Master images are stored by their owner and the checksum of their
+        content, with a symlink named by UUID to them, so that the images
+        an owner uploaded under several UUIDs are downloaded and stored
+        once. The checksum is an MD5 the owner can make collide, so images
+        are never shared between owners; images without a checksum or an
+        owner are stored by UUID.
+
         :param uuid: image UUID or href to fetch
         :param dest_path: destination file path
         :param ctx: context
@@ -85,25 +112,146 @@ class ImageCache(object):
                            'dest': dest_path})
                 return
 
-            try:
-                # NOTE(dtantsur): ensure we're not in the middle of clean up
-                with lockutils.lock('master_image', 'ironic-'):
-                    os.link(master_path, dest_path)
-            except OSError:
-                LOG.info(_("Master cache miss for image %(uuid)s, "
-                           "starting download") %
-                         {'uuid': uuid})
-            else:
+            if self._link_master_image(master_file_name, dest_path):
                 LOG.debug(_("Master cache hit for image %(uuid)s") %
                           {'uuid': uuid})
                 return
 
-            self._download_image(uuid, master_path, dest_path, ctx=ctx)
+            checksum, content_name = self._get_content(uuid, ctx)
+            if content_name is None:
+                LOG.info(_("Master cache miss for image %(uuid)s, "
+                           "starting download") %
+                         {'uuid': uuid})
+                self._download_image(uuid, master_path, dest_path, ctx=ctx)
+            else:
+                with lockutils.lock('download-image:%s' % content_name,
+                                    'ironic-'):
+                    if self._link_content(content_name, dest_path):
+                        LOG.debug(_("Master cache hit for image %(uuid)s, "
+                                    "stored as %(name)s") %
+                                  {'uuid': uuid, 'name': content_name})
+                        downloaded = False
+                    else:
+                        LOG.info(_("Master cache miss for image %(uuid)s, "
+                                   "starting download") %
+                                 {'uuid': uuid})
+                        try:
+                            self._download_image(
+                                uuid,
+                                os.path.join(self._master_dir, content_name),
+                                dest_path, ctx=ctx, checksum=checksum)
+                        except exception.ImageChecksumMismatch as e:
+                            # NOTE: the content does not match the checksum
+                            # of the image, do not share it with the images
+                            # really having that checksum.
+                            LOG.warning(_("%(error)s, storing image "
+                                          "%(uuid)s by UUID") %
+                                        {'error': e, 'uuid': uuid})
+                            content_name = None
+                        downloaded = True
+                    if content_name is not None:
+                        self._add_alias(master_file_name, content_name)
+                if content_name is None:
+                    self._download_image(uuid, master_path, dest_path,
+                                         ctx=ctx)
+                elif not downloaded:
+                    return
 
         # NOTE(dtantsur): we increased cache size - time to clean up
         self.clean_up()
 
-    def _download_image(self, uuid, master_path, dest_path, ctx=None):
+    def prefetch_image(self, uuid, ctx=None):
+        """Download an image into the cache, if it is not cached yet.
+
+        :param uuid: image UUID or href to fetch
+        :param ctx: context
+        """
+        if self._master_dir is None:
+            return
+        # NOTE: fetch the image to a link in the master directory, which
+        #       keeps the image from being cleaned up before it is cached.
+        tmp_dir = tempfile.mkdtemp(dir=self._master_dir)
+        try:
+            self.fetch_image(uuid, os.path.join(tmp_dir, 'image'), ctx=ctx)
+        finally:
+            utils.rmtree_without_raise(tmp_dir)
+
+    def _link_master_image(self, name, dest_path):
+        """Link the master image of a UUID to dest_path, if it is cached.
+
+        Should be called with the lock of the UUID taken.
+
+        :param name: the name of the master image of the UUID.
+        :returns: True if the image was linked.
+        """
+        master_path = os.path.join(self._master_dir, name)
+        try:
+            content_name = os.readlink(master_path)
+        except OSError as exc:
+            if exc.errno != errno.EINVAL:
+                return False
+            content_name = None
+
+        if content_name is not None:
+            with lockutils.lock('download-image:%s' % content_name,
+                                'ironic-'):
+                return self._link_content(content_name, dest_path)
+
+        # NOTE: clean up takes this lock before deleting a master
+        #       image, so it can not be deleted while it is linked.
+        try:
+            os.link(master_path, dest_path)
+        except OSError:
+            return False
+        self._get_index().touch(name)
+        return True
+
+    def _link_content(self, content_name, dest_path):
+        """Link a master image stored by content to dest_path, if cached.
+
+        Should be called with the lock of the content taken.
+
+        :returns: True if the image was linked.
+        """
+        try:
+            os.link(os.path.join(self._master_dir, content_name), dest_path)
+        except OSError:
+            return False
+        self._get_index().touch(content_name)
+        return True
+
+    def _add_alias(self, name, content_name):
+        """Make name a symlink to the master image stored as content_name.
+
+        Should be called with the lock of name taken.
+        """
+        alias_path = os.path.join(self._master_dir, name)
+        tmp_path = '%s.alias' % alias_path
+        utils.delete_if_exists(tmp_path)
+        os.symlink(content_name, tmp_path)
+        os.rename(tmp_path, alias_path)
+        self._get_index().add_alias(name, content_name)
+
+    def _get_content(self, uuid, ctx):
+        """Return the checksum of an image and the name to share it under.
+
+        :returns: a (checksum, name) tuple, (None, None) if the image has
+                  no valid checksum or owner.
+        """
+        image_service = self._image_service
+        if image_service is None:
+            image_service = service.Service(context=ctx)
+        image = image_service.show(uuid)
+        checksum = image.get('checksum')
+        owner = image.get('owner')
+        if (checksum and _CHECKSUM_RE.match(checksum) and
+                owner and _OWNER_RE.match(owner)):
+            return checksum, _CONTENT_NAME % {'owner': owner,
+                                              'checksum': checksum}
+        return None, None
+
+    def _download_image(self, uuid, master_path, dest_path, ctx=None,
+                        checksum=None):
         """Download image from Glance and store at a given path.
         This method should be called with uuid-specific lock taken.
 
@@ -111,26 +259,41 @@ class ImageCache(object):
         :param master_path: destination master path
         :param dest_path: destination file path
         :param ctx: context
+        :param checksum: if set, the MD5 the image must match
+        :raises: ImageChecksumMismatch if the image does not match checksum.
         """
         #TODO(ghe): timeout and retry for downloads
         #TODO(ghe): logging when image cannot be created
         fd, tmp_path = tempfile.mkstemp(dir=self._master_dir)
         os.close(fd)
-        images.fetch_to_raw(ctx, uuid, tmp_path,
-                            self._image_service)
+        with fileutils.remove_path_on_error(tmp_path):
+            images.fetch_to_raw(ctx, uuid, tmp_path,
+                                self._image_service, checksum=checksum)
         # NOTE(dtantsur): no need for global lock here - master_path
         # will have link count >1 at any moment, so won't be cleaned up
         os.link(tmp_path, master_path)
         os.link(master_path, dest_path)
         os.unlink(tmp_path)
+        self._get_index().add(os.path.basename(master_path),
+                              os.path.getsize(master_path))
+
+    def _get_index(self):
+        """Return the index of the master directory, loading it if needed."""
+        index = _INDEXES.get(self._master_dir)
+        if index is None:
+            index = _INDEXES[self._master_dir] = _CacheIndex(self._master_dir)
+        return index
 
     @lockutils.synchronized('master_image', 'ironic-')
     def clean_up(self):
         """Clean up directory with images, keeping cache of the latest images.
 
-        Files with link count >1 are never deleted.
-        Protected by global lock, so that no one messes with master images
-        after we get listing and before we actually delete files.
+        Images older than the TTL are deleted, then the oldest images until
+        the cache is smaller than its size. Files with link count >1 are
+        never deleted. Only the images which are deleted, or in use and
+        eligible for deletion, are looked at on disk, see _CacheIndex.
+        Protected by global lock, so that two clean ups do not pick the
+        same images.
         """
         if self._master_dir is None:
             return
@@ -138,72 +301,171 @@ class ImageCache(object):
         LOG.debug(_("Starting clean up for master image cache %(dir)s") %
                   {'dir': self._master_dir})
 
-        listing = _find_candidates_for_deletion(self._master_dir)
-        survived = self._clean_up_too_old(listing)
-        self._clean_up_ensure_cache_size(survived)
+        index = self._get_index()
+        for name in self._find_candidates_for_deletion(index):
+            self._delete_master_image(index, name)
 
-    def _clean_up_too_old(self, listing):
-        """Clean up stage 1: drop images that are older than TTL.
+        if index.total_size > self._cache_size:
+            LOG.info(_("After cleaning up cache dir %(dir)s "
+                       "cache size %(actual)d is still larger than "
+                       "threshold %(expected)d") %
+                     {'dir': self._master_dir, 'actual': index.total_size,
+                      'expected': self._cache_size})
+        index.save()
 
-        :param listing: list of tuples (file name, last used time)
-        :returns: list of files left after clean up
+    def _find_candidates_for_deletion(self, index):
+        """Find the images to delete, the oldest first.
+
+        Images are candidates while they are older than the TTL or the
+        cache is larger than its size, and not in use i.e. with link
+        count == 1.
+
+        :param index: the _CacheIndex of the master directory
+        :returns: list of the names of the images to delete
         """
         threshold = time.time() - self._cache_ttl
-        survived = []
-        for file_name, last_used, stat in listing:
-            if last_used < threshold:
-                utils.unlink_without_raise(file_name)
-            else:
-                survived.append((file_name, last_used, stat))
-        return survived
+        total_size = index.total_size
+        candidates = []
+        gone = []
+        for name, (size, last_used) in index.entries.iteritems():
+            if last_used >= threshold and total_size <= self._cache_size:
+                break
+            try:
+                stat = os.stat(os.path.join(self._master_dir, name))
+            except OSError:
+                gone.append(name)
+                total_size -= size
+                continue
+            if stat.st_nlink > 1:
+                continue
+            candidates.append(name)
+            total_size -= size
 
-    def _clean_up_ensure_cache_size(self, listing):
-        """Clean up stage 2: try to ensure cache size < threshold.
-        Try to delete the oldest files until conditions is satisfied
-        or no more files are eligable for delition.
+        for name in gone:
+            index.remove(name)
+        return candidates
 
-        :param listing: list of tuples (file name, last used time)
-        """
-        # NOTE(dtantsur): Sort listing to delete the oldest files first
-        listing = sorted(listing,
-                         key=lambda entry: entry[1],
-                         reverse=True)
-        total_listing = (os.path.join(self._master_dir, f)
-                         for f in os.listdir(self._master_dir))
-        total_size = sum(os.path.getsize(f)
-                         for f in total_listing)
-        while total_size > self._cache_size and listing:
-            file_name, last_used, stat = listing.pop()
+    def _delete_master_image(self, index, name):
+        """Delete a master image unless it was linked in the meantime."""
+        master_path = os.path.join(self._master_dir, name)
+        with lockutils.lock('download-image:%s' % name, 'ironic-'):
             try:
-                os.unlink(file_name)
-            except EnvironmentError as exc:
-                LOG.warn(_("Unable to delete file %(name)s from "
-                           "master image cache: %(exc)s") %
-                         {'name': file_name, 'exc': exc})
-            else:
-                total_size -= stat.st_size
+                if os.stat(master_path).st_nlink > 1:
+                    return
+                os.unlink(master_path)
+            except OSError as exc:
+                if exc.errno != errno.ENOENT:
+                    LOG.warn(_("Unable to delete file %(name)s from "
+                               "master image cache: %(exc)s") %
+                             {'name': master_path, 'exc': exc})
+                    return
+            index.remove(name)
 
-        if total_size > self._cache_size:
-            LOG.info(_("After cleaning up cache dir %(dir)s "
-                       "cache size %(actual)d is still larger than "
-                       "threshold %(expected)d") %
-                     {'dir': self._master_dir, 'actual': total_size,
-                      'expected': self._cache_size})
 
+class _CacheIndex(object):
+    """Index of the images of a master directory.
 
-def _find_candidates_for_deletion(master_dir):
-    """Find files eligible for deletion i.e. with link count ==1.
+    The directory is scanned once, when the index is loaded, and the index
+    is then updated by the caches as they download, use and delete images,
+    so that neither fetching nor cleaning up images lists the directory.
+    The images are kept ordered by last use, the oldest first. The last
+    uses are saved to _INDEX_FILE, so that they are kept across restarts
+    even when atime is not updated.
 
-    :param master_dir: directory to operate on
-    :returns: iterator yielding tuples (file name, last used time, stat)
+    The number of links of a master image is its reference count. It is
+    not kept in the index, since the images of the nodes are deleted
+    without telling the cache, and is only looked at on disk for images
+    which are going to be deleted. The aliases of the images stored by
+    content are symlinks, which do not count as links.
     """
-    for filename in os.listdir(master_dir):
-        filename = os.path.join(master_dir, filename)
-        stat = os.stat(filename)
-        if not os.path.isfile(filename) or stat.st_nlink > 1:
-            continue
-        # NOTE(dtantsur): Detect most recently accessed files,
-        # seeing atime can be disabled by the mount option
-        # Also include ctime as it changes when image is linked to
-        last_used_time = max(stat.st_mtime, stat.st_atime, stat.st_ctime)
-        yield filename, last_used_time, stat
+
+    def __init__(self, master_dir):
+        self._master_dir = master_dir
+        self._dirty = False
+        # name -> (size, last used time), the least recently used first
+        self.entries = collections.OrderedDict()
+        self.total_size = 0
+        # alias -> name of the image it points to
+        self.aliases = {}
+        self._load()
+
+    def _load(self):
+        index_path = os.path.join(self._master_dir, _INDEX_FILE)
+        try:
+            with open(index_path) as fp:
+                last_uses = json.load(fp)
+        except (EnvironmentError, ValueError):
+            last_uses = {}
+
+        listing = []
+        for name in os.listdir(self._master_dir):
+            filename = os.path.join(self._master_dir, name)
+            if os.path.islink(filename):
+                self.aliases[name] = os.readlink(filename)
+                continue
+            if name == _INDEX_FILE or not os.path.isfile(filename):
+                continue
+            stat = os.stat(filename)
+            # NOTE(dtantsur): Detect most recently accessed files,
+            # seeing atime can be disabled by the mount option
+            # Also include ctime as it changes when image is linked to
+            last_used = max(stat.st_mtime, stat.st_atime, stat.st_ctime,
+                            last_uses.get(name, 0))
+            listing.append((last_used, name, stat.st_size))
+
+        for last_used, name, size in sorted(listing):
+            self.entries[name] = (size, last_used)
+            self.total_size += size
+
+    def add(self, name, size):
+        """Add an image which was just downloaded."""
+        self._pop(name)
+        self.entries[name] = (size, time.time())
+        self.total_size += size
+        self._dirty = True
+
+    def add_alias(self, alias, name):
+        """Add an alias which was just made to an image."""
+        self.aliases[alias] = name
+
+    def touch(self, name):
+        """Record that an image was used."""
+        entry = self.entries.pop(name, None)
+        if entry is not None:
+            self.entries[name] = (entry[0], time.time())
+            self._dirty = True
+
+    def remove(self, name):
+        """Remove a deleted image, and delete its aliases."""
+        self._pop(name)
+        for alias, target in list(self.aliases.items()):
+            if target == name:
+                del self.aliases[alias]
+                utils.unlink_without_raise(
+                        os.path.join(self._master_dir, alias))
+
+    def _pop(self, name):
+        entry = self.entries.pop(name, None)
+        if entry is not None:
+            self.total_size -= entry[0]
+            self._dirty = True
+
+    def save(self):
+        """Save the last uses of the images if they changed."""
+        if not self._dirty:
+            return
+        last_uses = dict((name, last_used)
+                         for name, (size, last_used)
+                         in self.entries.iteritems())
+        fd, tmp_path = tempfile.mkstemp(dir=self._master_dir)
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(last_uses, fp)
+            os.rename(tmp_path, os.path.join(self._master_dir, _INDEX_FILE))
+        except EnvironmentError as exc:
+            utils.unlink_without_raise(tmp_path)
+            LOG.warn(_("Unable to save the index of master image cache "
+                       "%(dir)s: %(exc)s") %
+                     {'dir': self._master_dir, 'exc': exc})
+        else:
+            self._dirty = False
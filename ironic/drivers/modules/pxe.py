@@ -19,8 +19,11 @@ PXE Driver and supporting meta-classes.
 
 import os
 
+from eventlet import greenpool
+from eventlet import semaphore
 import jinja2
 from oslo.config import cfg
+import six
 
 from ironic.common import exception
 from ironic.common import image_service as service
@@ -80,6 +83,10 @@ pxe_opts = [
     cfg.IntOpt('image_cache_ttl',
                default=60,
                help='Maximum TTL (in minutes) for old master images in cache'),
+    cfg.IntOpt('image_download_concurrency',
+               default=4,
+               help='Maximum number of images a conductor downloads at the '
+                    'same time. 1 downloads them one after another.'),
     ]
 
 LOG = logging.getLogger(__name__)
@@ -88,6 +95,10 @@ CONF = cfg.CONF
 CONF.register_opts(pxe_opts, group='pxe')
 CONF.import_opt('use_ipv6', 'ironic.netconf')
 
+# The semaphores limiting the concurrent downloads of this conductor, by
+# [pxe]image_download_concurrency.
+_DOWNLOAD_SEMAPHORES = {}
+
 
 def _parse_driver_info(node):
     """Gets the driver-specific Node deployment info.
@@ -262,9 +273,8 @@ def _cache_tftp_images(ctx, node, pxe_info):
     LOG.debug(_("Fetching kernel and ramdisk for node %s") %
               node.uuid)
     image_cache = PXEImageCache(CONF.pxe.tftp_master_path)
-    for label in pxe_info:
-        (uuid, path) = pxe_info[label]
-        image_cache.fetch_image(uuid, path, ctx=ctx)
+    _run_concurrently([(_fetch_image, image_cache, uuid, path, ctx)
+                       for (uuid, path) in pxe_info.values()])
 
 
 def _cache_instance_image(ctx, node):
@@ -293,11 +303,81 @@ def _cache_instance_image(ctx, node):
               {'ami': uuid, 'uuid': node.uuid})
 
     image_cache = PXEImageCache(CONF.pxe.instance_master_path)
-    image_cache.fetch_image(uuid, image_path, ctx=ctx)
+    _fetch_image(image_cache, uuid, image_path, ctx)
 
     return (uuid, image_path)
 
 
+def _download_semaphore():
+    limit = max(CONF.pxe.image_download_concurrency, 1)
+    return _DOWNLOAD_SEMAPHORES.setdefault(limit,
+                                           semaphore.Semaphore(limit))
+
+
+def _fetch_image(image_cache, uuid, path, ctx):
+    """Fetch an image, waiting for a free download slot of the conductor."""
+    with _download_semaphore():
+        image_cache.fetch_image(uuid, path, ctx=ctx)
+
+
+def _prefetch_image(image_cache, uuid, ctx):
+    """Cache an image, waiting for a free download slot of the conductor."""
+    with _download_semaphore():
+        image_cache.prefetch_image(uuid, ctx=ctx)
+
+
+def _prefetch_images(ctx, images, boot_images):
+    """Download images into the master image caches.
+
+    :param images: UUIDs or hrefs of instance images, whose kernel and
+                   ramdisk are downloaded too.
+    :param boot_images: UUIDs or hrefs of kernels and ramdisks.
+    """
+    boot_images = list(boot_images)
+    if images:
+        glance_service = service.Service(context=ctx)
+        for uuid in images:
+            iproperties = glance_service.show(uuid)['properties']
+            for label in ('kernel', 'ramdisk'):
+                if iproperties.get(label + '_id'):
+                    boot_images.append(
+                            str(iproperties[label + '_id']).split('/')[-1])
+
+    tftp_cache = PXEImageCache(CONF.pxe.tftp_master_path)
+    instance_cache = PXEImageCache(CONF.pxe.instance_master_path)
+    calls = [(_prefetch_image, instance_cache, uuid, ctx)
+             for uuid in set(images)]
+    calls.extend((_prefetch_image, tftp_cache, uuid, ctx)
+                 for uuid in set(boot_images))
+    _run_concurrently(calls)
+
+
+def _run_concurrently(calls):
+    """Run calls in greenthreads and wait for all of them to finish.
+
+    :param calls: list of tuples of a function and its arguments.
+    :returns: list of the results of the calls.
+    :raises: the exception of the failed call if only one failed,
+             ImageDownloadFailed listing the errors if several did.
+    """
+    pool = greenpool.GreenPool(max(len(calls), 1))
+    threads = [pool.spawn(call[0], *call[1:]) for call in calls]
+    results = []
+    errors = []
+    for thread in threads:
+        try:
+            results.append(thread.wait())
+        except Exception as e:
+            errors.append(e)
+
+    if len(errors) == 1:
+        raise errors[0]
+    elif errors:
+        raise exception.ImageDownloadFailed(
+                reason='; '.join(six.text_type(e) for e in errors))
+    return results
+
+
 def _get_tftp_image_info(node, ctx):
     """Generate the paths for tftp files for this instance
 
@@ -321,7 +401,7 @@ def _get_tftp_image_info(node, ctx):
     driver_info = node.driver_info
     labels = ('kernel', 'ramdisk')
     if not (driver_info.get('pxe_kernel') and driver_info.get('pxe_ramdisk')):
-        glance_service = service.Service(version=1, context=ctx)
+        glance_service = service.Service(context=ctx)
         iproperties = glance_service.show(d_info['image_source'])['properties']
         for label in labels:
             driver_info['pxe_' + label] = str(iproperties[label +
@@ -339,15 +419,17 @@ def _get_tftp_image_info(node, ctx):
 
 
 def _cache_images(node, pxe_info, ctx):
-    """Prepare all the images for this instance."""
-    #TODO(ghe):parallized downloads
+    """Prepare all the images for this instance.
 
+    The images are downloaded concurrently, see
+    [pxe]image_download_concurrency.
+    """
     #TODO(ghe): Embedded image client in ramdisk
     # - Get rid of iscsi, image location in baremetal service node and
     # image service, no master image, no image outdated...
     # - security concerns
-    _cache_tftp_images(ctx, node, pxe_info)
-    _cache_instance_image(ctx, node)
+    _run_concurrently([(_cache_tftp_images, ctx, node, pxe_info),
+                       (_cache_instance_image, ctx, node)])
     #TODO(ghe): file injection
     # http://lists.openstack.org/pipermail/openstack-dev/2013-May/008728.html
     # http://lists.openstack.org/pipermail/openstack-dev/2013-July/011769.html
@@ -563,6 +645,19 @@ class PXEDeploy(base.DeployInterface):
     def take_over(self, task, node):
         _update_neutron(task, node)
 
+    def prefetch_images(self, context, images, boot_images):
+        """Download images into the master image caches.
+
+        The instance images are cached in [pxe]instance_master_path, their
+        kernels and ramdisks and the boot images in [pxe]tftp_master_path.
+
+        :param context: a context for this action.
+        :param images: a list of UUIDs or hrefs of instance images.
+        :param boot_images: a list of UUIDs or hrefs of other kernels and
+                            ramdisks, e.g. those of the deploy ramdisk.
+        """
+        _prefetch_images(context, images, boot_images)
+
 
 class VendorPassthru(base.VendorInterface):
     """Interface to mix IPMI and PXE vendor-specific interfaces."""
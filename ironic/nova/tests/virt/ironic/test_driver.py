@@ -83,8 +83,15 @@ class FakeNodeClient(object):
         pass
 
 
+class FakeHttpClient(object):
+
+    def json_request(self, method, url, **kwargs):
+        return None, {'state': ironic_states.JOB_DONE}
+
+
 class FakeClient(object):
 
+    http_client = FakeHttpClient()
     node = FakeNodeClient()
     port = FakePortClient()
 
@@ -683,6 +690,43 @@ class IronicDriverTestCase(test.NoDBTestCase):
                                                 instance['instance_type_id'])
             mock_cleanup_deploy.assert_called_once_with(node, instance, None)
 
+    @mock.patch.object(FAKE_CLIENT.http_client, 'json_request')
+    def test_spawn_node_trigger_deploy_job_failed(self, mock_json_request):
+        node_uuid = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+        node = ironic_utils.get_test_node(driver='fake', uuid=node_uuid)
+        instance = fake_instance.fake_instance_obj(self.ctx, node=node_uuid)
+
+        mock_get = mock.patch.object(FAKE_CLIENT.node, 'get').start()
+        mock_get.return_value = node
+        self.addCleanup(mock_get.stop)
+        mock_validate = mock.patch.object(FAKE_CLIENT.node, 'validate').start()
+        mock_validate.return_value = ironic_utils.get_test_validation()
+        self.addCleanup(mock_validate.stop)
+
+        mock_fg_bid = mock.patch.object(flavor_obj, 'get_by_id').start()
+        self.addCleanup(mock_fg_bid.stop)
+        mock_pvifs = mock.patch.object(self.driver, '_plug_vifs').start()
+        self.addCleanup(mock_pvifs.stop)
+        mock_sf = mock.patch.object(self.driver, '_start_firewall').start()
+        self.addCleanup(mock_sf.stop)
+        mock_cleanup_deploy = mock.patch.object(
+            self.driver, '_cleanup_deploy').start()
+        self.addCleanup(mock_cleanup_deploy.stop)
+
+        mock_json_request.return_value = (None, {
+                'state': ironic_states.JOB_FAILED,
+                'last_error': 'Node %s: invalid deploy' % node_uuid})
+        with mock.patch.object(FAKE_CLIENT.node, 'set_provision_state') \
+                as mock_sps:
+            mock_sps.return_value.uuid = 'fake-job'
+            self.assertRaises(exception.InstanceDeployFailure,
+                              self.driver.spawn,
+                              self.ctx, instance, None, [], None)
+
+            mock_json_request.assert_called_once_with('GET',
+                                                      '/v1/jobs/fake-job')
+            mock_cleanup_deploy.assert_called_once_with(node, instance, None)
+
     @mock.patch.object(FAKE_CLIENT.node, 'update')
     @mock.patch.object(FAKE_CLIENT.node, 'set_provision_state')
     @mock.patch.object(FAKE_CLIENT.node, 'get_by_instance_uuid')
@@ -286,6 +286,30 @@ class IronicDriver(virt_driver.ComputeDriver):
                    % {'inst': instance['uuid'], 'reason': node.last_error})
             raise exception.InstanceDeployFailure(msg)
 
+    def _wait_for_job(self, icli, job):
+        """Wait for Ironic to finish the job tracking a request.
+
+        Ironic validates and starts the action after it returned the job.
+
+        :param icli: an IronicClientWrapper.
+        :param job: the job returned by the request, if any.
+        :raises: InstanceDeployFailure if the job failed.
+        """
+        job_uuid = getattr(job, 'uuid', None)
+        if job_uuid is None:
+            return
+
+        def _check_job():
+            _resp, body = icli.call("http_client.json_request", 'GET',
+                                    '/v1/jobs/%s' % job_uuid)
+            if body['state'] == ironic_states.JOB_FAILED:
+                raise exception.InstanceDeployFailure(body['last_error'])
+            if body['state'] != ironic_states.JOB_RUNNING:
+                raise loopingcall.LoopingCallDone()
+
+        timer = loopingcall.FixedIntervalLoopingCall(_check_job)
+        timer.start(interval=CONF.ironic.api_retry_interval).wait()
+
     @classmethod
     def instance(cls):
         if not hasattr(cls, '_instance'):
@@ -427,8 +451,9 @@ class IronicDriver(virt_driver.ComputeDriver):
 
         # trigger the node deploy
         try:
-            icli.call("node.set_provision_state", node_uuid,
-                      ironic_states.ACTIVE)
+            job = icli.call("node.set_provision_state", node_uuid,
+                            ironic_states.ACTIVE)
+            self._wait_for_job(icli, job)
         except (exception.NovaException,                   # Retry failed
                 ironic_exception.HTTPInternalServerError,  # Validations
                 ironic_exception.HTTPBadRequest) as e:     # Maintenance
@@ -647,7 +672,9 @@ class IronicDriver(virt_driver.ComputeDriver):
 
         # Trigger the node rebuild/redeploy.
         try:
-            icli.call("node.set_provision_state", node_uuid, ironic_states.REBUILD)
+            job = icli.call("node.set_provision_state", node_uuid,
+                            ironic_states.REBUILD)
+            self._wait_for_job(icli, job)
         except (exception.NovaException,                   # Retry failed
                 ironic_exception.HTTPInternalServerError,  # Validations
                 ironic_exception.HTTPBadRequest) as e:     # Maintenance
@@ -64,3 +64,8 @@ POWER_ON = 'power on'
 POWER_OFF = 'power off'
 REBOOT = 'rebooting'
 SUSPEND = 'suspended'
+
+# States of a job, an asynchronous action on one or more nodes.
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
@@ -16,6 +16,7 @@ import functools
 
 from ironic.objects import chassis
 from ironic.objects import conductor
+from ironic.objects import job
 from ironic.objects import node
 from ironic.objects import port
 
@@ -37,11 +38,13 @@ def objectify(klass):
 
 Chassis = chassis.Chassis
 Conductor = conductor.Conductor
+Job = job.Job
 Node = node.Node
 Port = port.Port
 
 __all__ = (Chassis,
            Conductor,
+           Job,
            Node,
            Port,
            objectify)
@@ -21,6 +21,7 @@ from oslo import messaging
 import six
 
 from ironic.common import exception
+from ironic.common import utils
 from ironic.objects import utils as obj_utils
 from ironic.openstack.common import context
 from ironic.openstack.common import log as logging
@@ -54,14 +55,22 @@ def make_class_properties(cls):
                 cls.fields[name] = field
     for name, typefn in cls.fields.iteritems():
 
-        def getter(self, name=name):
+        def getter(self, name=name, typefn=typefn):
             attrname = get_attrname(name)
             if not hasattr(self, attrname):
                 self.obj_load_attr(name)
-            return getattr(self, attrname)
+            value = getattr(self, attrname)
+            if isinstance(value, utils.LazyJSON):
+                # NOTE: fields loaded from the database may still be
+                #       encoded, decode them the first time they are read.
+                value = typefn(value.decode())
+                setattr(self, attrname, value)
+            return value
 
         def setter(self, value, name=name, typefn=typefn):
             self._changed_fields.add(name)
+            if isinstance(value, utils.LazyJSON):
+                return setattr(self, get_attrname(name), value)
             try:
                 return setattr(self, get_attrname(name), typefn(value))
             except Exception:
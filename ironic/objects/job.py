@@ -0,0 +1,84 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from ironic.db import api as dbapi
+from ironic.objects import base
+from ironic.objects import utils
+
+
+class Job(base.IronicObject):
+    dbapi = dbapi.get_instance()
+
+    fields = {
+        'id': int,
+        'uuid': utils.str_or_none,
+        'action': utils.str_or_none,
+        'target': utils.str_or_none,
+        'filters': utils.dict_or_none,
+        'state': utils.str_or_none,
+        'total': utils.int_or_none,
+        'succeeded': utils.int_or_none,
+        'failed': utils.int_or_none,
+        'last_error': utils.str_or_none,
+    }
+
+    @staticmethod
+    def _from_db_object(job, db_job):
+        """Converts a database entity to a formal object."""
+        for field in job.fields:
+            job[field] = db_job[field]
+
+        job.obj_reset_changes()
+        return job
+
+    @base.remotable_classmethod
+    def get_by_uuid(cls, context, uuid):
+        """Find a job based on uuid and return a Job object.
+
+        :param uuid: the uuid of a job.
+        :returns: a :class:`Job` object.
+        """
+        db_job = cls.dbapi.get_job(uuid)
+        return Job._from_db_object(cls(context), db_job)
+
+    @base.remotable
+    def create(self, context=None):
+        """Create a Job record in the DB.
+
+        :param context: Security context. NOTE: This should only
+                        be used internally by the indirection_api.
+                        Unfortunately, RPC requires context as the first
+                        argument, even though we don't use it.
+                        A context should be set when instantiating the
+                        object, e.g.: Job(context=context)
+
+        """
+        values = self.obj_get_changes()
+        db_job = self.dbapi.create_job(values)
+        self._from_db_object(self, db_job)
+
+    def save(self, context):
+        """Save is not supported by Job objects."""
+        raise NotImplementedError(
+                _('Cannot update a job record directly.'))
+
+    @base.remotable
+    def refresh(self, context):
+        """Loads updates for this Job.
+
+        :param context: Security context
+        """
+        current = self.__class__.get_by_uuid(context, uuid=self.uuid)
+        for field in self.fields:
+            if (hasattr(self, base.get_attrname(field)) and
+                    self[field] != current[field]):
+                self[field] = current[field]
@@ -26,7 +26,9 @@ class Node(base.IronicObject):
     # Version 1.2: Add get() and get_by_id() and make get_by_uuid()
     #              only work with a uuid
     # Version 1.3: Add create() and destroy()
-    VERSION = '1.3'
+    # Version 1.4: Add version
+    # Version 1.5: Add flush()
+    VERSION = '1.5'
 
     dbapi = db_api.get_instance()
 
@@ -64,8 +66,25 @@ class Node(base.IronicObject):
             'last_error': obj_utils.str_or_none,
 
             'extra': obj_utils.dict_or_none,
+
+            # Incremented by each update of the node, save() only succeeds
+            # if the node was not updated since it was read.
+            'version': int,
             }
 
+    # Changes to these fields are what API clients and other conductors
+    # watch for, saving them is never deferred by coalesce_writes.
+    _visible_fields = frozenset(['instance_uuid', 'power_state',
+                                 'target_power_state', 'provision_state',
+                                 'target_provision_state', 'maintenance',
+                                 'console_enabled', 'last_error',
+                                 'reservation'])
+
+    # When set, save() keeps changes to internal fields (eg driver_info)
+    # pending until a visible field changes or flush() is called. Set by
+    # the TaskManager holding the node's exclusive lock.
+    coalesce_writes = False
+
     @staticmethod
     def _from_db_object(node, db_node):
         """Converts a database entity to a formal object."""
@@ -156,17 +175,47 @@ class Node(base.IronicObject):
         """Save updates to this Node.
 
         Column-wise updates will be made based on the result of
-        self.what_changed(). If target_power_state is provided,
-        it will be checked against the in-database copy of the
-        node before updates are made.
+        self.what_changed(). The updates are only made if the node
+        still has the version it had when it was read.
+
+        If nothing changed no update is made. If coalesce_writes is set
+        and only internal fields changed, the update is deferred to the
+        next save() of a visible field or to flush().
 
         :param context: Security context. NOTE: This is only used
                         internally by the indirection_api.
+        :raises: NodeVersionConflict if the node was updated since it
+                 was read.
         """
         updates = self.obj_get_changes()
-        self.dbapi.update_node(self.uuid, updates)
+        if not updates:
+            return
+        if (self.coalesce_writes and
+                not self._visible_fields.intersection(updates)):
+            return
+        expected_version = (self.version if self.obj_attr_is_set('version')
+                            else None)
+        db_node = self.dbapi.update_node(self.uuid, updates,
+                                         expected_version=expected_version)
+        self.version = db_node['version']
         self.obj_reset_changes()
 
+    @base.remotable
+    def flush(self, context=None):
+        """Save any pending updates to this Node, deferred or not.
+
+        :param context: Security context. NOTE: This is only used
+                        internally by the indirection_api.
+        :raises: NodeVersionConflict if the node was updated since it
+                 was read.
+        """
+        coalesce_writes = self.coalesce_writes
+        self.coalesce_writes = False
+        try:
+            self.save(context)
+        finally:
+            self.coalesce_writes = coalesce_writes
+
     @base.remotable
     def refresh(self, context=None):
         """Refresh the object by re-fetching from the DB.
@@ -103,3 +103,41 @@ class TestListDrivers(base.FunctionalTest):
         error = json.loads(response.json['error_message'])
         self.assertEqual('Missing argument: "method"',
                          error['faultstring'])
+
+    @mock.patch.object(rpcapi.ConductorAPI, 'prefetch_images')
+    def test_prefetch_images(self, mock_prefetch):
+        self.register_fake_conductors()
+        response = self.post_json(
+            '/drivers/%s/prefetch_images' % self.d1,
+            {'images': ['image'], 'boot_images': ['kernel', 'ramdisk']})
+
+        self.assertEqual(202, response.status_int)
+        mock_prefetch.assert_called_once_with(
+            mock.ANY, self.d1, ['image'], ['kernel', 'ramdisk'])
+
+    @mock.patch.object(rpcapi.ConductorAPI, 'prefetch_images')
+    def test_prefetch_images_boot_images_only(self, mock_prefetch):
+        self.register_fake_conductors()
+        response = self.post_json(
+            '/drivers/%s/prefetch_images' % self.d1,
+            {'boot_images': ['kernel']})
+
+        self.assertEqual(202, response.status_int)
+        mock_prefetch.assert_called_once_with(
+            mock.ANY, self.d1, [], ['kernel'])
+
+    def test_prefetch_images_driver_not_found(self):
+        response = self.post_json(
+            '/drivers/%s/prefetch_images' % self.d1,
+            {'images': ['image']},
+            expect_errors=True)
+
+        self.assertEqual(404, response.status_int)
+
+    def test_prefetch_images_no_images(self):
+        self.register_fake_conductors()
+        response = self.post_json(
+            '/drivers/%s/prefetch_images' % self.d1, {},
+            expect_errors=True)
+
+        self.assertEqual(400, response.status_int)
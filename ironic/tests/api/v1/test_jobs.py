@@ -0,0 +1,195 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests for the API /jobs/ methods.
+"""
+
+import mock
+from oslo.config import cfg
+
+from ironic.api.controllers.v1 import job as job_controller
+from ironic.common import exception
+from ironic.common import states
+from ironic.common import utils
+from ironic.conductor import rpcapi
+from ironic.tests.api import base
+from ironic.tests.db import utils as dbutils
+from ironic.tests.objects import utils as obj_utils
+
+
+class TestGetJob(base.FunctionalTest):
+
+    def test_get_one(self):
+        job = obj_utils.create_test_job(self.context, total=2, succeeded=1)
+        data = self.get_json('/jobs/%s' % job.uuid)
+        self.assertEqual(job.uuid, data['uuid'])
+        self.assertEqual('power', data['action'])
+        self.assertEqual({'driver': 'fake'}, data['filters'])
+        self.assertEqual(1, data['succeeded'])
+        self.assertIn(job.uuid, data['links'][0]['href'])
+
+    def test_get_one_not_found(self):
+        response = self.get_json('/jobs/%s' % utils.generate_uuid(),
+                                 expect_errors=True)
+        self.assertEqual(404, response.status_int)
+
+    @mock.patch.object(job_controller, 'time')
+    def test_get_one_wait(self, mock_time):
+        job = obj_utils.create_test_job(self.context, total=1)
+        mock_time.time.return_value = 100
+
+        def finish_job(interval):
+            self.dbapi.update_job_progress(job.uuid, succeeded=1)
+        mock_time.sleep.side_effect = finish_job
+
+        data = self.get_json('/jobs/%s?wait=10' % job.uuid)
+        self.assertEqual(states.JOB_DONE, data['state'])
+        self.assertEqual(1, data['succeeded'])
+        mock_time.sleep.assert_called_once_with(
+                cfg.CONF.api.poll_interval)
+
+    @mock.patch.object(job_controller, 'time')
+    def test_get_one_wait_timeout(self, mock_time):
+        cfg.CONF.set_override('max_job_wait', 2, 'api')
+        job = obj_utils.create_test_job(self.context, total=1)
+        mock_time.time.side_effect = [100, 100, 101, 102]
+
+        data = self.get_json('/jobs/%s?wait=30' % job.uuid)
+        self.assertEqual(states.JOB_RUNNING, data['state'])
+        # The wait is capped by max_job_wait
+        self.assertEqual(2, mock_time.sleep.call_count)
+
+    @mock.patch.object(job_controller, 'time')
+    def test_get_one_wait_finished_job(self, mock_time):
+        job = obj_utils.create_test_job(self.context, state=states.JOB_DONE)
+        data = self.get_json('/jobs/%s?wait=10' % job.uuid)
+        self.assertEqual(states.JOB_DONE, data['state'])
+        self.assertFalse(mock_time.sleep.called)
+
+    def test_get_one_wait_negative(self):
+        job = obj_utils.create_test_job(self.context)
+        response = self.get_json('/jobs/%s?wait=-1' % job.uuid,
+                                 expect_errors=True)
+        self.assertEqual(400, response.status_int)
+
+
+class TestPostJob(base.FunctionalTest):
+
+    def setUp(self):
+        super(TestPostJob, self).setUp()
+        self.chassis = self.dbapi.create_chassis(dbutils.get_test_chassis())
+        self.nodes = []
+        for i in range(4):
+            node = obj_utils.create_test_node(self.context, id=i,
+                                              uuid=utils.generate_uuid(),
+                                              maintenance=i < 3)
+            self.nodes.append(node)
+
+        p = mock.patch.object(rpcapi.ConductorAPI, 'get_topic_for')
+        self.mock_gtf = p.start()
+        self.addCleanup(p.stop)
+        p = mock.patch.object(rpcapi.ConductorAPI, 'do_bulk_node_action')
+        self.mock_bulk = p.start()
+        self.addCleanup(p.stop)
+
+    def test_post_power(self):
+        topics = {self.nodes[0].uuid: 'topic-a',
+                  self.nodes[1].uuid: 'topic-b',
+                  self.nodes[2].uuid: 'topic-a'}
+        self.mock_gtf.side_effect = lambda node: topics[node.uuid]
+
+        response = self.post_json('/jobs',
+                                  {'action': 'power',
+                                   'target': states.POWER_OFF,
+                                   'filters': {'maintenance': True}})
+        self.assertEqual(202, response.status_int)
+        job = response.json
+        self.assertEqual(3, job['total'])
+        self.assertEqual(states.JOB_RUNNING, job['state'])
+        self.assertEqual({'maintenance': True}, job['filters'])
+
+        self.assertEqual(2, self.mock_bulk.call_count)
+        calls = dict((c[0][5], c[0][2]) for c in self.mock_bulk.call_args_list)
+        self.assertEqual(sorted([self.nodes[0].uuid, self.nodes[2].uuid]),
+                         sorted(calls['topic-a']))
+        self.assertEqual([self.nodes[1].uuid], calls['topic-b'])
+        for c in self.mock_bulk.call_args_list:
+            self.assertEqual((job['uuid'], 'power', states.POWER_OFF),
+                             (c[0][1], c[0][3], c[0][4]))
+
+        data = self.get_json('/jobs/%s' % job['uuid'])
+        self.assertEqual(3, data['total'])
+
+    def test_post_node_uuids(self):
+        self.mock_gtf.return_value = 'topic-a'
+        uuids = [self.nodes[1].uuid, self.nodes[3].uuid]
+        response = self.post_json('/jobs',
+                                  {'action': 'provision',
+                                   'target': states.DELETED,
+                                   'filters': {'node_uuids': uuids}})
+        self.assertEqual(202, response.status_int)
+        self.assertEqual(2, response.json['total'])
+        self.mock_bulk.assert_called_once_with(mock.ANY,
+                                               response.json['uuid'],
+                                               mock.ANY, 'provision',
+                                               states.DELETED, 'topic-a')
+        self.assertEqual(sorted(uuids),
+                         sorted(self.mock_bulk.call_args[0][2]))
+
+    def test_post_no_valid_host(self):
+        self.mock_gtf.side_effect = exception.NoValidHost(reason='no host')
+        response = self.post_json('/jobs',
+                                  {'action': 'power',
+                                   'target': states.POWER_ON,
+                                   'filters': {'driver': 'fake'}})
+        self.assertEqual(202, response.status_int)
+        job = response.json
+        self.assertEqual(4, job['failed'])
+        self.assertEqual(states.JOB_FAILED, job['state'])
+        self.assertIn('no host', job['last_error'])
+        self.assertFalse(self.mock_bulk.called)
+
+    def test_post_no_nodes(self):
+        response = self.post_json('/jobs',
+                                  {'action': 'power',
+                                   'target': states.POWER_ON,
+                                   'filters': {'driver': 'other'}})
+        self.assertEqual(202, response.status_int)
+        self.assertEqual(0, response.json['total'])
+        self.assertEqual(states.JOB_DONE, response.json['state'])
+        self.assertFalse(self.mock_bulk.called)
+
+    def test_post_invalid_target(self):
+        response = self.post_json('/jobs',
+                                  {'action': 'power',
+                                   'target': states.ACTIVE,
+                                   'filters': {'driver': 'fake'}},
+                                  expect_errors=True)
+        self.assertEqual(400, response.status_int)
+        self.assertFalse(self.mock_bulk.called)
+
+    def test_post_invalid_action(self):
+        response = self.post_json('/jobs',
+                                  {'action': 'explode',
+                                   'target': states.POWER_ON,
+                                   'filters': {'driver': 'fake'}},
+                                  expect_errors=True)
+        self.assertEqual(400, response.status_int)
+
+    def test_post_no_filters(self):
+        response = self.post_json('/jobs',
+                                  {'action': 'power',
+                                   'target': states.POWER_OFF,
+                                   'filters': {}},
+                                  expect_errors=True)
+        self.assertEqual(400, response.status_int)
+        self.assertFalse(self.mock_bulk.called)
@@ -16,15 +16,18 @@ Tests for the API /nodes/ methods.
 """
 
 import datetime
+import time
 
 import mock
 from oslo.config import cfg
 from testtools.matchers import HasLength
 
+from ironic.api.controllers.v1 import node as node_controller
 from ironic.common import exception
 from ironic.common import states
 from ironic.common import utils
 from ironic.conductor import rpcapi
+from ironic.db.sqlalchemy import api as sqla_api
 from ironic import objects
 from ironic.openstack.common import context
 from ironic.openstack.common import timeutils
@@ -137,6 +140,50 @@ class TestListNodes(base.FunctionalTest):
                                  expect_errors=True)
         self.assertEqual(404, response.status_int)
 
+    def test_export(self):
+        cfg.CONF.set_override('stream_batch_size', 2, 'api')
+        cfg.CONF.set_override('max_limit', 3, 'api')
+        nodes = []
+        for id in range(5):
+            node = obj_utils.create_test_node(self.context, id=id,
+                                              uuid=utils.generate_uuid())
+            nodes.append(node.uuid)
+        data = self.get_json('/nodes/export')
+        self.assertEqual(nodes, [n['uuid'] for n in data['nodes']])
+        self.assertIn('driver_info', data['nodes'][0])
+        self.assertEqual(self.chassis.uuid, data['nodes'][0]['chassis_uuid'])
+        self.assertNotIn('chassis_id', data['nodes'][0])
+        self.assertNotIn('next', data)
+
+    def test_export_empty(self):
+        data = self.get_json('/nodes/export')
+        self.assertEqual([], data['nodes'])
+
+    def test_export_with_filters(self):
+        cfg.CONF.set_override('stream_batch_size', 1, 'api')
+        associated_nodes = self._create_association_test_nodes().\
+                get('associated')
+        data = self.get_json('/nodes/export?associated=true&sort_dir=desc')
+        self.assertEqual(list(reversed(associated_nodes)),
+                         [n['uuid'] for n in data['nodes']])
+
+    def test_export_invalid_sort_dir(self):
+        response = self.get_json('/nodes/export?sort_dir=foo',
+                                 expect_errors=True)
+        self.assertEqual(400, response.status_int)
+
+    def test_export_invalid_sort_key(self):
+        obj_utils.create_test_node(self.context)
+        response = self.get_json('/nodes/export?sort_key=foo',
+                                 expect_errors=True)
+        self.assertEqual(400, response.status_int)
+
+    def test_export_against_single(self):
+        node = obj_utils.create_test_node(self.context)
+        response = self.get_json('/nodes/%s/export' % node['uuid'],
+                                 expect_errors=True)
+        self.assertEqual(404, response.status_int)
+
     def test_many(self):
         nodes = []
         for id in range(5):
@@ -369,6 +416,57 @@ class TestListNodes(base.FunctionalTest):
         test_uuids_0 = [n.uuid for n in nodes if not n.maintenance]
         self.assertEqual(sorted(test_uuids_0), sorted(uuids))
 
+    def test_scheduling_filters(self):
+        for id, memory_mb in enumerate([1024, 4096, 8192]):
+            obj_utils.create_test_node(self.context, id=id,
+                                       uuid=utils.generate_uuid(),
+                                       properties={'memory_mb': memory_mb,
+                                                   'cpu_arch': 'x86_64'})
+
+        data = self.get_json('/nodes?min_memory_mb=4096&cpu_arch=x86_64')
+        self.assertThat(data['nodes'], HasLength(2))
+
+        data = self.get_json('/nodes/detail?min_memory_mb=4096&limit=1')
+        self.assertThat(data['nodes'], HasLength(1))
+        self.assertEqual(4096, data['nodes'][0]['properties']['memory_mb'])
+        self.assertIn('min_memory_mb=4096', data['next'])
+
+        data = self.get_json('/nodes?cpu_arch=i686')
+        self.assertEqual([], data['nodes'])
+
+    def test_state_and_driver_filters(self):
+        obj_utils.create_test_node(self.context, id=1,
+                                   uuid=utils.generate_uuid(),
+                                   power_state=states.POWER_ON,
+                                   provision_state=states.ACTIVE)
+        deployfail = obj_utils.create_test_node(
+                self.context, id=2, uuid=utils.generate_uuid(),
+                power_state=states.POWER_OFF,
+                provision_state=states.DEPLOYFAIL, reservation='fake-host')
+        other = obj_utils.create_test_node(self.context, id=3,
+                                           uuid=utils.generate_uuid(),
+                                           driver='fake-other',
+                                           power_state=states.POWER_OFF)
+
+        data = self.get_json('/nodes?provision_state=%s' % states.DEPLOYFAIL)
+        self.assertEqual([deployfail.uuid],
+                         [n['uuid'] for n in data['nodes']])
+
+        data = self.get_json('/nodes/detail?driver=fake-other')
+        self.assertEqual([other.uuid], [n['uuid'] for n in data['nodes']])
+
+        data = self.get_json('/nodes?power_state=%s&reserved=false'
+                             % states.POWER_OFF.replace(' ', '%20'))
+        self.assertEqual([other.uuid], [n['uuid'] for n in data['nodes']])
+
+        data = self.get_json('/nodes?reserved=true')
+        self.assertEqual([deployfail.uuid],
+                         [n['uuid'] for n in data['nodes']])
+
+        data = self.get_json('/nodes?power_state=%s&limit=1'
+                             % states.POWER_OFF.replace(' ', '%20'))
+        self.assertIn('power_state=power off', data['next'])
+
     def test_maintenance_nodes_error(self):
         response = self.get_json('/nodes?associated=true&maintenance=blah',
                                  expect_errors=True)
@@ -428,6 +526,216 @@ class TestListNodes(base.FunctionalTest):
             mock_gci.assert_called_once_with(mock.ANY, node.uuid, 'test-topic')
 
 
+class TestWatch(base.FunctionalTest):
+
+    def setUp(self):
+        super(TestWatch, self).setUp()
+        self.node1 = obj_utils.create_test_node(self.context)
+        self.node2 = obj_utils.create_test_node(self.context, id=2,
+                                                uuid=utils.generate_uuid())
+
+    def _set_power_state(self, node, power_state):
+        self.dbapi.update_node(node.id, {'power_state': power_state})
+
+    def test_watch_without_cursor(self):
+        self._set_power_state(self.node1, states.POWER_OFF)
+        data = self.get_json('/nodes/watch')
+        self.assertEqual([], data['events'])
+        self.assertEqual(self.dbapi.get_last_node_event_id(), data['cursor'])
+
+    def test_watch(self):
+        cursor = self.get_json('/nodes/watch')['cursor']
+        self._set_power_state(self.node1, states.POWER_OFF)
+        self._set_power_state(self.node2, states.POWER_OFF)
+
+        data = self.get_json('/nodes/watch?since=%d' % cursor)
+        self.assertEqual([self.node1.uuid, self.node2.uuid],
+                         [e['node_uuid'] for e in data['events']])
+        self.assertEqual(states.POWER_OFF, data['events'][0]['power_state'])
+        self.assertEqual(data['events'][-1]['id'], data['cursor'])
+
+        data = self.get_json('/nodes/watch?since=%d' % data['cursor'])
+        self.assertEqual([], data['events'])
+
+    def test_watch_node_uuids(self):
+        cursor = self.get_json('/nodes/watch')['cursor']
+        self._set_power_state(self.node1, states.POWER_OFF)
+        self._set_power_state(self.node2, states.POWER_OFF)
+        last_id = self.dbapi.get_last_node_event_id()
+
+        data = self.get_json('/nodes/watch?since=%d&node_uuids=%s' %
+                             (cursor, self.node1.uuid))
+        self.assertEqual([self.node1.uuid],
+                         [e['node_uuid'] for e in data['events']])
+        # The cursor skips the changes of the other nodes
+        self.assertEqual(last_id, data['cursor'])
+
+    def test_watch_limit(self):
+        cfg.CONF.set_override('max_limit', 1, 'api')
+        cursor = self.get_json('/nodes/watch')['cursor']
+        self._set_power_state(self.node1, states.POWER_OFF)
+        self._set_power_state(self.node2, states.POWER_OFF)
+
+        data = self.get_json('/nodes/watch?since=%d' % cursor)
+        self.assertEqual([self.node1.uuid],
+                         [e['node_uuid'] for e in data['events']])
+        data = self.get_json('/nodes/watch?since=%d' % data['cursor'])
+        self.assertEqual([self.node2.uuid],
+                         [e['node_uuid'] for e in data['events']])
+
+    @mock.patch.object(node_controller, 'time')
+    def test_watch_wait(self, mock_time):
+        cursor = self.get_json('/nodes/watch')['cursor']
+        mock_time.time.return_value = 100
+
+        def change_state(interval):
+            self._set_power_state(self.node1, states.POWER_OFF)
+        mock_time.sleep.side_effect = change_state
+
+        data = self.get_json('/nodes/watch?since=%d&wait=10' % cursor)
+        self.assertEqual([self.node1.uuid],
+                         [e['node_uuid'] for e in data['events']])
+        mock_time.sleep.assert_called_once_with(cfg.CONF.api.poll_interval)
+
+    @mock.patch.object(node_controller, 'time')
+    def test_watch_wait_timeout(self, mock_time):
+        cfg.CONF.set_override('max_watch_wait', 2, 'api')
+        cursor = self.get_json('/nodes/watch')['cursor']
+        mock_time.time.side_effect = [100, 100, 101, 102]
+
+        data = self.get_json('/nodes/watch?since=%d&wait=30' % cursor)
+        self.assertEqual([], data['events'])
+        self.assertEqual(cursor, data['cursor'])
+        # The wait is capped by max_watch_wait
+        self.assertEqual(2, mock_time.sleep.call_count)
+
+    def test_watch_uncommitted_event(self):
+        cursor = self.get_json('/nodes/watch')['cursor']
+        self._set_power_state(self.node1, states.POWER_OFF)
+        self._set_power_state(self.node2, states.POWER_OFF)
+        self._set_power_state(self.node1, states.POWER_ON)
+        first, second, third = self.dbapi.get_node_events(cursor)
+        with mock.patch.object(self.dbapi, 'get_last_node_event_id',
+                               return_value=first.id) as mock_last:
+            data = self.get_json('/nodes/watch?since=%d' % cursor)
+        mock_last.assert_called_once_with(
+                cfg.CONF.api.node_event_commit_window,
+                cfg.CONF.api.node_event_id_increment)
+        # The changes after one which may not be committed yet are left
+        # for the next request
+        self.assertEqual([first.id], [e['id'] for e in data['events']])
+        self.assertEqual(first.id, data['cursor'])
+
+        data = self.get_json('/nodes/watch?since=%d' % data['cursor'])
+        self.assertEqual([second.id, third.id],
+                         [e['id'] for e in data['events']])
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_watch_cursor_expired(self, mock_utcnow):
+        past = datetime.datetime(2000, 1, 1, 0, 0)
+        mock_utcnow.return_value = past
+        cursor = self.get_json('/nodes/watch')['cursor']
+        self._set_power_state(self.node1, states.POWER_OFF)
+        mock_utcnow.return_value = past + datetime.timedelta(minutes=10)
+        self._set_power_state(self.node1, states.POWER_ON)
+        self.dbapi.destroy_node_events(past + datetime.timedelta(minutes=5))
+
+        response = self.get_json('/nodes/watch?since=%d' % cursor,
+                                 expect_errors=True)
+        self.assertEqual(410, response.status_int)
+        self.assertTrue(response.json['error_message'])
+
+        cursor = self.get_json('/nodes/watch')['cursor']
+        data = self.get_json('/nodes/watch?since=%d' % cursor)
+        self.assertEqual([], data['events'])
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_watch_cursor_expired_no_event_left(self, mock_utcnow):
+        past = datetime.datetime(2000, 1, 1, 0, 0)
+        mock_utcnow.return_value = past
+        cursor = self.get_json('/nodes/watch')['cursor']
+        self._set_power_state(self.node1, states.POWER_OFF)
+        mock_utcnow.return_value = past + datetime.timedelta(minutes=10)
+        self.dbapi.destroy_node_events(past + datetime.timedelta(minutes=5))
+
+        response = self.get_json('/nodes/watch?since=%d' % cursor,
+                                 expect_errors=True)
+        self.assertEqual(410, response.status_int)
+
+        cursor = self.get_json('/nodes/watch')['cursor']
+        data = self.get_json('/nodes/watch?since=%d' % cursor)
+        self.assertEqual([], data['events'])
+
+    def test_watch_invalid_node_uuids(self):
+        response = self.get_json('/nodes/watch?since=0&node_uuids=foo',
+                                 expect_errors=True)
+        self.assertEqual(400, response.status_int)
+
+    def test_watch_negative_since(self):
+        response = self.get_json('/nodes/watch?since=-1',
+                                 expect_errors=True)
+        self.assertEqual(400, response.status_int)
+
+    def test_watch_from_chassis(self):
+        response = self.get_json('/chassis/nodes/watch', expect_errors=True)
+        self.assertEqual(404, response.status_int)
+
+
+class TestStats(base.FunctionalTest):
+
+    def setUp(self):
+        super(TestStats, self).setUp()
+        self.addCleanup(node_controller._NODE_STATS.update,
+                        dict(node_controller._NODE_STATS))
+        node_controller._NODE_STATS.update(stats=None, expires_at=0)
+        self.chassis = self.dbapi.create_chassis(dbutils.get_test_chassis())
+        obj_utils.create_test_node(self.context,
+                                   chassis_id=self.chassis.id,
+                                   power_state=states.POWER_ON,
+                                   provision_state=states.ACTIVE)
+        obj_utils.create_test_node(self.context, id=2,
+                                   uuid=utils.generate_uuid(),
+                                   chassis_id=None,
+                                   power_state=states.POWER_OFF,
+                                   provision_state=states.NOSTATE,
+                                   maintenance=True)
+
+    def test_stats(self):
+        data = self.get_json('/nodes/stats')
+        self.assertEqual({states.ACTIVE: 1, 'None': 1},
+                         data['provision_state'])
+        self.assertEqual({states.POWER_ON: 1, states.POWER_OFF: 1},
+                         data['power_state'])
+        self.assertEqual({'fake': 2}, data['driver'])
+        self.assertEqual({'True': 1, 'False': 1}, data['maintenance'])
+        self.assertEqual({self.chassis.uuid: 1, 'None': 1},
+                         data['chassis_uuid'])
+        self.assertEqual(2, data['total'])
+
+    @mock.patch.object(node_controller, 'time')
+    def test_stats_cached(self, mock_time):
+        cfg.CONF.set_override('node_stats_cache_ttl', 10, 'api')
+        mock_time.time.return_value = 100
+        self.assertEqual(2, self.get_json('/nodes/stats')['total'])
+
+        obj_utils.create_test_node(self.context, id=3,
+                                   uuid=utils.generate_uuid())
+        mock_time.time.return_value = 109
+        self.assertEqual(2, self.get_json('/nodes/stats')['total'])
+        mock_time.time.return_value = 110
+        self.assertEqual(3, self.get_json('/nodes/stats')['total'])
+
+    def test_stats_not_cached(self):
+        self.assertEqual(2, self.get_json('/nodes/stats')['total'])
+        obj_utils.create_test_node(self.context, id=3,
+                                   uuid=utils.generate_uuid())
+        self.assertEqual(3, self.get_json('/nodes/stats')['total'])
+
+    def test_stats_from_chassis(self):
+        response = self.get_json('/chassis/nodes/stats', expect_errors=True)
+        self.assertEqual(404, response.status_int)
+
+
 class TestPatch(base.FunctionalTest):
 
     def setUp(self):
@@ -461,6 +769,46 @@ class TestPatch(base.FunctionalTest):
         self.mock_update_node.assert_called_once_with(
                 mock.ANY, mock.ANY, 'test-topic')
 
+    def test_update_version_conflict(self):
+        self.mock_update_node.side_effect = exception.NodeVersionConflict(
+                node=self.node['uuid'], version=self.node['version'])
+        response = self.patch_json('/nodes/%s' % self.node['uuid'],
+                                   [{'path': '/extra/foo', 'value': 'bar',
+                                     'op': 'add'}],
+                                   expect_errors=True)
+        self.assertEqual('application/json', response.content_type)
+        self.assertEqual(409, response.status_code)
+        self.assertTrue(response.json['error_message'])
+
+    def test_update_reads_primary(self):
+        # NOTE: the replica is the primary database itself, a node read
+        #       from the replica is made to lag one version behind.
+        cfg.CONF.set_override('slave_connection', 'sqlite://', 'database')
+        self.addCleanup(setattr, sqla_api, '_SLAVE_FACADE',
+                        sqla_api._SLAVE_FACADE)
+        sqla_api._SLAVE_FACADE = sqla_api._create_facade_lazily()
+        self.addCleanup(sqla_api._SLAVE_LAG.update,
+                        dict(sqla_api._SLAVE_LAG))
+        sqla_api._SLAVE_LAG.update(checked_at=time.time(), lagging=False)
+        get_by_uuid = objects.Node.get_by_uuid
+
+        def fake_get_by_uuid(context, uuid):
+            node = get_by_uuid(context, uuid)
+            if sqla_api._use_slave():
+                node.version -= 1
+                node.obj_reset_changes()
+            return node
+
+        self.mock_update_node.return_value = self.node
+        with mock.patch.object(objects.Node, 'get_by_uuid',
+                               side_effect=fake_get_by_uuid):
+            response = self.patch_json('/nodes/%s' % self.node['uuid'],
+                                       [{'path': '/extra/foo',
+                                         'value': 'bar', 'op': 'add'}])
+        self.assertEqual(200, response.status_code)
+        node = self.mock_update_node.call_args[0][1]
+        self.assertEqual(self.node['version'], node.version)
+
     def test_update_state(self):
         response = self.patch_json('/nodes/%s' % self.node['uuid'],
                                    [{'power_state': 'new state'}],
@@ -720,12 +1068,12 @@ class TestPost(base.FunctionalTest):
 
         with mock.patch.object(
                 rpcapi.ConductorAPI, 'vendor_passthru') as mock_vendor:
-            mock_vendor.return_value = 'OK'
             response = self.post_json('/nodes/%s/vendor_passthru/test' % uuid,
                                       info, expect_errors=False)
             mock_vendor.assert_called_once_with(
-                    mock.ANY, uuid, 'test', info, 'test-topic')
-            self.assertEqual('"OK"', response.body)
+                    mock.ANY, uuid, 'test', info, 'test-topic',
+                    job_id=response.json['uuid'])
+            self.assertEqual('vendor_passthru', response.json['action'])
             self.assertEqual(202, response.status_code)
 
     def test_vendor_passthru_no_such_method(self):
@@ -742,7 +1090,8 @@ class TestPost(base.FunctionalTest):
             response = self.post_json('/nodes/%s/vendor_passthru/test' % uuid,
                                       info, expect_errors=True)
             mock_vendor.assert_called_once_with(
-                    mock.ANY, uuid, 'test', info, 'test-topic')
+                    mock.ANY, uuid, 'test', info, 'test-topic',
+                    job_id=mock.ANY)
             self.assertEqual(400, response.status_code)
 
     def test_vendor_passthru_without_method(self):
@@ -809,6 +1158,92 @@ class TestPost(base.FunctionalTest):
         self.assertTrue(response.json['error_message'])
 
 
+class TestBulkPost(base.FunctionalTest):
+
+    def setUp(self):
+        super(TestBulkPost, self).setUp()
+        cdict = dbutils.get_test_chassis()
+        self.chassis = self.dbapi.create_chassis(cdict)
+        p = mock.patch.object(rpcapi.ConductorAPI, 'get_topic_for')
+        self.mock_gtf = p.start()
+        self.mock_gtf.return_value = 'test-topic'
+        self.addCleanup(p.stop)
+
+    def _get_test_node(self, *addresses):
+        ndict = post_get_test_node(uuid=utils.generate_uuid())
+        ndict['ports'] = [{'address': a} for a in addresses]
+        return ndict
+
+    def test_bulk_create(self):
+        nodes = [self._get_test_node('52:54:00:cf:2d:31'),
+                 self._get_test_node('52:54:00:cf:2d:32',
+                                     '52:54:00:cf:2d:33')]
+        response = self.post_json('/nodes/bulk', nodes)
+        self.assertEqual(200, response.status_int)
+        results = response.json['nodes']
+        self.assertEqual([n['uuid'] for n in nodes],
+                         [r['uuid'] for r in results])
+        self.assertNotIn('error', results[0])
+        self.assertEqual(2, len(results[0]['links']))
+
+        node = self.get_json('/nodes/%s' % nodes[1]['uuid'])
+        self.assertEqual(self.chassis.uuid, node['chassis_uuid'])
+        ports = self.get_json('/nodes/%s/ports' % nodes[1]['uuid'])['ports']
+        self.assertEqual(sorted(p['uuid'] for p in results[1]['ports']),
+                         sorted(p['uuid'] for p in ports))
+        self.assertEqual(['52:54:00:cf:2d:32', '52:54:00:cf:2d:33'],
+                         sorted(p['address'] for p in ports))
+
+    def test_bulk_create_conflicts(self):
+        nodes = [self._get_test_node('52:54:00:cf:2d:31'),
+                 self._get_test_node('52:54:00:cf:2d:31'),
+                 self._get_test_node()]
+        nodes[2]['uuid'] = nodes[0]['uuid']
+        response = self.post_json('/nodes/bulk', nodes)
+        self.assertEqual(200, response.status_int)
+        results = response.json['nodes']
+        self.assertNotIn('error', results[0])
+        self.assertIn('52:54:00:cf:2d:31', results[1]['error'])
+        self.assertNotIn('links', results[1])
+        self.assertIn(nodes[2]['uuid'], results[2]['error'])
+        response = self.get_json('/nodes/%s' % nodes[1]['uuid'],
+                                 expect_errors=True)
+        self.assertEqual(404, response.status_int)
+
+    def test_bulk_create_invalid_driver(self):
+        self.mock_gtf.side_effect = [exception.NoValidHost('Fake Error'),
+                                     'test-topic']
+        nodes = [self._get_test_node(), self._get_test_node()]
+        response = self.post_json('/nodes/bulk', nodes)
+        results = response.json['nodes']
+        self.assertIn('Fake Error', results[0]['error'])
+        self.assertNotIn('error', results[1])
+        response = self.get_json('/nodes/%s' % nodes[0]['uuid'],
+                                 expect_errors=True)
+        self.assertEqual(404, response.status_int)
+
+    def test_bulk_create_invalid_address(self):
+        nodes = [self._get_test_node('52:54:00:cf:2d:31'),
+                 self._get_test_node('invalid')]
+        response = self.post_json('/nodes/bulk', nodes, expect_errors=True)
+        self.assertEqual(400, response.status_int)
+        response = self.get_json('/nodes/%s' % nodes[0]['uuid'],
+                                 expect_errors=True)
+        self.assertEqual(404, response.status_int)
+
+    def test_bulk_create_too_many(self):
+        cfg.CONF.set_override('max_limit', 1, 'api')
+        nodes = [self._get_test_node(), self._get_test_node()]
+        response = self.post_json('/nodes/bulk', nodes, expect_errors=True)
+        self.assertEqual(400, response.status_int)
+
+    def test_bulk_create_from_chassis(self):
+        response = self.post_json('/chassis/nodes/bulk',
+                                  [self._get_test_node()],
+                                  expect_errors=True)
+        self.assertEqual(403, response.status_int)
+
+
 class TestDelete(base.FunctionalTest):
 
     def setUp(self):
@@ -881,11 +1316,19 @@ class TestPut(base.FunctionalTest):
         response = self.put_json('/nodes/%s/states/power' % self.node['uuid'],
                                  {'target': states.POWER_ON})
         self.assertEqual(202, response.status_code)
-        self.assertEqual('', response.body)
+        self.assertEqual('power', response.json['action'])
+        self.assertEqual(states.POWER_ON, response.json['target'])
+        self.assertEqual(states.JOB_RUNNING, response.json['state'])
+        self.assertEqual([self.node['uuid']],
+                         response.json['filters']['node_uuids'])
+        self.assertEqual(1, response.json['total'])
         self.mock_cnps.assert_called_once_with(mock.ANY,
                                                self.node['uuid'],
                                                states.POWER_ON,
-                                               'test-topic')
+                                               'test-topic',
+                                               job_id=response.json['uuid'])
+        job = objects.Job.get_by_uuid(self.context, response.json['uuid'])
+        self.assertEqual(states.JOB_RUNNING, job.state)
 
     def test_power_invalid_state_request(self):
         ret = self.put_json('/nodes/%s/states/power' % self.node.uuid,
@@ -896,17 +1339,21 @@ class TestPut(base.FunctionalTest):
         ret = self.put_json('/nodes/%s/states/provision' % self.node.uuid,
                             {'target': states.ACTIVE})
         self.assertEqual(202, ret.status_code)
-        self.assertEqual('', ret.body)
+        self.assertEqual('provision', ret.json['action'])
+        self.assertEqual(states.ACTIVE, ret.json['target'])
         self.mock_dnd.assert_called_once_with(
-                mock.ANY, self.node.uuid, False, 'test-topic')
+                mock.ANY, self.node.uuid, False, 'test-topic',
+                job_id=ret.json['uuid'])
 
     def test_provision_with_tear_down(self):
         ret = self.put_json('/nodes/%s/states/provision' % self.node.uuid,
                             {'target': states.DELETED})
         self.assertEqual(202, ret.status_code)
-        self.assertEqual('', ret.body)
+        self.assertEqual('provision', ret.json['action'])
+        self.assertEqual(states.DELETED, ret.json['target'])
         self.mock_dntd.assert_called_once_with(
-                mock.ANY, self.node.uuid, 'test-topic')
+                mock.ANY, self.node.uuid, 'test-topic',
+                job_id=ret.json['uuid'])
 
     def test_provision_invalid_state_request(self):
         ret = self.put_json('/nodes/%s/states/provision' % self.node.uuid,
@@ -930,9 +1377,8 @@ class TestPut(base.FunctionalTest):
         ret = self.put_json('/nodes/%s/states/provision' % node.uuid,
                             {'target': states.DELETED})
         self.assertEqual(202, ret.status_code)
-        self.assertEqual('', ret.body)
         self.mock_dntd.assert_called_once_with(
-                mock.ANY, node.uuid, 'test-topic')
+                mock.ANY, node.uuid, 'test-topic', job_id=ret.json['uuid'])
 
     def test_provision_already_in_state(self):
         node = obj_utils.create_test_node(
@@ -1007,3 +1453,4 @@ class TestPut(base.FunctionalTest):
                                 expect_errors=True)
             self.assertEqual(400, ret.status_code)
             self.assertTrue(ret.json['error_message'])
+            self.assertFalse(dnd.called)
@@ -28,6 +28,8 @@ from oslo import messaging
 
 from ironic.common import driver_factory
 from ironic.common import exception
+from ironic.common.glance_service import base_image_service
+from ironic.common import keystone
 from ironic.common import states
 from ironic.common import utils as ironic_utils
 from ironic.conductor import manager
@@ -35,10 +37,12 @@ from ironic.conductor import task_manager
 from ironic.conductor import utils as conductor_utils
 from ironic.db import api as dbapi
 from ironic.drivers import base as drivers_base
+from ironic.drivers.modules import pxe
 from ironic import objects
 from ironic.openstack.common import context
 from ironic.openstack.common import timeutils
 from ironic.tests import base as tests_base
+from ironic.tests import stubs
 from ironic.tests.conductor import utils as mgr_utils
 from ironic.tests.db import base as tests_db_base
 from ironic.tests.db import utils
@@ -129,6 +133,18 @@ class ManagerTestCase(tests_db_base.DbTestCase):
             self.service._conductor_service_record_keepalive(self.context)
             mock_touch.assert_called_once_with(self.hostname)
 
+    @mock.patch.object(timeutils, 'utcnow')
+    def test__prune_node_events(self, mock_utcnow):
+        self.config(node_event_retention=60, group='conductor')
+        mock_utcnow.return_value = datetime.datetime(2000, 1, 1, 0, 5)
+        self._start_service()
+        with mock.patch.object(self.dbapi, 'destroy_node_events') \
+                as mock_destroy:
+            mock_destroy.return_value = 0
+            self.service._prune_node_events(self.context)
+            mock_destroy.assert_called_once_with(
+                    datetime.datetime(2000, 1, 1, 0, 4))
+
     def test_change_node_power_state_power_on(self):
         # Test change_node_power_state including integration with
         # conductor.utils.node_power_action and lower.
@@ -285,6 +301,21 @@ class ManagerTestCase(tests_db_base.DbTestCase):
         res = self.service.update_node(self.context, node)
         self.assertEqual({'test': 'two'}, res['extra'])
 
+    def test_update_node_concurrent_power_state(self):
+        node = obj_utils.create_test_node(self.context, driver='fake',
+                                          extra={'test': 'one'},
+                                          power_state=states.POWER_OFF)
+        # the power state is synchronized after the API read the node
+        self.dbapi.update_node(node.id, {'power_state': states.POWER_ON})
+
+        node.extra = {'test': 'two'}
+        res = self.service.update_node(self.context, node)
+        self.assertEqual({'test': 'two'}, res['extra'])
+        self.assertEqual(states.POWER_ON, res['power_state'])
+        node.refresh()
+        self.assertEqual({'test': 'two'}, node.extra)
+        self.assertEqual(states.POWER_ON, node.power_state)
+
     def test_update_node_already_locked(self):
         node = obj_utils.create_test_node(self.context, driver='fake',
                                           extra={'test': 'one'})
@@ -520,6 +551,110 @@ class ManagerTestCase(tests_db_base.DbTestCase):
                           'test_method',
                           {})
 
+    def test_prefetch_images(self):
+        self._start_service()
+        with mock.patch.object(self.driver.deploy,
+                               'prefetch_images') as mock_prefetch:
+            self.service.prefetch_images(self.context, 'fake', ['image'],
+                                         ['kernel'])
+            self.service._worker_pool.waitall()
+        mock_prefetch.assert_called_once_with(self.context, ['image'],
+                                              ['kernel'])
+
+    def test_prefetch_images_driver_not_supported(self):
+        self._start_service()
+        with mock.patch.object(self.service,
+                               '_spawn_worker') as mock_spawn:
+            self.service.prefetch_images(self.context, 'other', ['image'],
+                                         [])
+        self.assertFalse(mock_spawn.called)
+
+    def test_prefetch_images_fails(self):
+        self._start_service()
+        with mock.patch.object(self.driver.deploy,
+                               'prefetch_images') as mock_prefetch:
+            mock_prefetch.side_effect = exception.ImageDownloadFailed(
+                    reason='boom')
+            self.service.prefetch_images(self.context, 'fake', ['image'],
+                                         [])
+            self.service._worker_pool.waitall()
+        self.assertTrue(mock_prefetch.called)
+
+    @mock.patch.object(keystone, 'get_admin_auth_token')
+    def test_start_prefetches_images(self, mock_token):
+        mock_token.return_value = 'admin-token'
+        self.config(prefetch_images=['image'],
+                    prefetch_boot_images=['kernel', 'ramdisk'],
+                    group='conductor')
+        with mock.patch.object(self.driver.deploy,
+                               'prefetch_images') as mock_prefetch:
+            self._start_service()
+            self.service._worker_pool.waitall()
+        mock_prefetch.assert_called_once_with(mock.ANY, ['image'],
+                                              ['kernel', 'ramdisk'])
+        self.assertTrue(mock_prefetch.call_args[0][0].is_admin)
+        self.assertEqual('admin-token',
+                         mock_prefetch.call_args[0][0].auth_token)
+
+    @mock.patch.object(keystone, 'get_admin_auth_token')
+    def test_start_prefetches_images_noauth(self, mock_token):
+        self.config(auth_strategy='noauth', group='glance')
+        self.config(prefetch_images=['image'], group='conductor')
+        with mock.patch.object(self.driver.deploy,
+                               'prefetch_images') as mock_prefetch:
+            self._start_service()
+            self.service._worker_pool.waitall()
+        self.assertFalse(mock_token.called)
+        self.assertIsNone(mock_prefetch.call_args[0][0].auth_token)
+
+    @mock.patch.object(keystone, 'get_admin_auth_token')
+    def test_start_prefetches_images_no_token(self, mock_token):
+        mock_token.side_effect = exception.CatalogUnauthorized
+        self.config(prefetch_images=['image'], group='conductor')
+        with mock.patch.object(self.driver.deploy,
+                               'prefetch_images') as mock_prefetch:
+            self._start_service()
+            self.service._worker_pool.waitall()
+        self.assertFalse(mock_prefetch.called)
+
+    @mock.patch.object(pxe, '_prefetch_image')
+    @mock.patch.object(base_image_service.client, 'Client')
+    @mock.patch.object(keystone, 'get_admin_auth_token')
+    def test_prefetch_startup_images_glance_token(self, mock_token,
+                                                  mock_client,
+                                                  mock_prefetch):
+        for cache in (base_image_service._CLIENTS,
+                      base_image_service._IMAGE_METADATA):
+            patcher = mock.patch.dict(cache, clear=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        mock_token.return_value = 'admin-token'
+        glance = stubs.StubGlanceClient([{'id': 'image',
+                                          'properties': {
+                                              'kernel_id': 'kernel',
+                                              'ramdisk_id': 'ramdisk'}}])
+        glance.http_client = mock.Mock()
+        glance.http_client.session.adapters = {}
+        mock_client.return_value = glance
+        self.config(prefetch_images=['image'], group='conductor')
+        self._start_service()
+        self.service._worker_pool.waitall()
+
+        self.service._prefetch_startup_images([pxe.PXEDeploy()])
+        mock_client.assert_called_with(1, mock.ANY, insecure=False,
+                                       token='admin-token')
+        self.assertEqual(['image', 'kernel', 'ramdisk'],
+                         sorted(c[0][1] for c in mock_prefetch.call_args_list))
+        for call in mock_prefetch.call_args_list:
+            self.assertEqual('admin-token', call[0][2].auth_token)
+
+    def test_start_prefetches_nothing(self):
+        with mock.patch.object(self.driver.deploy,
+                               'prefetch_images') as mock_prefetch:
+            self._start_service()
+            self.service._worker_pool.waitall()
+        self.assertFalse(mock_prefetch.called)
+
     def test_do_node_deploy_invalid_state(self):
         # test node['provision_state'] is not NOSTATE
         node = obj_utils.create_test_node(self.context, driver='fake',
@@ -724,6 +859,199 @@ class ManagerTestCase(tests_db_base.DbTestCase):
         # Verify reservation has been cleared.
         self.assertIsNone(node.reservation)
 
+    def test_change_node_power_state_with_job(self):
+        node = obj_utils.create_test_node(self.context, driver='fake',
+                                          power_state=states.POWER_OFF)
+        job = obj_utils.create_test_job(self.context, total=1)
+        self._start_service()
+
+        with mock.patch.object(self.driver.power, 'get_power_state') \
+                as get_power_mock:
+            get_power_mock.return_value = states.POWER_OFF
+            self.service.change_node_power_state(self.context, node.uuid,
+                                                 states.POWER_ON,
+                                                 job_id=job.uuid)
+            # The job is only updated once the worker is done
+            job.refresh()
+            self.assertEqual(0, job.succeeded)
+            self.service._worker_pool.waitall()
+
+        job.refresh()
+        self.assertEqual(states.JOB_DONE, job.state)
+        self.assertEqual(1, job.succeeded)
+        node.refresh()
+        self.assertIsNone(node.reservation)
+
+    def test_change_node_power_state_with_job_exception_in_background_task(
+            self):
+        node = obj_utils.create_test_node(self.context, driver='fake',
+                                          power_state=states.POWER_OFF)
+        job = obj_utils.create_test_job(self.context, total=1)
+        self._start_service()
+
+        with contextlib.nested(
+                mock.patch.object(self.driver.power, 'get_power_state'),
+                mock.patch.object(self.driver.power, 'set_power_state')) \
+                as (get_power_mock, set_power_mock):
+            get_power_mock.return_value = states.POWER_OFF
+            set_power_mock.side_effect = exception.PowerStateFailure(
+                pstate=states.POWER_ON)
+            self.service.change_node_power_state(self.context, node.uuid,
+                                                 states.POWER_ON,
+                                                 job_id=job.uuid)
+            self.service._worker_pool.waitall()
+
+        job.refresh()
+        self.assertEqual(states.JOB_FAILED, job.state)
+        self.assertEqual(1, job.failed)
+        self.assertIn(node.uuid, job.last_error)
+        node.refresh()
+        self.assertIsNone(node.reservation)
+
+    def test_change_node_power_state_with_job_node_already_locked(self):
+        node = obj_utils.create_test_node(self.context, driver='fake',
+                                          reservation='fake-reserv')
+        job = obj_utils.create_test_job(self.context, total=1)
+        self._start_service()
+
+        exc = self.assertRaises(messaging.rpc.ExpectedException,
+                                self.service.change_node_power_state,
+                                self.context, node.uuid, states.POWER_ON,
+                                job_id=job.uuid)
+        self.assertEqual(exception.NodeLocked, exc.exc_info[0])
+        job.refresh()
+        self.assertEqual(states.JOB_FAILED, job.state)
+        self.assertEqual(1, job.failed)
+        self.assertIn('locked', job.last_error)
+
+    def test_vendor_passthru_with_job(self):
+        node = obj_utils.create_test_node(self.context, driver='fake')
+        job = obj_utils.create_test_job(self.context, action='vendor_passthru',
+                                        target=None, total=1)
+        info = {'bar': 'baz'}
+        self._start_service()
+
+        self.service.vendor_passthru(self.context, node.uuid, 'first_method',
+                                     info, job_id=job.uuid)
+        self.service._worker_pool.waitall()
+
+        job.refresh()
+        self.assertEqual(states.JOB_DONE, job.state)
+        self.assertEqual(1, job.succeeded)
+
+    def test_do_bulk_node_action_power(self):
+        self.config(bulk_action_batch_size=2, group='conductor')
+        nodes = [obj_utils.create_test_node(self.context, id=i,
+                                            uuid=ironic_utils.generate_uuid(),
+                                            driver='fake',
+                                            power_state=states.POWER_OFF)
+                 for i in range(3)]
+        job = obj_utils.create_test_job(self.context, total=3)
+        self._start_service()
+
+        with mock.patch.object(self.driver.power, 'get_power_state') \
+                as get_power_mock:
+            get_power_mock.return_value = states.POWER_OFF
+            self.service.do_bulk_node_action(self.context, job.uuid,
+                                             [n.uuid for n in nodes],
+                                             'power', states.POWER_ON)
+            self.service._worker_pool.waitall()
+
+        for node in nodes:
+            node.refresh()
+            self.assertEqual(states.POWER_ON, node.power_state)
+            self.assertIsNone(node.reservation)
+        job.refresh()
+        self.assertEqual(states.JOB_DONE, job.state)
+        self.assertEqual(3, job.succeeded)
+        self.assertEqual(0, job.failed)
+
+    def test_do_bulk_node_action_failure(self):
+        node1 = obj_utils.create_test_node(self.context, id=1,
+                                           uuid=ironic_utils.generate_uuid(),
+                                           driver='fake')
+        node2 = obj_utils.create_test_node(self.context, id=2,
+                                           uuid=ironic_utils.generate_uuid(),
+                                           driver='fake',
+                                           reservation='fake-reserv')
+        job = obj_utils.create_test_job(self.context, total=2)
+        self._start_service()
+
+        with mock.patch.object(self.driver.power, 'get_power_state') \
+                as get_power_mock:
+            get_power_mock.return_value = states.POWER_ON
+            self.service.do_bulk_node_action(self.context, job.uuid,
+                                             [node1.uuid, node2.uuid],
+                                             'power', states.POWER_OFF)
+            self.service._worker_pool.waitall()
+
+        job.refresh()
+        self.assertEqual(states.JOB_FAILED, job.state)
+        self.assertEqual(1, job.succeeded)
+        self.assertEqual(1, job.failed)
+        self.assertIn(node2.uuid, job.last_error)
+        self.assertIn('locked', job.last_error)
+
+    def test_do_bulk_node_action_no_free_worker(self):
+        job = obj_utils.create_test_job(self.context, total=2)
+        self._start_service()
+
+        with mock.patch.object(self.service, '_spawn_worker') as spawn_mock:
+            spawn_mock.side_effect = exception.NoFreeConductorWorker()
+            self.service.do_bulk_node_action(self.context, job.uuid,
+                                             ['fake-uuid1', 'fake-uuid2'],
+                                             'power', states.POWER_OFF)
+
+        job.refresh()
+        self.assertEqual(states.JOB_FAILED, job.state)
+        self.assertEqual(2, job.failed)
+
+    def test_do_bulk_node_action_pool_too_small(self):
+        self.config(workers_pool_size=1, group='conductor')
+        job = obj_utils.create_test_job(self.context, total=2)
+        self._start_service()
+
+        with mock.patch.object(self.service, '_spawn_worker') as spawn_mock:
+            self.service.do_bulk_node_action(self.context, job.uuid,
+                                             ['fake-uuid1', 'fake-uuid2'],
+                                             'power', states.POWER_OFF)
+        self.assertFalse(spawn_mock.called)
+
+        job.refresh()
+        self.assertEqual(states.JOB_FAILED, job.state)
+        self.assertEqual(2, job.failed)
+
+    def test__start_node_action(self):
+        with contextlib.nested(
+                mock.patch.object(self.service, 'change_node_power_state'),
+                mock.patch.object(self.service, 'do_node_deploy'),
+                mock.patch.object(self.service, 'do_node_tear_down')) \
+                as (power_mock, deploy_mock, tear_down_mock):
+            self.service._start_node_action(self.context, 'fake-uuid',
+                                            'power', states.REBOOT,
+                                            'fake-job')
+            power_mock.assert_called_once_with(self.context, 'fake-uuid',
+                                               states.REBOOT,
+                                               job_id='fake-job')
+            self.service._start_node_action(self.context, 'fake-uuid',
+                                            'provision', states.ACTIVE,
+                                            'fake-job')
+            deploy_mock.assert_called_once_with(self.context, 'fake-uuid',
+                                                job_id='fake-job')
+            self.service._start_node_action(self.context, 'fake-uuid',
+                                            'provision', states.DELETED,
+                                            'fake-job')
+            tear_down_mock.assert_called_once_with(self.context,
+                                                   'fake-uuid',
+                                                   job_id='fake-job')
+
+    def test__start_node_action_unwraps_expected_exception(self):
+        node = obj_utils.create_test_node(self.context, driver='fake',
+                                          reservation='fake-reserv')
+        self.assertRaises(exception.NodeLocked,
+                          self.service._start_node_action, self.context,
+                          node.uuid, 'power', states.POWER_ON, None)
+
     def test_validate_driver_interfaces(self):
         node = obj_utils.create_test_node(self.context, driver='fake')
         ret = self.service.validate_driver_interfaces(self.context,
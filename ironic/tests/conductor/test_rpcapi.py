@@ -142,6 +142,13 @@ class RPCAPITestCase(base.DbTestCase):
                           node_id=self.fake_node['uuid'],
                           new_state=states.POWER_ON)
 
+    def test_change_node_power_state_with_job(self):
+        self._test_rpcapi('change_node_power_state',
+                          'cast',
+                          node_id=self.fake_node['uuid'],
+                          new_state=states.POWER_ON,
+                          job_id='fake-job')
+
     def test_pass_vendor_info(self):
         self._test_rpcapi('vendor_passthru',
                           'call',
@@ -149,6 +156,14 @@ class RPCAPITestCase(base.DbTestCase):
                           driver_method='test-driver-method',
                           info={"test_info": "test_value"})
 
+    def test_pass_vendor_info_with_job(self):
+        self._test_rpcapi('vendor_passthru',
+                          'cast',
+                          node_id=self.fake_node['uuid'],
+                          driver_method='test-driver-method',
+                          info={"test_info": "test_value"},
+                          job_id='fake-job')
+
     def test_driver_vendor_passthru(self):
         self._test_rpcapi('driver_vendor_passthru',
                           'call',
@@ -156,17 +171,41 @@ class RPCAPITestCase(base.DbTestCase):
                           driver_method='test-driver-method',
                           info={'test_key': 'test_value'})
 
+    def test_prefetch_images(self):
+        ctxt = context.get_admin_context()
+        rpcapi = conductor_rpcapi.ConductorAPI(topic='fake-topic')
+        with mock.patch.object(rpcapi.client, 'prepare') as mock_prepare:
+            rpcapi.prefetch_images(ctxt, 'fake-driver', ['image'],
+                                   ['kernel'])
+        mock_prepare.assert_called_once_with(fanout=True)
+        mock_prepare.return_value.cast.assert_called_once_with(
+                ctxt, 'prefetch_images', driver_name='fake-driver',
+                images=['image'], boot_images=['kernel'])
+
     def test_do_node_deploy(self):
         self._test_rpcapi('do_node_deploy',
                           'call',
                           node_id=self.fake_node['uuid'],
                           rebuild=False)
 
+    def test_do_node_deploy_with_job(self):
+        self._test_rpcapi('do_node_deploy',
+                          'cast',
+                          node_id=self.fake_node['uuid'],
+                          rebuild=False,
+                          job_id='fake-job')
+
     def test_do_node_tear_down(self):
         self._test_rpcapi('do_node_tear_down',
                           'call',
                           node_id=self.fake_node['uuid'])
 
+    def test_do_node_tear_down_with_job(self):
+        self._test_rpcapi('do_node_tear_down',
+                          'cast',
+                          node_id=self.fake_node['uuid'],
+                          job_id='fake-job')
+
     def test_validate_driver_interfaces(self):
         self._test_rpcapi('validate_driver_interfaces',
                           'call',
@@ -199,3 +238,11 @@ class RPCAPITestCase(base.DbTestCase):
         self._test_rpcapi('update_port',
                           'call',
                           port_obj=fake_port)
+
+    def test_do_bulk_node_action(self):
+        self._test_rpcapi('do_bulk_node_action',
+                          'cast',
+                          job_id='fake-job',
+                          node_ids=['fake-node1', 'fake-node2'],
+                          action='power',
+                          target=states.POWER_OFF)
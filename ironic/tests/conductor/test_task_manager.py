@@ -34,6 +34,7 @@ from ironic.openstack.common import context
 from ironic.tests import base as tests_base
 from ironic.tests.conductor import utils as mgr_utils
 from ironic.tests.db import base as db_base
+from ironic.tests.db import utils as db_utils
 from ironic.tests.objects import utils as obj_utils
 
 
@@ -88,6 +89,68 @@ class TaskManagerTestCase(TaskManagerSetup):
         node.refresh(self.context)
         self.assertIsNone(node.reservation)
 
+    def test_task_manager_coalesces_writes(self):
+        self.config(coalesce_node_writes=True, group='conductor')
+        node_uuid = self.uuids[0]
+
+        with task_manager.acquire(self.context, node_uuid) as task:
+            self.assertTrue(task.node.coalesce_writes)
+            old_driver_info = task.node.driver_info
+            task.node.driver_info = {'pxe_deploy_key': 'key'}
+            task.node.save(self.context)
+            node = objects.Node.get_by_uuid(self.context, node_uuid)
+            self.assertEqual(old_driver_info, node.driver_info)
+
+            task.node.power_state = 'power on'
+            task.node.save(self.context)
+            node.refresh(self.context)
+            self.assertEqual({'pxe_deploy_key': 'key'}, node.driver_info)
+            self.assertEqual('power on', node.power_state)
+
+    def test_task_manager_flushes_writes_on_release(self):
+        self.config(coalesce_node_writes=True, group='conductor')
+        node_uuid = self.uuids[0]
+
+        with task_manager.acquire(self.context, node_uuid) as task:
+            task.node.driver_info = {'pxe_deploy_key': 'key'}
+            task.node.save(self.context)
+
+        self.assertFalse(task.resources)
+        node = objects.Node.get_by_uuid(self.context, node_uuid)
+        self.assertEqual({'pxe_deploy_key': 'key'}, node.driver_info)
+        self.assertIsNone(node.reservation)
+
+    def test_task_manager_coalesce_writes_disabled(self):
+        # NOTE: coalescing is disabled by default
+        node_uuid = self.uuids[0]
+
+        with task_manager.acquire(self.context, node_uuid) as task:
+            self.assertFalse(task.node.coalesce_writes)
+
+        with task_manager.acquire(self.context, node_uuid,
+                                  coalesce_writes=True) as task:
+            self.assertTrue(task.node.coalesce_writes)
+
+    def test_task_manager_shared_does_not_coalesce_writes(self):
+        self.config(coalesce_node_writes=True, group='conductor')
+        with task_manager.acquire(self.context, self.uuids[0],
+                                  shared=True) as task:
+            self.assertFalse(task.node.coalesce_writes)
+
+    def test_task_manager_loads_ports_lazily(self):
+        node_uuid = self.uuids[0]
+        node = objects.Node.get_by_uuid(self.context, node_uuid)
+        port = self.dbapi.create_port(db_utils.get_test_port(node_id=node.id))
+
+        with mock.patch.object(dbapi.IMPL, 'get_ports_by_node_id',
+                               wraps=self.dbapi.get_ports_by_node_id) \
+                as get_ports_mock:
+            with task_manager.acquire(self.context, node_uuid) as task:
+                self.assertFalse(get_ports_mock.called)
+                self.assertEqual([port.uuid], [p.uuid for p in task.ports])
+                self.assertEqual([port.uuid], [p.uuid for p in task.ports])
+            get_ports_mock.assert_called_once_with(node.id)
+
     def test_get_many_nodes(self):
         uuids = self.uuids[1:3]
 
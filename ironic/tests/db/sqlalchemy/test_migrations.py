@@ -519,3 +519,90 @@ class TestMigrations(BaseMigrationTestCase, WalkVersionsMixin):
         self.assertIn('instance_info', col_names)
         self.assertIsInstance(nodes.c.instance_info.type,
                               sqlalchemy.types.TEXT)
+
+    def _check_4f399b21ae71(self, engine, data):
+        jobs = db_utils.get_table(engine, 'jobs')
+        col_names = [column.name for column in jobs.c]
+        for column in ('uuid', 'action', 'target', 'filters', 'state',
+                       'total', 'succeeded', 'failed', 'last_error'):
+            self.assertIn(column, col_names)
+        self.assertIsInstance(jobs.c.total.type, sqlalchemy.types.Integer)
+
+    def _check_fda9c2b8a957(self, engine, data):
+        events = db_utils.get_table(engine, 'node_events')
+        col_names = [column.name for column in events.c]
+        for column in ('id', 'node_uuid', 'power_state', 'target_power_state',
+                       'provision_state', 'target_provision_state',
+                       'last_error', 'created_at'):
+            self.assertIn(column, col_names)
+        indexes = [index.name for index in events.indexes]
+        self.assertIn('node_events_created_at', indexes)
+
+    def _check_d9a535cf701d(self, engine, data):
+        nodes = db_utils.get_table(engine, 'nodes')
+        col_names = [column.name for column in nodes.c]
+        self.assertIn('version', col_names)
+        self.assertIsInstance(nodes.c.version.type, sqlalchemy.types.Integer)
+
+    def _pre_upgrade_1c2b7d5e8f3a(self, engine):
+        ports = db_utils.get_table(engine, 'ports')
+        data = [{'uuid': 'b2a5f8a2-6f0c-4a4e-9b46-3c3f1c1b7a01',
+                 'address': '52:54:00:cf:2d:31',
+                 'extra': '{"vif_port_id": "fake-vif"}'},
+                {'uuid': 'b2a5f8a2-6f0c-4a4e-9b46-3c3f1c1b7a02',
+                 'address': '52:54:00:cf:2d:32',
+                 'extra': '{}'}]
+        engine.execute(ports.insert(), data)
+        return data
+
+    def _check_1c2b7d5e8f3a(self, engine, data):
+        ports = db_utils.get_table(engine, 'ports')
+        self.assertIn('vif_port_id', [column.name for column in ports.c])
+        self.assertIn('port_vif_port_id',
+                      [index.name for index in ports.indexes])
+        vifs = dict(engine.execute(sqlalchemy.select([ports.c.uuid,
+                                                      ports.c.vif_port_id])))
+        self.assertEqual('fake-vif', vifs[data[0]['uuid']])
+        self.assertIsNone(vifs[data[1]['uuid']])
+
+    def _pre_upgrade_3ae36a5f5131(self, engine):
+        nodes = db_utils.get_table(engine, 'nodes')
+        data = [{'uuid': 'c4e7f1e6-6d42-4d3e-8d3a-0b8a3d1e2f01',
+                 'properties': '{"cpus": "8", "memory_mb": 262144, '
+                               '"local_gb": 100, "cpu_arch": "x86_64"}'},
+                {'uuid': 'c4e7f1e6-6d42-4d3e-8d3a-0b8a3d1e2f02',
+                 'properties': '{}'}]
+        engine.execute(nodes.insert(), data)
+        return data
+
+    def _check_3ae36a5f5131(self, engine, data):
+        nodes = db_utils.get_table(engine, 'nodes')
+        indexes = [index.name for index in nodes.indexes]
+        for column in ('cpus', 'memory_mb', 'local_gb', 'cpu_arch'):
+            self.assertIn(column, [c.name for c in nodes.c])
+            self.assertIn('node_%s' % column, indexes)
+        self.assertIsInstance(nodes.c.memory_mb.type,
+                              sqlalchemy.types.Integer)
+
+        rows = dict((row['uuid'], row) for row in engine.execute(
+                nodes.select().where(nodes.c.uuid.in_(
+                        [d['uuid'] for d in data]))))
+        first = rows[data[0]['uuid']]
+        self.assertEqual((8, 262144, 100, 'x86_64'),
+                         (first['cpus'], first['memory_mb'],
+                          first['local_gb'], first['cpu_arch']))
+        self.assertIsNone(rows[data[1]['uuid']]['memory_mb'])
+
+    def _check_5a8f2c4b9e71(self, engine, data):
+        nodes = db_utils.get_table(engine, 'nodes')
+        indexes = [index.name for index in nodes.indexes]
+        for column in ('driver', 'provision_state', 'power_state',
+                       'reservation'):
+            self.assertIn('node_%s' % column, indexes)
+
+    def _check_7c1e4b2d9a63(self, engine, data):
+        marks = db_utils.get_table(engine, 'node_event_marks')
+        col_names = [column.name for column in marks.c]
+        self.assertIn('pruned_id', col_names)
+        self.assertIsInstance(marks.c.pruned_id.type,
+                              sqlalchemy.types.Integer)
@@ -0,0 +1,109 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for reading from the database replica."""
+
+import datetime
+
+import mock
+
+from ironic.db import api as dbapi
+from ironic.db.sqlalchemy import api as sqla_api
+from ironic.openstack.common import timeutils
+from ironic.tests.db import base
+from ironic.tests.db import utils
+
+
+class DbReplicaTestCase(base.DbTestCase):
+
+    def setUp(self):
+        super(DbReplicaTestCase, self).setUp()
+        self.dbapi = dbapi.get_instance()
+        self.config(slave_connection='sqlite://', group='database')
+
+        # NOTE: the replica is the primary database itself in these tests.
+        self.addCleanup(setattr, sqla_api, '_SLAVE_FACADE',
+                        sqla_api._SLAVE_FACADE)
+        sqla_api._SLAVE_FACADE = sqla_api._create_facade_lazily()
+        self.addCleanup(sqla_api._SLAVE_LAG.update,
+                        dict(sqla_api._SLAVE_LAG))
+        sqla_api._SLAVE_LAG.update(checked_at=None, lagging=True)
+        self.addCleanup(self.dbapi.use_replica_reads, False)
+
+        self.dbapi.register_conductor(utils.get_test_conductor())
+        self.node = self.dbapi.create_node(utils.get_test_node())
+
+    @mock.patch.object(sqla_api, 'get_session', wraps=sqla_api.get_session)
+    def test_reads_use_replica(self, mock_get_session):
+        self.dbapi.use_replica_reads(True)
+        self.dbapi.get_node_by_uuid(self.node.uuid)
+        mock_get_session.assert_called_with(use_slave=True)
+
+    @mock.patch.object(sqla_api, 'get_session', wraps=sqla_api.get_session)
+    def test_reads_use_primary_when_not_enabled(self, mock_get_session):
+        self.dbapi.get_node_by_uuid(self.node.uuid)
+        mock_get_session.assert_called_once_with(use_slave=False)
+
+    @mock.patch.object(sqla_api, 'get_session', wraps=sqla_api.get_session)
+    def test_reads_use_primary_without_replica(self, mock_get_session):
+        self.config(slave_connection=None, group='database')
+        self.dbapi.use_replica_reads(True)
+        self.dbapi.get_node_by_uuid(self.node.uuid)
+        mock_get_session.assert_called_once_with(use_slave=False)
+
+    def test_reads_use_primary_after_write(self):
+        self.dbapi.use_replica_reads(True)
+        self.assertTrue(sqla_api._use_slave())
+
+        self.dbapi.update_node(self.node.id, {'extra': {'foo': 'bar'}})
+        self.assertFalse(sqla_api._use_slave())
+
+        self.dbapi.use_replica_reads(True)
+        self.assertTrue(sqla_api._use_slave())
+
+    @mock.patch.object(sqla_api, 'get_session', wraps=sqla_api.get_session)
+    def test_create_nodes_checks_primary(self, mock_get_session):
+        self.dbapi.use_replica_reads(True)
+        self.dbapi.create_nodes([utils.get_test_node(id=2, uuid=None)])
+        self.assertEqual([mock.call(), mock.call()],
+                         mock_get_session.call_args_list)
+
+    def test_slave_lagging(self):
+        self.assertFalse(sqla_api._slave_lagging())
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_slave_lagging_old_heartbeat(self, mock_utcnow):
+        mock_utcnow.return_value = (datetime.datetime.utcnow() +
+                                    datetime.timedelta(minutes=10))
+        self.assertTrue(sqla_api._slave_lagging())
+
+    def test_slave_lagging_no_heartbeat(self):
+        self.dbapi.unregister_conductor(utils.get_test_conductor()['hostname'])
+        self.assertTrue(sqla_api._slave_lagging())
+
+    def test_slave_lagging_unreachable(self):
+        with mock.patch.object(sqla_api, 'get_session',
+                               side_effect=Exception('boom')):
+            self.assertTrue(sqla_api._slave_lagging())
+
+    @mock.patch.object(sqla_api, 'time')
+    def test_slave_lagging_cached(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.assertFalse(sqla_api._slave_lagging())
+        with mock.patch.object(sqla_api, 'get_session') as mock_get_session:
+            mock_time.time.return_value = 1004
+            self.assertFalse(sqla_api._slave_lagging())
+            self.assertFalse(mock_get_session.called)
+
+            mock_time.time.return_value = 1005
+            mock_get_session.side_effect = Exception('boom')
+            self.assertTrue(sqla_api._slave_lagging())
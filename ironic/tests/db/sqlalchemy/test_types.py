@@ -12,7 +12,12 @@
 
 """Tests for custom SQLAlchemy types via Ironic DB."""
 
+import json
+
+import mock
+
 from ironic.openstack.common.db import exception as db_exc
+from ironic.openstack.common import importutils
 
 from ironic.common import utils as ironic_utils
 from ironic.db import api as dbapi
@@ -47,6 +52,46 @@ class SqlAlchemyCustomTypesTestCase(base.DbTestCase):
         ch2 = sa_api.model_query(models.Chassis).filter_by(uuid=ch2_id).one()
         self.assertEqual(extra, ch2.extra)
 
+    def test_LazyJSONEncodedDict_not_decoded(self):
+        ch_id = ironic_utils.generate_uuid()
+        self.dbapi.create_chassis({'uuid': ch_id, 'extra': {'foo': 'bar'}})
+        with mock.patch.object(json, 'loads',
+                               wraps=json.loads) as mock_loads:
+            query = sa_api.model_query(models.Chassis)
+            ch = query.filter_by(uuid=ch_id).one()
+            self.assertIsInstance(ch.extra, ironic_utils.LazyJSON)
+            self.assertFalse(mock_loads.called)
+        self.assertEqual({'foo': 'bar'}, ch.extra)
+
+    def test_LazyJSONEncodedDict_bind_undecoded(self):
+        value = ironic_utils.LazyJSON('{"foo": "bar"}')
+        json_type = models.LazyJSONEncodedDict()
+        self.assertEqual('{"foo": "bar"}',
+                         json_type.process_bind_param(value, None))
+
+    def test_LazyJSONEncodedDict_bind_changed(self):
+        value = ironic_utils.LazyJSON('{"foo": "bar"}')
+        value['foo'] = 'baz'
+        json_type = models.LazyJSONEncodedDict()
+        self.assertEqual({'foo': 'baz'},
+                         json.loads(json_type.process_bind_param(value,
+                                                                 None)))
+
+    @mock.patch.dict(models._JSON_CODECS, clear=True)
+    @mock.patch.object(importutils, 'try_import')
+    def test_json_codec(self, mock_import):
+        self.config(json_codec='fastjson', group='database')
+        self.assertEqual(mock_import.return_value, models.json_codec())
+        self.assertEqual(mock_import.return_value, models.json_codec())
+        mock_import.assert_called_once_with('fastjson')
+
+    @mock.patch.dict(models._JSON_CODECS, clear=True)
+    @mock.patch.object(importutils, 'try_import')
+    def test_json_codec_not_installed(self, mock_import):
+        mock_import.return_value = None
+        self.config(json_codec='fastjson', group='database')
+        self.assertEqual(json, models.json_codec())
+
     def test_JSONEncodedDict_type_check(self):
         self.assertRaises(db_exc.DBError,
                           self.dbapi.create_chassis,
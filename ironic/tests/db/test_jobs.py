@@ -0,0 +1,77 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for manipulating Jobs via the DB API"""
+
+from ironic.common import exception
+from ironic.common import states
+from ironic.db import api as dbapi
+from ironic.tests.db import base
+from ironic.tests.db import utils
+
+
+class DbJobTestCase(base.DbTestCase):
+
+    def setUp(self):
+        super(DbJobTestCase, self).setUp()
+        self.dbapi = dbapi.get_instance()
+
+    def _create_test_job(self, **kwargs):
+        job = utils.get_test_job(**kwargs)
+        del job['id']
+        del job['state']
+        return self.dbapi.create_job(job)
+
+    def test_create_job(self):
+        job = self._create_test_job(total=3)
+        self.assertEqual(states.JOB_RUNNING, job.state)
+        self.assertEqual(0, job.succeeded)
+        self.assertEqual({'driver': 'fake'}, job.filters)
+
+    def test_create_job_without_nodes(self):
+        job = self._create_test_job(total=0)
+        self.assertEqual(states.JOB_DONE, job.state)
+
+    def test_get_job(self):
+        job = self._create_test_job()
+        self.assertEqual(job.id, self.dbapi.get_job(job.uuid).id)
+        self.assertEqual(job.uuid, self.dbapi.get_job(job.id).uuid)
+
+    def test_get_job_not_found(self):
+        self.assertRaises(exception.JobNotFound,
+                          self.dbapi.get_job,
+                          '12345678-9999-0000-aaaa-123456789012')
+
+    def test_update_job_progress(self):
+        job = self._create_test_job(total=3)
+        job = self.dbapi.update_job_progress(job.uuid, succeeded=2)
+        self.assertEqual(states.JOB_RUNNING, job.state)
+        self.assertEqual(2, job.succeeded)
+        job = self.dbapi.update_job_progress(job.uuid, succeeded=1)
+        self.assertEqual(states.JOB_DONE, job.state)
+        self.assertEqual(3, job.succeeded)
+        self.assertIsNone(job.last_error)
+
+    def test_update_job_progress_failed(self):
+        job = self._create_test_job(total=3)
+        self.dbapi.update_job_progress(job.uuid, succeeded=1, failed=1,
+                                       last_error='boom')
+        job = self.dbapi.update_job_progress(job.uuid, succeeded=1)
+        self.assertEqual(states.JOB_FAILED, job.state)
+        self.assertEqual(2, job.succeeded)
+        self.assertEqual(1, job.failed)
+        self.assertEqual('boom', job.last_error)
+
+    def test_update_job_progress_not_found(self):
+        self.assertRaises(exception.JobNotFound,
+                          self.dbapi.update_job_progress,
+                          '12345678-9999-0000-aaaa-123456789012', failed=1)
@@ -0,0 +1,183 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for recording and reading node events via the DB API"""
+
+import datetime
+
+import mock
+
+from ironic.common import states
+from ironic.common import utils as ironic_utils
+from ironic.db import api as dbapi
+from ironic.db.sqlalchemy import api as sa_api
+from ironic.db.sqlalchemy import models
+from ironic.openstack.common import timeutils
+from ironic.tests.db import base
+from ironic.tests.db import utils
+
+
+class DbNodeEventTestCase(base.DbTestCase):
+
+    def setUp(self):
+        super(DbNodeEventTestCase, self).setUp()
+        self.dbapi = dbapi.get_instance()
+        self.node = self.dbapi.create_node(utils.get_test_node())
+
+    def test_update_node_records_event(self):
+        self.dbapi.update_node(self.node.id,
+                               {'power_state': states.POWER_OFF,
+                                'last_error': 'boom'})
+        events = self.dbapi.get_node_events(0)
+        self.assertEqual(1, len(events))
+        self.assertEqual(self.node.uuid, events[0].node_uuid)
+        self.assertEqual(states.POWER_OFF, events[0].power_state)
+        self.assertEqual(self.node.provision_state,
+                         events[0].provision_state)
+        self.assertEqual('boom', events[0].last_error)
+        self.assertEqual(events[0].id, self.dbapi.get_last_node_event_id())
+
+    def test_update_node_unchanged_state_records_no_event(self):
+        self.dbapi.update_node(self.node.id,
+                               {'power_state': self.node.power_state,
+                                'extra': {'foo': 'bar'}})
+        self.assertEqual([], self.dbapi.get_node_events(0))
+        self.assertEqual(0, self.dbapi.get_last_node_event_id())
+
+    def test_get_node_events(self):
+        other = self.dbapi.create_node(
+                utils.get_test_node(id=2, uuid=ironic_utils.generate_uuid()))
+        self.dbapi.update_node(self.node.id,
+                               {'provision_state': states.DEPLOYING})
+        self.dbapi.update_node(other.id, {'power_state': states.POWER_OFF})
+        self.dbapi.update_node(self.node.id,
+                               {'provision_state': states.ACTIVE})
+        first, second, third = self.dbapi.get_node_events(0)
+        self.assertTrue(first.id < second.id < third.id)
+
+        self.assertEqual([second.id, third.id],
+                         [e.id for e in self.dbapi.get_node_events(first.id)])
+        self.assertEqual([first.id, third.id],
+                         [e.id for e in self.dbapi.get_node_events(
+                             0, node_uuids=[self.node.uuid])])
+        self.assertEqual([first.id],
+                         [e.id for e in self.dbapi.get_node_events(0,
+                                                                   limit=1)])
+
+    def test_get_node_events_until(self):
+        for state in (states.DEPLOYING, states.ACTIVE):
+            self.dbapi.update_node(self.node.id, {'provision_state': state})
+        first, second = self.dbapi.get_node_events(0)
+        self.assertEqual([first.id],
+                         [e.id for e in self.dbapi.get_node_events(
+                             0, until=first.id)])
+
+    def _record_events(self, mock_utcnow, times):
+        ids = []
+        for offset in times:
+            mock_utcnow.return_value = (self.past +
+                                        datetime.timedelta(seconds=offset))
+            self.dbapi.update_node(self.node.id,
+                                   {'power_state': str(offset)})
+            ids.append(self.dbapi.get_last_node_event_id())
+        return ids
+
+    def _forget_event(self, event_id):
+        # NOTE: an event whose transaction is not committed yet.
+        session = sa_api.get_session()
+        with session.begin():
+            query = sa_api.model_query(models.NodeEvent, session=session)
+            query.filter_by(id=event_id).delete()
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_get_last_node_event_id_commit_window(self, mock_utcnow):
+        self.past = datetime.datetime(2000, 1, 1, 0, 0)
+        ids = self._record_events(mock_utcnow, [0, 1, 2])
+        mock_utcnow.return_value = self.past + datetime.timedelta(seconds=3)
+        self.assertEqual(ids[2], self.dbapi.get_last_node_event_id(10))
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_get_last_node_event_id_uncommitted(self, mock_utcnow):
+        self.past = datetime.datetime(2000, 1, 1, 0, 0)
+        ids = self._record_events(mock_utcnow, [0, 20, 21, 22])
+        self._forget_event(ids[2])
+        mock_utcnow.return_value = self.past + datetime.timedelta(seconds=25)
+        # The missing event may still be committed
+        self.assertEqual(ids[1], self.dbapi.get_last_node_event_id(10))
+        self.assertEqual(ids[3], self.dbapi.get_last_node_event_id())
+        # Until it is older than the commit window
+        mock_utcnow.return_value = self.past + datetime.timedelta(seconds=35)
+        self.assertEqual(ids[3], self.dbapi.get_last_node_event_id(10))
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_get_last_node_event_id_uncommitted_only_recent(self,
+                                                            mock_utcnow):
+        self.past = datetime.datetime(2000, 1, 1, 0, 0)
+        ids = self._record_events(mock_utcnow, [0, 1, 2])
+        self._forget_event(ids[1])
+        self.assertEqual(ids[0], self.dbapi.get_last_node_event_id(10))
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_get_last_node_event_id_id_increment(self, mock_utcnow):
+        self.past = datetime.datetime(2000, 1, 1, 0, 0)
+        ids = self._record_events(mock_utcnow, [0, 20, 21, 22])
+        self._forget_event(ids[2])
+        mock_utcnow.return_value = self.past + datetime.timedelta(seconds=25)
+        # No id is missing if they are allocated two by two
+        self.assertEqual(ids[3], self.dbapi.get_last_node_event_id(
+                10, id_increment=2))
+        # Only the events older than the commit window are settled
+        self.assertEqual(ids[0], self.dbapi.get_last_node_event_id(
+                10, id_increment=0))
+
+    def test_get_last_node_event_id_commit_window_no_event(self):
+        self.assertEqual(0, self.dbapi.get_last_node_event_id(10))
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_get_last_node_event_id_commit_window_pruned(self, mock_utcnow):
+        self.past = datetime.datetime(2000, 1, 1, 0, 0)
+        ids = self._record_events(mock_utcnow, [0, 20, 21])
+        self.dbapi.destroy_node_events(
+                self.past + datetime.timedelta(seconds=10))
+        self._forget_event(ids[1])
+        mock_utcnow.return_value = self.past + datetime.timedelta(seconds=25)
+        self.assertEqual(ids[0], self.dbapi.get_last_node_event_id(10))
+
+    def test_get_pruned_node_event_id_no_event(self):
+        self.assertEqual(0, self.dbapi.get_pruned_node_event_id())
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_destroy_node_events(self, mock_utcnow):
+        past = datetime.datetime(2000, 1, 1, 0, 0)
+        mock_utcnow.return_value = past
+        self.dbapi.update_node(self.node.id,
+                               {'provision_state': states.DEPLOYING})
+        mock_utcnow.return_value = past + datetime.timedelta(minutes=10)
+        self.dbapi.update_node(self.node.id,
+                               {'provision_state': states.ACTIVE})
+
+        count = self.dbapi.destroy_node_events(
+                past + datetime.timedelta(minutes=5))
+        self.assertEqual(1, count)
+        events = self.dbapi.get_node_events(0)
+        self.assertEqual(1, len(events))
+        self.assertEqual(states.ACTIVE, events[0].provision_state)
+        self.assertEqual(events[0].id - 1,
+                         self.dbapi.get_pruned_node_event_id())
+
+        # The id of the last deleted event is kept with no event left
+        self.assertEqual(1, self.dbapi.destroy_node_events(
+                past + datetime.timedelta(minutes=15)))
+        self.assertEqual(events[0].id, self.dbapi.get_pruned_node_event_id())
+        self.assertEqual(0, self.dbapi.destroy_node_events(
+                past + datetime.timedelta(minutes=15)))
+        self.assertEqual(events[0].id, self.dbapi.get_pruned_node_event_id())
@@ -24,6 +24,7 @@ from ironic.common import exception
 from ironic.common import states
 from ironic.common import utils as ironic_utils
 from ironic.db import api as dbapi
+from ironic.db.sqlalchemy import api as sa_api
 from ironic.openstack.common import timeutils
 from ironic.tests.db import base
 from ironic.tests.db import utils
@@ -78,6 +79,68 @@ class DbNodeTestCase(base.DbTestCase):
         del n['chassis_id']
         self.dbapi.create_node(n)
 
+    def _get_bulk_node(self, addresses=[], **kwargs):
+        n = utils.get_test_node(uuid=ironic_utils.generate_uuid(), **kwargs)
+        del n['id']
+        n['ports'] = [{'address': a, 'extra': {}} for a in addresses]
+        return n
+
+    def test_create_nodes(self):
+        nodes = [self._get_bulk_node(['52:54:00:cf:2d:31']),
+                 self._get_bulk_node(['52:54:00:cf:2d:32',
+                                      '52:54:00:cf:2d:33'])]
+        res = self.dbapi.create_nodes(nodes, batch_size=1)
+        self.assertEqual([None, None], res)
+        node = self.dbapi.get_node_by_uuid(nodes[1]['uuid'])
+        self.assertEqual(states.NOSTATE, node.power_state)
+        ports = self.dbapi.get_ports_by_node_id(node.id)
+        self.assertEqual(['52:54:00:cf:2d:32', '52:54:00:cf:2d:33'],
+                         sorted(p.address for p in ports))
+        self.assertEqual(nodes[1]['ports'][0]['uuid'],
+                         self.dbapi.get_port('52:54:00:cf:2d:32').uuid)
+
+    def test_create_nodes_conflicts(self):
+        existing = self._create_test_node()
+        self.dbapi.create_port(utils.get_test_port(
+                                   address='52:54:00:cf:2d:31'))
+        nodes = [self._get_bulk_node(['52:54:00:cf:2d:31']),
+                 self._get_bulk_node(['52:54:00:cf:2d:32']),
+                 self._get_bulk_node(['52:54:00:cf:2d:32']),
+                 self._get_bulk_node(),
+                 self._get_bulk_node(['52:54:00:cf:2d:33'])]
+        nodes[3]['uuid'] = existing['uuid']
+        res = self.dbapi.create_nodes(nodes)
+
+        self.assertIsInstance(res[0], exception.MACAlreadyExists)
+        self.assertIsNone(res[1])
+        self.assertIsInstance(res[2], exception.MACAlreadyExists)
+        self.assertIsInstance(res[3], exception.NodeAlreadyExists)
+        self.assertIsNone(res[4])
+        self.assertRaises(exception.NodeNotFound,
+                          self.dbapi.get_node_by_uuid, nodes[0]['uuid'])
+        self.dbapi.get_node_by_uuid(nodes[1]['uuid'])
+        self.assertRaises(exception.NodeNotFound,
+                          self.dbapi.get_node_by_uuid, nodes[2]['uuid'])
+        self.dbapi.get_node_by_uuid(nodes[4]['uuid'])
+
+    def test_create_nodes_concurrent_conflict(self):
+        nodes = [self._get_bulk_node(['52:54:00:cf:2d:31']),
+                 self._get_bulk_node(['52:54:00:cf:2d:32'])]
+        self.dbapi.create_port(utils.get_test_port(
+                                   address='52:54:00:cf:2d:31'))
+        # simulate the port being created after the check
+        with mock.patch.object(self.dbapi, '_check_new_nodes') as check_mock:
+            check_mock.side_effect = [
+                [None, None],
+                [exception.MACAlreadyExists(mac='52:54:00:cf:2d:31')]]
+            res = self.dbapi.create_nodes(nodes)
+
+        self.assertIsInstance(res[0], exception.MACAlreadyExists)
+        self.assertIsNone(res[1])
+        self.assertRaises(exception.NodeNotFound,
+                          self.dbapi.get_node_by_uuid, nodes[0]['uuid'])
+        self.dbapi.get_node_by_uuid(nodes[1]['uuid'])
+
     def test_get_node_by_id(self):
         n = self._create_test_node()
         res = self.dbapi.get_node_by_id(n['id'])
@@ -191,6 +254,46 @@ class DbNodeTestCase(base.DbTestCase):
         res_uuids = [r.uuid for r in res]
         self.assertEqual(uuids.sort(), res_uuids.sort())
 
+    def test_get_node_stats(self):
+        ch = utils.get_test_chassis(id=1, uuid=ironic_utils.generate_uuid())
+        self.dbapi.create_chassis(ch)
+        self.dbapi.create_node(utils.get_test_node(
+                id=1, uuid=ironic_utils.generate_uuid(), chassis_id=1,
+                driver='driver-one', power_state=states.POWER_ON,
+                provision_state=states.ACTIVE))
+        self.dbapi.create_node(utils.get_test_node(
+                id=2, uuid=ironic_utils.generate_uuid(), chassis_id=1,
+                driver='driver-one', power_state=states.POWER_OFF,
+                provision_state=states.ACTIVE, maintenance=True))
+        self.dbapi.create_node(utils.get_test_node(
+                id=3, uuid=ironic_utils.generate_uuid(), chassis_id=None,
+                driver='driver-two', power_state=states.POWER_OFF,
+                provision_state=states.NOSTATE))
+
+        stats = self.dbapi.get_node_stats()
+        self.assertEqual({states.ACTIVE: 2, states.NOSTATE: 1},
+                         stats['provision_state'])
+        self.assertEqual({states.POWER_ON: 1, states.POWER_OFF: 2},
+                         stats['power_state'])
+        self.assertEqual({'driver-one': 2, 'driver-two': 1},
+                         stats['driver'])
+        self.assertEqual({True: 1, False: 2}, stats['maintenance'])
+        self.assertEqual({ch['uuid']: 2, None: 1}, stats['chassis_uuid'])
+        self.assertEqual(3, stats['total'])
+
+    @mock.patch.object(sa_api, 'get_session', wraps=sa_api.get_session)
+    def test_get_node_stats_single_query(self, mock_get_session):
+        self.dbapi.create_node(utils.get_test_node())
+        mock_get_session.reset_mock()
+        stats = self.dbapi.get_node_stats()
+        self.assertEqual(1, stats['total'])
+        mock_get_session.assert_called_once_with(use_slave=False)
+
+    def test_get_node_stats_no_nodes(self):
+        stats = self.dbapi.get_node_stats()
+        self.assertEqual({}, stats['driver'])
+        self.assertEqual(0, stats['total'])
+
     def test_get_node_list_with_filters(self):
         ch1 = utils.get_test_chassis(id=1, uuid=ironic_utils.generate_uuid())
         ch2 = utils.get_test_chassis(id=2, uuid=ironic_utils.generate_uuid())
@@ -201,11 +304,13 @@ class DbNodeTestCase(base.DbTestCase):
                                  instance_uuid=ironic_utils.generate_uuid(),
                                  reservation='fake-host',
                                  uuid=ironic_utils.generate_uuid(),
-                                 chassis_id=ch1['id'])
+                                 chassis_id=ch1['id'],
+                                 power_state=states.POWER_ON)
         n2 = utils.get_test_node(id=2, driver='driver-two',
                                  uuid=ironic_utils.generate_uuid(),
                                  chassis_id=ch2['id'],
-                                 maintenance=True)
+                                 maintenance=True,
+                                 power_state=states.POWER_OFF)
         self.dbapi.create_node(n1)
         self.dbapi.create_node(n2)
 
@@ -221,6 +326,10 @@ class DbNodeTestCase(base.DbTestCase):
         res = self.dbapi.get_node_list(filters={'driver': 'bad-driver'})
         self.assertEqual([], [r.id for r in res])
 
+        res = self.dbapi.get_node_list(
+                filters={'power_state': states.POWER_ON})
+        self.assertEqual([1], [r.id for r in res])
+
         res = self.dbapi.get_node_list(filters={'associated': True})
         self.assertEqual([1], [r.id for r in res])
 
@@ -239,6 +348,28 @@ class DbNodeTestCase(base.DbTestCase):
         res = self.dbapi.get_node_list(filters={'maintenance': False})
         self.assertEqual([1], [r.id for r in res])
 
+    def test_get_node_list_with_scheduling_filters(self):
+        for i, (memory_mb, cpu_arch) in enumerate([(1024, 'x86_64'),
+                                                   (4096, 'x86_64'),
+                                                   (8192, 'i686')]):
+            self.dbapi.create_node(utils.get_test_node(
+                    id=i + 1, uuid=ironic_utils.generate_uuid(),
+                    properties={'memory_mb': memory_mb, 'cpu_arch': cpu_arch,
+                                'cpus': '%d' % (i + 1), 'local_gb': 10}))
+
+        res = self.dbapi.get_node_list(filters={'min_memory_mb': 4096})
+        self.assertEqual([2, 3], sorted(r.id for r in res))
+
+        res = self.dbapi.get_node_list(filters={'min_memory_mb': 4096,
+                                                'cpu_arch': 'x86_64'})
+        self.assertEqual([2], [r.id for r in res])
+
+        res = self.dbapi.get_node_list(filters={'min_cpus': 2})
+        self.assertEqual([2, 3], sorted(r.id for r in res))
+
+        res = self.dbapi.get_node_list(filters={'min_local_gb': 11})
+        self.assertEqual([], [r.id for r in res])
+
     def test_get_node_list_chassis_not_found(self):
         self.assertRaises(exception.ChassisNotFound,
                           self.dbapi.get_node_list,
@@ -315,6 +446,60 @@ class DbNodeTestCase(base.DbTestCase):
         res = self.dbapi.update_node(n['id'], {'extra': new_extra})
         self.assertEqual(new_extra, res.extra)
 
+    def test_update_node_bumps_version(self):
+        n = self._create_test_node()
+        res = self.dbapi.update_node(n['id'], {'extra': {'foo': 'bar'}})
+        self.assertEqual(n['version'] + 1, res.version)
+
+    def test_update_node_expected_version(self):
+        n = self._create_test_node()
+        res = self.dbapi.update_node(n['uuid'], {'extra': {'foo': 'bar'}},
+                                     expected_version=n['version'])
+        self.assertEqual({'foo': 'bar'}, res.extra)
+        self.assertEqual(n['version'] + 1, res.version)
+
+    def test_update_node_version_conflict(self):
+        n = self._create_test_node()
+        self.dbapi.update_node(n['id'], {'extra': {'foo': 'bar'}})
+        self.assertRaises(exception.NodeVersionConflict,
+                          self.dbapi.update_node,
+                          n['id'], {'extra': {'foo': 'baz'}},
+                          expected_version=n['version'])
+        res = self.dbapi.get_node_by_id(n['id'])
+        self.assertEqual({'foo': 'bar'}, res.extra)
+
+    def test_update_node_expected_version_not_found(self):
+        self.assertRaises(exception.NodeNotFound,
+                          self.dbapi.update_node,
+                          ironic_utils.generate_uuid(), {'extra': {}},
+                          expected_version=0)
+
+    def test_update_node_expected_version_already_associated(self):
+        n = self._create_test_node(instance_uuid=ironic_utils.generate_uuid())
+        self.assertRaises(exception.NodeAssociated,
+                          self.dbapi.update_node,
+                          n['id'],
+                          {'instance_uuid': ironic_utils.generate_uuid()},
+                          expected_version=n['version'])
+
+    def test_update_node_scheduling_columns(self):
+        n = self._create_test_node(properties={'memory_mb': '512'})
+        self.assertEqual([n['id']], [r.id for r in self.dbapi.get_node_list(
+                filters={'min_memory_mb': 512})])
+
+        self.dbapi.update_node(n['id'], {'properties': {'cpu_arch': 'arm'}})
+        self.assertEqual([], [r.id for r in self.dbapi.get_node_list(
+                filters={'min_memory_mb': 512})])
+        self.assertEqual([n['id']], [r.id for r in self.dbapi.get_node_list(
+                filters={'cpu_arch': 'arm'})])
+
+        self.dbapi.update_node(n['id'], {'properties': {'memory_mb': 'big'}},
+                               expected_version=1)
+        self.assertEqual([], [r.id for r in self.dbapi.get_node_list(
+                filters={'cpu_arch': 'arm'})])
+        self.assertEqual([], [r.id for r in self.dbapi.get_node_list(
+                filters={'min_memory_mb': 0})])
+
     def test_update_node_not_found(self):
         node_uuid = ironic_utils.generate_uuid()
         new_extra = {'foo': 'bar'}
@@ -70,6 +70,28 @@ class DbPortTestCase(base.DbTestCase):
         self.assertRaises(exception.InvalidIdentity,
                           self.dbapi.get_port, 'not-a-mac')
 
+    def test_get_port_by_vif(self):
+        p = db_utils.get_test_port(extra={'vif_port_id': 'fake-vif'})
+        self.dbapi.create_port(p)
+        res = self.dbapi.get_port_by_vif('fake-vif')
+        self.assertEqual(p['uuid'], res.uuid)
+        self.assertRaises(exception.PortNotFound,
+                          self.dbapi.get_port_by_vif, 'other-vif')
+
+    def test_get_port_by_vif_after_update(self):
+        self.dbapi.create_port(self.p)
+        self.assertRaises(exception.PortNotFound,
+                          self.dbapi.get_port_by_vif, 'fake-vif')
+
+        self.dbapi.update_port(self.p['id'],
+                               {'extra': {'vif_port_id': 'fake-vif'}})
+        res = self.dbapi.get_port_by_vif('fake-vif')
+        self.assertEqual(self.p['uuid'], res.uuid)
+
+        self.dbapi.update_port(self.p['id'], {'extra': {}})
+        self.assertRaises(exception.PortNotFound,
+                          self.dbapi.get_port_by_vif, 'fake-vif')
+
     def test_get_ports_by_node_id(self):
         p = db_utils.get_test_port(node_id=self.n.id)
         self.dbapi.create_port(p)
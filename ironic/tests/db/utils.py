@@ -93,6 +93,7 @@ def get_test_node(**kw):
         'maintenance': kw.get('maintenance', False),
         'console_enabled': kw.get('console_enabled', False),
         'extra': kw.get('extra', {}),
+        'version': kw.get('version', 0),
         'updated_at': kw.get('created_at'),
         'created_at': kw.get('updated_at'),
     }
@@ -129,3 +130,20 @@ def get_test_conductor(**kw):
         'created_at': kw.get('created_at'),
         'updated_at': kw.get('updated_at'),
     }
+
+
+def get_test_job(**kw):
+    return {
+        'id': kw.get('id', 7),
+        'uuid': kw.get('uuid', '0c3e3a0c-6c4f-4a5e-a9e8-22eb1e5b3f0d'),
+        'action': kw.get('action', 'power'),
+        'target': kw.get('target', 'power off'),
+        'filters': kw.get('filters', {'driver': 'fake'}),
+        'state': kw.get('state', 'running'),
+        'total': kw.get('total', 1),
+        'succeeded': kw.get('succeeded', 0),
+        'failed': kw.get('failed', 0),
+        'last_error': kw.get('last_error'),
+        'created_at': kw.get('created_at'),
+        'updated_at': kw.get('updated_at'),
+    }
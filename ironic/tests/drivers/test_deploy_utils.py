@@ -14,6 +14,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import errno
 import time
 
 import fixtures
@@ -25,6 +26,7 @@ from ironic.common import disk_partitioner
 from ironic.common import exception
 from ironic.common import utils as common_utils
 from ironic.drivers.modules import deploy_utils as utils
+from ironic.openstack.common import processutils
 from ironic.tests import base as tests_base
 
 
@@ -389,6 +391,130 @@ class OtherFunctionTestCase(tests_base.TestCase):
         self.assertEqual(2, utils.get_image_mb('x'))
 
 
+class GetDataExtentsTestCase(tests_base.TestCase):
+
+    MB = 1024 * 1024
+
+    def _get_data_extents(self, data, size, block_size=MB):
+        """Map a file of size bytes, whose data is at the data ranges."""
+        def fake_lseek(fd, offset, whence):
+            for start, end in data:
+                if whence == utils._SEEK_DATA and offset < end:
+                    return max(start, offset)
+                if whence == utils._SEEK_HOLE and offset < end:
+                    return end
+            if whence == utils._SEEK_HOLE:
+                return size
+            raise OSError(errno.ENXIO, 'No such device or address')
+
+        with tempfile.NamedTemporaryFile() as f:
+            f.truncate(size)
+            f.flush()
+            with mock.patch.object(os, 'lseek', side_effect=fake_lseek):
+                return utils.get_data_extents(f.name, block_size)
+
+    def test_aligned(self):
+        extents = self._get_data_extents(
+                [(100, 200), (200 * self.MB + 10, 201 * self.MB + 10)],
+                300 * self.MB)
+        self.assertEqual([(0, self.MB), (200 * self.MB, 202 * self.MB)],
+                         extents)
+
+    def test_small_holes_copied(self):
+        extents = self._get_data_extents(
+                [(0, self.MB), (10 * self.MB, 11 * self.MB)], 300 * self.MB)
+        self.assertEqual([(0, 11 * self.MB)], extents)
+
+    def test_end_of_file(self):
+        extents = self._get_data_extents([(0, 100)], 100)
+        self.assertEqual([(0, 100)], extents)
+
+    def test_empty(self):
+        self.assertEqual([], self._get_data_extents([], 300 * self.MB))
+
+    def test_not_supported(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.truncate(1000)
+            f.flush()
+            with mock.patch.object(os, 'lseek',
+                                   side_effect=OSError(errno.EINVAL, '')):
+                self.assertEqual([(0, 1000)],
+                                 utils.get_data_extents(f.name, self.MB))
+
+
+@mock.patch.object(common_utils, 'execute')
+class DdTestCase(tests_base.TestCase):
+
+    def test_dd(self, mock_exec):
+        utils.dd('src', 'dst')
+        mock_exec.assert_called_once_with('dd', 'if=src', 'of=dst',
+                                          'bs=1048576', 'oflag=direct',
+                                          run_as_root=True,
+                                          check_exit_code=[0])
+
+    def test_dd_block_size_aligned(self, mock_exec):
+        self.config(dd_block_size=130, group='deploy')
+        utils.dd('src', 'dst')
+        self.assertIn('bs=131072', mock_exec.call_args[0])
+
+    @mock.patch.object(utils, 'get_data_extents')
+    def test_dd_sparse(self, mock_extents, mock_exec):
+        self.config(sparse_image_writes=True, group='deploy')
+        mb = 1024 * 1024
+        mock_extents.return_value = [(0, 2 * mb), (100 * mb, 101 * mb + 10)]
+        utils.dd('src', 'dst')
+        mock_extents.assert_called_once_with('src', mb)
+        args = ('dd', 'if=src', 'of=dst', 'bs=1048576', 'oflag=direct')
+        self.assertEqual(
+            [mock.call('blkdiscard', '-z', 'dst', run_as_root=True,
+                       check_exit_code=[0]),
+             mock.call(*(args + ('skip=0', 'seek=0', 'count=2',
+                                 'conv=sparse,notrunc')),
+                       run_as_root=True, check_exit_code=[0]),
+             mock.call(*(args + ('skip=100', 'seek=100', 'count=2',
+                                 'conv=sparse,notrunc')),
+                       run_as_root=True, check_exit_code=[0])],
+            mock_exec.call_args_list)
+
+    @mock.patch.object(utils, 'get_data_extents')
+    def test_dd_sparse_zero_not_supported(self, mock_extents, mock_exec):
+        self.config(sparse_image_writes=True, group='deploy')
+        mock_exec.side_effect = [processutils.ProcessExecutionError(),
+                                 ('', '')]
+        utils.dd('src', 'dst')
+        self.assertFalse(mock_extents.called)
+        self.assertEqual(mock.call('dd', 'if=src', 'of=dst', 'bs=1048576',
+                                   'oflag=direct', run_as_root=True,
+                                   check_exit_code=[0]),
+                         mock_exec.call_args)
+
+    @mock.patch.object(utils, 'get_data_extents')
+    def test_dd_sparse_discard(self, mock_extents, mock_exec):
+        self.config(sparse_image_writes=True, group='deploy')
+        self.config(discard_before_write=True, group='deploy')
+        mock_extents.return_value = []
+        utils.dd('src', 'dst')
+        self.assertEqual([mock.call('blkdiscard', 'dst', run_as_root=True,
+                                    check_exit_code=[0]),
+                          mock.call('blkdiscard', '-z', 'dst',
+                                    run_as_root=True, check_exit_code=[0])],
+                         mock_exec.call_args_list)
+
+    def test_dd_discard(self, mock_exec):
+        self.config(discard_before_write=True, group='deploy')
+        utils.dd('src', 'dst')
+        self.assertEqual(mock.call('blkdiscard', 'dst', run_as_root=True,
+                                   check_exit_code=[0]),
+                         mock_exec.call_args_list[0])
+        self.assertEqual('dd', mock_exec.call_args_list[1][0][0])
+
+    def test_dd_discard_not_supported(self, mock_exec):
+        self.config(discard_before_write=True, group='deploy')
+        mock_exec.side_effect = [processutils.ProcessExecutionError(),
+                                 ('', '')]
+        utils.dd('src', 'dst')
+        self.assertEqual(2, mock_exec.call_count)
+
 @mock.patch.object(disk_partitioner.DiskPartitioner, 'commit', lambda _: None)
 class WorkOnDiskTestCase(tests_base.TestCase):
 
@@ -21,8 +21,10 @@ import os
 import tempfile
 import time
 
+from ironic.common import exception
 from ironic.common import images
 from ironic.drivers.modules import image_cache
+from ironic.openstack.common import lockutils
 from ironic.tests import base
 
 
@@ -41,6 +43,10 @@ class TestImageCacheFetch(base.TestCase):
         self.dest_path = os.path.join(self.dest_dir, 'dest')
         self.uuid = 'uuid'
         self.master_path = os.path.join(self.master_dir, self.uuid)
+        self.checksum = 'f' * 32
+        self.owner = 'owner'
+        self.content_name = 'md5-owner-' + self.checksum
+        self.content_path = os.path.join(self.master_dir, self.content_name)
 
     @mock.patch.object(image_cache.ImageCache, 'clean_up')
     @mock.patch.object(image_cache.ImageCache, '_download_image')
@@ -76,18 +82,165 @@ class TestImageCacheFetch(base.TestCase):
                          os.stat(self.master_path).st_ino)
         self.assertFalse(mock_clean_up.called)
 
+    @mock.patch.object(lockutils, 'lock', wraps=lockutils.lock)
+    @mock.patch.object(image_cache.ImageCache, 'clean_up')
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_master_exists_no_global_lock(
+            self, mock_download, mock_clean_up, mock_lock, mock_fetch_to_raw):
+        touch(self.master_path)
+        self.cache.fetch_image(self.uuid, self.dest_path)
+        mock_lock.assert_called_once_with('download-image:uuid', 'ironic-')
+        self.assertIn(self.uuid, self.cache._get_index().entries)
+
+    @mock.patch.object(image_cache.ImageCache, '_get_content',
+                       return_value=(None, None))
     @mock.patch.object(image_cache.ImageCache, 'clean_up')
     @mock.patch.object(image_cache.ImageCache, '_download_image')
     def test_fetch_image(self, mock_download, mock_clean_up,
-                         mock_fetch_to_raw):
+                         mock_content, mock_fetch_to_raw):
         self.cache.fetch_image(self.uuid, self.dest_path)
         self.assertFalse(mock_fetch_to_raw.called)
         mock_download.assert_called_once_with(
             self.uuid, self.master_path, self.dest_path, ctx=None)
         self.assertTrue(mock_clean_up.called)
 
+    @mock.patch.object(image_cache.ImageCache, '_get_content')
+    @mock.patch.object(image_cache.ImageCache, 'clean_up')
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_by_checksum(self, mock_download, mock_clean_up,
+                                     mock_content, mock_fetch_to_raw):
+        mock_content.return_value = (self.checksum, self.content_name)
+        self.cache.fetch_image(self.uuid, self.dest_path)
+        mock_download.assert_called_once_with(
+            self.uuid, self.content_path, self.dest_path, ctx=None,
+            checksum=self.checksum)
+        self.assertEqual(self.content_name, os.readlink(self.master_path))
+        self.assertEqual({self.uuid: self.content_name},
+                         self.cache._get_index().aliases)
+        self.assertTrue(mock_clean_up.called)
+
+    @mock.patch.object(image_cache.ImageCache, '_get_content')
+    @mock.patch.object(image_cache.ImageCache, 'clean_up')
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_checksum_mismatch(self, mock_download,
+                                           mock_clean_up, mock_content,
+                                           mock_fetch_to_raw):
+        mock_content.return_value = (self.checksum, self.content_name)
+        mock_download.side_effect = [
+            exception.ImageChecksumMismatch(image_id=self.uuid,
+                                            actual='0' * 32,
+                                            expected=self.checksum),
+            None]
+        self.cache.fetch_image(self.uuid, self.dest_path)
+        self.assertEqual([mock.call(self.uuid, self.content_path,
+                                    self.dest_path, ctx=None,
+                                    checksum=self.checksum),
+                          mock.call(self.uuid, self.master_path,
+                                    self.dest_path, ctx=None)],
+                         mock_download.call_args_list)
+        self.assertFalse(os.path.islink(self.master_path))
+        self.assertEqual({}, self.cache._get_index().aliases)
+        self.assertTrue(mock_clean_up.called)
+
+    @mock.patch.object(image_cache.ImageCache, '_get_content')
+    @mock.patch.object(image_cache.ImageCache, 'clean_up')
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_same_content(self, mock_download, mock_clean_up,
+                                      mock_content, mock_fetch_to_raw):
+        # NOTE: another image with the same content is cached
+        touch(self.content_path)
+        mock_content.return_value = (self.checksum, self.content_name)
+        self.cache.fetch_image(self.uuid, self.dest_path)
+        self.assertFalse(mock_download.called)
+        self.assertEqual(os.stat(self.dest_path).st_ino,
+                         os.stat(self.content_path).st_ino)
+        self.assertEqual(self.content_name, os.readlink(self.master_path))
+        self.assertFalse(mock_clean_up.called)
+
+    @mock.patch.object(image_cache.ImageCache, '_get_content')
+    @mock.patch.object(image_cache.ImageCache, 'clean_up')
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_alias_exists(self, mock_download, mock_clean_up,
+                                      mock_content, mock_fetch_to_raw):
+        touch(self.content_path)
+        os.symlink(self.content_name, self.master_path)
+        self.cache.fetch_image(self.uuid, self.dest_path)
+        self.assertFalse(mock_content.called)
+        self.assertFalse(mock_download.called)
+        self.assertEqual(os.stat(self.dest_path).st_ino,
+                         os.stat(self.content_path).st_ino)
+        # NOTE: the alias is a symlink, the content is not in use twice
+        self.assertEqual(2, os.stat(self.content_path).st_nlink)
+
+    @mock.patch.object(image_cache.ImageCache, '_get_content')
+    @mock.patch.object(image_cache.ImageCache, 'clean_up')
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_dangling_alias(self, mock_download, mock_clean_up,
+                                        mock_content, mock_fetch_to_raw):
+        os.symlink(self.content_name, self.master_path)
+        mock_content.return_value = (self.checksum, self.content_name)
+        self.cache.fetch_image(self.uuid, self.dest_path)
+        mock_download.assert_called_once_with(
+            self.uuid, self.content_path, self.dest_path, ctx=None,
+            checksum=self.checksum)
+        self.assertEqual(self.content_name, os.readlink(self.master_path))
+
+    @mock.patch.object(image_cache.ImageCache, '_get_content',
+                       return_value=(None, None))
+    def test_prefetch_image(self, mock_content, mock_fetch_to_raw):
+        def _fake_fetch_to_raw(ctx, uuid, tmp_path, *args, **kwargs):
+            with open(tmp_path, 'w') as fp:
+                fp.write("TEST")
+
+        mock_fetch_to_raw.side_effect = _fake_fetch_to_raw
+        self.cache = image_cache.ImageCache(self.master_dir, cache_size=10,
+                                            cache_ttl=0)
+        self.cache.prefetch_image(self.uuid)
+        self.assertEqual(1, os.stat(self.master_path).st_nlink)
+        self.assertEqual(sorted([self.uuid, image_cache._INDEX_FILE]),
+                         sorted(os.listdir(self.master_dir)))
+
+    @mock.patch.object(image_cache.ImageCache, 'fetch_image')
+    def test_prefetch_image_no_master_dir(self, mock_fetch,
+                                          mock_fetch_to_raw):
+        self.cache._master_dir = None
+        self.cache.prefetch_image(self.uuid)
+        self.assertFalse(mock_fetch.called)
+
+    def _test__get_content(self, image):
+        image_service = mock.Mock()
+        image_service.show.return_value = image
+        self.cache._image_service = image_service
+        result = self.cache._get_content('uuid', None)
+        image_service.show.assert_called_once_with('uuid')
+        return result
+
+    def test__get_content(self, mock_fetch_to_raw):
+        self.assertEqual((self.checksum, self.content_name),
+                         self._test__get_content({'checksum': self.checksum,
+                                                  'owner': self.owner}))
+
+    def test__get_content_other_owner(self, mock_fetch_to_raw):
+        self.assertEqual((self.checksum, 'md5-other-' + self.checksum),
+                         self._test__get_content({'checksum': self.checksum,
+                                                  'owner': 'other'}))
+
+    def test__get_content_invalid_checksum(self, mock_fetch_to_raw):
+        self.assertEqual((None, None),
+                         self._test__get_content({'checksum': '../etc/passwd',
+                                                  'owner': self.owner}))
+
+    def test__get_content_invalid_owner(self, mock_fetch_to_raw):
+        self.assertEqual((None, None),
+                         self._test__get_content({'checksum': self.checksum,
+                                                  'owner': '../etc'}))
+
+    def test__get_content_no_owner(self, mock_fetch_to_raw):
+        self.assertEqual((None, None),
+                         self._test__get_content({'checksum': self.checksum}))
+
     def test__download_image(self, mock_fetch_to_raw):
-        def _fake_fetch_to_raw(ctx, uuid, tmp_path, *args):
+        def _fake_fetch_to_raw(ctx, uuid, tmp_path, *args, **kwargs):
             self.assertEqual(self.uuid, uuid)
             self.assertTrue(os.path.isfile(tmp_path))
             self.assertNotEqual(self.dest_path, tmp_path)
@@ -102,7 +255,23 @@ class TestImageCacheFetch(base.TestCase):
                          os.stat(self.master_path).st_ino)
         with open(self.dest_path) as fp:
             self.assertEqual("TEST", fp.read())
+        self.assertEqual((4, mock.ANY),
+                         self.cache._get_index().entries[self.uuid])
+
 
+    def test__download_image_checksum_mismatch(self, mock_fetch_to_raw):
+        mock_fetch_to_raw.side_effect = exception.ImageChecksumMismatch(
+                image_id=self.uuid, actual='0' * 32, expected=self.checksum)
+        self.assertRaises(exception.ImageChecksumMismatch,
+                          self.cache._download_image, self.uuid,
+                          self.content_path, self.dest_path,
+                          checksum=self.checksum)
+        mock_fetch_to_raw.assert_called_once_with(
+                None, self.uuid, mock.ANY, self.cache._image_service,
+                checksum=self.checksum)
+        self.assertFalse(os.path.exists(self.content_path))
+        self.assertFalse(os.path.exists(self.dest_path))
+        self.assertEqual([], os.listdir(self.master_dir))
 
 class TestImageCacheCleanUp(base.TestCase):
 
@@ -113,8 +282,7 @@ class TestImageCacheCleanUp(base.TestCase):
                                             cache_size=10,
                                             cache_ttl=600)
 
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_ensure_cache_size')
-    def test_clean_up_old_deleted(self, mock_clean_size):
+    def test_clean_up_old_deleted(self):
         files = [os.path.join(self.master_dir, str(i))
                  for i in range(2)]
         for filename in files:
@@ -125,16 +293,11 @@ class TestImageCacheCleanUp(base.TestCase):
         with mock.patch.object(time, 'time', lambda: new_current_time):
             self.cache.clean_up()
 
-        survived = mock_clean_size.call_args[0][0]
-        self.assertEqual(1, len(survived))
-        self.assertEqual(files[0], survived[0][0])
-        # NOTE(dtantsur): do not compare milliseconds
-        self.assertEqual(int(new_current_time - 100), int(survived[0][1]))
-        self.assertEqual(int(new_current_time - 100),
-                         int(survived[0][2].st_mtime))
+        self.assertTrue(os.path.exists(files[0]))
+        self.assertFalse(os.path.exists(files[1]))
+        self.assertEqual(['0'], list(self.cache._get_index().entries))
 
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_ensure_cache_size')
-    def test_clean_up_files_with_links_untouched(self, mock_clean_size):
+    def test_clean_up_files_with_links_untouched(self):
         files = [os.path.join(self.master_dir, str(i))
                  for i in range(2)]
         for filename in files:
@@ -147,11 +310,8 @@ class TestImageCacheCleanUp(base.TestCase):
 
         for filename in files:
             self.assertTrue(os.path.exists(filename))
-        mock_clean_size.assert_called_once_with([])
 
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_too_old')
-    def test_clean_up_ensure_cache_size(self, mock_clean_ttl):
-        mock_clean_ttl.side_effect = lambda listing: listing
+    def test_clean_up_ensure_cache_size(self):
         # NOTE(dtantsur): Cache size in test is 10 bytes, we create 6 files
         # with 3 bytes each and expect 3 to be deleted
         files = [os.path.join(self.master_dir, str(i))
@@ -172,11 +332,10 @@ class TestImageCacheCleanUp(base.TestCase):
             self.assertTrue(os.path.exists(filename))
         for filename in files[3:]:
             self.assertFalse(os.path.exists(filename))
+        self.assertEqual(9, self.cache._get_index().total_size)
 
     @mock.patch.object(image_cache.LOG, 'info')
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_too_old')
-    def test_clean_up_cache_still_large(self, mock_clean_ttl, mock_log):
-        mock_clean_ttl.side_effect = lambda listing: listing
+    def test_clean_up_cache_still_large(self, mock_log):
         # NOTE(dtantsur): Cache size in test is 10 bytes, we create 2 files
         # than cannot be deleted and expected this to be logged
         files = [os.path.join(self.master_dir, str(i))
@@ -191,3 +350,102 @@ class TestImageCacheCleanUp(base.TestCase):
         for filename in files:
             self.assertTrue(os.path.exists(filename))
         self.assertTrue(mock_log.called)
+
+    def test_clean_up_does_not_list_directory(self):
+        self.cache.clean_up()
+
+        master_path = os.path.join(self.master_dir, 'new')
+        with open(master_path, 'w') as fp:
+            fp.write('12345678901')
+        self.cache._get_index().add('new', 11)
+        with mock.patch.object(os, 'listdir') as mock_listdir:
+            self.cache.clean_up()
+            self.assertFalse(mock_listdir.called)
+
+        self.assertFalse(os.path.exists(master_path))
+        self.assertEqual(0, self.cache._get_index().total_size)
+
+    def test_clean_up_forgets_missing_files(self):
+        touch(os.path.join(self.master_dir, 'gone'))
+        index = self.cache._get_index()
+        os.unlink(os.path.join(self.master_dir, 'gone'))
+
+        new_current_time = time.time() + 900
+        with mock.patch.object(time, 'time', lambda: new_current_time):
+            self.cache.clean_up()
+
+        self.assertEqual({}, index.entries)
+
+    def test_clean_up_deletes_aliases(self):
+        touch(os.path.join(self.master_dir, 'md5-content'))
+        for alias in ('uuid1', 'uuid2'):
+            os.symlink('md5-content', os.path.join(self.master_dir, alias))
+
+        new_current_time = time.time() + 900
+        with mock.patch.object(time, 'time', lambda: new_current_time):
+            self.cache.clean_up()
+
+        self.assertEqual([image_cache._INDEX_FILE],
+                         os.listdir(self.master_dir))
+        self.assertEqual({}, self.cache._get_index().aliases)
+
+
+class TestCacheIndex(base.TestCase):
+
+    def setUp(self):
+        super(TestCacheIndex, self).setUp()
+        self.master_dir = tempfile.mkdtemp()
+
+    def test_load(self):
+        for name, content in (('a', '1'), ('b', '12')):
+            with open(os.path.join(self.master_dir, name), 'w') as fp:
+                fp.write(content)
+        new_current_time = time.time() + 100
+        os.utime(os.path.join(self.master_dir, 'a'),
+                 (new_current_time, new_current_time))
+
+        index = image_cache._CacheIndex(self.master_dir)
+
+        self.assertEqual(['b', 'a'], list(index.entries))
+        self.assertEqual(3, index.total_size)
+        self.assertEqual(int(new_current_time), int(index.entries['a'][1]))
+
+    def test_load_aliases(self):
+        touch(os.path.join(self.master_dir, 'md5-content'))
+        os.symlink('md5-content', os.path.join(self.master_dir, 'uuid'))
+
+        index = image_cache._CacheIndex(self.master_dir)
+
+        self.assertEqual(['md5-content'], list(index.entries))
+        self.assertEqual({'uuid': 'md5-content'}, index.aliases)
+
+    def test_add_touch_remove(self):
+        index = image_cache._CacheIndex(self.master_dir)
+        index.add('a', 1)
+        index.add('b', 2)
+        index.touch('a')
+        self.assertEqual(['b', 'a'], list(index.entries))
+        self.assertEqual(3, index.total_size)
+
+        index.remove('b')
+        index.remove('missing')
+        self.assertEqual(['a'], list(index.entries))
+        self.assertEqual(1, index.total_size)
+
+    def test_save(self):
+        touch(os.path.join(self.master_dir, 'a'))
+        index = image_cache._CacheIndex(self.master_dir)
+        new_current_time = time.time() + 100
+        with mock.patch.object(time, 'time', lambda: new_current_time):
+            index.touch('a')
+        index.save()
+
+        index = image_cache._CacheIndex(self.master_dir)
+        self.assertEqual(['a'], list(index.entries))
+        self.assertEqual(new_current_time, index.entries['a'][1])
+
+    def test_save_not_changed(self):
+        index = image_cache._CacheIndex(self.master_dir)
+        index.save()
+        self.assertFalse(os.path.exists(
+            os.path.join(self.master_dir, image_cache._INDEX_FILE)))
@@ -17,9 +17,11 @@
 
 """Test class for PXE driver."""
 
+import eventlet
 import fixtures
 import mock
 import os
+import six
 import tempfile
 
 from oslo.config import cfg
@@ -429,6 +431,94 @@ class PXEPrivateMethodsTestCase(db_base.DbTestCase):
                                       'disk'),
                          image_path)
 
+    @mock.patch.object(pxe, '_cache_instance_image')
+    @mock.patch.object(pxe, '_cache_tftp_images')
+    def test__cache_images(self, mock_tftp, mock_instance):
+        pxe._cache_images(self.node, {}, None)
+        mock_tftp.assert_called_once_with(None, self.node, {})
+        mock_instance.assert_called_once_with(None, self.node)
+
+    @mock.patch.object(pxe, '_cache_instance_image')
+    @mock.patch.object(pxe, '_cache_tftp_images')
+    def test__cache_images_one_fails(self, mock_tftp, mock_instance):
+        mock_instance.side_effect = exception.ImageNotFound(image_id='img')
+        self.assertRaises(exception.ImageNotFound,
+                          pxe._cache_images, self.node, {}, None)
+        mock_tftp.assert_called_once_with(None, self.node, {})
+
+    @mock.patch.object(pxe, '_cache_instance_image')
+    @mock.patch.object(pxe, '_cache_tftp_images')
+    def test__cache_images_several_fail(self, mock_tftp, mock_instance):
+        mock_tftp.side_effect = exception.ImageNotFound(image_id='kernel')
+        mock_instance.side_effect = exception.ImageNotFound(image_id='img')
+        exc = self.assertRaises(exception.ImageDownloadFailed,
+                                pxe._cache_images, self.node, {}, None)
+        self.assertIn('kernel', six.text_type(exc))
+        self.assertIn('img', six.text_type(exc))
+
+    def _test__fetch_image_concurrency(self, limit):
+        self.config(image_download_concurrency=limit, group='pxe')
+        running = []
+        concurrency = []
+
+        def fake_fetch_image(uuid, path, ctx=None):
+            running.append(uuid)
+            concurrency.append(len(running))
+            eventlet.sleep(0)
+            running.remove(uuid)
+
+        image_cache = mock.Mock(spec_set=['fetch_image'])
+        image_cache.fetch_image.side_effect = fake_fetch_image
+        pxe._run_concurrently([(pxe._fetch_image, image_cache, uuid,
+                                'path', None) for uuid in 'abcd'])
+        self.assertEqual(4, image_cache.fetch_image.call_count)
+        return max(concurrency)
+
+    def test__fetch_image_concurrency(self):
+        self.assertEqual(2, self._test__fetch_image_concurrency(2))
+
+    def test__fetch_image_concurrency_one(self):
+        self.assertEqual(1, self._test__fetch_image_concurrency(1))
+
+    @mock.patch.object(image_cache.ImageCache, 'prefetch_image')
+    def test__prefetch_images(self, mock_prefetch_image):
+        temp_dir = tempfile.mkdtemp()
+        self.config(tftp_master_path=os.path.join(temp_dir, 'tftp'),
+                    instance_master_path=os.path.join(temp_dir, 'instance'),
+                    group='pxe')
+        properties = {'properties': {u'kernel_id': u'instance_kernel_uuid',
+                                     u'ramdisk_id': u'instance_ramdisk_uuid'}}
+        with mock.patch.object(base_image_service.BaseImageService, '_show') \
+                as show_mock:
+            show_mock.return_value = properties
+            pxe._prefetch_images(self.context, ['glance://image_uuid'],
+                                 ['deploy_kernel', 'deploy_ramdisk'])
+            show_mock.assert_called_once_with('glance://image_uuid',
+                                              method='get')
+
+        self.assertEqual(sorted(['glance://image_uuid',
+                                 'instance_kernel_uuid',
+                                 'instance_ramdisk_uuid',
+                                 'deploy_kernel', 'deploy_ramdisk']),
+                         sorted(call[0][0] for call
+                                in mock_prefetch_image.call_args_list))
+
+    @mock.patch.object(pxe, '_prefetch_image')
+    def test__prefetch_images_master_paths(self, mock_prefetch_image):
+        temp_dir = tempfile.mkdtemp()
+        self.config(tftp_master_path=os.path.join(temp_dir, 'tftp'),
+                    instance_master_path=os.path.join(temp_dir, 'instance'),
+                    group='pxe')
+        with mock.patch.object(base_image_service.BaseImageService, '_show') \
+                as show_mock:
+            show_mock.return_value = {'properties': {}}
+            pxe._prefetch_images(None, ['image'], ['kernel'])
+
+        master_dirs = dict((call[0][1], call[0][0]._master_dir)
+                           for call in mock_prefetch_image.call_args_list)
+        self.assertEqual({'image': CONF.pxe.instance_master_path,
+                          'kernel': CONF.pxe.tftp_master_path},
+                         master_dirs)
 
 class PXEDriverTestCase(db_base.DbTestCase):
 
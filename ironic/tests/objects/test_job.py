@@ -0,0 +1,68 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from ironic.db import api as db_api
+from ironic import objects
+from ironic.tests.db import base
+from ironic.tests.db import utils
+
+
+class TestJobObject(base.DbTestCase):
+
+    def setUp(self):
+        super(TestJobObject, self).setUp()
+        self.fake_job = utils.get_test_job()
+        self.dbapi = db_api.get_instance()
+
+    def test_load(self):
+        uuid = self.fake_job['uuid']
+        with mock.patch.object(self.dbapi, 'get_job',
+                               autospec=True) as mock_get_job:
+            mock_get_job.return_value = self.fake_job
+
+            job = objects.Job.get_by_uuid(self.context, uuid)
+
+            mock_get_job.assert_called_once_with(uuid)
+            self.assertEqual(self.context, job._context)
+
+    def test_create(self):
+        job = objects.Job(self.context, action='power', target='power on',
+                          filters={'driver': 'fake'}, total=2)
+        with mock.patch.object(self.dbapi, 'create_job',
+                               autospec=True) as mock_create_job:
+            mock_create_job.return_value = self.fake_job
+            job.create()
+
+            args, _kwargs = mock_create_job.call_args
+            self.assertEqual('power', args[0]['action'])
+            self.assertEqual(self.fake_job['uuid'], job.uuid)
+
+    def test_save(self):
+        job = objects.Job(self.context)
+        self.assertRaises(NotImplementedError, job.save, self.context)
+
+    def test_refresh(self):
+        uuid = self.fake_job['uuid']
+        returns = [self.fake_job,
+                   utils.get_test_job(succeeded=1, state='done')]
+        expected = [mock.call(uuid), mock.call(uuid)]
+        with mock.patch.object(self.dbapi, 'get_job', side_effect=returns,
+                               autospec=True) as mock_get_job:
+            job = objects.Job.get_by_uuid(self.context, uuid)
+            self.assertEqual('running', job.state)
+            job.refresh()
+            self.assertEqual('done', job.state)
+            self.assertEqual(1, job.succeeded)
+
+            self.assertEqual(expected, mock_get_job.call_args_list)
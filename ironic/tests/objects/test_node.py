@@ -18,6 +18,7 @@ import datetime
 import mock
 
 from ironic.common import exception
+from ironic.common import utils as ironic_utils
 from ironic.db import api as db_api
 from ironic.db.sqlalchemy import models
 from ironic import objects
@@ -64,6 +65,8 @@ class TestNodeObject(base.DbTestCase):
             mock_get_node.return_value = self.fake_node
             with mock.patch.object(self.dbapi, 'update_node',
                                    autospec=True) as mock_update_node:
+                mock_update_node.return_value = dict(self.fake_node,
+                                                     version=1)
 
                 n = objects.Node.get(self.context, uuid)
                 n.properties = {"fake": "property"}
@@ -71,7 +74,53 @@ class TestNodeObject(base.DbTestCase):
 
                 mock_get_node.assert_called_once_with(uuid)
                 mock_update_node.assert_called_once_with(
-                        uuid, {'properties': {"fake": "property"}})
+                        uuid, {'properties': {"fake": "property"}},
+                        expected_version=0)
+                self.assertEqual(1, n.version)
+
+    def test_save_no_changes(self):
+        with mock.patch.object(self.dbapi, 'update_node',
+                               autospec=True) as mock_update_node:
+            n = objects.Node._from_db_object(objects.Node(self.context),
+                                             self.fake_node)
+            n.save()
+            self.assertFalse(mock_update_node.called)
+
+    def test_save_coalesce_writes(self):
+        uuid = self.fake_node['uuid']
+        with mock.patch.object(self.dbapi, 'update_node',
+                               autospec=True) as mock_update_node:
+            mock_update_node.return_value = dict(self.fake_node, version=1)
+            n = objects.Node._from_db_object(objects.Node(self.context),
+                                             self.fake_node)
+            n.coalesce_writes = True
+            n.driver_info = {'foo': 'bar'}
+            n.save()
+            self.assertFalse(mock_update_node.called)
+
+            n.power_state = 'power on'
+            n.save()
+            mock_update_node.assert_called_once_with(
+                    uuid, {'driver_info': {'foo': 'bar'},
+                           'power_state': 'power on'},
+                    expected_version=0)
+            self.assertEqual(set(), n.obj_what_changed())
+
+    def test_flush(self):
+        uuid = self.fake_node['uuid']
+        with mock.patch.object(self.dbapi, 'update_node',
+                               autospec=True) as mock_update_node:
+            mock_update_node.return_value = dict(self.fake_node, version=1)
+            n = objects.Node._from_db_object(objects.Node(self.context),
+                                             self.fake_node)
+            n.coalesce_writes = True
+            n.driver_info = {'foo': 'bar'}
+            n.save()
+            n.flush()
+            mock_update_node.assert_called_once_with(
+                    uuid, {'driver_info': {'foo': 'bar'}},
+                    expected_version=0)
+            self.assertTrue(n.coalesce_writes)
 
     def test_refresh(self):
         uuid = self.fake_node['uuid']
@@ -133,3 +182,26 @@ class TestNodeObject(base.DbTestCase):
             self.assertIsInstance(n, models.Node)
         for n in _convert_db_nodes():
             self.assertIsInstance(n, objects.Node)
+
+    def test_json_fields_decoded_lazily(self):
+        db_node = dict(self.fake_node,
+                       properties=ironic_utils.LazyJSON('{"cpus": 4}'))
+        with mock.patch.object(self.dbapi, 'get_node_by_uuid',
+                               autospec=True) as mock_get_node:
+            mock_get_node.return_value = db_node
+            n = objects.Node.get(self.context, self.fake_node['uuid'])
+
+        self.assertIsInstance(n._properties, ironic_utils.LazyJSON)
+        self.assertEqual({'cpus': 4}, n.properties)
+        self.assertEqual({'cpus': 4}, n._properties)
+        self.assertEqual(set(), n.obj_what_changed())
+
+    def test_json_fields_saved_decoded(self):
+        node = self.dbapi.create_node(self.fake_node)
+        n = objects.Node.get(self.context, node.uuid)
+        n.properties = dict(n.properties, cpus=8)
+        n.save()
+
+        n = objects.Node.get(self.context, node.uuid)
+        self.assertEqual(8, n.properties['cpus'])
+        self.assertEqual(self.fake_node['extra'], n.extra)
@@ -38,3 +38,25 @@ def create_test_node(ctxt, **kw):
     node = get_test_node(ctxt, **kw)
     node.create()
     return node
+
+
+def get_test_job(ctxt, **kw):
+    """Return a Job object with appropriate attributes.
+
+    NOTE: The object leaves the attributes marked as changed, such
+    that a create() could be used to commit it to the DB.
+    """
+    db_job = db_utils.get_test_job(**kw)
+    job = objects.Job(context=ctxt)
+    for key in db_job:
+        setattr(job, key, db_job[key])
+    return job
+
+
+def create_test_job(ctxt, **kw):
+    """Create a job in the DB and return a Job object with appropriate
+    attributes.
+    """
+    job = get_test_job(ctxt, **kw)
+    job.create()
+    return job
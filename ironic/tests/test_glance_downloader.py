@@ -0,0 +1,234 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for downloading images from a local stand-in for glance."""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import mock
+from six.moves import BaseHTTPServer
+
+from ironic.common import exception
+from ironic.common.glance_service import base_image_service
+from ironic.common.glance_service import downloader
+from ironic.common import image_service as service
+from ironic.openstack.common import context
+from ironic.tests import base
+
+IMAGE = b''.join(chr(i % 251) for i in range(300 * 1024))
+
+
+class FakeGlanceHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get('range'),
+                                self.headers.get('x-auth-token')))
+        if self.path != '/v1/images/image':
+            self.send_response(404)
+            self.end_headers()
+            return
+        if server.errors:
+            self.send_response(server.errors.pop(0))
+            self.end_headers()
+            return
+
+        start, end = 0, len(IMAGE)
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('range', ''))
+        if server.ranges and match:
+            start = int(match.group(1))
+            if match.group(2):
+                end = int(match.group(2)) + 1
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' %
+                             (start, end - 1, len(IMAGE)))
+        else:
+            self.send_response(200)
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('x-image-meta-checksum', server.checksum)
+        self.end_headers()
+
+        if server.breaks:
+            # NOTE: send part of the data and close the connection
+            end = min(end, start + server.breaks.pop(0))
+        self.wfile.write(IMAGE[start:end])
+
+
+class GlanceDownloadTestCase(base.TestCase):
+
+    def setUp(self):
+        super(GlanceDownloadTestCase, self).setUp()
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                FakeGlanceHandler)
+        self.server.requests = []
+        self.server.errors = []
+        self.server.breaks = []
+        self.server.ranges = True
+        self.server.checksum = hashlib.md5(IMAGE).hexdigest()
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.01,))
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.path = os.path.join(temp_dir, 'image')
+        for patcher in (mock.patch('time.sleep'),
+                        mock.patch.object(base_image_service.client,
+                                          'Client'),
+                        mock.patch.dict(base_image_service._CLIENTS,
+                                        clear=True),
+                        mock.patch.dict(base_image_service._IMAGE_METADATA,
+                                        clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.config(glance_host='127.0.0.1',
+                    glance_port=self.server.server_address[1],
+                    group='glance')
+        self.context = context.RequestContext(auth_token='token')
+        self.service = service.Service(version=1, context=self.context)
+
+    def _download(self, image_id='image', checksum=None):
+        with open(self.path, 'wb') as f:
+            self.service.download(image_id, f, checksum=checksum)
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def _ranges(self):
+        return [request[1] for request in self.server.requests]
+
+    def test_download(self):
+        self.assertEqual(IMAGE, self._download())
+        self.assertEqual([('/v1/images/image', None, 'token')],
+                         self.server.requests)
+
+    def test_download_resumed(self):
+        self.server.breaks = [100000, 50000]
+        self.assertEqual(IMAGE, self._download())
+        self.assertEqual([None, 'bytes=100000-307199',
+                          'bytes=150000-307199'],
+                         self._ranges())
+
+    def test_download_resumed_without_ranges(self):
+        self.server.ranges = False
+        self.server.breaks = [100000]
+        self.assertEqual(IMAGE, self._download())
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_download_resumed_after_server_error(self):
+        self.server.errors = [503]
+        self.assertEqual(IMAGE, self._download())
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_download_too_many_breaks(self):
+        self.config(glance_download_resumes=2, group='glance')
+        self.server.breaks = [1000, 1000, 1000]
+        self.assertRaises(exception.GlanceConnectionFailed, self._download)
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_download_checksum_mismatch(self):
+        self.server.checksum = hashlib.md5(b'other').hexdigest()
+        self.assertRaises(exception.ImageChecksumMismatch, self._download)
+
+    def test_download_expected_checksum(self):
+        self.assertEqual(IMAGE, self._download(
+                checksum=hashlib.md5(IMAGE).hexdigest()))
+
+    def test_download_expected_checksum_mismatch(self):
+        self.assertRaises(exception.ImageChecksumMismatch, self._download,
+                          checksum=hashlib.md5(b'other').hexdigest())
+
+    def test_download_forgets_metadata_of_changed_image(self):
+        base_image_service._cache_image(1, 'image', None,
+                                        {'checksum': 'old'})
+        self._download()
+        self.assertEqual({}, base_image_service._IMAGE_METADATA)
+
+    def test_download_not_found(self):
+        self.assertRaises(exception.ImageNotFound, self._download, 'missing')
+
+    def test_download_not_authorized(self):
+        self.server.errors = [403]
+        self.assertRaises(exception.ImageNotAuthorized, self._download)
+
+    def test_download_parallel(self):
+        self.config(glance_download_streams=3,
+                    glance_download_stream_min_size=0, group='glance')
+        # NOTE: the first request, for all the image, breaks in the
+        #       first segment
+        self.server.breaks = [50000]
+        self.assertEqual(IMAGE, self._download())
+        ranges = self._ranges()
+        self.assertIsNone(ranges[0])
+        self.assertEqual(sorted(['bytes=50000-102399', 'bytes=102400-204799',
+                                 'bytes=204800-307199']),
+                         sorted(ranges[1:]))
+
+    def test_download_parallel_checksum_mismatch(self):
+        self.config(glance_download_streams=3,
+                    glance_download_stream_min_size=0, group='glance')
+        self.server.checksum = hashlib.md5(b'other').hexdigest()
+        self.assertRaises(exception.ImageChecksumMismatch, self._download)
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_download_parallel_expected_checksum_mismatch(self):
+        self.config(glance_download_streams=3,
+                    glance_download_stream_min_size=0, group='glance')
+        self.assertRaises(exception.ImageChecksumMismatch, self._download,
+                          checksum=hashlib.md5(b'other').hexdigest())
+
+    def test_download_parallel_small_image(self):
+        self.config(glance_download_streams=3, group='glance')
+        self.assertEqual(IMAGE, self._download())
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_download_parallel_not_to_a_file(self):
+        self.config(glance_download_streams=3,
+                    glance_download_stream_min_size=0, group='glance')
+        chunks = []
+        writer = mock.Mock(spec=['write'])
+        writer.write.side_effect = chunks.append
+        self.service.download('image', writer)
+        self.assertEqual(IMAGE, b''.join(chunks))
+        self.assertEqual(1, len(self.server.requests))
+
+
+class ImageResponseTestCase(base.TestCase):
+
+    def _response(self, status, headers):
+        response = mock.Mock(status=status)
+        response.getheader.side_effect = lambda name: headers.get(name)
+        return downloader.ImageResponse(mock.Mock(), response)
+
+    def test_partial_content(self):
+        response = self._response(206, {'content-range': 'bytes 10-19/100',
+                                        'content-md5': 'md5'})
+        self.assertEqual(10, response.start)
+        self.assertEqual(100, response.size)
+        self.assertEqual('md5', response.checksum)
+
+    def test_invalid_content_range(self):
+        self.assertRaises(exception.ImageDownloadFailed, self._response,
+                          206, {'content-range': 'bytes x-y/z'})
@@ -16,14 +16,18 @@
 
 import datetime
 import filecmp
+import hashlib
 import os
 import tempfile
+
+import mock
 import testtools
 
 from ironic.common import exception
 from ironic.common.glance_service import base_image_service
 from ironic.common.glance_service import service_utils
 from ironic.common import image_service as service
+from ironic.common import utils
 from ironic.openstack.common import context
 from ironic.tests import base
 from ironic.tests import matchers
@@ -91,6 +95,11 @@ class TestGlanceImageService(base.TestCase):
 
     def setUp(self):
         super(TestGlanceImageService, self).setUp()
+        for cache in (base_image_service._CLIENTS,
+                      base_image_service._IMAGE_METADATA):
+            patcher = mock.patch.dict(cache, clear=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
         client = stubs.StubGlanceClient()
         self.context = context.RequestContext(auth_token=True)
         self.context.user_id = 'fake'
@@ -329,6 +338,115 @@ class TestGlanceImageService(base.TestCase):
         new_image_data = self.service.show(image_id)
         self.assertEqual('new image name', new_image_data['name'])
 
+    def test_show_cached(self):
+        image_id = self.service.create(self._make_fixture(name='image'))['id']
+        images = self.service.client.images
+        with mock.patch.object(images, 'get') as mock_get:
+            mock_get.return_value = self.service.client._images[0]
+            first = self.service.show(image_id)
+            first['name'] = 'changed'
+            self.assertEqual('image', self.service.show(image_id)['name'])
+        mock_get.assert_called_once_with(image_id)
+
+    @mock.patch('time.time')
+    def test_show_cache_expired(self, mock_time):
+        self.config(glance_metadata_cache_ttl=10, group='glance')
+        image_id = self.service.create(self._make_fixture(name='image'))['id']
+        mock_time.return_value = 100
+        self.service.show(image_id)
+        self.service.client._images[0].name = 'new name'
+        mock_time.return_value = 109
+        self.assertEqual('image', self.service.show(image_id)['name'])
+        mock_time.return_value = 110
+        self.assertEqual('new name', self.service.show(image_id)['name'])
+
+    def test_show_cache_disabled(self):
+        self.config(glance_metadata_cache_ttl=0, group='glance')
+        image_id = self.service.create(self._make_fixture(name='image'))['id']
+        self.service.show(image_id)
+        self.assertEqual({}, base_image_service._IMAGE_METADATA)
+
+    def test_show_cached_checks_access(self):
+        fixture = self._make_fixture(name='image', is_public=False,
+                                     properties={'owner_id': 'fake'})
+        image_id = self.service.create(fixture)['id']
+        self.service.show(image_id)
+        other_context = context.RequestContext()
+        other_context.project_id = 'other'
+        other_service = service.Service(self.service.client, 1,
+                                        other_context)
+        self.assertRaises(exception.ImageNotFound, other_service.show,
+                          image_id)
+
+    def test_forget_image_checksum_changed(self):
+        fixture = self._make_fixture(name='image', checksum='old')
+        image_id = self.service.create(fixture)['id']
+        self.service.show(image_id)
+        base_image_service._forget_image(image_id, 'old')
+        self.assertIn((1, image_id), base_image_service._IMAGE_METADATA)
+        base_image_service._forget_image(image_id, 'new')
+        self.assertNotIn((1, image_id), base_image_service._IMAGE_METADATA)
+
+    def test_delete_forgets_image(self):
+        image_id = self.service.create(self._make_fixture(name='image'))['id']
+        self.service.show(image_id)
+        self.service.delete(image_id)
+        self.assertEqual({}, base_image_service._IMAGE_METADATA)
+
+    @mock.patch.object(base_image_service.client, 'Client')
+    def test_get_client_shared(self, mock_client):
+        mock_client.side_effect = lambda *args, **kwargs: mock.Mock()
+        params = {'insecure': False}
+        first = base_image_service._get_client(1, 'http://glance', params)
+        self.assertIs(first, base_image_service._get_client(
+                1, 'http://glance', dict(params)))
+        self.assertIsNot(first, base_image_service._get_client(
+                1, 'http://glance', {'insecure': True}))
+        self.assertIsNot(first, base_image_service._get_client(
+                2, 'http://glance', params))
+        self.assertEqual(3, mock_client.call_count)
+
+    @mock.patch.object(base_image_service.client, 'Client')
+    def test_get_client_token_shares_connections(self, mock_client):
+        adapter = mock.Mock()
+
+        def fake_client(*args, **kwargs):
+            glance_client = mock.Mock()
+            glance_client.http_client.session.adapters = {'http://': adapter}
+            return glance_client
+
+        mock_client.side_effect = fake_client
+        first = base_image_service._get_client(
+                1, 'http://glance', {'insecure': False, 'token': 'token1'})
+        second = base_image_service._get_client(
+                1, 'http://glance', {'insecure': False, 'token': 'token2'})
+
+        # NOTE: one pooled client without token, then one per token
+        self.assertEqual([mock.call(1, 'http://glance', insecure=False),
+                          mock.call(1, 'http://glance', insecure=False,
+                                    token='token1'),
+                          mock.call(1, 'http://glance', insecure=False,
+                                    token='token2')],
+                         mock_client.call_args_list)
+        self.assertEqual([(1, 'http://glance', (('insecure', False),))],
+                         list(base_image_service._CLIENTS))
+        self.assertIsNot(first, second)
+        for glance_client in (first, second):
+            glance_client.http_client.session.mount.assert_called_once_with(
+                    'http://', adapter)
+
+    @mock.patch.object(base_image_service, '_MAX_CLIENTS', 2)
+    @mock.patch.object(base_image_service.client, 'Client')
+    def test_get_client_least_recently_used_dropped(self, mock_client):
+        mock_client.side_effect = lambda *args, **kwargs: mock.Mock()
+        first = base_image_service._get_client(1, 'http://first', {})
+        base_image_service._get_client(1, 'http://second', {})
+        self.assertIs(first,
+                      base_image_service._get_client(1, 'http://first', {}))
+        base_image_service._get_client(1, 'http://third', {})
+        self.assertEqual([(1, 'http://first', ()), (1, 'http://third', ())],
+                         list(base_image_service._CLIENTS))
+
     def test_delete(self):
         fixture1 = self._make_fixture(name='test image 1')
         fixture2 = self._make_fixture(name='test image 2')
@@ -504,6 +622,102 @@ class TestGlanceImageService(base.TestCase):
         os.remove(stub_client.s_tmpfname)
         os.remove(tmpfname)
 
+    @mock.patch.object(utils, 'copy_file')
+    def test_download_file_url_to_path(self, mock_copy):
+        class MyGlanceStubClient(stubs.StubGlanceClient):
+            """A client that returns a file url."""
+            def get(self, image_id):
+                return type('GlanceTestDirectUrlMeta', (object,),
+                            {'direct_url': 'file:///glance/images/1'})
+
+        stub_context = context.RequestContext(auth_token=True)
+        stub_service = service.Service(MyGlanceStubClient(),
+                                       context=stub_context,
+                                       version=2)
+        mock_copy.return_value = 'reflink'
+        self.config(allowed_direct_url_schemes=['file'],
+                    allow_direct_url_hardlinks=True, group='glance')
+        writer = mock.Mock()
+        self.assertTrue(stub_service.download(1, writer, path='/dest'))
+        mock_copy.assert_called_once_with('/glance/images/1', '/dest',
+                                          hardlink=True)
+        self.assertFalse(writer.write.called)
+
+    @mock.patch.object(utils, 'copy_file')
+    def test_download_file_url_configured_version(self, mock_copy):
+        class MyGlanceStubClient(stubs.StubGlanceClient):
+            """A client that returns a file url."""
+            def get(self, image_id):
+                return type('GlanceTestDirectUrlMeta', (object,),
+                            {'direct_url': 'file:///glance/images/1'})
+
+        self.config(glance_api_version=2,
+                    allowed_direct_url_schemes=['file'], group='glance')
+        stub_context = context.RequestContext(auth_token=True)
+        stub_service = service.Service(MyGlanceStubClient(),
+                                       context=stub_context)
+        self.assertEqual(2, stub_service.version)
+        self.assertTrue(stub_service.download(1, mock.Mock(), path='/dest'))
+        mock_copy.assert_called_once_with('/glance/images/1', '/dest',
+                                          hardlink=False)
+
+    def test_download_to_path(self):
+        class MyGlanceStubClient(stubs.StubGlanceClient):
+            """A client that returns image data."""
+            def data(self, image_id):
+                return ['image ', 'data']
+
+        stub_context = context.RequestContext(auth_token=True)
+        stub_service = service.Service(MyGlanceStubClient(),
+                                       context=stub_context)
+        (fd, path) = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        self.assertTrue(stub_service.download(1, path=path))
+        with open(path) as f:
+            self.assertEqual('image data', f.read())
+
+    def test_download_to_path_checksum_mismatch(self):
+        class MyGlanceStubClient(stubs.StubGlanceClient):
+            """A client that returns image data."""
+            def data(self, image_id):
+                return ['image ', 'data']
+
+        stub_context = context.RequestContext(auth_token=True)
+        stub_service = service.Service(MyGlanceStubClient(),
+                                       context=stub_context)
+        (fd, path) = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        stub_service.download(1, path=path,
+                              checksum=hashlib.md5('image data').hexdigest())
+        self.assertRaises(exception.ImageChecksumMismatch,
+                          stub_service.download, 1, path=path,
+                          checksum=hashlib.md5('other').hexdigest())
+
+    def test_download_file_url_to_path_checksum_mismatch(self):
+        class MyGlanceStubClient(stubs.StubGlanceClient):
+            """A client that returns a file url."""
+            def get(self, image_id):
+                return type('GlanceTestDirectUrlMeta', (object,),
+                            {'direct_url': 'file:///glance/images/1'})
+
+        stub_context = context.RequestContext(auth_token=True)
+        stub_service = service.Service(MyGlanceStubClient(),
+                                       context=stub_context,
+                                       version=2)
+        self.config(allowed_direct_url_schemes=['file'], group='glance')
+        (fd, path) = tempfile.mkstemp()
+        os.write(fd, 'image data')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with mock.patch.object(utils, 'copy_file') as mock_copy:
+            self.assertRaises(exception.ImageChecksumMismatch,
+                              stub_service.download, 1, path=path,
+                              checksum=hashlib.md5('other').hexdigest())
+        mock_copy.assert_called_once_with('/glance/images/1', path,
+                                          hardlink=False)
+
     def test_client_forbidden_converts_to_imagenotauthed(self):
         class MyGlanceStubClient(stubs.StubGlanceClient):
             """A client that raises a Forbidden exception."""
@@ -17,12 +17,25 @@
 #    under the License.
 
 import contextlib
+import distutils.spawn
 import fixtures
+import hashlib
+import mock
+import os
+import re
+import shutil
+import struct
+import tempfile
+import testtools
 
 from ironic.common import exception
 from ironic.common import images
+from ironic.common import qcow2
+from ironic.common import utils
 from ironic.openstack.common import excutils
+from ironic.openstack.common import processutils
 from ironic.tests import base
+from ironic.tests import test_qcow2
 
 
 class IronicImagesTestCase(base.TestCase):
@@ -49,7 +62,7 @@ class IronicImagesTestCase(base.TestCase):
         def fake_del_if_exists(path):
             self.executes.append(('rm', '-f', path))
 
-        def fake_qemu_img_info(path):
+        def fake_probe_image(path):
             class FakeImgInfo(object):
                 pass
 
@@ -75,7 +88,7 @@ class IronicImagesTestCase(base.TestCase):
         self.useFixture(fixtures.MonkeyPatch(
                 'ironic.common.images.fetch', lambda *_: None))
         self.useFixture(fixtures.MonkeyPatch(
-                'ironic.common.images.qemu_img_info', fake_qemu_img_info))
+                'ironic.common.images.probe_image', fake_probe_image))
         self.useFixture(fixtures.MonkeyPatch(
                 'ironic.openstack.common.fileutils.remove_path_on_error',
                 fake_rm_on_error))
@@ -110,3 +123,338 @@ class IronicImagesTestCase(base.TestCase):
         self.assertEqual(expected_commands, self.executes)
 
         del self.executes
+
+
+class ProbeImageTestCase(base.TestCase):
+
+    def setUp(self):
+        super(ProbeImageTestCase, self).setUp()
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.path = os.path.join(temp_dir, 'image')
+        execute_patcher = mock.patch.object(utils, 'execute')
+        self.mock_execute = execute_patcher.start()
+        self.addCleanup(execute_patcher.stop)
+
+    def _probe(self, image):
+        with open(self.path, 'wb') as f:
+            f.write(image)
+        return images.probe_image(self.path)
+
+    def test_probe_raw(self):
+        info = self._probe(b'\0' * 4096)
+        self.assertEqual('raw', info.file_format)
+        self.assertEqual(4096, info.virtual_size)
+        self.assertIsNone(info.backing_file)
+        self.assertEqual(self.path, info.image)
+        self.assertFalse(self.mock_execute.called)
+
+    def test_probe_empty(self):
+        self.assertEqual('raw', self._probe(b'').file_format)
+        self.assertFalse(self.mock_execute.called)
+
+    def test_probe_qcow2(self):
+        info = self._probe(test_qcow2.make_qcow2({}, 1024 * 1024, version=3))
+        self.assertEqual('qcow2', info.file_format)
+        self.assertEqual(1024 * 1024, info.virtual_size)
+        self.assertEqual(test_qcow2.CLUSTER_SIZE, info.cluster_size)
+        self.assertIsNone(info.backing_file)
+        self.assertFalse(self.mock_execute.called)
+
+    def test_probe_qcow2_backing_file(self):
+        image = bytearray(test_qcow2.make_qcow2({}, 1024 * 1024))
+        struct.pack_into('>QI', image, 8, 100, 7)
+        image[100:107] = b'backing'
+        info = self._probe(bytes(image))
+        self.assertEqual('qcow2', info.file_format)
+        self.assertEqual('backing', info.backing_file)
+        self.assertFalse(self.mock_execute.called)
+
+    def _test_probe_qemu_img(self, image):
+        self.mock_execute.return_value = (
+                '{"format": "vmdk", "virtual-size": 1024, '
+                '"backing-filename": "backing"}', '')
+        info = self._probe(image)
+        self.mock_execute.assert_called_once_with(
+                'env', 'LC_ALL=C', 'LANG=C', 'qemu-img', 'info',
+                '--output=json', self.path)
+        self.assertEqual('vmdk', info.file_format)
+        self.assertEqual(1024, info.virtual_size)
+        self.assertEqual('backing', info.backing_file)
+
+    def test_probe_other_format(self):
+        self._test_probe_qemu_img(b'KDMV' + b'\0' * 1020)
+
+    def test_probe_signature_at_offset(self):
+        self._test_probe_qemu_img(b'\0' * 0x40 + b'\x7f\x10\xda\xbe')
+
+    def test_probe_uml_cow(self):
+        self._test_probe_qemu_img(b'OOOM\0\0\0\x02' + b'\0' * 1016)
+
+    def test_probe_signature_at_end(self):
+        self._test_probe_qemu_img(b'\0' * 4096 + b'koly' + b'\0' * 508)
+
+    def test_probe_vmdk_descriptor(self):
+        self._test_probe_qemu_img(b'# Disk DescriptorFile\nversion=1\n'
+                                  b'RW 1 FLAT "/etc/shadow" 0\n')
+
+    def test_probe_vmdk_descriptor_without_header_comment(self):
+        self._test_probe_qemu_img(b'# comment\n  \r\nversion=2\r\n'
+                                  b'RW 1 FLAT "/etc/shadow" 0\n')
+
+    def test_probe_not_vmdk_descriptor(self):
+        info = self._probe(b'# comment\nsomething\nversion=1\n')
+        self.assertEqual('raw', info.file_format)
+        self.assertFalse(self.mock_execute.called)
+
+    def test_probe_qcow2_unknown_features(self):
+        self._test_probe_qemu_img(test_qcow2.make_qcow2(
+                {}, 1024, version=3, incompatible_features=1 << 2))
+
+    def test_probe_qcow_version_1(self):
+        self._test_probe_qemu_img(test_qcow2.make_qcow2({}, 1024, version=1))
+
+    def test_signatures_cover_probed_formats(self):
+        # NOTE: the block drivers of qemu which probe images, other than
+        #       raw.
+        self.assertEqual(sorted(['bochs', 'cloop', 'cow', 'dmg', 'luks',
+                                 'parallels', 'qcow', 'qcow2', 'qed', 'vdi',
+                                 'vhdx', 'vmdk', 'vpc']),
+                         sorted(set(signature[0] for signature
+                                    in images._QEMU_IMG_SIGNATURES)))
+
+    @testtools.skipUnless(distutils.spawn.find_executable('qemu-img'),
+                          'qemu-img is not installed')
+    def test_signatures_cover_installed_qemu_img(self):
+        # NOTE: the formats of qemu-img which do not probe images
+        not_probed = set(['raw', 'host_device', 'host_cdrom', 'host_floppy',
+                          'file', 'vvfat', 'nbd', 'iscsi', 'iser', 'rbd',
+                          'sheepdog', 'gluster', 'nfs', 'ssh', 'http',
+                          'https', 'ftp', 'ftps', 'tftp', 'blkdebug',
+                          'blkverify', 'blkreplay', 'quorum', 'null-co',
+                          'null-aio', 'throttle', 'copy-on-read',
+                          'replication', 'compress', 'vxhs', 'nvme',
+                          'preallocate', 'copy-before-write',
+                          'snapshot-access'])
+        out = processutils.execute('qemu-img', '--help',
+                                   check_exit_code=False)[0]
+        formats = set(re.search(r'Supported formats:(.*)', out).group(1)
+                      .split())
+        probed = set(signature[0] for signature
+                     in images._QEMU_IMG_SIGNATURES)
+        self.assertEqual(set(), formats - probed - not_probed)
+
+    def test_probe_missing(self):
+        info = images.probe_image(self.path)
+        self.assertIsNone(info.file_format)
+        self.assertFalse(self.mock_execute.called)
+
+    def test_image_to_raw_without_qemu_img_info(self):
+        image = test_qcow2.make_qcow2({}, 1024 * 1024)
+        with open(self.path + '.part', 'wb') as f:
+            f.write(image)
+
+        def fake_execute(*cmd, **kwargs):
+            with open(cmd[-1], 'wb') as f:
+                f.write(b'\0' * 1024 * 1024)
+            return '', ''
+
+        self.mock_execute.side_effect = fake_execute
+        images.image_to_raw('image', self.path, self.path + '.part')
+        self.mock_execute.assert_called_once_with(
+                'qemu-img', 'convert', '-O', 'raw', self.path + '.part',
+                self.path + '.converted', run_as_root=False)
+        self.assertEqual(1024 * 1024, os.path.getsize(self.path))
+
+
+class QemuImgInfoTestCase(base.TestCase):
+
+    def test_parse_json(self):
+        info = images.QemuImgInfo(
+                '{"filename": "image", "format": "qcow2", '
+                '"virtual-size": 1024, "cluster-size": 65536, '
+                '"actual-size": 512, "backing-filename": "backing", '
+                '"snapshots": [{"id": "1", "name": "snap", '
+                '"vm-state-size": 0}]}', format='json')
+        self.assertEqual('image', info.image)
+        self.assertEqual('qcow2', info.file_format)
+        self.assertEqual(1024, info.virtual_size)
+        self.assertEqual(65536, info.cluster_size)
+        self.assertEqual(512, info.disk_size)
+        self.assertEqual('backing', info.backing_file)
+        self.assertEqual([{'id': '1', 'tag': 'snap', 'vm_size': 0}],
+                         info.snapshots)
+
+    def test_parse_json_empty(self):
+        info = images.QemuImgInfo(format='json')
+        self.assertIsNone(info.file_format)
+        self.assertEqual([], info.snapshots)
+
+
+class FakeImageService(object):
+    def __init__(self, image, chunk_size=1000, local=False):
+        self.image = image
+        self.chunk_size = chunk_size
+        # whether the image is copied to path when one is given
+        self.local = local
+
+    def download(self, image_href, data=None, path=None, checksum=None):
+        # NOTE: like glance, the image is verified once written.
+        actual = hashlib.md5(self.image).hexdigest()
+        if path is not None and (self.local or data is None):
+            with open(path, 'wb') as f:
+                f.write(self.image)
+            if checksum and checksum != actual:
+                raise exception.ImageChecksumMismatch(
+                        image_id=image_href, actual=actual, expected=checksum)
+            return True
+        for i in range(0, len(self.image), self.chunk_size):
+            data.write(self.image[i:i + self.chunk_size])
+        if checksum and checksum != actual:
+            raise exception.ImageChecksumMismatch(
+                    image_id=image_href, actual=actual, expected=checksum)
+
+
+class FetchConvertingTestCase(base.TestCase):
+
+    def setUp(self):
+        super(FetchConvertingTestCase, self).setUp()
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.path = os.path.join(temp_dir, 'image.part')
+        self.raw_path = os.path.join(temp_dir, 'image')
+        self.clusters = test_qcow2.make_clusters(50, 2)
+        self.size = 50 * test_qcow2.CLUSTER_SIZE
+
+    def _fetch(self, image, local=False, checksum=None):
+        return images.fetch(None, 'image', self.path,
+                            FakeImageService(image, local=local),
+                            self.raw_path, checksum=checksum)
+
+    def test_fetch_qcow2_converted(self):
+        image = test_qcow2.make_qcow2(self.clusters, self.size)
+        self.assertTrue(self._fetch(image))
+        self.assertFalse(os.path.exists(self.path))
+        with open(self.raw_path, 'rb') as f:
+            self.assertEqual(test_qcow2.raw_image(self.clusters, self.size),
+                             f.read())
+
+    def test_fetch_raw_not_converted(self):
+        image = test_qcow2.raw_image(self.clusters, self.size)
+        self.assertFalse(self._fetch(image))
+        self.assertFalse(os.path.exists(self.raw_path))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(image, f.read())
+
+    def test_fetch_small_image_not_converted(self):
+        self.assertFalse(self._fetch(b'small'))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(b'small', f.read())
+
+    def test_fetch_qcow2_not_streamable(self):
+        image = test_qcow2.make_qcow2(self.clusters, self.size,
+                                      backing_file=True)
+        self.assertFalse(self._fetch(image))
+        self.assertFalse(os.path.exists(self.raw_path))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(image, f.read())
+
+    @mock.patch.object(qcow2, '_MAX_PENDING_CLUSTERS', 10)
+    def test_fetch_qcow2_streaming_unsupported(self):
+        image = test_qcow2.make_qcow2(self.clusters, self.size)
+        image_service = FakeImageService(image)
+        with mock.patch.object(image_service, 'download',
+                               wraps=image_service.download) as mock_dl:
+            self.assertFalse(images.fetch(None, 'image', self.path,
+                                          image_service, self.raw_path))
+            self.assertEqual(2, mock_dl.call_count)
+        self.assertFalse(os.path.exists(self.raw_path))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(image, f.read())
+
+    def test_fetch_qcow2_local_file_not_converted(self):
+        image = test_qcow2.make_qcow2(self.clusters, self.size)
+        self.assertFalse(self._fetch(image, local=True))
+        self.assertFalse(os.path.exists(self.raw_path))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(image, f.read())
+
+    def test_fetch_without_raw_path(self):
+        image = test_qcow2.make_qcow2(self.clusters, self.size)
+        self.assertFalse(images.fetch(None, 'image', self.path,
+                                      FakeImageService(image)))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(image, f.read())
+
+    def test_fetch_qcow2_truncated(self):
+        image = test_qcow2.make_qcow2(self.clusters, self.size)
+        self.assertRaises(exception.ImageConvertFailed,
+                          self._fetch, image[:-1000])
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.raw_path))
+
+    def test_fetch_qcow2_converted_checksum(self):
+        image = test_qcow2.make_qcow2(self.clusters, self.size)
+        self.assertTrue(self._fetch(image,
+                                    checksum=hashlib.md5(image).hexdigest()))
+        self.assertTrue(os.path.exists(self.raw_path))
+
+    def test_fetch_qcow2_converted_checksum_mismatch(self):
+        image = test_qcow2.make_qcow2(self.clusters, self.size)
+        self.assertRaises(exception.ImageChecksumMismatch,
+                          self._fetch, image, checksum='0' * 32)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.raw_path))
+
+    def test_fetch_raw_checksum_mismatch(self):
+        image = test_qcow2.raw_image(self.clusters, self.size)
+        self.assertRaises(exception.ImageChecksumMismatch,
+                          self._fetch, image, checksum='0' * 32)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_fetch_local_file_checksum(self):
+        image = test_qcow2.make_qcow2(self.clusters, self.size)
+        self.assertFalse(self._fetch(image, local=True,
+                                     checksum=hashlib.md5(image).hexdigest()))
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_fetch_local_file_checksum_mismatch(self):
+        image = test_qcow2.make_qcow2(self.clusters, self.size)
+        self.assertRaises(exception.ImageChecksumMismatch,
+                          self._fetch, image, local=True, checksum='0' * 32)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_fetch_checksum_verified_by_service(self):
+        image_service = mock.Mock()
+        image_service.download.return_value = None
+        self.assertFalse(images.fetch(None, 'image', self.path,
+                                      image_service, checksum='md5'))
+        image_service.download.assert_called_once_with('image',
+                                                        path=self.path,
+                                                        checksum='md5')
+
+    def test_fetch_without_raw_path_checksum_mismatch(self):
+        self.assertRaises(exception.ImageChecksumMismatch,
+                          images.fetch, None, 'image', self.path,
+                          FakeImageService(b'image'), checksum='0' * 32)
+        self.assertFalse(os.path.exists(self.path))
+
+    @mock.patch.object(images, 'image_to_raw')
+    @mock.patch.object(images, 'fetch')
+    def test_fetch_to_raw_converted(self, mock_fetch, mock_to_raw):
+        mock_fetch.return_value = True
+        images.fetch_to_raw(None, 'image', self.raw_path)
+        mock_fetch.assert_called_once_with(None, 'image', self.path, None,
+                                           self.raw_path, None)
+        self.assertFalse(mock_to_raw.called)
+
+    @mock.patch.object(images, 'image_to_raw')
+    @mock.patch.object(images, 'fetch')
+    def test_fetch_to_raw_not_while_downloading(self, mock_fetch,
+                                                mock_to_raw):
+        self.config(convert_images_while_downloading=False)
+        mock_fetch.return_value = False
+        images.fetch_to_raw(None, 'image', self.raw_path)
+        mock_fetch.assert_called_once_with(None, 'image', self.path, None,
+                                           None, None)
+        mock_to_raw.assert_called_once_with('image', self.raw_path, self.path)
@@ -110,3 +110,17 @@ class KeystoneTestCase(base.TestCase):
         mock_ks.assert_called_once_with(username='fake', password='fake',
                                         tenant_name='fake',
                                         auth_url=expected_url)
+
+    @mock.patch('keystoneclient.v2_0.client.Client')
+    def test_get_admin_auth_token(self, mock_ks):
+        mock_ks.return_value.auth_token = 'admin-token'
+        self.assertEqual('admin-token', keystone.get_admin_auth_token())
+        mock_ks.assert_called_once_with(username='fake', password='fake',
+                                        tenant_name='fake',
+                                        auth_url='http://127.0.0.1:9898/v2.0')
+
+    @mock.patch('keystoneclient.v2_0.client.Client')
+    def test_get_admin_auth_token_unauthorized(self, mock_ks):
+        mock_ks.side_effect = ksexception.Unauthorized
+        self.assertRaises(exception.CatalogUnauthorized,
+                          keystone.get_admin_auth_token)
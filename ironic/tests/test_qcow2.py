@@ -0,0 +1,265 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for reading qcow2 images."""
+
+import struct
+import tempfile
+import zlib
+
+import mock
+
+from ironic.common import qcow2
+from ironic.tests import base
+
+CLUSTER_BITS = 9
+CLUSTER_SIZE = 1 << CLUSTER_BITS
+L2_ENTRIES = CLUSTER_SIZE // 8
+
+
+def make_qcow2(clusters, size, layout='tables_first', compress=False,
+               version=2, nb_snapshots=0, backing_file=False,
+               incompatible_features=0):
+    """Build a qcow2 image.
+
+    :param clusters: dict of guest cluster index -> cluster data.
+    :param size: the virtual size of the image.
+    :param layout: tables_first to write all the tables before the data,
+                   interleaved to write each L2 table before the data it
+                   maps, data_first to write the data before the tables.
+    """
+    image = bytearray()
+
+    def alloc(length):
+        image.extend(b'\0' * (-len(image) % CLUSTER_SIZE))
+        offset = len(image)
+        image.extend(b'\0' * length)
+        return offset
+
+    def put_entry(offset, index, value):
+        struct.pack_into('>Q', image, offset + index * 8, value)
+
+    def write_data(index):
+        if compress:
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -12)
+            data = compressor.compress(clusters[index]) + compressor.flush()
+            offset = len(image)
+            image.extend(data)
+            x = 62 - (CLUSTER_BITS - 8)
+            sectors = (offset % 512 + len(data) + 511) // 512
+            return (1 << 62) | ((sectors - 1) << x) | offset
+        offset = alloc(CLUSTER_SIZE)
+        image[offset:offset + CLUSTER_SIZE] = clusters[index]
+        return (1 << 63) | offset
+
+    alloc(CLUSTER_SIZE)
+    nb_clusters = (size + CLUSTER_SIZE - 1) // CLUSTER_SIZE
+    l1_size = (nb_clusters + L2_ENTRIES - 1) // L2_ENTRIES
+    l1_offset = None
+    if layout != 'data_first':
+        l1_offset = alloc(CLUSTER_SIZE)
+
+    entries = {}
+    l2_offsets = []
+    for l1_index in range(l1_size):
+        indexes = [i for i in sorted(clusters)
+                   if i // L2_ENTRIES == l1_index]
+        if layout == 'interleaved':
+            l2_offsets.append(alloc(CLUSTER_SIZE))
+            entries.update((i, write_data(i)) for i in indexes)
+        elif layout == 'tables_first':
+            l2_offsets.append(alloc(CLUSTER_SIZE))
+    if layout != 'interleaved':
+        entries.update((i, write_data(i)) for i in sorted(clusters))
+    if layout == 'data_first':
+        l2_offsets = [alloc(CLUSTER_SIZE) for i in range(l1_size)]
+        l1_offset = alloc(CLUSTER_SIZE)
+
+    for index, entry in entries.items():
+        put_entry(l2_offsets[index // L2_ENTRIES], index % L2_ENTRIES, entry)
+    for l1_index, l2_offset in enumerate(l2_offsets):
+        put_entry(l1_offset, l1_index, (1 << 63) | l2_offset)
+
+    struct.pack_into('>4sIQIIQIIQQIIQ', image, 0, qcow2.MAGIC, version,
+                     1024 if backing_file else 0, 0, CLUSTER_BITS, size, 0,
+                     l1_size, l1_offset, 0, 0, nb_snapshots, 0)
+    if version >= 3:
+        struct.pack_into('>QQQII', image, 72, incompatible_features, 0, 0,
+                         4, 104)
+    return bytes(image)
+
+
+def make_clusters(count, step=1):
+    return dict((i, chr(ord('a') + i % 26) * CLUSTER_SIZE)
+                for i in range(0, count, step))
+
+
+def raw_image(clusters, size):
+    data = b''.join(clusters.get(i, b'\0' * CLUSTER_SIZE)
+                    for i in range((size + CLUSTER_SIZE - 1) // CLUSTER_SIZE))
+    return data[:size]
+
+
+class Qcow2HeaderTestCase(base.TestCase):
+
+    def test_parse_header(self):
+        image = make_qcow2({}, 1024 * 1024, version=3)
+        header = qcow2.parse_header(image[:qcow2.HEADER_SIZE])
+        self.assertEqual(3, header.version)
+        self.assertEqual(1024 * 1024, header.size)
+        self.assertEqual(CLUSTER_SIZE, header.cluster_size)
+        self.assertTrue(header.streamable)
+
+    def test_parse_header_not_qcow2(self):
+        self.assertIsNone(qcow2.parse_header(b'\0' * 512))
+
+    def test_parse_header_truncated(self):
+        self.assertRaises(ValueError, qcow2.parse_header, qcow2.MAGIC)
+
+    def _test_invalid(self, fmt, offset, value):
+        image = bytearray(make_qcow2({}, 1024 * 1024))
+        struct.pack_into(fmt, image, offset, value)
+        self.assertRaises(ValueError, qcow2.parse_header, bytes(image))
+
+    def test_parse_header_l1_table_too_large(self):
+        # NOTE: 2^32 - 1 entries would be 32 GiB of L1 table
+        self._test_invalid('>I', 36, 2 ** 32 - 1)
+
+    def test_parse_header_l1_table_too_small(self):
+        # NOTE: a 512 bytes cluster L1 entry maps 32 KiB
+        self._test_invalid('>I', 36, 1)
+
+    def test_parse_header_size_too_large(self):
+        self._test_invalid('>Q', 24, 2 ** 63)
+
+    def test_parse_header_l1_table_not_aligned(self):
+        self._test_invalid('>Q', 40, CLUSTER_SIZE + 8)
+
+    def test_parse_header_invalid_cluster_bits(self):
+        self._test_invalid('>I', 20, 40)
+
+    def test_not_streamable_backing_file(self):
+        image = make_qcow2({}, 1024, backing_file=True)
+        self.assertFalse(qcow2.parse_header(image).streamable)
+
+    def test_not_streamable_incompatible_features(self):
+        image = make_qcow2({}, 1024, version=3, incompatible_features=1 << 2)
+        self.assertFalse(qcow2.parse_header(image).streamable)
+
+    def test_streamable_dirty(self):
+        image = make_qcow2({}, 1024, version=3,
+                           incompatible_features=qcow2.INCOMPAT_DIRTY)
+        self.assertTrue(qcow2.parse_header(image).streamable)
+
+
+class StreamConverterTestCase(base.TestCase):
+
+    def _convert(self, image, chunk_size=4096):
+        header = qcow2.parse_header(image)
+        raw_file = tempfile.TemporaryFile()
+        self.addCleanup(raw_file.close)
+        spill_file = tempfile.TemporaryFile()
+        self.addCleanup(spill_file.close)
+        self.spill_file = mock.Mock(wraps=spill_file)
+        converter = qcow2.StreamConverter(header, raw_file, self.spill_file)
+        for i in range(0, len(image), chunk_size):
+            converter.write(image[i:i + chunk_size])
+        converter.finish()
+        raw_file.seek(0)
+        return raw_file.read()
+
+    def _spilled(self):
+        return self.spill_file.write.call_count
+
+    def _test_convert(self, size=200 * CLUSTER_SIZE, step=3, **kwargs):
+        clusters = make_clusters(size // CLUSTER_SIZE, step)
+        image = make_qcow2(clusters, size, **kwargs)
+        self.assertEqual(raw_image(clusters, size), self._convert(image))
+
+    def test_convert_tables_first(self):
+        self._test_convert(layout='tables_first')
+        # NOTE: only the header is read before the tables
+        self.assertEqual(1, self._spilled())
+
+    def test_convert_interleaved(self):
+        self._test_convert(layout='interleaved')
+        self.assertEqual(1, self._spilled())
+
+    def test_convert_data_first(self):
+        self._test_convert(layout='data_first')
+        # NOTE: the header, the 67 data clusters and the 4 L2 tables are
+        #       read before the L1 table
+        self.assertEqual(1 + 67 + 4, self._spilled())
+
+    def test_convert_compressed(self):
+        self._test_convert(layout='interleaved', compress=True)
+
+    def test_convert_compressed_data_first(self):
+        self._test_convert(layout='data_first', compress=True)
+
+    def test_convert_with_snapshots(self):
+        self._test_convert(layout='interleaved', nb_snapshots=1)
+        # NOTE: the header and the data clusters read before the last L2
+        #       table, all but the 3 it maps, are kept
+        self.assertEqual(1 + 67 - 3, self._spilled())
+
+    def test_convert_version_3(self):
+        self._test_convert(version=3)
+
+    def test_convert_partial_last_cluster(self):
+        self._test_convert(size=10 * CLUSTER_SIZE + 100, step=1)
+
+    def test_convert_small_chunks(self):
+        clusters = make_clusters(20)
+        image = make_qcow2(clusters, 20 * CLUSTER_SIZE, compress=True)
+        self.assertEqual(raw_image(clusters, 20 * CLUSTER_SIZE),
+                         self._convert(image, chunk_size=100))
+
+    def test_convert_empty(self):
+        self.assertEqual(b'\0' * 4096, self._convert(make_qcow2({}, 4096)))
+
+    def test_convert_truncated(self):
+        clusters = make_clusters(20)
+        image = make_qcow2(clusters, 20 * CLUSTER_SIZE)
+        self.assertRaises(ValueError, self._convert, image[:-CLUSTER_SIZE])
+
+    def test_convert_raw_file_too_large(self):
+        header = qcow2.parse_header(make_qcow2({}, 4096))
+        raw_file = mock.Mock()
+        raw_file.truncate.side_effect = IOError(27, 'File too large')
+        self.assertRaises(ValueError, qcow2.StreamConverter, header,
+                          raw_file, mock.Mock())
+
+    @mock.patch.object(qcow2, '_MAX_PENDING_CLUSTERS', 10)
+    def test_convert_too_many_pending_clusters(self):
+        clusters = make_clusters(20)
+        image = make_qcow2(clusters, 20 * CLUSTER_SIZE)
+        self.assertRaises(qcow2.StreamingUnsupported, self._convert, image)
+
+    @mock.patch.object(qcow2, '_MAX_PENDING_CLUSTERS', 10)
+    def test_convert_too_many_pending_compressed_clusters(self):
+        clusters = make_clusters(20)
+        image = make_qcow2(clusters, 20 * CLUSTER_SIZE, compress=True,
+                           layout='tables_first')
+        self.assertRaises(qcow2.StreamingUnsupported, self._convert, image)
+
+    @mock.patch.object(qcow2, '_MAX_PENDING_CLUSTERS', 30)
+    def test_convert_pending_clusters_released(self):
+        # NOTE: each L2 table maps at most 22 of the 67 data clusters
+        self._test_convert(layout='interleaved')
+
+    def test_convert_invalid_compressed_cluster(self):
+        clusters = make_clusters(2)
+        image = bytearray(make_qcow2(clusters, 2 * CLUSTER_SIZE,
+                                     compress=True))
+        image[-10:] = b'\xff' * 10
+        self.assertRaises(ValueError, self._convert, bytes(image))
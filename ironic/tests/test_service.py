@@ -0,0 +1,84 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the WSGI service of ironic-api."""
+
+import threading
+
+import mock
+
+from ironic.common import service
+from ironic.tests import base
+
+
+class WSGIServiceTestCase(base.TestCase):
+
+    def setUp(self):
+        super(WSGIServiceTestCase, self).setUp()
+        self.app = mock.Mock(return_value=['foo', 'bar'])
+        self.service = service.WSGIService('ironic-api', self.app,
+                                           '127.0.0.1', 0)
+        self.addCleanup(self.service.server.server_close)
+
+    def test__handle_request(self):
+        start_response = mock.Mock()
+        result = self.service._handle_request({}, start_response)
+        self.assertEqual(0, self.service.handled_requests)
+
+        self.assertEqual('foo', next(result))
+        self.assertEqual(1, self.service.handled_requests)
+        self.assertEqual(1, self.service.active_requests)
+
+        self.assertEqual(['bar'], list(result))
+        self.assertEqual(1, self.service.handled_requests)
+        self.assertEqual(0, self.service.active_requests)
+        self.app.assert_called_once_with({}, start_response)
+
+    def test__handle_request_closed(self):
+        body = mock.MagicMock()
+        body.__iter__.return_value = iter(['foo', 'bar'])
+        self.app.return_value = body
+        result = self.service._handle_request({}, mock.Mock())
+        next(result)
+        result.close()
+        body.close.assert_called_once_with()
+        self.assertEqual(0, self.service.active_requests)
+
+    def test__handle_request_concurrent(self):
+        def handle():
+            for i in range(100):
+                list(self.service._handle_request({}, mock.Mock()))
+
+        threads = [threading.Thread(target=handle) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1000, self.service.handled_requests)
+        self.assertEqual(0, self.service.active_requests)
+
+    def test__handle_request_locked(self):
+        self.service._counts_lock = mock.MagicMock()
+        list(self.service._handle_request({}, mock.Mock()))
+        self.assertEqual(2, self.service._counts_lock.__enter__.call_count)
+
+    def test_start_stop(self):
+        self.service.start()
+        self.assertTrue(self.service._serving)
+        self.service.stop()
+        self.assertFalse(self.service._serving)
+        self.service.wait()
+
+    def test_stop_not_started(self):
+        with mock.patch.object(self.service.server, 'shutdown') as shutdown:
+            self.service.stop()
+            self.assertFalse(shutdown.called)
@@ -67,6 +67,83 @@ class BareMetalUtilsTestCase(base.TestCase):
             symlink_mock.assert_called_once_with("/fake/source", "/fake/link")
 
 
+class CopyFileTestCase(base.TestCase):
+
+    def setUp(self):
+        super(CopyFileTestCase, self).setUp()
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(utils.rmtree_without_raise, temp_dir)
+        self.source = os.path.join(temp_dir, 'source')
+        self.dest = os.path.join(temp_dir, 'dest')
+        self.data = os.urandom(3 * 1024 * 1024 + 1)
+        with open(self.source, 'wb') as f:
+            f.write(self.data)
+
+    def _dest_data(self):
+        with open(self.dest, 'rb') as f:
+            return f.read()
+
+    def test_copy_file(self):
+        self.assertIn(utils.copy_file(self.source, self.dest),
+                      ('reflink', 'copy_file_range', 'sendfile', 'copy'))
+        self.assertEqual(self.data, self._dest_data())
+        self.assertNotEqual(os.stat(self.source).st_ino,
+                            os.stat(self.dest).st_ino)
+
+    def test_copy_file_hardlink(self):
+        utils.write_to_file(self.dest, 'old')
+        self.assertEqual('hardlink',
+                         utils.copy_file(self.source, self.dest,
+                                         hardlink=True))
+        self.assertEqual(os.stat(self.source).st_ino,
+                         os.stat(self.dest).st_ino)
+
+    @mock.patch.object(os, 'link')
+    def test_copy_file_hardlink_fails(self, mock_link):
+        mock_link.side_effect = OSError(errno.EXDEV, 'cross-device link')
+        self.assertNotEqual('hardlink',
+                            utils.copy_file(self.source, self.dest,
+                                            hardlink=True))
+        self.assertEqual(self.data, self._dest_data())
+
+    @mock.patch('fcntl.ioctl')
+    def test_copy_file_reflink(self, mock_ioctl):
+        self.assertEqual('reflink', utils.copy_file(self.source, self.dest))
+        self.assertEqual(utils._FICLONE, mock_ioctl.call_args[0][1])
+
+    @mock.patch.object(utils, '_kernel_copy')
+    @mock.patch('fcntl.ioctl')
+    def test_copy_file_buffered(self, mock_ioctl, mock_kernel_copy):
+        mock_ioctl.side_effect = IOError(errno.EOPNOTSUPP, 'not supported')
+        mock_kernel_copy.return_value = False
+        self.assertEqual('copy', utils.copy_file(self.source, self.dest))
+        self.assertEqual(self.data, self._dest_data())
+        self.assertEqual(['copy_file_range', 'sendfile'],
+                         [c[0][0] for c in mock_kernel_copy.call_args_list])
+
+    @mock.patch('fcntl.ioctl')
+    def test_copy_file_ioctl_error(self, mock_ioctl):
+        mock_ioctl.side_effect = IOError(errno.EIO, 'I/O error')
+        self.assertRaises(IOError, utils.copy_file, self.source, self.dest)
+
+    def _test_kernel_copy(self, name):
+        with open(self.source, 'rb') as source:
+            with open(self.dest, 'wb') as dest:
+                # NOTE: the copy goes on from the current offsets
+                os.write(dest.fileno(), os.read(source.fileno(), 1000))
+                self.assertTrue(utils._kernel_copy(name, source.fileno(),
+                                                   dest.fileno()))
+        self.assertEqual(self.data, self._dest_data())
+
+    def test_kernel_copy_sendfile(self):
+        self._test_kernel_copy('sendfile')
+
+    def test_kernel_copy_unsupported(self):
+        with open(self.source, 'rb') as source:
+            self.assertFalse(utils._kernel_copy('sendfile', source.fileno(),
+                                                source.fileno()))
+
+
 class ExecuteTestCase(base.TestCase):
 
     def test_retry_on_failure(self):
@@ -346,6 +423,34 @@ class GenericUtilsTestCase(base.TestCase):
         self.assertEqual(value, utils.safe_rstrip(value))
 
 
+class LazyJSONTestCase(base.TestCase):
+
+    def test_not_decoded(self):
+        loads = mock.Mock()
+        value = utils.LazyJSON('{"foo": "bar"}', loads)
+        self.assertFalse(value.decoded)
+        self.assertFalse(loads.called)
+
+    def test_mapping(self):
+        value = utils.LazyJSON('{"foo": "bar"}')
+        self.assertEqual({'foo': 'bar'}, value)
+        self.assertEqual('bar', value['foo'])
+        self.assertIsNone(value.get('baz'))
+        self.assertEqual(['foo'], list(value))
+        self.assertEqual(1, len(value))
+        self.assertIn('foo', value)
+        self.assertEqual({'foo': 'bar'}, value.copy())
+        self.assertIsInstance(value.copy(), dict)
+        self.assertTrue(value.decoded)
+
+    def test_change(self):
+        value = utils.LazyJSON('{"foo": "bar"}')
+        value['baz'] = 1
+        del value['foo']
+        self.assertEqual({'baz': 1}, value)
+        self.assertEqual({'baz': 1}, value.decode())
+
+
 class MkfsTestCase(base.TestCase):
 
     def test_mkfs(self):
@@ -0,0 +1,104 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure the throughput of listing nodes from the database.
+
+Creates nodes with sizeable JSON fields in a temporary sqlite database
+and lists them, reading either the fields shown by the summary node list
+of the API, which leaves the JSON fields undecoded, or all the fields,
+which decodes them as every node list did before. For example:
+
+    python tools/node_list_benchmark.py --nodes 2000 --codecs json simplejson
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from ironic.openstack.common import gettextutils
+gettextutils.install('ironic')
+
+from ironic.common import utils
+from ironic.db import api as dbapi
+from ironic.db.sqlalchemy import api as sqla_api
+from ironic.db.sqlalchemy import models
+from ironic.openstack.common import log as logging
+
+SUMMARY_FIELDS = ['instance_uuid', 'maintenance', 'power_state',
+                  'provision_state', 'uuid']
+
+
+def create_nodes(count):
+    properties = {'cpus': 8, 'memory_mb': 16384, 'local_gb': 100,
+                  'cpu_arch': 'x86_64'}
+    properties.update(('capability_%d' % i, 'value_%d' % i)
+                      for i in range(20))
+    driver_info = dict(('field_%d' % i, 'x' * 32) for i in range(20))
+    extra = dict(('key_%d' % i, i) for i in range(20))
+    nodes = [{'uuid': utils.generate_uuid(), 'driver': 'fake',
+              'properties': properties, 'driver_info': driver_info,
+              'instance_info': {}, 'extra': extra}
+             for i in range(count)]
+    dbapi.get_instance().create_nodes(nodes)
+
+
+def list_nodes(count, fields):
+    start = time.time()
+    for node in dbapi.get_instance().get_node_list(limit=count):
+        for field in fields or node.fields:
+            getattr(node, field)
+    return count / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--nodes', type=int, default=1000,
+                        help='Number of nodes to create and list.')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of times each list is repeated.')
+    parser.add_argument('--codecs', nargs='+', default=['json'],
+                        help='JSON codecs to compare, see '
+                             '[database]json_codec.')
+    args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        cfg.CONF([], project='ironic', default_config_files=[])
+        logging.setup('ironic')
+        cfg.CONF.set_override('connection', 'sqlite:///%s' %
+                              os.path.join(tempdir, 'ironic.sqlite'),
+                              'database')
+        models.Base.metadata.create_all(sqla_api.get_engine())
+        create_nodes(args.nodes)
+        # Warm up the database and the caches before measuring.
+        list_nodes(args.nodes, None)
+
+        print('%-12s %20s %20s' % ('codec', 'all fields (n/s)',
+                                   'summary (n/s)'))
+        for codec in args.codecs:
+            cfg.CONF.set_override('json_codec', codec, 'database')
+            eager = max(list_nodes(args.nodes, None)
+                        for i in range(args.runs))
+            lazy = max(list_nodes(args.nodes, SUMMARY_FIELDS)
+                       for i in range(args.runs))
+            print('%-12s %20d %20d' % (codec, eager, lazy))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main()